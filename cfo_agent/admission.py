@@ -0,0 +1,207 @@
+"""
+Admission control for the API endpoints
+
+Each endpoint gets a bounded number of in-flight requests and a short FIFO
+wait queue. A request is rejected up front (429 + Retry-After) when the queue
+is full or its projected wait - queue position x average service time /
+concurrency - would exceed its deadline, so admitted requests keep bounded
+latency under overload instead of everything slowing down together.
+
+A lower-priority controller (visualization) yields to a higher-priority one
+(/ask): it admits nothing new while the higher-priority queue is non-empty.
+
+Time a request spends parked outside the service (a HITL review, see
+paused()) is left out of the service-time average, so one slow reviewer
+doesn't make ordinary requests look expensive and trigger spurious 429s.
+
+Streaming endpoints take their slot before the response starts (so overload
+is still a 429) and hand it to AdmittedStreamingResponse, which frees it
+when the response ends however it ends - finished, failed or disconnected,
+including before the body was ever iterated.
+"""
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional
+import asyncio
+import math
+import time
+
+from starlette.responses import StreamingResponse
+
+
+# Pause bookkeeping of the admitted request running in this context
+_ticket: ContextVar[Optional[Dict]] = ContextVar('admission_ticket', default=None)
+
+
+class Overloaded(Exception):
+    """Request rejected by admission control"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded in-flight limit with a deadline-aware wait queue"""
+
+    def __init__(self, name: str, max_inflight: int, max_queue: int, yield_to: Optional['AdmissionController'] = None,
+                 initial_service_time: float = 1.0):
+        self.name = name
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.yield_to = yield_to
+        self.lower: List['AdmissionController'] = []  # controllers yielding to this one
+        if yield_to is not None:
+            yield_to.lower.append(self)
+        self.inflight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.service_time = initial_service_time  # EWMA of seconds per admitted request
+        self.admitted = 0
+        self.rejected = 0
+
+    def projected_wait(self, position: Optional[int] = None) -> float:
+        """Expected seconds until a request at this queue position starts"""
+        position = len(self.waiters) + 1 if position is None else position
+        return position * self.service_time / self.max_inflight
+
+    def _blocked(self) -> bool:
+        return self.yield_to is not None and len(self.yield_to.waiters) > 0
+
+    def _can_start(self) -> bool:
+        return self.inflight < self.max_inflight and not self.waiters and not self._blocked()
+
+    async def acquire(self, deadline: float) -> float:
+        """
+        Wait for a slot
+
+        Args:
+            deadline: Seconds the caller is willing to wait in total
+
+        Returns:
+            Seconds spent queued
+
+        Raises:
+            Overloaded: queue full, projected wait beyond deadline, or deadline hit while queued
+        """
+        if self._can_start():
+            self.inflight += 1
+            self.admitted += 1
+            return 0.0
+
+        projected = self.projected_wait()
+        if len(self.waiters) >= self.max_queue or projected + self.service_time > deadline:
+            self.rejected += 1
+            raise Overloaded(f"{self.name} is overloaded (projected wait {projected:.1f}s)",
+                             retry_after=max(projected, self.service_time))
+
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=max(deadline - self.service_time, 0.0))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # a slot was handed over just as we gave up: pass it on
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected += 1
+            raise Overloaded(f"{self.name} is overloaded (queued past deadline)", retry_after=self.projected_wait())
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                self._wake_lower_priority()
+        # release() handed its slot to us (inflight already counted)
+        self.admitted += 1
+        return time.monotonic() - started
+
+    def release(self, service_seconds: Optional[float] = None):
+        """Free a slot (handing it to the next waiter) and fold in the service time"""
+        if service_seconds is not None:
+            self.service_time = 0.8 * self.service_time + 0.2 * service_seconds
+        while self.waiters and not self._blocked():
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # slot passes straight to the waiter
+                self._wake_lower_priority()
+                return
+        self.inflight -= 1
+        self._wake_lower_priority()
+
+    def _wake_lower_priority(self):
+        """Start queued lower-priority work once this queue has drained"""
+        if self.waiters:
+            return
+        for controller in self.lower:
+            while controller.waiters and controller.inflight < controller.max_inflight:
+                waiter = controller.waiters.popleft()
+                if not waiter.done():
+                    controller.inflight += 1
+                    waiter.set_result(None)
+
+    @asynccontextmanager
+    async def admit(self, deadline: float) -> AsyncIterator[float]:
+        """Hold a slot for the duration of the block; yields seconds spent queued"""
+        waited = await self.acquire(deadline)
+        started = time.monotonic()
+        ticket = {'paused': 0.0, 'active': 0, 'since': 0.0}
+        token = _ticket.set(ticket)
+        try:
+            yield waited
+        finally:
+            _ticket.reset(token)
+            now = time.monotonic()
+            if ticket['active']:
+                ticket['paused'] += now - ticket['since']
+            self.release(max(now - started - ticket['paused'], 0.0))
+
+    def stats(self) -> Dict:
+        """Current load and counters"""
+        return {
+            'inflight': self.inflight,
+            'max_inflight': self.max_inflight,
+            'queued': len(self.waiters),
+            'max_queue': self.max_queue,
+            'service_time_ms': round(self.service_time * 1000, 1),
+            'admitted': self.admitted,
+            'rejected': self.rejected
+        }
+
+
+@contextmanager
+def paused() -> Iterator[None]:
+    """Leave the block's time out of the current admitted request's service-time sample"""
+    ticket = _ticket.get()
+    if ticket is None:
+        yield
+        return
+    # Overlapping pauses (parallel tasks of one request) count once
+    if ticket['active'] == 0:
+        ticket['since'] = time.monotonic()
+    ticket['active'] += 1
+    try:
+        yield
+    finally:
+        ticket['active'] -= 1
+        if ticket['active'] == 0:
+            ticket['paused'] += time.monotonic() - ticket['since']
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """StreamingResponse holding an admission slot (already acquired) until the response ends"""
+
+    def __init__(self, content, controller: AdmissionController, **kwargs):
+        super().__init__(content, **kwargs)
+        self.controller = controller
+        self.started = time.monotonic()
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.controller.release(time.monotonic() - self.started)
+
+
+def retry_after_header(error: Overloaded) -> Dict[str, str]:
+    """Retry-After header value (whole seconds, at least 1)"""
+    return {'Retry-After': str(max(1, math.ceil(error.retry_after)))}
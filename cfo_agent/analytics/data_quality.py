@@ -0,0 +1,200 @@
+"""
+Batch data-quality stage: outlier z-scores and balance-sheet health flags
+
+Runs once after each data load and writes one row per company-quarter into
+dq_quarter_flags, so vw_outliers_quarter and vw_financial_health_quarter can
+be thin selects instead of recomputing window aggregates on every query.
+"""
+from typing import Dict, List, Optional
+import numpy as np
+from analytics.panel import to_float_array, to_python
+
+
+# Source surface for the checks and target table for the flags
+SOURCE_SURFACE = 'vw_company_quarter'
+FLAGS_TABLE = 'dq_quarter_flags'
+
+# Column order for COPY into dq_quarter_flags
+FLAG_COLUMNS = [
+    'company_id', 'fiscal_year', 'fiscal_quarter',
+    'revenue', 'net_margin', 'z_revenue', 'z_net_margin',
+    'outlier_revenue_3sigma', 'outlier_net_margin_3sigma',
+    'total_assets', 'total_liabilities', 'equity',
+    'liabilities_plus_equity', 'balance_gap', 'balance_gap_pct',
+    'balance_status', 'flag_negative_equity', 'flag_net_loss',
+    'sigma_threshold'
+]
+
+
+def group_zscores(groups: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Population z-score of each value within its group (NULL-aware)
+
+    Equivalent to (x - AVG(x) OVER w) / STDDEV_POP(x) OVER w with
+    w = PARTITION BY group. Returns NaN where x is NULL or the group has
+    zero/undefined spread.
+    """
+    _, inverse = np.unique(groups, return_inverse=True)
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+
+    counts = np.bincount(inverse, weights=present.astype(np.float64))
+    sums = np.bincount(inverse, weights=filled)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+        deviations = np.where(present, values - means[inverse], 0.0)
+        variances = np.bincount(inverse, weights=deviations ** 2) / counts
+        stds = np.sqrt(variances)
+        z = (values - means[inverse]) / stds[inverse]
+
+    # Float accumulation leaves ~1e-17 spread on constant groups, which the
+    # exact numeric STDDEV_POP in Postgres reports as 0
+    flat = stds <= 1e-12 * np.maximum(np.abs(means), 1.0)
+    z[flat[inverse] | ~np.isfinite(z)] = np.nan
+    return z
+
+
+def compute_outlier_flags(company_ids: np.ndarray, revenue: np.ndarray, net_margin: np.ndarray,
+                          sigma_threshold: float = 3.0) -> Dict[str, np.ndarray]:
+    """Vectorized per-company z-scores and sigma outlier flags for revenue and net margin"""
+    z_revenue = group_zscores(company_ids, revenue)
+    z_net_margin = group_zscores(company_ids, net_margin)
+
+    return {
+        'z_revenue': z_revenue,
+        'z_net_margin': z_net_margin,
+        'outlier_revenue_3sigma': (np.nan_to_num(np.abs(z_revenue)) >= sigma_threshold).astype(np.int16),
+        'outlier_net_margin_3sigma': (np.nan_to_num(np.abs(z_net_margin)) >= sigma_threshold).astype(np.int16)
+    }
+
+
+def compute_health_flags(total_assets: np.ndarray, total_liabilities: np.ndarray, equity: np.ndarray,
+                         net_income: np.ndarray, tolerance_pct: float = 0.005,
+                         tolerance_abs: float = 1_000_000) -> Dict[str, np.ndarray]:
+    """
+    Vectorized balance-sheet checks
+
+    A row is within tolerance when |assets - liabilities - equity| is at most
+    max(|assets| * tolerance_pct, tolerance_abs), treating NULL components as 0.
+    """
+    liabilities_plus_equity = total_liabilities + equity
+    balance_gap = total_assets - liabilities_plus_equity
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        balance_gap_pct = np.where(
+            np.nan_to_num(total_assets) != 0,
+            balance_gap / np.abs(total_assets),
+            np.nan
+        )
+
+    gap_for_check = np.abs(np.nan_to_num(total_assets) - np.nan_to_num(total_liabilities) - np.nan_to_num(equity))
+    allowed = np.maximum(np.nan_to_num(np.abs(total_assets) * tolerance_pct), tolerance_abs)
+    within = gap_for_check <= allowed
+
+    return {
+        'liabilities_plus_equity': liabilities_plus_equity,
+        'balance_gap': balance_gap,
+        'balance_gap_pct': balance_gap_pct,
+        'balance_status': np.where(within, 'within_tolerance', 'out_of_balance'),
+        'flag_negative_equity': (np.nan_to_num(equity) < 0).astype(np.int16),
+        'flag_net_loss': (np.nan_to_num(net_income) < 0).astype(np.int16)
+    }
+
+
+class DataQualityStage:
+    """Computes data-quality flags for the whole universe and writes them to dq_quarter_flags"""
+
+    def __init__(self, sigma_threshold: float = 3.0, balance_tolerance_pct: float = 0.005,
+                 balance_tolerance_abs: float = 1_000_000):
+        self.sigma_threshold = sigma_threshold
+        self.balance_tolerance_pct = balance_tolerance_pct
+        self.balance_tolerance_abs = balance_tolerance_abs
+
+    def compute(self, records: List) -> List[tuple]:
+        """
+        Compute flag rows from vw_company_quarter records
+
+        Args:
+            records: Rows with company_id, fiscal_year, fiscal_quarter, revenue,
+                     net_margin, net_income, total_assets, total_liabilities, equity
+
+        Returns:
+            List of tuples in FLAG_COLUMNS order, ready for COPY
+        """
+        if not records:
+            return []
+
+        company_ids = np.array([r['company_id'] for r in records])
+        revenue = to_float_array(records, 'revenue')
+        net_margin = to_float_array(records, 'net_margin')
+
+        outliers = compute_outlier_flags(company_ids, revenue, net_margin, self.sigma_threshold)
+        health = compute_health_flags(
+            to_float_array(records, 'total_assets'),
+            to_float_array(records, 'total_liabilities'),
+            to_float_array(records, 'equity'),
+            to_float_array(records, 'net_income'),
+            self.balance_tolerance_pct,
+            self.balance_tolerance_abs
+        )
+
+        columns = {
+            'revenue': revenue,
+            'net_margin': net_margin,
+            'total_assets': to_float_array(records, 'total_assets'),
+            'total_liabilities': to_float_array(records, 'total_liabilities'),
+            'equity': to_float_array(records, 'equity'),
+            **outliers,
+            **health
+        }
+
+        rows = []
+        for i, r in enumerate(records):
+            row = [r['company_id'], r['fiscal_year'], r['fiscal_quarter']]
+            for name in FLAG_COLUMNS[3:-1]:
+                value = to_python(columns[name][i])
+                row.append(str(value) if isinstance(value, np.str_) else value)
+            row.append(float(self.sigma_threshold))
+            rows.append(tuple(row))
+
+        return rows
+
+    async def run(self, pool, company_ids: Optional[List[int]] = None) -> int:
+        """
+        Recompute and replace flags in one write transaction
+
+        Args:
+            pool: asyncpg pool (the agent pool is read-only by default, so the
+                  transaction is switched to READ WRITE explicitly)
+            company_ids: Optional subset of companies touched by the last load
+
+        Returns:
+            Number of flag rows written
+        """
+        sql = f"""
+        SELECT company_id, fiscal_year, fiscal_quarter, revenue, net_margin, net_income,
+               total_assets, total_liabilities, equity
+        FROM {SOURCE_SURFACE}
+        """
+
+        async with pool.acquire() as conn:
+            # Outlier statistics are per company, so a partial reload only
+            # needs the affected companies' full history
+            if company_ids:
+                records = await conn.fetch(sql + " WHERE company_id = ANY($1)", company_ids)
+            else:
+                records = await conn.fetch(sql)
+
+            rows = self.compute(records)
+
+            async with conn.transaction():
+                await conn.execute("SET TRANSACTION READ WRITE")
+                if company_ids:
+                    await conn.execute(f"DELETE FROM {FLAGS_TABLE} WHERE company_id = ANY($1)", company_ids)
+                else:
+                    await conn.execute(f"DELETE FROM {FLAGS_TABLE}")
+                if rows:
+                    await conn.copy_records_to_table(FLAGS_TABLE, records=rows, columns=FLAG_COLUMNS)
+
+        return len(rows)
@@ -0,0 +1,361 @@
+"""
+In-process columnar fact store
+
+Holds the company x period fact universe (financials, ratios, growth and
+stock prices) as NumPy column arrays so templated intents can be answered
+without a database round trip. Postgres stays the source of truth and the
+fallback: the store only answers intents whose template output columns it
+can reproduce exactly.
+"""
+import asyncio
+import json
+import re
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from analytics.panel import records_to_columns, to_python
+
+
+# Load queries: the template SELECT lists without the per-request filters,
+# so every stored column carries the same name and scaling as the template
+TABLE_SOURCES = {
+    'quarter': """
+        SELECT c.ticker, c.name, f.fiscal_year, f.fiscal_quarter,
+               f.revenue/1e9 as revenue_b, f.net_income/1e9 as net_income_b, f.operating_income/1e9 as op_income_b,
+               f.gross_profit/1e9 as gross_profit_b, f.r_and_d_expenses/1e9 as rd_b, f.sg_and_a_expenses/1e9 as sga_b,
+               f.cogs/1e9 as cogs_b, f.cash_flow_ops/1e9 as operating_cash_flow, f.cash_flow_investing/1e9 as investing_cash_flow,
+               f.cash_flow_financing/1e9 as financing_cash_flow, f.capex/1e9 as capex, f.dividends/1e9 as dividends,
+               f.buybacks/1e9 as buybacks, f.eps, f.total_assets, f.total_liabilities, f.equity,
+               r.gross_margin, r.operating_margin, r.net_margin, r.roe, r.roa, r.debt_to_equity, r.debt_to_assets,
+               r.rnd_to_revenue, r.sgna_to_revenue
+        FROM fact_financials f
+        JOIN dim_company c USING (company_id)
+        LEFT JOIN vw_ratios_quarter r ON r.company_id = f.company_id AND r.fiscal_year = f.fiscal_year AND r.fiscal_quarter = f.fiscal_quarter
+    """,
+    'annual': """
+        SELECT c.ticker, c.name, mv.fiscal_year,
+               mv.revenue_annual/1e9 as revenue_b, mv.net_income_annual/1e9 as net_income_b,
+               mv.operating_income_annual/1e9 as op_income_b, mv.gross_profit_annual/1e9 as gross_profit_annual_b,
+               mv.gross_profit_annual/1e9 as gross_profit_b,
+               mv.r_and_d_expenses_annual/1e9 as rd_annual_b, mv.sg_and_a_expenses_annual/1e9 as sga_annual_b,
+               mv.cogs_annual/1e9 as cogs_annual_b, mv.total_assets_eoy, mv.total_liabilities_eoy, mv.equity_eoy,
+               mv.cash_flow_ops_annual/1e9 as operating_cash_flow, mv.cash_flow_investing_annual/1e9 as investing_cash_flow,
+               mv.cash_flow_financing_annual/1e9 as financing_cash_flow, mv.capex_annual/1e9 as capex_annual_b,
+               fa.eps, fa.dividends, fa.buybacks,
+               r.gross_margin_annual, r.operating_margin_annual, r.net_margin_annual, r.roe_annual_avg_equity,
+               r.roe_annual_avg_equity as roe_annual, r.roa_annual, r.debt_to_assets_annual, r.debt_to_equity_annual,
+               r.rnd_to_revenue_annual, r.sgna_to_revenue_annual,
+               r.company_id IS NOT NULL as has_ratios
+        FROM mv_financials_annual mv
+        JOIN dim_company c USING (company_id)
+        LEFT JOIN mv_ratios_annual r USING (company_id, fiscal_year)
+        LEFT JOIN (
+            SELECT company_id, fiscal_year, SUM(eps) as eps, SUM(dividends)/1e9 as dividends, SUM(buybacks)/1e9 as buybacks
+            FROM fact_financials
+            GROUP BY company_id, fiscal_year
+        ) fa USING (company_id, fiscal_year)
+    """,
+    'growth_quarter': """
+        SELECT c.ticker, c.name, g.fiscal_year, g.fiscal_quarter,
+               g.revenue_qoq, g.revenue_yoy, g.net_income_qoq, g.net_income_yoy
+        FROM vw_growth_quarter g
+        JOIN dim_company c USING (company_id)
+    """,
+    'growth_annual': """
+        SELECT c.ticker, c.name, g.fiscal_year,
+               g.revenue_yoy, g.revenue_cagr_3y, g.revenue_cagr_5y, g.net_income_yoy
+        FROM vw_growth_annual g
+        JOIN dim_company c USING (company_id)
+    """,
+    'stock_quarter': """
+        SELECT c.ticker, c.name, sq.fiscal_year, sq.fiscal_quarter,
+               sq.avg_price, sq.open_price, sq.close_price, sq.high_price, sq.low_price, sq.return_qoq, sq.return_yoy,
+               sq.price_change_abs, sq.price_change_pct, sq.volatility_pct, sq.volume_total, sq.volume_avg,
+               sq.dividend_yield, sq.dividend_per_share
+        FROM vw_stock_prices_quarter sq
+        JOIN dim_company c USING (company_id)
+    """,
+    'stock_annual': """
+        SELECT c.ticker, c.name, sa.fiscal_year,
+               sa.avg_price_annual, sa.avg_open_price_annual, sa.avg_close_price_annual, sa.high_price_annual,
+               sa.low_price_annual, sa.close_price_eoy, sa.return_annual, sa.volatility_pct_annual,
+               sa.volume_total_annual, sa.volume_avg_annual, sa.dividend_per_share_annual, sa.dividend_yield_annual
+        FROM mv_stock_prices_annual sa
+        JOIN dim_company c USING (company_id)
+    """
+}
+
+# Intents the store can answer: source table and how tickers are bound
+INTENT_TABLES = {
+    'quarter_snapshot': ('quarter', 'ticker'),
+    'annual_metrics': ('annual', 'ticker'),
+    'growth_qoq_yoy': ('growth_quarter', 'ticker'),
+    'growth_annual_cagr': ('growth_annual', 'ticker'),
+    'multi_company_quarter': ('quarter', 'pair'),
+    'multi_company_annual': ('annual', 'pair'),
+    'stock_price_quarterly': ('stock_quarter', 'ticker'),
+    'stock_price_annual': ('stock_annual', 'ticker')
+}
+
+# Intents whose template inner-joins a table the source LEFT JOINs: only rows
+# where this flag column is true exist in the template's output
+REQUIRED_MATCH = {
+    'annual_metrics': 'has_ratios'
+}
+
+# Data version: changes whenever a load touches facts or prices
+DATA_VERSION_SQL = """
+SELECT CONCAT_WS('|',
+    (SELECT COUNT(*) FROM fact_financials), (SELECT MAX(version_ts) FROM fact_financials),
+    (SELECT COUNT(*) FROM fact_stock_prices), (SELECT MAX(version_ts) FROM fact_stock_prices)
+) AS data_version
+"""
+
+
+def template_output_columns(sql: str) -> List[str]:
+    """Output column names of a template's top-level SELECT list"""
+    match = re.match(r'\s*SELECT\s+(.*?)\s+FROM\s', sql, re.IGNORECASE | re.DOTALL)
+    if not match:
+        return []
+
+    items, depth, current = [], 0, ''
+    for ch in match.group(1):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            items.append(current)
+            current = ''
+        else:
+            current += ch
+    items.append(current)
+
+    names = []
+    for item in items:
+        item = item.strip()
+        alias = re.search(r'\s+as\s+([a-z_][a-z0-9_]*)$', item, re.IGNORECASE)
+        names.append(alias.group(1) if alias else item.split('.')[-1])
+    return names
+
+
+class ColumnarTable:
+    """One surface held as column arrays, indexed by (ticker, fiscal_year, fiscal_quarter)"""
+
+    def __init__(self, name: str, columns: Dict[str, np.ndarray]):
+        self.name = name
+        self.columns = columns
+        self.row_count = len(columns['ticker']) if columns else 0
+        self.has_quarter = 'fiscal_quarter' in columns
+
+        tickers = columns.get('ticker', np.array([], dtype=object))
+        years = columns.get('fiscal_year', np.zeros(0, dtype=np.int32))
+        quarters = columns.get('fiscal_quarter', np.zeros(self.row_count, dtype=np.int32))
+
+        # Driver-native copies (NaN -> None) so projection does no conversion
+        self._values = {name: [to_python(v) for v in values] for name, values in columns.items()}
+
+        # Exact-period index and per-ticker rows ordered latest first
+        self._key_index: Dict[tuple, int] = {}
+        self._by_ticker: Dict[str, np.ndarray] = {}
+
+        order = np.lexsort((-quarters, -years, tickers.astype(str))) if self.row_count else []
+        for row in order:
+            self._key_index[(tickers[row], int(years[row]), int(quarters[row]))] = int(row)
+
+        for ticker in np.unique(tickers.astype(str)) if self.row_count else []:
+            self._by_ticker[ticker] = order[tickers[order] == ticker]
+
+    def rows_for(self, ticker: str, fy: Optional[int] = None, fq: Optional[int] = None) -> np.ndarray:
+        """Row indices for a ticker, latest first, optionally filtered by period"""
+        if fy is not None and (fq is not None or not self.has_quarter):
+            row = self._key_index.get((ticker, int(fy), int(fq or 0)))
+            return np.array([row] if row is not None else [], dtype=np.int64)
+
+        rows = self._by_ticker.get(ticker)
+        if rows is None:
+            return np.array([], dtype=np.int64)
+        if fy is not None:
+            rows = rows[self.columns['fiscal_year'][rows] == int(fy)]
+        if fq is not None and self.has_quarter:
+            rows = rows[self.columns['fiscal_quarter'][rows] == int(fq)]
+        return rows
+
+    def within(self, rows: np.ndarray, fy_from: Optional[int] = None, fy_to: Optional[int] = None,
+               fq_from: Optional[int] = None, fq_to: Optional[int] = None) -> np.ndarray:
+        """Rows whose period lies in the inclusive range (open-ended where None), order kept"""
+        if fy_from is None and fy_to is None:
+            return rows
+        periods = self.columns['fiscal_year'][rows].astype(np.int64) * 10
+        if self.has_quarter:
+            periods += self.columns['fiscal_quarter'][rows].astype(np.int64)
+        keep = np.ones(len(rows), dtype=bool)
+        if fy_from is not None:
+            keep &= periods >= int(fy_from) * 10 + (int(fq_from or 1) if self.has_quarter else 0)
+        if fy_to is not None:
+            keep &= periods <= int(fy_to) * 10 + (int(fq_to or 4) if self.has_quarter else 0)
+        return rows[keep]
+
+    def project(self, rows: np.ndarray, output_columns: List[str]) -> List[Dict]:
+        """Materialize rows as dicts with the template's output columns"""
+        selected = [(name, self._values[name]) for name in output_columns]
+        return [
+            {name: values[row] for name, values in selected}
+            for row in rows.tolist()
+        ]
+
+
+class FactStore:
+    """Optional in-process analytical store serving templated intents"""
+
+    def __init__(self, templates_path: str = 'catalog/templates.json'):
+        self.templates_path = templates_path
+        self.tables: Dict[str, ColumnarTable] = {}
+        self.data_version: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self._output_columns: Dict[str, List[str]] = {}
+        self._servable: Dict[str, bool] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        """True once a snapshot has been loaded"""
+        return bool(self.tables)
+
+    def _load_output_columns(self) -> Dict[str, List[str]]:
+        """Output columns per servable intent, taken from the templates"""
+        with open(self.templates_path, 'r') as f:
+            templates = json.load(f)['templates']
+
+        output_columns = {}
+        for template in templates.values():
+            if template['intent'] in INTENT_TABLES:
+                output_columns[template['intent']] = template_output_columns(template['sql'])
+        return output_columns
+
+    async def load(self, pool):
+        """Load a full snapshot and swap it in atomically"""
+        start = time.perf_counter()
+
+        async with pool.acquire() as conn:
+            version = await conn.fetchval(DATA_VERSION_SQL)
+            tables = {}
+            for name, sql in TABLE_SOURCES.items():
+                records = await conn.fetch(sql)
+                tables[name] = ColumnarTable(name, records_to_columns(records))
+
+        self.load_tables(tables, version)
+        rows = sum(t.row_count for t in tables.values())
+        print(f"Fact store loaded {rows} rows across {len(tables)} tables in {time.perf_counter() - start:.2f}s")
+
+    def load_tables(self, tables: Dict[str, ColumnarTable], version: Optional[str] = None):
+        """Install prebuilt tables (used by load() and for offline snapshots)"""
+        if not self._output_columns:
+            self._output_columns = self._load_output_columns()
+        servable = {}
+        for intent, (table_name, _) in INTENT_TABLES.items():
+            columns = self._output_columns.get(intent)
+            if columns and intent in REQUIRED_MATCH:
+                columns = columns + [REQUIRED_MATCH[intent]]
+            servable[intent] = self._covers(tables.get(table_name), columns)
+        self._servable = servable
+        self.tables = tables
+        self.data_version = version
+        self.loaded_at = time.time()
+
+    @staticmethod
+    def _covers(table: Optional[ColumnarTable], columns: Optional[List[str]]) -> bool:
+        return bool(table and columns) and all(c in table.columns for c in columns)
+
+    async def refresh_if_stale(self, pool) -> bool:
+        """Reload when the data version has changed; returns True if reloaded"""
+        async with pool.acquire() as conn:
+            version = await conn.fetchval(DATA_VERSION_SQL)
+        if version == self.data_version:
+            return False
+        await self.load(pool)
+        return True
+
+    async def _refresh_loop(self, pool, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await self.refresh_if_stale(pool):
+                    print(f"Fact store refreshed to data version {self.data_version}")
+            except Exception as e:
+                print(f"Warning: Fact store refresh failed: {e}")
+
+    def start_refresh(self, pool, interval: float = 300.0):
+        """Poll the data version in the background"""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(pool, interval))
+
+    async def stop_refresh(self):
+        """Stop the background refresh task"""
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    def can_answer(self, plan: Dict) -> bool:
+        """Whether the plan's intent is servable from the loaded snapshot"""
+        return self.ready and self._servable.get(plan.get('intent'), False)
+
+    def answer(self, plan: Dict) -> Optional[List[Dict]]:
+        """
+        Answer a planned task from memory
+
+        Mirrors the template semantics: NULL fy/fq means "any period", period
+        ranges (fy_from..fy_to) are inclusive, rows are ordered latest first (by ticker first for multi-company) and capped at
+        :limit.
+
+        Returns:
+            List of result rows as dicts, or None if the store cannot answer
+        """
+        if not self.can_answer(plan):
+            return None
+
+        intent = plan['intent']
+        params = plan.get('params', {})
+        table_name, ticker_mode = INTENT_TABLES[intent]
+        table = self.tables[table_name]
+
+        if ticker_mode == 'pair':
+            tickers = sorted({t for t in (params.get('t1'), params.get('t2')) if t})
+        else:
+            tickers = [params['ticker']] if params.get('ticker') else []
+        if not tickers:
+            return None
+
+        fy = params.get('fy')
+        fq = params.get('fq') if table.has_quarter else None
+        bounds = {key: params.get(key) for key in ('fy_from', 'fy_to', 'fq_from', 'fq_to')}
+        if len(tickers) == 1:
+            rows = table.within(table.rows_for(tickers[0], fy, fq), **bounds)
+        else:
+            rows = np.concatenate([table.within(table.rows_for(t, fy, fq), **bounds) for t in tickers])
+
+        if intent in REQUIRED_MATCH:
+            rows = rows[table.columns[REQUIRED_MATCH[intent]][rows] > 0]
+
+        limit = params.get('limit')
+        if limit is not None:
+            rows = rows[:int(limit)]
+
+        return table.project(rows, self._output_columns[intent])
+
+    def stats(self) -> Dict:
+        """Snapshot summary for health/metrics endpoints"""
+        return {
+            'ready': self.ready,
+            'data_version': self.data_version,
+            'loaded_at': self.loaded_at,
+            'tables': {name: t.row_count for name, t in self.tables.items()}
+        }
+
+
+# Global store instance (loaded at startup when FACT_STORE_ENABLED=true)
+fact_store = FactStore()
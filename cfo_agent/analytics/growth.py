@@ -0,0 +1,355 @@
+"""
+Arbitrary-window growth and CAGR engine
+
+Computes QoQ, YoY, TTM-over-TTM and N-year CAGR for any fact metric and any
+window over the whole company panel in one vectorized pass. The growth
+views (vw_growth_quarter / vw_growth_annual) only carry revenue and net
+income at fixed windows; the planner routes every other growth question
+here. The panel comes from the in-process fact store snapshot when it is
+loaded, otherwise from a cached fact_financials load.
+"""
+import os
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from analytics.panel import records_to_columns, sort_panel, to_python
+from analytics.ratios import safe_divide, group_starts, rolling_window, fiscal_year_groups, group_sum
+
+
+# Metric -> panel column (same names and scaling as the fact store 'quarter' table)
+GROWTH_METRICS = {
+    'revenue': 'revenue_b',
+    'net_income': 'net_income_b',
+    'operating_income': 'op_income_b',
+    'gross_profit': 'gross_profit_b',
+    'r_and_d_expenses': 'rd_b',
+    'sg_and_a_expenses': 'sga_b',
+    'cogs': 'cogs_b',
+    'operating_cash_flow': 'operating_cash_flow',
+    'capex': 'capex',
+    'dividends': 'dividends',
+    'buybacks': 'buybacks',
+    'eps': 'eps',
+    'total_assets': 'total_assets',
+    'total_liabilities': 'total_liabilities',
+    'equity': 'equity'
+}
+
+# Balance-sheet metrics are taken at fiscal year end instead of summed
+STOCK_METRICS = {'total_assets', 'total_liabilities', 'equity'}
+
+# Window units: qoq/ttm in quarters, yoy/cagr in years
+GROWTH_KINDS = ('qoq', 'yoy', 'ttm', 'cagr')
+DEFAULT_WINDOWS = {'qoq': 1, 'yoy': 1, 'ttm': 4, 'cagr': 3}
+
+PANEL_SQL = """
+SELECT c.ticker, c.name, f.fiscal_year, f.fiscal_quarter,
+       f.revenue/1e9 as revenue_b, f.net_income/1e9 as net_income_b, f.operating_income/1e9 as op_income_b,
+       f.gross_profit/1e9 as gross_profit_b, f.r_and_d_expenses/1e9 as rd_b, f.sg_and_a_expenses/1e9 as sga_b,
+       f.cogs/1e9 as cogs_b, f.cash_flow_ops/1e9 as operating_cash_flow, f.capex/1e9 as capex,
+       f.dividends/1e9 as dividends, f.buybacks/1e9 as buybacks, f.eps,
+       f.total_assets, f.total_liabilities, f.equity
+FROM fact_financials f
+JOIN dim_company c USING (company_id)
+"""
+
+
+def growth_frequency(kind: str, frequency: str = 'quarter') -> str:
+    """Granularity of a growth result: cagr is always annual, qoq/ttm always quarterly"""
+    if kind == 'cagr':
+        return 'annual'
+    if kind in ('qoq', 'ttm'):
+        return 'quarter'
+    return frequency
+
+
+def lag(values: np.ndarray, starts: np.ndarray, periods: int) -> np.ndarray:
+    """LAG(x, periods) OVER (PARTITION BY company ORDER BY period) on a sorted panel"""
+    n = len(values)
+    source = np.arange(n) - periods
+    valid = source >= starts
+    result = np.full(n, np.nan)
+    result[valid] = values[source[valid]]
+    return result
+
+
+def pct_change(current: np.ndarray, prior: np.ndarray) -> np.ndarray:
+    """(current - prior) / NULLIF(prior, 0), as in the growth views"""
+    return safe_divide(current - prior, prior)
+
+
+def compound_growth(current: np.ndarray, prior: np.ndarray, years: int) -> np.ndarray:
+    """(current / prior)^(1/years) - 1 where both ends are positive, else NULL"""
+    result = np.full(len(current), np.nan)
+    with np.errstate(invalid='ignore'):
+        valid = (prior > 0) & (current > 0)
+    result[valid] = np.power(current[valid] / prior[valid], 1.0 / years) - 1
+    return result
+
+
+def growth_label(metric: str, kind: str, window: int) -> str:
+    """Human-readable name of a growth measure, e.g. '7-year revenue CAGR'"""
+    name = metric.replace('_', ' ').replace('r and d', 'R&D').replace('sg and a', 'SG&A')
+    if kind == 'cagr':
+        return f"{window}-year {name} CAGR"
+    if kind == 'ttm':
+        return f"TTM {name} growth vs {window} quarters earlier"
+    if kind == 'qoq':
+        return f"QoQ {name} growth" if window == 1 else f"{window}-quarter {name} growth"
+    return f"YoY {name} growth" if window == 1 else f"{window}-year {name} growth"
+
+
+class GrowthEngine:
+    """Vectorized growth over a ticker x quarter panel"""
+
+    def __init__(self, panel: Dict[str, np.ndarray]):
+        """
+        Args:
+            panel: Column arrays with ticker, name, fiscal_year, fiscal_quarter and
+                   the GROWTH_METRICS columns (NaN for NULL), any order
+        """
+        tickers, codes = np.unique(panel['ticker'].astype(str), return_inverse=True)
+        order = sort_panel(codes, panel['fiscal_year'], panel['fiscal_quarter'])
+        self.panel = {name: values[order] for name, values in panel.items()}
+        self.tickers = tickers
+        self._codes = codes[order]
+        self._starts = group_starts(self._codes)
+        self._annual: Optional[Dict[str, np.ndarray]] = None
+        self._cache: Dict[tuple, Dict[str, np.ndarray]] = {}
+
+    @classmethod
+    def from_records(cls, records: List) -> 'GrowthEngine':
+        """Build from PANEL_SQL records"""
+        return cls(records_to_columns(records))
+
+    @classmethod
+    async def from_pool(cls, pool) -> 'GrowthEngine':
+        """Load the full panel in one query"""
+        async with pool.acquire() as conn:
+            records = await conn.fetch(PANEL_SQL)
+        return cls.from_records(records)
+
+    @classmethod
+    def from_fact_store(cls, store) -> Optional['GrowthEngine']:
+        """Build from a loaded fact store's 'quarter' table, if it has every metric"""
+        table = store.tables.get('quarter') if store.ready else None
+        if table is None or table.row_count == 0:
+            return None
+        needed = ['ticker', 'name', 'fiscal_year', 'fiscal_quarter'] + list(GROWTH_METRICS.values())
+        if not all(c in table.columns for c in needed):
+            return None
+        return cls({c: table.columns[c] for c in needed})
+
+    def _annual_panel(self) -> Dict[str, np.ndarray]:
+        """Fiscal-year aggregates: flows summed, balance-sheet metrics at year end"""
+        if self._annual is None:
+            ends, group = fiscal_year_groups(self._codes, self.panel['fiscal_year'])
+            n_groups = len(ends)
+            annual = {
+                'code': self._codes[ends],
+                'fiscal_year': self.panel['fiscal_year'][ends],
+                'quarter_count': np.bincount(group, minlength=n_groups)
+            }
+            for metric, column in GROWTH_METRICS.items():
+                if metric in STOCK_METRICS:
+                    annual[column] = self.panel[column][ends]
+                else:
+                    annual[column], _ = group_sum(self.panel[column], group, n_groups)
+            annual['starts'] = group_starts(annual['code'])
+            self._annual = annual
+        return self._annual
+
+    def compute(self, metric: str, kind: str, window: int, frequency: str = 'quarter') -> Dict[str, np.ndarray]:
+        """
+        Growth for every company and period
+
+        Args:
+            metric: Key of GROWTH_METRICS
+            kind: 'qoq', 'yoy', 'ttm' or 'cagr'
+            window: Quarters (qoq, ttm) or years (yoy, cagr) to look back
+            frequency: 'quarter' or 'annual' (cagr is always annual)
+
+        Returns:
+            Column arrays: code, fiscal_year, fiscal_quarter (quarterly only),
+            current, prior, growth - sorted by company then period
+        """
+        if metric not in GROWTH_METRICS:
+            raise ValueError(f"Unsupported growth metric: {metric}")
+        if kind not in GROWTH_KINDS:
+            raise ValueError(f"Unsupported growth kind: {kind}")
+        if window < 1:
+            raise ValueError(f"Growth window must be positive: {window}")
+
+        frequency = growth_frequency(kind, frequency)
+        key = (metric, kind, window, frequency)
+        if key in self._cache:
+            return self._cache[key]
+
+        column = GROWTH_METRICS[metric]
+        if frequency == 'annual':
+            annual = self._annual_panel()
+            # Partial fiscal years would understate annual totals, so growth is
+            # only measured between complete years
+            values = np.where(annual['quarter_count'] == 4, annual[column], np.nan)
+            prior = lag(values, annual['starts'], window)
+            growth = compound_growth(values, prior, window) if kind == 'cagr' else pct_change(values, prior)
+            result = {'code': annual['code'], 'fiscal_year': annual['fiscal_year']}
+        else:
+            values = self.panel[column]
+            if kind == 'ttm':
+                # Only compare full trailing windows; mv_financials_ttm also emits
+                # partial sums for a company's first three quarters
+                sums, counts = rolling_window(values, self._starts, 4)
+                values = np.where(counts == 4, sums, np.nan)
+            periods = window * 4 if kind == 'yoy' else window
+            prior = lag(values, self._starts, periods)
+            growth = pct_change(values, prior)
+            result = {
+                'code': self._codes,
+                'fiscal_year': self.panel['fiscal_year'],
+                'fiscal_quarter': self.panel['fiscal_quarter']
+            }
+
+        result.update({'current': values, 'prior': prior, 'growth': growth})
+        self._cache[key] = result
+        return result
+
+    def select(self, result: Dict[str, np.ndarray], tickers: List[str], fy: Optional[int] = None,
+               fq: Optional[int] = None, limit: int = 10, fy_from: Optional[int] = None,
+               fy_to: Optional[int] = None, fq_from: Optional[int] = None, fq_to: Optional[int] = None) -> np.ndarray:
+        """
+        Row indices to return for a request
+
+        With tickers: each ticker's rows, latest first, optionally filtered by
+        period or an inclusive period range (fy_from..fy_to, open-ended where
+        None) and capped at limit per ticker (template semantics). Without
+        tickers (all peers): each company's latest row with a computable growth
+        in the period filter, ranked by growth descending.
+        """
+        quarterly = 'fiscal_quarter' in result
+        mask = np.ones(len(result['code']), dtype=bool)
+        if fy is not None:
+            mask &= result['fiscal_year'] == int(fy)
+        if fq is not None and quarterly:
+            mask &= result['fiscal_quarter'] == int(fq)
+        if fy_from is not None or fy_to is not None:
+            periods = result['fiscal_year'].astype(np.int64) * 10
+            if quarterly:
+                periods += result['fiscal_quarter'].astype(np.int64)
+            if fy_from is not None:
+                mask &= periods >= int(fy_from) * 10 + (int(fq_from or 1) if quarterly else 0)
+            if fy_to is not None:
+                mask &= periods <= int(fy_to) * 10 + (int(fq_to or 4) if quarterly else 0)
+
+        if tickers:
+            rows = []
+            for ticker in sorted(set(tickers)):
+                code = np.searchsorted(self.tickers, ticker)
+                if code >= len(self.tickers) or self.tickers[code] != ticker:
+                    continue
+                rows.append(np.flatnonzero(mask & (result['code'] == code))[::-1][:limit])
+            return np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+
+        candidates = np.flatnonzero(mask & ~np.isnan(result['growth']))
+        if candidates.size == 0:
+            return candidates
+        codes = result['code'][candidates]
+        is_last = np.ones(len(candidates), dtype=bool)
+        is_last[:-1] = codes[1:] != codes[:-1]
+        latest = candidates[is_last]
+        return latest[np.argsort(-result['growth'][latest], kind='stable')][:limit]
+
+    def answer(self, spec: Dict, params: Dict) -> List[Dict]:
+        """
+        Answer a planned growth task
+
+        Args:
+            spec: Growth spec from the decomposer (metric, kind, window, frequency)
+            params: Planned params (tickers, fy, fq, fy_from/fy_to, fq_from/fq_to, limit)
+
+        Returns:
+            List of rows: ticker, name, fiscal_year, [fiscal_quarter], metric,
+            current_value, prior_value, growth, growth_label
+        """
+        metric = spec.get('metric', 'revenue')
+        kind = spec.get('kind', 'yoy')
+        window = int(spec.get('window') or DEFAULT_WINDOWS[kind])
+        result = self.compute(metric, kind, window, spec.get('frequency', 'quarter'))
+
+        rows = self.select(
+            result,
+            params.get('tickers') or [],
+            params.get('fy'),
+            params.get('fq'),
+            int(params.get('limit') or 10),
+            **{key: params.get(key) for key in ('fy_from', 'fy_to', 'fq_from', 'fq_to')}
+        )
+
+        label = growth_label(metric, kind, window)
+        names = self._names()
+        has_quarter = 'fiscal_quarter' in result
+        output = []
+        for row in rows.tolist():
+            code = int(result['code'][row])
+            item = {
+                'ticker': str(self.tickers[code]),
+                'name': names[code],
+                'fiscal_year': int(result['fiscal_year'][row])
+            }
+            if has_quarter:
+                item['fiscal_quarter'] = int(result['fiscal_quarter'][row])
+            item.update({
+                'metric': metric,
+                'current_value': to_python(result['current'][row]),
+                'prior_value': to_python(result['prior'][row]),
+                'growth': to_python(result['growth'][row]),
+                'growth_label': label
+            })
+            output.append(item)
+        return output
+
+    def _names(self) -> List[str]:
+        """Company name per ticker code"""
+        names = [None] * len(self.tickers)
+        if 'name' in self.panel:
+            first_rows = np.flatnonzero(np.r_[True, self._codes[1:] != self._codes[:-1]])
+            for row in first_rows.tolist():
+                names[int(self._codes[row])] = self.panel['name'][row]
+        return [n if n is not None else str(t) for n, t in zip(names, self.tickers)]
+
+
+class GrowthService:
+    """Keeps a GrowthEngine over the freshest available panel"""
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('GROWTH_PANEL_TTL_SECONDS', '300'))
+        self.engine: Optional[GrowthEngine] = None
+        self._source: Optional[tuple] = None
+        self._loaded_at = 0.0
+
+    async def get_engine(self, pool) -> GrowthEngine:
+        """Engine over the fact store snapshot if loaded, else a cached DB load"""
+        from analytics.fact_store import fact_store
+
+        if fact_store.ready:
+            source = ('fact_store', fact_store.data_version, fact_store.loaded_at)
+            if self._source != source:
+                engine = GrowthEngine.from_fact_store(fact_store)
+                if engine is not None:
+                    self.engine, self._source, self._loaded_at = engine, source, time.time()
+            if self._source == source:
+                return self.engine
+
+        if self.engine is None or self._source != ('db',) or time.time() - self._loaded_at > self.ttl_seconds:
+            self.engine = await GrowthEngine.from_pool(pool)
+            self._source, self._loaded_at = ('db',), time.time()
+        return self.engine
+
+    async def answer(self, plan: Dict, pool) -> List[Dict]:
+        """Answer a plan routed to the growth engine"""
+        engine = await self.get_engine(pool)
+        return engine.answer(plan['growth'], plan.get('params', {}))
+
+
+# Global service instance (panel loaded lazily on the first growth request)
+growth_service = GrowthService()
@@ -0,0 +1,56 @@
+"""
+Panel helpers shared by the analytics engines
+
+A panel is the company x period grid the analytics modules work on: one
+row per (company, fiscal_year, fiscal_quarter), one float64 array per metric.
+"""
+from typing import Dict, List
+import numpy as np
+
+
+def to_float_array(records: List, column: str) -> np.ndarray:
+    """Convert a record column (Decimal/None) to a float64 array with NaN for NULL"""
+    return np.array(
+        [np.nan if r[column] is None else float(r[column]) for r in records],
+        dtype=np.float64
+    )
+
+
+def to_python(value):
+    """Convert a NumPy scalar to the equivalent DB-driver value (NaN -> None)"""
+    if isinstance(value, np.floating):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def records_to_columns(records: List) -> Dict[str, np.ndarray]:
+    """
+    Convert asyncpg records (or dicts) to a dict of column arrays
+
+    Text columns stay object arrays, fiscal period keys become int32 and every
+    other column becomes float64 with NaN for NULL.
+    """
+    if not records:
+        return {}
+
+    columns = {}
+    for name in records[0].keys():
+        sample = next((r[name] for r in records if r[name] is not None), None)
+        if name in ('fiscal_year', 'fiscal_quarter', 'company_id'):
+            columns[name] = np.array([r[name] or 0 for r in records], dtype=np.int32)
+        elif isinstance(sample, str):
+            columns[name] = np.array([r[name] for r in records], dtype=object)
+        else:
+            columns[name] = to_float_array(records, name)
+    return columns
+
+
+def sort_panel(company_ids: np.ndarray, fiscal_year: np.ndarray, fiscal_quarter: np.ndarray) -> np.ndarray:
+    """Row order that sorts the panel by company, then period ascending"""
+    return np.lexsort((fiscal_quarter, fiscal_year, company_ids))
@@ -0,0 +1,250 @@
+"""
+Vectorized ratio and TTM computation engine
+
+Computes every ratio the SQL layer defines (vw_ratios_canonical,
+mv_financials_ttm / mv_ratios_ttm, mv_financials_annual / mv_ratios_annual)
+for the whole company x quarter panel in one batch. Used as the verification
+oracle for the views and as the source for the precomputed calc_ratios_*
+tables.
+"""
+from typing import Dict, List
+import numpy as np
+from analytics.panel import records_to_columns, sort_panel
+
+
+# Panel load: fact_financials with the reconciled (authoritative) gross profit
+PANEL_SQL = """
+SELECT f.company_id, f.fiscal_year, f.fiscal_quarter,
+       f.revenue, g.gross_profit_authoritative AS gross_profit, f.cogs,
+       f.operating_income, f.net_income, f.r_and_d_expenses, f.sg_and_a_expenses, f.capex,
+       f.total_assets, f.total_liabilities, f.equity
+FROM fact_financials f
+LEFT JOIN vw_gross_profit_reconciled g USING (company_id, fiscal_year, fiscal_quarter)
+"""
+
+# Flow metrics are summed over a window; stock metrics are averaged or taken at period end
+FLOW_METRICS = [
+    'revenue', 'gross_profit', 'cogs', 'operating_income', 'net_income',
+    'r_and_d_expenses', 'sg_and_a_expenses', 'capex'
+]
+STOCK_METRICS = ['total_assets', 'total_liabilities', 'equity']
+
+# Ratio definitions: name -> (numerator, denominator)
+QUARTER_RATIOS = {
+    'roe': ('net_income', 'equity'),
+    'roa': ('net_income', 'total_assets'),
+    'gross_margin': ('gross_profit', 'revenue'),
+    'operating_margin': ('operating_income', 'revenue'),
+    'net_margin': ('net_income', 'revenue'),
+    'debt_to_equity': ('total_liabilities', 'equity'),
+    'debt_to_assets': ('total_liabilities', 'total_assets'),
+    'rnd_to_revenue': ('r_and_d_expenses', 'revenue'),
+    'sgna_to_revenue': ('sg_and_a_expenses', 'revenue')
+}
+
+TTM_RATIOS = {
+    'gross_margin_ttm': ('gross_profit_ttm_from_cogs', 'revenue_ttm'),
+    'operating_margin_ttm': ('operating_income_ttm', 'revenue_ttm'),
+    'net_margin_ttm': ('net_income_ttm', 'revenue_ttm'),
+    'roe_ttm': ('net_income_ttm', 'equity_avg_ttm'),
+    'roa_ttm': ('net_income_ttm', 'total_assets_avg_ttm')
+}
+
+ANNUAL_RATIOS = {
+    'gross_margin_annual': ('gross_profit_annual', 'revenue_annual'),
+    'operating_margin_annual': ('operating_income_annual', 'revenue_annual'),
+    'net_margin_annual': ('net_income_annual', 'revenue_annual'),
+    'roe_annual_avg_equity': ('net_income_annual', 'equity_avg_fy'),
+    'roe_annual_end_equity': ('net_income_annual', 'equity_eoy'),
+    'roa_annual': ('net_income_annual', 'total_assets_avg_fy'),
+    'debt_to_equity_annual': ('total_liabilities_eoy', 'equity_eoy'),
+    'debt_to_assets_annual': ('total_liabilities_eoy', 'total_assets_eoy'),
+    'rnd_to_revenue_annual': ('r_and_d_expenses_annual', 'revenue_annual'),
+    'sgna_to_revenue_annual': ('sg_and_a_expenses_annual', 'revenue_annual')
+}
+
+
+def safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """numerator / NULLIF(denominator, 0) with NaN standing in for NULL"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = numerator / denominator
+    result[(denominator == 0) | np.isnan(denominator)] = np.nan
+    return result
+
+
+def group_starts(groups: np.ndarray) -> np.ndarray:
+    """For a panel sorted by group, the index of each row's first group row"""
+    n = len(groups)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = groups[1:] != groups[:-1]
+    return np.maximum.accumulate(np.where(is_start, np.arange(n), 0))
+
+
+def rolling_window(values: np.ndarray, starts: np.ndarray, window: int):
+    """
+    NULL-aware rolling SUM and COUNT over the last `window` rows of each group
+
+    Equivalent to SUM(x) OVER (PARTITION BY g ORDER BY period ROWS BETWEEN
+    window-1 PRECEDING AND CURRENT ROW) on a panel sorted by group and period.
+    Returns (sums, counts); sums are NaN where the window holds no values.
+    """
+    n = len(values)
+    present = ~np.isnan(values)
+    cum_sum = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+    cum_count = np.concatenate(([0], np.cumsum(present)))
+
+    end = np.arange(n) + 1
+    begin = np.maximum(end - window, starts)
+
+    sums = cum_sum[end] - cum_sum[begin]
+    counts = cum_count[end] - cum_count[begin]
+    sums[counts == 0] = np.nan
+    return sums, counts
+
+
+def fiscal_year_groups(company_ids: np.ndarray, years: np.ndarray):
+    """
+    Group a panel sorted by (company, year, quarter) into fiscal years
+
+    Returns (ends, group): the index of each group's last row (the fiscal
+    year-end quarter) and each row's group number.
+    """
+    n = len(company_ids)
+    is_end = np.ones(n, dtype=bool)
+    is_end[:-1] = (company_ids[1:] != company_ids[:-1]) | (years[1:] != years[:-1])
+    ends = np.flatnonzero(is_end)
+    group = np.cumsum(np.concatenate(([0], is_end[:-1]))) if n else np.zeros(0, dtype=np.int64)
+    return ends, group
+
+
+def group_sum(values: np.ndarray, group: np.ndarray, n_groups: int):
+    """NULL-aware SUM and COUNT per group; sums are NaN where a group holds no values"""
+    present = ~np.isnan(values)
+    sums = np.bincount(group, weights=np.where(present, values, 0.0), minlength=n_groups)
+    counts = np.bincount(group, weights=present.astype(np.float64), minlength=n_groups)
+    sums[counts == 0] = np.nan
+    return sums, counts
+
+
+class RatioEngine:
+    """Batch ratio/TTM/annual computation over a company x quarter panel"""
+
+    def __init__(self, panel: Dict[str, np.ndarray]):
+        """
+        Args:
+            panel: Column arrays with company_id, fiscal_year, fiscal_quarter and
+                   the FLOW_METRICS / STOCK_METRICS (NaN for NULL), any order
+        """
+        order = sort_panel(panel['company_id'], panel['fiscal_year'], panel['fiscal_quarter'])
+        self.panel = {name: values[order] for name, values in panel.items()}
+        self.keys = {k: self.panel[k] for k in ('company_id', 'fiscal_year', 'fiscal_quarter')}
+        self._starts = group_starts(self.panel['company_id'])
+
+    @classmethod
+    def from_records(cls, records: List) -> 'RatioEngine':
+        """Build from PANEL_SQL records"""
+        return cls(records_to_columns(records))
+
+    @classmethod
+    async def from_pool(cls, pool) -> 'RatioEngine':
+        """Load the full panel in one query"""
+        async with pool.acquire() as conn:
+            records = await conn.fetch(PANEL_SQL)
+        return cls.from_records(records)
+
+    def quarterly_ratios(self) -> Dict[str, np.ndarray]:
+        """Per-quarter ratios (vw_ratios_canonical)"""
+        result = dict(self.keys)
+        for name, (num, den) in QUARTER_RATIOS.items():
+            result[name] = safe_divide(self.panel[num], self.panel[den])
+        return result
+
+    def ttm(self, window: int = 4) -> Dict[str, np.ndarray]:
+        """Trailing sums/averages and TTM ratios (mv_financials_ttm + mv_ratios_ttm)"""
+        result = dict(self.keys)
+
+        for metric in FLOW_METRICS:
+            sums, _ = rolling_window(self.panel[metric], self._starts, window)
+            name = 'sgna_ttm' if metric == 'sg_and_a_expenses' else f'{metric}_ttm'
+            result[name] = sums
+
+        for metric in ('total_assets', 'equity'):
+            sums, counts = rolling_window(self.panel[metric], self._starts, window)
+            result[f'{metric}_avg_ttm'] = safe_divide(sums, counts.astype(np.float64))
+
+        # mv_ratios_ttm derives gross margin from COGS, not reconciled gross profit
+        result['gross_profit_ttm_from_cogs'] = result['revenue_ttm'] - result['cogs_ttm']
+        for name, (num, den) in TTM_RATIOS.items():
+            result[name] = safe_divide(result[num], result[den])
+        del result['gross_profit_ttm_from_cogs']
+
+        return result
+
+    def annual(self) -> Dict[str, np.ndarray]:
+        """Fiscal-year aggregates and ratios (mv_financials_annual + mv_ratios_annual)"""
+        company_ids = self.panel['company_id']
+        years = self.panel['fiscal_year']
+
+        # Rows are sorted by (company, year, quarter), so groups are contiguous
+        # and the last row of each group is the fiscal year-end quarter
+        if len(company_ids) == 0:
+            return {}
+        ends, group = fiscal_year_groups(company_ids, years)
+        n_groups = len(ends)
+
+        result = {
+            'company_id': company_ids[ends],
+            'fiscal_year': years[ends],
+            'quarter_count': np.bincount(group, minlength=n_groups)
+        }
+
+        for metric in FLOW_METRICS:
+            result[f'{metric}_annual'], _ = group_sum(self.panel[metric], group, n_groups)
+
+        for metric in STOCK_METRICS:
+            result[f'{metric}_eoy'] = self.panel[metric][ends]
+
+        for metric in ('total_assets', 'equity'):
+            sums, counts = group_sum(self.panel[metric], group, n_groups)
+            result[f'{metric}_avg_fy'] = safe_divide(sums, counts)
+
+        for name, (num, den) in ANNUAL_RATIOS.items():
+            result[name] = safe_divide(result[num], result[den])
+
+        return result
+
+
+def compare(expected: Dict[str, np.ndarray], actual: Dict[str, np.ndarray], keys: List[str],
+            columns: List[str], tolerance: float = 1e-9) -> Dict[str, Dict]:
+    """
+    Compare two keyed column sets (e.g. engine output vs a SQL view)
+
+    Returns per-column stats: rows compared, mismatches beyond tolerance
+    (relative for large values), NULL mismatches and the max abs difference.
+    """
+    index = {tuple(int(expected[k][i]) for k in keys): i for i in range(len(expected[keys[0]]))}
+    pairs = [
+        (index[key], j) for j, key in
+        enumerate(zip(*(actual[k].astype(np.int64) for k in keys)))
+        if key in index
+    ]
+    exp_rows = np.array([p[0] for p in pairs], dtype=np.int64)
+    act_rows = np.array([p[1] for p in pairs], dtype=np.int64)
+
+    report = {}
+    for column in columns:
+        e = expected[column][exp_rows]
+        a = actual[column][act_rows]
+        null_mismatch = np.isnan(e) != np.isnan(a)
+        both = ~np.isnan(e) & ~np.isnan(a)
+        diff = np.abs(e[both] - a[both])
+        scale = np.maximum(np.abs(e[both]), 1.0)
+        report[column] = {
+            'rows': len(pairs),
+            'mismatches': int(np.sum(diff > tolerance * scale)),
+            'null_mismatches': int(np.sum(null_mismatch)),
+            'max_abs_diff': float(diff.max()) if diff.size else 0.0
+        }
+    return report
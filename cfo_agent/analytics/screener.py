@@ -0,0 +1,359 @@
+"""
+Multi-predicate screening engine
+
+Answers "companies with net margin > 20% and revenue growth > 10% in FY2024"
+over the whole universe. For every fiscal period the index keeps each
+metric's values pre-sorted, so a predicate is a binary search, an AND/OR
+tree is a handful of boolean-mask operations over the period's companies,
+and top-K is a walk down the pre-sorted order of the sort metric.
+"""
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from analytics.panel import records_to_columns, to_python
+
+
+# Screenable metrics per frequency: name -> (fact store table, column)
+SCREEN_METRICS = {
+    'annual': {
+        'revenue': ('annual', 'revenue_b'),
+        'net_income': ('annual', 'net_income_b'),
+        'operating_income': ('annual', 'op_income_b'),
+        'gross_profit': ('annual', 'gross_profit_b'),
+        'eps': ('annual', 'eps'),
+        'gross_margin': ('annual', 'gross_margin_annual'),
+        'operating_margin': ('annual', 'operating_margin_annual'),
+        'net_margin': ('annual', 'net_margin_annual'),
+        'roe': ('annual', 'roe_annual'),
+        'roa': ('annual', 'roa_annual'),
+        'debt_to_equity': ('annual', 'debt_to_equity_annual'),
+        'debt_to_assets': ('annual', 'debt_to_assets_annual'),
+        'rnd_to_revenue': ('annual', 'rnd_to_revenue_annual'),
+        'sgna_to_revenue': ('annual', 'sgna_to_revenue_annual'),
+        'revenue_growth': ('growth_annual', 'revenue_yoy'),
+        'net_income_growth': ('growth_annual', 'net_income_yoy'),
+        'revenue_cagr_3y': ('growth_annual', 'revenue_cagr_3y'),
+        'revenue_cagr_5y': ('growth_annual', 'revenue_cagr_5y')
+    },
+    'quarter': {
+        'revenue': ('quarter', 'revenue_b'),
+        'net_income': ('quarter', 'net_income_b'),
+        'operating_income': ('quarter', 'op_income_b'),
+        'gross_profit': ('quarter', 'gross_profit_b'),
+        'eps': ('quarter', 'eps'),
+        'gross_margin': ('quarter', 'gross_margin'),
+        'operating_margin': ('quarter', 'operating_margin'),
+        'net_margin': ('quarter', 'net_margin'),
+        'roe': ('quarter', 'roe'),
+        'roa': ('quarter', 'roa'),
+        'debt_to_equity': ('quarter', 'debt_to_equity'),
+        'debt_to_assets': ('quarter', 'debt_to_assets'),
+        'rnd_to_revenue': ('quarter', 'rnd_to_revenue'),
+        'sgna_to_revenue': ('quarter', 'sgna_to_revenue'),
+        'revenue_growth': ('growth_quarter', 'revenue_yoy'),
+        'net_income_growth': ('growth_quarter', 'net_income_yoy'),
+        'revenue_qoq': ('growth_quarter', 'revenue_qoq'),
+        'net_income_qoq': ('growth_quarter', 'net_income_qoq')
+    }
+}
+
+# Metrics held in $B, and plain numbers; every other metric is a fraction shown as %
+AMOUNT_METRICS = {'revenue', 'net_income', 'operating_income', 'gross_profit'}
+PLAIN_METRICS = {'eps', 'debt_to_equity'}
+
+OPERATORS = ('>', '>=', '<', '<=', 'between')
+MAX_PREDICATES = 20
+
+
+def describe_screen(node: Dict) -> str:
+    """Readable form of a predicate tree, e.g. 'net margin > 20.0% and revenue > $100.0B'"""
+    for combinator in ('and', 'or'):
+        if combinator in node:
+            parts = [describe_screen(child) for child in node[combinator]]
+            text = f" {combinator} ".join(parts)
+            return f"({text})" if combinator == 'or' and len(parts) > 1 else text
+
+    metric = node['metric']
+    name = metric.replace('_', ' ').replace('rnd', 'R&D').replace('sgna', 'SG&A')
+
+    def fmt(value):
+        if metric in AMOUNT_METRICS:
+            return f"${value:.1f}B"
+        if metric in PLAIN_METRICS:
+            return f"{value:.2f}"
+        return f"{value * 100:.1f}%"
+
+    if node['op'] == 'between':
+        low, high = node['value']
+        return f"{name} between {fmt(low)} and {fmt(high)}"
+    return f"{name} {node['op']} {fmt(node['value'])}"
+
+
+def predicate_metrics(node: Dict) -> List[str]:
+    """Metrics referenced by a predicate tree, in order of first use"""
+    if 'metric' in node:
+        return [node['metric']]
+    metrics = []
+    for child in node.get('and', []) + node.get('or', []):
+        for metric in predicate_metrics(child):
+            if metric not in metrics:
+                metrics.append(metric)
+    return metrics
+
+
+class ScreenIndex:
+    """Per-period sorted metric arrays for one frequency ('annual' or 'quarter')"""
+
+    def __init__(self, frequency: str, tables: Dict[str, Dict[str, np.ndarray]]):
+        """
+        Args:
+            frequency: 'annual' or 'quarter'
+            tables: Fact store tables as column arrays ('annual' + 'growth_annual'
+                    or 'quarter' + 'growth_quarter')
+        """
+        self.frequency = frequency
+        self.metrics = SCREEN_METRICS[frequency]
+        base = tables[frequency]
+        n = len(base['ticker'])
+
+        self.tickers = base['ticker'].astype(str)
+        self.names = base['name'] if 'name' in base else self.tickers
+        self.years = base['fiscal_year'].astype(np.int32)
+        self.quarters = base['fiscal_quarter'].astype(np.int32) if frequency == 'quarter' else np.zeros(n, dtype=np.int32)
+
+        # Align every metric column to the base table's rows
+        keys = list(zip(self.tickers.tolist(), self.years.tolist(), self.quarters.tolist()))
+        aligned = {}
+        for table_name in {table for table, _ in self.metrics.values()}:
+            table = tables.get(table_name)
+            if table is None or table_name == frequency:
+                continue
+            quarters = table['fiscal_quarter'] if frequency == 'quarter' else np.zeros(len(table['ticker']), dtype=np.int32)
+            position = {
+                key: i for i, key in
+                enumerate(zip(table['ticker'].astype(str).tolist(), table['fiscal_year'].tolist(), quarters.tolist()))
+            }
+            rows = np.array([position.get(key, -1) for key in keys], dtype=np.int64)
+            aligned[table_name] = rows
+
+        self.columns: Dict[str, np.ndarray] = {}
+        for metric, (table_name, column) in self.metrics.items():
+            table = tables.get(table_name)
+            if table is None or column not in table:
+                continue
+            if table_name == frequency:
+                self.columns[metric] = np.asarray(table[column], dtype=np.float64)
+            else:
+                rows = aligned[table_name]
+                values = np.full(n, np.nan)
+                values[rows >= 0] = table[column][rows[rows >= 0]]
+                self.columns[metric] = values
+
+        # Period slices (rows ordered by ticker) and per-metric sorted orders
+        order = np.lexsort((self.tickers, self.quarters, self.years))
+        period_keys = self.years[order].astype(np.int64) * 10 + self.quarters[order]
+        bounds = np.flatnonzero(np.r_[True, period_keys[1:] != period_keys[:-1], True])
+
+        self.periods: Dict[Tuple[int, int], np.ndarray] = {}
+        self._sorted: Dict[Tuple[int, int], Dict[str, Tuple[np.ndarray, np.ndarray]]] = {}
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            rows = order[start:end]
+            period = (int(self.years[rows[0]]), int(self.quarters[rows[0]]))
+            self.periods[period] = rows
+            self._sorted[period] = {}
+            for metric, values in self.columns.items():
+                period_values = values[rows]
+                present = np.flatnonzero(~np.isnan(period_values))
+                positions = present[np.argsort(period_values[present], kind='stable')]
+                self._sorted[period][metric] = (period_values[positions], positions)
+
+    def latest_period(self) -> Optional[Tuple[int, int]]:
+        """Most recent period that at least half the universe has reported"""
+        if not self.periods:
+            return None
+        widest = max(len(rows) for rows in self.periods.values())
+        return max(p for p, rows in self.periods.items() if len(rows) * 2 >= widest)
+
+    def validate(self, node: Dict, depth: int = 0) -> int:
+        """Check a predicate tree; returns the number of predicates"""
+        if depth > 4:
+            raise ValueError("Screen is nested too deeply")
+        combinators = [c for c in ('and', 'or') if c in node]
+        if combinators:
+            children = node[combinators[0]]
+            if len(combinators) > 1 or not isinstance(children, list) or not children:
+                raise ValueError("Each screen node needs exactly one non-empty 'and' or 'or' list")
+            count = sum(self.validate(child, depth + 1) for child in children)
+        else:
+            metric, op, value = node.get('metric'), node.get('op'), node.get('value')
+            if metric not in self.columns:
+                raise ValueError(f"Unknown {self.frequency} screen metric: {metric}. Available: {sorted(self.columns)}")
+            if op not in OPERATORS:
+                raise ValueError(f"Unsupported screen operator: {op}. Use one of {list(OPERATORS)}")
+            if op == 'between':
+                if not isinstance(value, (list, tuple)) or len(value) != 2:
+                    raise ValueError("'between' needs a [low, high] value")
+            elif not isinstance(value, (int, float)):
+                raise ValueError(f"Screen value for {metric} must be a number")
+            count = 1
+        if depth == 0 and count > MAX_PREDICATES:
+            raise ValueError(f"Screens are limited to {MAX_PREDICATES} predicates")
+        return count
+
+    def _evaluate(self, node: Dict, period: Tuple[int, int], size: int) -> np.ndarray:
+        """Boolean mask over the period's rows"""
+        if 'and' in node or 'or' in node:
+            children = node.get('and') or node.get('or')
+            masks = [self._evaluate(child, period, size) for child in children]
+            combine = np.logical_and if 'and' in node else np.logical_or
+            return combine.reduce(masks) if len(masks) > 1 else masks[0]
+
+        values, positions = self._sorted[period][node['metric']]
+        op, value = node['op'], node['value']
+        if op == '>':
+            selected = positions[np.searchsorted(values, value, side='right'):]
+        elif op == '>=':
+            selected = positions[np.searchsorted(values, value, side='left'):]
+        elif op == '<':
+            selected = positions[:np.searchsorted(values, value, side='left')]
+        elif op == '<=':
+            selected = positions[:np.searchsorted(values, value, side='right')]
+        else:
+            low, high = value
+            selected = positions[np.searchsorted(values, low, side='left'):np.searchsorted(values, high, side='right')]
+
+        mask = np.zeros(size, dtype=bool)
+        mask[selected] = True
+        return mask
+
+    def screen(self, where: Dict, fiscal_year: Optional[int] = None, fiscal_quarter: Optional[int] = None,
+               sort: Optional[str] = None, order: str = 'desc', limit: int = 25) -> Dict:
+        """
+        Run a screen for one period
+
+        Args:
+            where: Predicate tree - {'and': [...]}, {'or': [...]} or a leaf
+                   {'metric': 'net_margin', 'op': '>', 'value': 0.2}
+            fiscal_year / fiscal_quarter: Period (None = latest reported period)
+            sort: Metric to rank by (default: first metric in the screen)
+            order: 'desc' or 'asc'
+            limit: Top-K rows to return
+
+        Returns:
+            Dict with 'period', 'matched' (total matches) and 'rows'
+        """
+        self.validate(where)
+        metrics = predicate_metrics(where)
+        sort = sort or metrics[0]
+        if sort not in self.columns:
+            raise ValueError(f"Unknown {self.frequency} sort metric: {sort}")
+        if order not in ('asc', 'desc'):
+            raise ValueError("order must be 'asc' or 'desc'")
+
+        if fiscal_year is None:
+            period = self.latest_period()
+        elif self.frequency == 'quarter' and fiscal_quarter is None:
+            period = max((p for p in self.periods if p[0] == int(fiscal_year)), default=None)
+        else:
+            period = (int(fiscal_year), int(fiscal_quarter or 0) if self.frequency == 'quarter' else 0)
+
+        result = {'period': {'fiscal_year': None, 'fiscal_quarter': None}, 'matched': 0, 'rows': []}
+        if period not in self.periods:
+            return result
+        result['period'] = {'fiscal_year': period[0], 'fiscal_quarter': period[1] or None}
+
+        rows = self.periods[period]
+        mask = self._evaluate(where, period, len(rows))
+        matched = int(mask.sum())
+
+        # Top-K: walk the pre-sorted order of the sort metric, NULL sort values last
+        _, positions = self._sorted[period][sort]
+        hits = positions[mask[positions]]
+        if order == 'desc':
+            hits = hits[::-1]
+        if len(hits) < matched:
+            unsorted = np.flatnonzero(mask & np.isnan(self.columns[sort][rows]))
+            hits = np.concatenate([hits, unsorted])
+        hits = hits[:max(int(limit), 0)]
+
+        columns = metrics + ([sort] if sort not in metrics else [])
+        output = []
+        for position in hits.tolist():
+            row = int(rows[position])
+            item = {
+                'ticker': str(self.tickers[row]),
+                'name': self.names[row],
+                'fiscal_year': int(self.years[row])
+            }
+            if self.frequency == 'quarter':
+                item['fiscal_quarter'] = int(self.quarters[row])
+            for metric in columns:
+                item[metric] = to_python(self.columns[metric][row])
+            output.append(item)
+
+        result['matched'] = matched
+        result['rows'] = output
+        return result
+
+
+class ScreeningService:
+    """Keeps screen indexes over the freshest available snapshot"""
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('SCREEN_INDEX_TTL_SECONDS', '300'))
+        self.indexes: Dict[str, ScreenIndex] = {}
+        self._sources: Dict[str, tuple] = {}
+        self._loaded_at: Dict[str, float] = {}
+
+    async def get_index(self, pool, frequency: str) -> ScreenIndex:
+        """Index over the fact store snapshot if loaded, else a cached DB load"""
+        from analytics.fact_store import fact_store, TABLE_SOURCES
+
+        if frequency not in SCREEN_METRICS:
+            raise ValueError(f"Unknown screen frequency: {frequency}")
+        table_names = [frequency, f'growth_{frequency}']
+
+        if fact_store.ready and all(name in fact_store.tables for name in table_names):
+            source = ('fact_store', fact_store.data_version, fact_store.loaded_at)
+            if self._sources.get(frequency) != source:
+                tables = {name: fact_store.tables[name].columns for name in table_names}
+                self.indexes[frequency] = ScreenIndex(frequency, tables)
+                self._sources[frequency] = source
+            return self.indexes[frequency]
+
+        stale = time.time() - self._loaded_at.get(frequency, 0.0) > self.ttl_seconds
+        if frequency not in self.indexes or self._sources.get(frequency) != ('db',) or stale:
+            tables = {}
+            async with pool.acquire() as conn:
+                for name in table_names:
+                    tables[name] = records_to_columns(await conn.fetch(TABLE_SOURCES[name]))
+            self.indexes[frequency] = ScreenIndex(frequency, tables)
+            self._sources[frequency] = ('db',)
+            self._loaded_at[frequency] = time.time()
+        return self.indexes[frequency]
+
+    async def screen(self, pool, where: Dict, frequency: str = 'annual', **options) -> Dict:
+        """Run a screen (see ScreenIndex.screen for options)"""
+        index = await self.get_index(pool, frequency)
+        return index.screen(where, **options)
+
+    async def answer(self, plan: Dict, pool) -> List[Dict]:
+        """Answer a plan routed to the screening engine"""
+        spec = plan['screen']
+        params = plan.get('params', {})
+        result = await self.screen(
+            pool,
+            spec['where'],
+            spec.get('frequency', 'annual'),
+            fiscal_year=params.get('fy'),
+            fiscal_quarter=params.get('fq'),
+            sort=spec.get('sort'),
+            order=spec.get('order', 'desc'),
+            limit=params.get('limit', 25)
+        )
+        return result['rows']
+
+
+# Global service instance (indexes built lazily on the first screen)
+screening_service = ScreeningService()
@@ -2,29 +2,62 @@
 FastAPI service for CFO Agent
 """
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+import asyncio
+import json
+import os
+import time
 import uvicorn
 
 from graph import cfo_agent_graph
+from options import make_options, REQUEST_DEADLINE_SECONDS
 from db.pool import db_pool
 from db.whitelist import load_schema_cache
 from db.resolve import load_ticker_cache
 from hitl import hitl_gate
 from viz_data_fetcher import VizDataFetcher  # NEW: Visualization support
+from analytics.fact_store import fact_store
+from analytics.screener import screening_service
+from memory import session_memory
+from singleflight import SingleFlight, normalize_question
+from batch import BatchRunner, MAX_BATCH_QUESTIONS
+from admission import AdmissionController, AdmittedStreamingResponse, Overloaded, retry_after_header
+from metrics import registry, request_latency, requests_total
+from cost_gate import cost_gate
+from learned_templates import learned_templates
+from export import EXPORT_FORMATS, decode_token, make_encoder, page_query, plan_export, stream_export
 
 
 # Pydantic models
 class QueryRequest(BaseModel):
     question: str
     session_id: Optional[str] = "default"
-    enable_hitl: Optional[bool] = False
+    enable_hitl: Optional[bool] = None  # None = HITL_ENABLED
+    allow_generative: Optional[bool] = False  # Fall back to generative SQL when no template fits
+    timeout_seconds: Optional[float] = None  # Request deadline (default REQUEST_DEADLINE_SECONDS)
+    debug: Optional[bool] = False  # Return SQL/params/trace alongside the answer
+    bundle: Optional[bool] = None  # One round trip for all SQL and citations (default SQL_BUNDLE)
 
 
 class QueryResponse(BaseModel):
     response: str
     session_id: str
     viz_metadata: Optional[Dict[str, Any]] = None  # NEW: Optional visualization metadata
+    debug: Optional[Dict[str, Any]] = None
+
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    session_id: Optional[str] = "default"
+    allow_generative: Optional[bool] = False
+    debug: Optional[bool] = False
+
+
+class ApprovalDecision(BaseModel):
+    approved: bool
+    reason: Optional[str] = None
 
 
 # NEW: Visualization models (completely separate from existing)
@@ -40,6 +73,28 @@ class VisualizationResponse(BaseModel):
     chart_config: dict
 
 
+class ExportRequest(BaseModel):
+    surface: str
+    columns: Optional[List[str]] = None  # default: every column in the schema cache
+    format: Optional[str] = "ndjson"  # csv | ndjson | arrow
+    ticker: Optional[str] = None
+    fy_from: Optional[int] = None
+    fy_to: Optional[int] = None
+    after: Optional[str] = None  # resume token: key of the last row already read
+    max_rows: Optional[int] = None  # stop after this many rows (default: whole surface)
+
+
+# Screening models
+class ScreenRequest(BaseModel):
+    where: Dict[str, Any]
+    frequency: Optional[str] = "annual"
+    fiscal_year: Optional[int] = None
+    fiscal_quarter: Optional[int] = None
+    sort: Optional[str] = None
+    order: Optional[str] = "desc"
+    limit: Optional[int] = 25
+
+
 # FastAPI app
 app = FastAPI(
     title="CFO Agent API",
@@ -50,14 +105,60 @@ app = FastAPI(
 # NEW: Global visualization fetcher (initialized in startup)
 viz_fetcher = None
 
+# Identical concurrent /ask requests share one agent run (ASK_COALESCE=false to disable)
+ask_flight = SingleFlight("ask") if os.getenv('ASK_COALESCE', 'true').lower() == 'true' else None
+
+# HITL approvals are parked in one worker process (see hitl.py)
+API_WORKERS = int(os.getenv('API_WORKERS', '1'))
+
+# Batch runner for /ask/batch (shares the agent graph's nodes)
+batch_runner = BatchRunner(cfo_agent_graph)
+
+# Admission control: bounded in-flight work per endpoint; visualization yields to /ask
+ask_admission = AdmissionController(
+    "ask",
+    max_inflight=int(os.getenv('ASK_MAX_INFLIGHT', '16')),
+    max_queue=int(os.getenv('ASK_MAX_QUEUE', '32'))
+)
+viz_admission = AdmissionController(
+    "visualize",
+    max_inflight=int(os.getenv('VIZ_MAX_INFLIGHT', '4')),
+    max_queue=int(os.getenv('VIZ_MAX_QUEUE', '8')),
+    yield_to=ask_admission
+)
+# Exports hold a connection for the whole stream: few at a time, behind /ask
+export_admission = AdmissionController(
+    "export",
+    max_inflight=int(os.getenv('EXPORT_MAX_INFLIGHT', '2')),
+    max_queue=int(os.getenv('EXPORT_MAX_QUEUE', '4')),
+    yield_to=ask_admission
+)
+# A batch holds one slot for its whole stream (BATCH_CONCURRENCY questions inside it)
+batch_admission = AdmissionController(
+    "batch",
+    max_inflight=int(os.getenv('BATCH_MAX_INFLIGHT', '2')),
+    max_queue=int(os.getenv('BATCH_MAX_QUEUE', '4')),
+    yield_to=ask_admission
+)
+screen_admission = AdmissionController(
+    "screen",
+    max_inflight=int(os.getenv('SCREEN_MAX_INFLIGHT', '4')),
+    max_queue=int(os.getenv('SCREEN_MAX_QUEUE', '8')),
+    yield_to=ask_admission
+)
+
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize database connections and caches on startup"""
     print("🚀 Starting CFO Agent...")
     
-    # Initialize database pool
+    # Initialize database pool (DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE)
     await db_pool.initialize()
+    if os.getenv('DB_POOL_ADAPTIVE', 'false').lower() == 'true':
+        db_pool.start_adaptive(float(os.getenv('DB_POOL_ADAPT_INTERVAL_SECONDS', '10')))
+    if db_pool.replicas:
+        db_pool.start_health_checks(float(os.getenv('DB_HEALTH_CHECK_INTERVAL_SECONDS', '5')))
     print("✅ Database pool initialized")
     
     # Load schema cache
@@ -68,9 +169,21 @@ async def startup_event():
     await load_ticker_cache()
     print("✅ Ticker cache loaded")
     
+    # Optional in-process fact store (templated intents without DB round trips)
+    if os.getenv('FACT_STORE_ENABLED', 'false').lower() == 'true':
+        try:
+            await fact_store.load(db_pool)
+            fact_store.start_refresh(db_pool, float(os.getenv('FACT_STORE_REFRESH_SECONDS', '300')))
+            print("✅ Fact store loaded")
+        except Exception as e:
+            print(f"⚠️ Fact store unavailable, using Postgres only: {e}")
+    
+    # Expire idle sessions in the background (bounded session memory)
+    session_memory.start_sweeper(float(os.getenv('SESSION_SWEEP_INTERVAL_SECONDS', '60')))
+    
     # NEW: Initialize visualization fetcher
     global viz_fetcher
-    viz_fetcher = VizDataFetcher(db_pool.pool)
+    viz_fetcher = VizDataFetcher(db_pool)
     print("✅ Visualization fetcher initialized")
     
     print("🎉 CFO Agent ready!")
@@ -80,6 +193,8 @@ async def startup_event():
 async def shutdown_event():
     """Clean up on shutdown"""
     print("👋 Shutting down CFO Agent...")
+    await fact_store.stop_refresh()
+    await session_memory.stop_sweeper()
     await db_pool.close()
     print("✅ Database pool closed")
 
@@ -94,14 +209,36 @@ async def root():
     }
 
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (this worker's in-process counters)"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health():
     """Detailed health check"""
     return {
         "status": "healthy",
-        "database": "connected",
+        "database": "connected" if db_pool.pool else "not initialized",
+        "pool": db_pool.stats(),
         "schema_cache": "loaded",
-        "ticker_cache": "loaded"
+        "ticker_cache": "loaded",
+        "fact_store": fact_store.stats(),
+        "cost_gate": cost_gate.stats(),
+        "learned_templates": learned_templates.stats(),
+        "sessions": await session_memory.offload(session_memory.stats),
+        "admission": {
+            "ask": ask_admission.stats(),
+            "visualize": viz_admission.stats(),
+            "export": export_admission.stats(),
+            "batch": batch_admission.stats(),
+            "screen": screen_admission.stats()
+        },
+        "coalescing": {
+            "ask": ask_flight.stats() if ask_flight else None,
+            "sql": cfo_agent_graph.sql_executor.flight.stats() if cfo_agent_graph.sql_executor.flight else None
+        }
     }
 
 
@@ -115,25 +252,76 @@ async def ask_question(request: QueryRequest):
         
     Returns:
         QueryResponse with formatted answer and optional viz_metadata
+        (429 + Retry-After when the agent is overloaded)
     """
+    if request.enable_hitl is None:
+        request.enable_hitl = hitl_gate.enabled
+    if request.enable_hitl and API_WORKERS > 1:
+        raise HTTPException(status_code=400, detail="HITL needs a single API worker (API_WORKERS=1)")
     try:
-        # Enable/disable HITL based on request
-        if request.enable_hitl:
-            hitl_gate.enable()
-        else:
-            hitl_gate.disable()
+        async with ask_admission.admit(request.timeout_seconds or REQUEST_DEADLINE_SECONDS) as waited:
+            return await _answer_question(request, waited)
+    except Overloaded as e:
+        requests_total.inc(intent='unknown', status='rejected')
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+
+
+def _request_labels(plans) -> tuple:
+    """(intent, template) metric labels for a request's plans"""
+    if not plans:
+        return 'none', 'none'
+    if len(plans) > 1:
+        return 'multi_task', 'multi_task'
+    plan = plans[0]
+    return plan.get('intent') or 'unknown', plan.get('template_name') or plan.get('engine') or 'none'
+
+
+async def _answer_question(request: QueryRequest, waited: float) -> QueryResponse:
+    """Run an admitted /ask request (waited = seconds spent in the admission queue)"""
+    # Every request has a deadline; each stage derives its timeout from what's left.
+    # By default HITL requests also get the reviewer's approval window.
+    default_budget = REQUEST_DEADLINE_SECONDS + (hitl_gate.timeout if request.enable_hitl else 0)
+    budget = max((request.timeout_seconds or default_budget) - waited, 0.001)
+    started = time.perf_counter()
+    try:
+        # Options travel with this request's state; the shared HITL gate is never toggled
+        options = make_options(
+            hitl=request.enable_hitl,
+            allow_generative=request.allow_generative,
+            timeout_seconds=budget,
+            debug=request.debug,
+            bundle=request.bundle
+        )
         
         # Run the agent graph and get full state
         initial_state = {
             'question': request.question,
             'session_id': request.session_id,
+            'options': options,
             'errors': []
         }
-        final_state = await cfo_agent_graph.graph.ainvoke(initial_state)
+        if ask_flight is None:
+            final_state = await cfo_agent_graph.invoke(initial_state)
+        else:
+            # Planning never reads session memory, so sessions can share a run;
+            # only the options that change the answer are part of the key
+            key = (normalize_question(request.question), options['hitl'], options['allow_generative'], options['debug'])
+            final_state, shared = await ask_flight.do(
+                key,
+                lambda: cfo_agent_graph.invoke(initial_state),
+                timeout=budget
+            )
+            if shared:
+                # The leader only updated its own session; record this request in ours
+                await cfo_agent_graph.update_memory_node({**final_state, 'session_id': request.session_id})
         
         # Extract response
         response_text = final_state.get('final_response', 'Error: No response generated')
         
+        intent, template = _request_labels(final_state.get('plans'))
+        request_latency.observe(time.perf_counter() - started + waited, intent=intent, template=template)
+        requests_total.inc(intent=intent, status='degraded' if final_state.get('degraded') else 'ok')
+        
         # NEW: Check if visualization is available
         viz_metadata = None
         if viz_fetcher:
@@ -159,26 +347,185 @@ async def ask_question(request: QueryRequest):
                     }
                     print(f"[VIZ CHECK] Metadata created: {viz_metadata}")
         
+        debug = None
+        if options['debug']:
+            debug = {
+                'sql_executed': final_state.get('sql_executed', []),
+                'params_used': final_state.get('params_used', []),
+                'trace': final_state.get('trace', []),
+                'degraded': final_state.get('degraded', []),
+                'errors': final_state.get('errors', [])
+            }
+        
         return QueryResponse(
             response=response_text,
             session_id=request.session_id,
-            viz_metadata=viz_metadata
+            viz_metadata=viz_metadata,
+            debug=debug
         )
     
+    except asyncio.TimeoutError:
+        requests_total.inc(intent='unknown', status='timeout')
+        raise HTTPException(status_code=504, detail=f"No answer within {budget:.1f}s")
     except Exception as e:
+        requests_total.inc(intent='unknown', status='error')
         raise HTTPException(
             status_code=500,
             detail=f"Agent execution failed: {str(e)}"
         )
 
 
+@app.post("/ask/batch")
+async def ask_batch(request: BatchQueryRequest):
+    """
+    Answer many questions in one call, streamed as NDJSON
+    
+    Identical questions are decomposed once and identical plans (same
+    template/engine and params) execute once across the whole batch;
+    overlapping plans (e.g. different periods of one template) are not merged.
+    Batches are admitted before streaming starts (429 + Retry-After when
+    overloaded) and yield to /ask.
+    
+    Example:
+        POST /ask/batch {"questions": ["Apple revenue 2023", "Microsoft revenue 2023"]}
+        
+        {"index": 1, "question": "Microsoft revenue 2023", "response": "...", "errors": [], "ms": 812.4}
+        {"index": 0, "question": "Apple revenue 2023", "response": "...", "errors": [], "ms": 845.0}
+        {"summary": {"questions": 2, "distinct_questions": 2, "plans": 2, "distinct_plans": 2, "ms": 846.1}}
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions given")
+    if len(request.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch has {len(request.questions)} questions (max {MAX_BATCH_QUESTIONS})"
+        )
+    
+    # Batches run unattended: HITL never applies
+    options = make_options(hitl=False, allow_generative=request.allow_generative, debug=request.debug)
+    
+    try:
+        await batch_admission.acquire(REQUEST_DEADLINE_SECONDS)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+    
+    async def lines():
+        async for line in batch_runner.stream(request.questions, request.session_id, options):
+            yield json.dumps(line, default=str) + "\n"
+    
+    return AdmittedStreamingResponse(lines(), batch_admission, media_type="application/x-ndjson")
+
+
+@app.post("/export")
+async def export_surface(request: ExportRequest):
+    """
+    Stream a whole whitelisted surface as CSV, NDJSON or Arrow IPC
+    
+    Rows come in key order (company_id, fiscal_year[, fiscal_quarter]) in
+    validated keyset pages, so there is no 200-row cap. To resume, pass the
+    key of the last row read as after (NDJSON ends with {"next": token}).
+    
+    Example:
+        POST /export {"surface": "fact_financials", "columns": ["revenue", "net_income"], "format": "csv"}
+        POST /export {"surface": "mv_ratios_annual", "ticker": "AAPL", "max_rows": 1000, "after": "3.2019"}
+    """
+    fmt = (request.format or 'ndjson').lower()
+    try:
+        spec = plan_export(request.surface, request.columns, request.ticker, request.fy_from, request.fy_to)
+        after = decode_token(request.after, spec) if request.after else None
+        page_query(spec, after)  # reject before streaming if the first page fails validation
+        encoder = make_encoder(fmt)
+        if request.max_rows is not None and request.max_rows < 1:
+            raise ValueError("max_rows must be at least 1")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        await export_admission.acquire(REQUEST_DEADLINE_SECONDS)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+    
+    # The response frees the slot when it ends, even if the stream never starts
+    media_type, extension = EXPORT_FORMATS[fmt]
+    chunks = stream_export(db_pool, spec, encoder, after, request.max_rows)
+    return AdmittedStreamingResponse(chunks, export_admission, media_type=media_type, headers={
+        'Content-Disposition': f'attachment; filename="{spec["surface"]}.{extension}"'
+    })
+
+
+@app.post("/screen")
+async def screen(request: ScreenRequest):
+    """
+    Screen the whole universe with an AND/OR predicate tree
+    
+    Example:
+        POST /screen
+        {
+            "where": {"and": [
+                {"metric": "net_margin", "op": ">", "value": 0.2},
+                {"metric": "revenue_growth", "op": ">", "value": 0.1}
+            ]},
+            "fiscal_year": 2024,
+            "sort": "net_margin",
+            "limit": 10
+        }
+        
+        Returns {"period": {...}, "matched": 7, "rows": [...]}
+        (429 + Retry-After when overloaded)
+    """
+    try:
+        async with screen_admission.admit(REQUEST_DEADLINE_SECONDS):
+            return await _run_screen(request)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+
+
+async def _run_screen(request: ScreenRequest) -> Dict:
+    """Run an admitted screen"""
+    try:
+        return await screening_service.screen(
+            db_pool,
+            request.where,
+            request.frequency,
+            fiscal_year=request.fiscal_year,
+            fiscal_quarter=request.fiscal_quarter,
+            sort=request.sort,
+            order=request.order,
+            limit=min(request.limit or 25, 200)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Screen failed: {str(e)}"
+        )
+
+
+@app.get("/hitl/pending")
+async def list_pending_approvals():
+    """List SQL waiting for human approval"""
+    return {"pending": hitl_gate.list_pending()}
+
+
+@app.post("/hitl/{approval_id}")
+async def decide_approval(approval_id: str, decision: ApprovalDecision):
+    """
+    Approve or reject a pending SQL execution
+    
+    Example:
+        POST /hitl/3f2a9c01b7de {"approved": true}
+    """
+    if not hitl_gate.resolve(approval_id, decision.approved, decision.reason or ""):
+        raise HTTPException(status_code=404, detail=f"No pending approval '{approval_id}'")
+    return {"approval_id": approval_id, "approved": decision.approved}
+
+
 @app.get("/session/{session_id}/context")
 async def get_session_context(session_id: str):
     """Get session context/memory"""
-    from memory import session_memory
-    
-    context = session_memory.get_context_summary(session_id)
-    session = session_memory.get_or_create_session(session_id)
+    context = await session_memory.offload(session_memory.get_context_summary, session_id)
+    session = await session_memory.offload(session_memory.get_or_create_session, session_id)
     
     return {
         "session_id": session_id,
@@ -192,9 +539,7 @@ async def get_session_context(session_id: str):
 @app.delete("/session/{session_id}")
 async def clear_session(session_id: str):
     """Clear session memory"""
-    from memory import session_memory
-    
-    session_memory.clear_session(session_id)
+    await session_memory.offload(session_memory.clear_session, session_id)
     
     return {
         "status": "cleared",
@@ -212,7 +557,8 @@ async def get_visualization(request: VisualizationRequest):
     Get visualization data for a query.
     
     This is a SEPARATE endpoint that does NOT affect the existing /ask endpoint.
-    It fetches extended historical data for chart rendering.
+    It fetches extended historical data for chart rendering. Admission is
+    lower priority than /ask (429 + Retry-After when overloaded).
     
     Args:
         request: VisualizationRequest with session_id, intent, and params
@@ -245,6 +591,15 @@ async def get_visualization(request: VisualizationRequest):
             }
         }
     """
+    try:
+        async with viz_admission.admit(REQUEST_DEADLINE_SECONDS):
+            return await _build_visualization(request)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+
+
+async def _build_visualization(request: VisualizationRequest) -> VisualizationResponse:
+    """Fetch chart data for an admitted visualization request"""
     try:
         if not viz_fetcher:
             raise HTTPException(
@@ -326,9 +681,15 @@ async def get_visualization(request: VisualizationRequest):
 
 
 if __name__ == "__main__":
+    # API_WORKERS > 1 runs one process per worker; use SESSION_BACKEND=sqlite
+    # so follow-up context is shared between them (reload is single-process only)
+    # HITL approvals live in the worker that parked them, so HITL needs one worker
+    if API_WORKERS > 1 and hitl_gate.enabled:
+        raise SystemExit("HITL_ENABLED=true needs API_WORKERS=1: pending approvals live in one worker process")
     uvicorn.run(
         "app:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        reload=API_WORKERS == 1,
+        workers=API_WORKERS
     )
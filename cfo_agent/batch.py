@@ -0,0 +1,137 @@
+"""
+Batch question answering with cross-question plan deduplication
+
+Questions are decomposed concurrently (BATCH_CONCURRENCY at a time). Every
+plan is keyed on its template/engine and parameters, and each distinct plan
+executes once per batch (at most DB_POOL_MAX_SIZE at a time) no matter how
+many questions need it. Answers are yielded as soon as each question is done,
+so a batch costs roughly its distinct queries rather than the sum over
+questions.
+
+Only identical plans are merged. Plans that overlap without being equal
+(same template, different periods, e.g. "Apple revenue 2023" and "Apple
+revenue 2022-2023") still execute separately.
+"""
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
+import os
+import time
+
+from options import ExecutionOptions, make_options
+from singleflight import normalize_question
+
+
+# Plan fields that determine what a task executes
+PLAN_KEY_FIELDS = ('intent', 'template_name', 'engine', 'sql', 'params', 'entities_resolved', 'growth', 'screen')
+
+MAX_BATCH_QUESTIONS = int(os.getenv('BATCH_MAX_QUESTIONS', '500'))
+
+
+def plan_key(plan: Dict) -> str:
+    """Identity of a plan's work: equal keys produce equal results"""
+    return json.dumps({field: plan.get(field) for field in PLAN_KEY_FIELDS}, sort_keys=True, default=str)
+
+
+class BatchRunner:
+    """Runs many questions through the agent graph's nodes, sharing identical work"""
+
+    def __init__(self, graph, concurrency: Optional[int] = None, sql_concurrency: Optional[int] = None):
+        self.graph = graph
+        self.concurrency = concurrency or int(os.getenv('BATCH_CONCURRENCY', '8'))
+        self.sql_concurrency = sql_concurrency or int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+
+    async def stream(self, questions: List[str], session_id: str = "default",
+                     options: Optional[ExecutionOptions] = None) -> AsyncIterator[Dict]:
+        """
+        Answer questions, yielding one result per question in completion order
+
+        Yields:
+            {'index', 'question', 'response', 'errors', 'ms'} per question, then
+            {'summary': {...}} once every question is answered
+        """
+        options = options or make_options()
+        question_slots = asyncio.Semaphore(self.concurrency)
+        sql_slots = asyncio.Semaphore(self.sql_concurrency)
+        planned: Dict[str, asyncio.Task] = {}
+        executed: Dict[str, asyncio.Task] = {}
+        stats = {'questions': len(questions), 'plans': 0}
+        started = time.perf_counter()
+
+        async def plan_question(question: str) -> Dict:
+            async with question_slots:
+                state = {'question': question, 'session_id': session_id, 'options': options, 'errors': []}
+                state = await self.graph.decompose_node(state)
+                return await self.graph.resolve_entities_node(state)
+
+        async def execute_plan(plan: Dict) -> Tuple[List[Dict], str, Dict, List[str], List[Dict]]:
+            async with sql_slots:
+                state = await self.graph.run_tasks_node({'plans': [plan], 'options': options})
+            return (state['results'][0], state['sql_executed'][0], state['params_used'][0],
+                    state.get('errors', []), state.get('trace', []))
+
+        async def answer(index: int, question: str) -> Dict:
+            question_started = time.perf_counter()
+            try:
+                key = normalize_question(question)
+                if key not in planned:
+                    planned[key] = asyncio.ensure_future(plan_question(question))
+                # Nodes assign state keys, so a shallow copy keeps duplicate questions independent
+                state = dict(await planned[key])
+                state['question'] = question
+                state['errors'] = list(state.get('errors', []))
+
+                tasks = []
+                for plan in state['plans']:
+                    stats['plans'] += 1
+                    pkey = plan_key(plan)
+                    if pkey not in executed:
+                        executed[pkey] = asyncio.ensure_future(execute_plan(plan))
+                    tasks.append(executed[pkey])
+                outcomes = await asyncio.gather(*tasks)
+
+                state['results'] = [list(rows) for rows, _, _, _, _ in outcomes]
+                state['sql_executed'] = [sql for _, sql, _, _, _ in outcomes]
+                state['params_used'] = [params for _, _, params, _, _ in outcomes]
+                state['trace'] = [entry for *_, trace in outcomes for entry in trace]
+                for *_, errors, _ in outcomes:
+                    state['errors'].extend(errors)
+
+                state = await self.graph.fetch_citations_node(state)
+                state = await self.graph.format_response_node(state)
+                await self.graph.update_memory_node(state)
+
+                line = {
+                    'index': index,
+                    'question': question,
+                    'response': state.get('final_response', 'Error: No response generated'),
+                    'errors': state['errors']
+                }
+                if options['debug']:
+                    line['debug'] = {
+                        'sql_executed': state['sql_executed'],
+                        'params_used': state['params_used'],
+                        'trace': state['trace']
+                    }
+            except Exception as e:
+                line = {'index': index, 'question': question, 'response': None,
+                        'errors': [f"Agent execution failed: {str(e)}"]}
+            line['ms'] = round((time.perf_counter() - question_started) * 1000, 2)
+            return line
+
+        pending = [asyncio.ensure_future(answer(i, q)) for i, q in enumerate(questions)]
+        try:
+            for next_done in asyncio.as_completed(pending):
+                yield await next_done
+        finally:
+            # Client went away mid-stream: stop work nobody will read
+            for task in pending + list(planned.values()) + list(executed.values()):
+                task.cancel()
+
+        yield {'summary': {
+            'questions': stats['questions'],
+            'distinct_questions': len(planned),
+            'plans': stats['plans'],
+            'distinct_plans': len(executed),
+            'ms': round((time.perf_counter() - started) * 1000, 2)
+        }}
@@ -0,0 +1,83 @@
+"""
+Single round-trip request bundling
+
+All of a request's read queries (task SQL and citation lookups) are compiled
+into one statement: each query becomes a CTE, each CTE is folded into a JSON
+array with json_agg (in the query's own row order), and the arrays come back
+as one JSON object in one row.
+decode_bundle splits it back into per-query result sets. On a high-latency
+link to hosted Postgres an answer then costs one round trip instead of one
+per query.
+
+Rows decoded from JSON carry JSON types: numerics become int/float, dates
+and timestamps ISO strings.
+"""
+from typing import Dict, List, Tuple
+import json
+import re
+
+
+# :name placeholders (not :: casts)
+PARAM_PATTERN = re.compile(r'(?<!:):([A-Za-z_]\w*)')
+QUERY_NAME_PATTERN = re.compile(r'[a-z_][a-z0-9_]*')
+
+
+def bundle_queries(queries: Dict[str, Tuple[str, Dict]]) -> Tuple[str, Dict]:
+    """
+    Compile several read queries into one statement
+
+    Args:
+        queries: {name: (sql, params)}; names must be lowercase SQL identifiers
+
+    Returns:
+        (sql, params) - returns one row with one JSON column, 'bundle'
+    """
+    ctes = []
+    entries = []
+    bundled_params: Dict = {}
+
+    for name, (sql, params) in queries.items():
+        if not QUERY_NAME_PATTERN.fullmatch(name):
+            raise ValueError(f"Invalid bundle query name: {name}")
+        renamed: Dict[str, str] = {}
+
+        def rename(match):
+            key = match.group(1)
+            if key not in params:
+                return match.group(0)
+            if key not in renamed:
+                # Fixed-width names: none is a prefix of another when placeholders are substituted
+                renamed[key] = f"b{len(bundled_params):04d}"
+                bundled_params[renamed[key]] = params[key]
+            return f":{renamed[key]}"
+
+        body = PARAM_PATTERN.sub(rename, sql.strip().rstrip(';'))
+        # json_agg doesn't inherit the CTE's ORDER BY: number the rows as the
+        # query returns them (latest first for templates) and aggregate in that order
+        ctes.append(f"{name} AS (\nSELECT row_to_json(q) AS row_json, row_number() OVER () AS rn FROM (\n{body}\n) q\n)")
+        entries.append(f"('{name}', (SELECT json_agg(row_json ORDER BY rn) FROM {name}))")
+
+    # json_object_agg over VALUES: no 100-argument limit as with json_build_object
+    sql = (
+        "WITH " + ",\n".join(ctes) + "\n"
+        "SELECT json_object_agg(name, rows) AS bundle\n"
+        "FROM (VALUES " + ",\n".join(entries) + ") AS bundle_rows(name, rows)"
+    )
+    return sql, bundled_params
+
+
+def decode_bundle(document) -> Dict[str, List[Dict]]:
+    """
+    Split a bundle result back into per-query rows
+
+    Args:
+        document: The 'bundle' column (JSON text, or already decoded)
+
+    Returns:
+        {name: list of row dicts} (empty list for queries that matched nothing)
+    """
+    if document is None:
+        return {}
+    if isinstance(document, (str, bytes)):
+        document = json.loads(document)
+    return {name: rows or [] for name, rows in document.items()}
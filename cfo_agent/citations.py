@@ -1,7 +1,7 @@
 """
 Citations: fetch provenance from citation views
 """
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from db.pool import db_pool
 
 
@@ -37,8 +37,21 @@ class CitationFetcher:
         
         return citations
     
-    async def _fetch_financial_citation(self, ticker: str, fiscal_year: int, fiscal_quarter: Optional[int]) -> Optional[Dict]:
-        """Fetch financial data citation"""
+    def citation_queries(self, ticker: str, fiscal_year: int, fiscal_quarter: Optional[int] = None) -> Dict[str, Tuple[str, Dict]]:
+        """
+        Citation lookups for a company and period, without running them
+        
+        Returns:
+            {'financial' | 'stock' | 'macro': (sql, params)}; each returns at most one row
+        """
+        return {
+            'financial': self._financial_query(ticker, fiscal_year, fiscal_quarter),
+            'stock': self._stock_query(ticker, fiscal_year, fiscal_quarter),
+            'macro': self._macro_query()
+        }
+    
+    def _financial_query(self, ticker: str, fiscal_year: int, fiscal_quarter: Optional[int]) -> Tuple[str, Dict]:
+        """Financial data citation"""
         if fiscal_quarter:
             sql = """
             SELECT ticker, fiscal_year, fiscal_quarter, source_code, source_name, 
@@ -58,15 +71,10 @@ class CitationFetcher:
             LIMIT 1
             """
             params = {'ticker': ticker, 'fy': fiscal_year}
-        
-        try:
-            record = await db_pool.execute_one(sql, params)
-            return dict(record) if record else None
-        except Exception:
-            return None
+        return sql, params
     
-    async def _fetch_stock_citation(self, ticker: str, fiscal_year: int, fiscal_quarter: Optional[int]) -> Optional[Dict]:
-        """Fetch stock data citation"""
+    def _stock_query(self, ticker: str, fiscal_year: int, fiscal_quarter: Optional[int]) -> Tuple[str, Dict]:
+        """Stock data citation"""
         if fiscal_quarter:
             sql = """
             SELECT ticker, fiscal_year, fiscal_quarter, source_code, source_name, version_ts
@@ -84,15 +92,10 @@ class CitationFetcher:
             LIMIT 1
             """
             params = {'ticker': ticker, 'fy': fiscal_year}
-        
-        try:
-            record = await db_pool.execute_one(sql, params)
-            return dict(record) if record else None
-        except Exception:
-            return None
+        return sql, params
     
-    async def _fetch_macro_citation(self, fiscal_year: int, fiscal_quarter: Optional[int]) -> Optional[Dict]:
-        """Fetch macro indicator citation (CPI as example)"""
+    def _macro_query(self) -> Tuple[str, Dict]:
+        """Macro indicator citation (CPI as example)"""
         sql = """
         SELECT indicator_code, source_code, source_name, version_ts
         FROM vw_macro_citations
@@ -100,13 +103,27 @@ class CitationFetcher:
         ORDER BY quarter_end DESC
         LIMIT 1
         """
-        
+        return sql, {}
+    
+    async def _fetch_one(self, sql: str, params: Dict) -> Optional[Dict]:
         try:
-            record = await db_pool.execute_one(sql, {})
+            record = await db_pool.execute_one(sql, params)
             return dict(record) if record else None
         except Exception:
             return None
     
+    async def _fetch_financial_citation(self, ticker: str, fiscal_year: int, fiscal_quarter: Optional[int]) -> Optional[Dict]:
+        """Fetch financial data citation"""
+        return await self._fetch_one(*self._financial_query(ticker, fiscal_year, fiscal_quarter))
+    
+    async def _fetch_stock_citation(self, ticker: str, fiscal_year: int, fiscal_quarter: Optional[int]) -> Optional[Dict]:
+        """Fetch stock data citation"""
+        return await self._fetch_one(*self._stock_query(ticker, fiscal_year, fiscal_quarter))
+    
+    async def _fetch_macro_citation(self, fiscal_year: int, fiscal_quarter: Optional[int]) -> Optional[Dict]:
+        """Fetch macro indicator citation (CPI as example)"""
+        return await self._fetch_one(*self._macro_query())
+    
     def format_citation_line(self, citations: Dict) -> str:
         """
         Format citations into a single provenance line
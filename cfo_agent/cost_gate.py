@@ -0,0 +1,141 @@
+"""
+Cost gate for generative SQL
+
+LLM-written SQL passes validate_sql (shape: SELECT-only, allowlisted
+surfaces, LIMIT) but nothing there stops a valid query from seq-scanning a
+large join until the statement timeout. Before a generated candidate can
+reach the executor the gate runs EXPLAIN (FORMAT JSON) on it - planning
+only, nothing executes - and rejects plans whose estimated total cost or
+largest intermediate row count is above SQL_MAX_PLAN_COST /
+SQL_MAX_PLAN_ROWS. Candidates are explained concurrently and the passing
+ones ranked cheapest first. Verdicts computed from a plan are cached per
+SQL hash, so a regenerated query is judged without another round trip;
+EXPLAIN errors and timeouts are not cached.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from db.pool import db_pool
+from metrics import cache_requests, cost_gate_verdicts
+
+
+COST_GATE = os.getenv('SQL_COST_GATE', 'true').lower() == 'true'
+
+# Postgres planner units (seq_page_cost = 1.0)
+MAX_PLAN_COST = float(os.getenv('SQL_MAX_PLAN_COST', '50000'))
+
+# Largest row estimate of any plan node (e.g. an exploding join under the LIMIT)
+MAX_PLAN_ROWS = float(os.getenv('SQL_MAX_PLAN_ROWS', '1000000'))
+
+EXPLAIN_TIMEOUT = 2.0
+
+
+def sql_hash(sql: str) -> str:
+    """Cache key for a statement (whitespace-insensitive)"""
+    return hashlib.sha256(' '.join(sql.split()).encode()).hexdigest()
+
+
+def plan_estimate(explain_output) -> Tuple[float, float]:
+    """
+    Estimated cost and row count from EXPLAIN (FORMAT JSON) output
+
+    Returns:
+        (root total cost, largest 'Plan Rows' of any node)
+    """
+    if isinstance(explain_output, str):
+        explain_output = json.loads(explain_output)
+    root = explain_output[0]['Plan']
+    max_rows = 0.0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        max_rows = max(max_rows, float(node.get('Plan Rows', 0)))
+        stack.extend(node.get('Plans', []))
+    return float(root['Total Cost']), max_rows
+
+
+async def explain_plan(sql: str, params: Dict, timeout: float) -> Tuple[float, float]:
+    """EXPLAIN a :named query (planned, not run) and return (cost, rows)"""
+    record = await db_pool.execute_one(f"EXPLAIN (FORMAT JSON) {sql.strip().rstrip(';')}", params, timeout=timeout)
+    return plan_estimate(record[0])
+
+
+class CostGate:
+    """EXPLAIN-based admission for generated SQL, with a per-SQL verdict cache"""
+
+    def __init__(self, explain: Optional[Callable[[str, Dict, float], Awaitable[Tuple[float, float]]]] = None,
+                 max_cost: float = MAX_PLAN_COST, max_rows: float = MAX_PLAN_ROWS, cache_size: int = 1024):
+        self.explain = explain or explain_plan
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.cache_size = cache_size
+        self.verdicts: 'OrderedDict[str, Dict]' = OrderedDict()
+
+    async def judge(self, sql: str, params: Dict, timeout: Optional[float] = None) -> Dict:
+        """
+        Verdict for one candidate
+
+        Returns:
+            {'ok': bool, 'cost': float|None, 'rows': float|None, 'reason': str}
+        """
+        key = sql_hash(sql)
+        cached = self.verdicts.get(key)
+        cache_requests.inc(cache='cost_gate', result='hit' if cached else 'miss')
+        if cached:
+            self.verdicts.move_to_end(key)
+            return cached
+
+        budget = EXPLAIN_TIMEOUT if timeout is None else max(min(timeout, EXPLAIN_TIMEOUT), 0.001)
+        try:
+            cost, rows = await self.explain(sql, params, budget)
+        except (TimeoutError, asyncio.TimeoutError) as e:
+            cost_gate_verdicts.inc(verdict='error')
+            return {'ok': False, 'cost': None, 'rows': None, 'reason': f"EXPLAIN timed out: {e}"}  # not cached
+        except Exception as e:
+            # Not cached either: a connection reset or failover says nothing about this SQL
+            cost_gate_verdicts.inc(verdict='error')
+            return {'ok': False, 'cost': None, 'rows': None, 'reason': f"EXPLAIN failed: {e}"}
+
+        if cost > self.max_cost:
+            reason = f"estimated cost {cost:,.0f} exceeds {self.max_cost:,.0f}"
+        elif rows > self.max_rows:
+            reason = f"estimated {rows:,.0f} rows in one plan node exceeds {self.max_rows:,.0f}"
+        else:
+            reason = ""
+        verdict = {'ok': not reason, 'cost': cost, 'rows': rows, 'reason': reason}
+
+        cost_gate_verdicts.inc(verdict='pass' if verdict['ok'] else 'reject')
+        self.verdicts[key] = verdict
+        if len(self.verdicts) > self.cache_size:
+            self.verdicts.popitem(last=False)
+        return verdict
+
+    async def rank(self, candidates: List[Tuple[str, Dict]], timeout: Optional[float] = None
+                   ) -> Tuple[List[Tuple[str, Dict]], List[str]]:
+        """
+        Explain candidates concurrently
+
+        Returns:
+            (passing candidates cheapest first, rejection reasons)
+        """
+        verdicts = await asyncio.gather(*(self.judge(sql, params, timeout) for sql, params in candidates))
+        passing = sorted(
+            (verdict['cost'], index) for index, verdict in enumerate(verdicts) if verdict['ok']
+        )
+        reasons = [verdict['reason'] for verdict in verdicts if not verdict['ok']]
+        return [candidates[index] for _, index in passing], reasons
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': COST_GATE,
+            'max_cost': self.max_cost,
+            'max_rows': self.max_rows,
+            'cached_verdicts': len(self.verdicts)
+        }
+
+
+# Global cost gate instance
+cost_gate = CostGate()
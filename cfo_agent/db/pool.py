@@ -1,101 +1,710 @@
 """
 Async PostgreSQL connection pool for read-only database access
+
+The agent only reads (default_transaction_read_only=on), so besides the
+primary (SUPABASE_DB_URL) it can spread queries over read replicas
+(DB_REPLICA_URLS, comma-separated). Each DSN is a Backend with its own
+asyncpg pool; every acquire goes to the healthy backend with the fewest
+outstanding requests relative to its limit. Replicas lagging more than
+DB_REPLICA_MAX_LAG_SECONDS are skipped (DB_FRESH_MAX_LAG_SECONDS for
+freshness-sensitive queries), unreachable backends are taken out until a
+health check passes, and the primary is always the last resort.
+
+Every connection goes through DatabasePool.acquire(), which records the wait
+(queueing for a connection vs. running the query), queue depth and
+saturation per backend. The number of connections callers may hold is an
+adjustable limit between DB_POOL_MIN_SIZE and DB_POOL_MAX_SIZE; with
+DB_POOL_ADAPTIVE it is resized from observed waits and the server's
+max_connections headroom, and idle connections above the limit are closed
+after DB_POOL_IDLE_LIFETIME_SECONDS. numeric columns decode straight to float
+(DB_NUMERIC_AS_FLOAT) rather than Decimal.
+
+Inside db_pool.session() every query of the request (task SQL, citations,
+entity resolution) shares one pinned connection and one read-only
+REPEATABLE READ transaction, so an answer costs one pool slot and sees one
+snapshot. The connection is taken on the first query and released when the
+session ends.
 """
+import asyncio
 import os
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional, Tuple
 import asyncpg
-from typing import Optional
 from dotenv import load_dotenv
+from metrics import (
+    pool_acquire_wait, db_query_latency, pool_connections, pool_saturation, backend_failovers,
+    db_session_queries
+)
 
 load_dotenv()
 
+# Free server connections (before the reserve for admin/other clients)
+SERVER_HEADROOM_SQL = """
+SELECT current_setting('max_connections')::int - (SELECT count(*) FROM pg_stat_activity) AS free
+"""
 
-class DatabasePool:
-    """Async connection pool manager for Supabase/Postgres"""
-    
-    def __init__(self):
+# Seconds behind the primary (0 on the primary itself)
+REPLICATION_LAG_SQL = """
+SELECT CASE WHEN pg_is_in_recovery()
+            THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            ELSE 0 END
+"""
+
+# :name placeholders (not :: casts)
+NAMED_PARAM_PATTERN = re.compile(r'(?<!:):([A-Za-z_]\w*)')
+
+# Errors meaning "this backend is unreachable", as opposed to a bad query
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.CannotConnectNowError,
+    asyncpg.exceptions.TooManyConnectionsError
+)
+
+# Errors during a query meaning the backend connection was lost. Client-side
+# misuse (InterfaceError: released connection, wrong argument count) says
+# nothing about backend health.
+BACKEND_LOST_ERRORS = (
+    asyncpg.exceptions.ConnectionDoesNotExistError,
+    asyncpg.exceptions.PostgresConnectionError,
+    OSError
+)
+
+
+async def init_connection(conn: asyncpg.Connection):
+    """Per-connection setup: numeric decodes to float instead of Decimal (DB_NUMERIC_AS_FLOAT)"""
+    if os.getenv('DB_NUMERIC_AS_FLOAT', 'true').lower() == 'true':
+        await conn.set_type_codec('numeric', encoder=str, decoder=float, schema='pg_catalog', format='text')
+
+
+def next_pool_limit(limit: int, min_size: int, max_size: int, mean_wait: float, saturated: int,
+                    peak_in_use: int, headroom: int, target_wait: float) -> int:
+    """
+    Adaptive pool limit for the next interval
+
+    Grows (by up to a quarter, within server headroom) while callers queue for
+    connections; shrinks by one when the pool is mostly idle.
+
+    Args:
+        limit: Current limit
+        min_size / max_size: Configured bounds
+        mean_wait: Mean acquire wait over the interval (seconds)
+        saturated: Acquires that found every allowed connection busy
+        peak_in_use: Most connections held at once
+        headroom: Free server connections after the reserve
+        target_wait: Acceptable mean acquire wait (seconds)
+
+    Returns:
+        New limit
+    """
+    if (mean_wait > target_wait or saturated) and headroom > 0:
+        return min(max_size, limit + min(headroom, max(1, limit // 4)))
+    if not saturated and mean_wait <= target_wait / 4 and peak_in_use <= limit // 2:
+        return max(min_size, limit - 1)
+    return limit
+
+
+class AdjustableLimiter:
+    """FIFO semaphore whose limit can change at runtime"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self):
+        if self.in_use < self.limit and not self.waiters:
+            self.in_use += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # slot was handed over as we were cancelled
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+
+    def release(self):
+        self.in_use -= 1
+        self._wake()
+
+    def set_limit(self, limit: int):
+        self.limit = limit
+        self._wake()
+
+    def _wake(self):
+        while self.waiters and self.in_use < self.limit:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_use += 1
+                waiter.set_result(None)
+
+
+class Backend:
+    """One DSN: its asyncpg pool, connection limit, load and health"""
+
+    def __init__(self, name: str, dsn: str, role: str, min_size: int, max_size: int):
+        self.name = name
+        self.dsn = dsn
+        self.role = role  # 'primary' | 'replica'
+        self.min_size = min_size
+        self.max_size = max_size
         self.pool: Optional[asyncpg.Pool] = None
-        self.db_url = os.getenv('SUPABASE_DB_URL')
-        if not self.db_url:
-            raise ValueError("SUPABASE_DB_URL environment variable not set")
-    
-    async def initialize(self, min_size: int = 2, max_size: int = 10):
-        """Initialize the connection pool"""
+        self.limiter = AdjustableLimiter(max_size)
+        self.healthy = True
+        self.lag_seconds = 0.0
+        self.last_error: Optional[str] = None
+        self.saturation_events = 0
+        self.reset_window()
+
+    async def connect(self):
+        """Create the asyncpg pool"""
         if self.pool is None:
             self.pool = await asyncpg.create_pool(
-                self.db_url,
-                min_size=min_size,
-                max_size=max_size,
+                self.dsn,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                max_inactive_connection_lifetime=float(os.getenv('DB_POOL_IDLE_LIFETIME_SECONDS', '60')),
+                timeout=float(os.getenv('DB_CONNECT_TIMEOUT_SECONDS', '5')),
                 command_timeout=5.0,  # 5 second timeout
                 server_settings={
                     'application_name': 'cfo_agent',
                     'default_transaction_read_only': 'on'  # Read-only mode
-                }
+                },
+                init=init_connection
             )
-    
+
     async def close(self):
-        """Close the connection pool"""
         if self.pool:
             await self.pool.close()
             self.pool = None
-    
-    async def execute_query(self, sql: str, params: dict = None, timeout: float = 5.0):
+
+    @property
+    def outstanding(self) -> int:
+        """Requests holding or waiting for a connection"""
+        return self.limiter.in_use + len(self.limiter.waiters)
+
+    def load(self) -> float:
+        """Outstanding requests relative to the connection limit"""
+        return self.outstanding / max(self.limiter.limit, 1)
+
+    def mark_down(self, error: Exception):
+        if self.healthy:
+            print(f"⚠️ Database backend {self.name} marked unhealthy: {error}")
+            backend_failovers.inc(backend=self.name)
+        self.healthy = False
+        self.last_error = str(error)
+
+    def mark_up(self):
+        if not self.healthy:
+            print(f"✅ Database backend {self.name} healthy again")
+        self.healthy = True
+        self.last_error = None
+
+    async def checkout(self) -> asyncpg.Connection:
+        """Take a connection (respecting the limit); raises CONNECTION_ERRORS if unreachable"""
+        if self.pool is None:
+            await self.connect()
+        started = time.perf_counter()
+        if self.limiter.in_use >= self.limiter.limit:
+            self.saturation_events += 1
+            self._window_saturated += 1
+            pool_saturation.inc(backend=self.name)
+        await self.limiter.acquire()
+        try:
+            conn = await self.pool.acquire()
+        except BaseException:
+            self.limiter.release()
+            raise
+        wait = time.perf_counter() - started
+        pool_acquire_wait.observe(wait, backend=self.name)
+        self._window_wait += wait
+        self._window_acquires += 1
+        self._window_peak = max(self._window_peak, self.limiter.in_use)
+        return conn
+
+    async def checkin(self, conn: asyncpg.Connection):
+        try:
+            await self.pool.release(conn)
+        finally:
+            self.limiter.release()
+
+    async def _fetchval_unlimited(self, sql: str):
+        """Housekeeping query that bypasses the limiter (must run while saturated)"""
+        conn = await self.pool.acquire(timeout=2.0)
+        try:
+            return await conn.fetchval(sql, timeout=2.0)
+        finally:
+            await self.pool.release(conn)
+
+    async def check_health(self):
+        """Reconnect if needed and refresh replication lag"""
+        try:
+            if self.pool is None:
+                await self.connect()
+            lag = await self._fetchval_unlimited(REPLICATION_LAG_SQL)
+            self.lag_seconds = float(lag or 0.0)
+            self.mark_up()
+        except Exception as e:
+            self.mark_down(e)
+
+    def reset_window(self):
+        """Start a new adaptive-sizing observation window"""
+        self._window_wait = 0.0
+        self._window_acquires = 0
+        self._window_saturated = 0
+        self._window_peak = self.limiter.in_use
+
+    async def server_headroom(self, reserve: int) -> int:
+        """Server connections still free after leaving `reserve` for others (0 if unknown)"""
+        try:
+            free = await self._fetchval_unlimited(SERVER_HEADROOM_SQL)
+            return max(int(free) - reserve, 0)
+        except Exception:
+            return 0
+
+    async def adapt(self, target_wait: float, reserve: int) -> int:
+        """Resize the limit from the last window's observations; returns the new limit"""
+        mean_wait = self._window_wait / self._window_acquires if self._window_acquires else 0.0
+        wants_more = mean_wait > target_wait or self._window_saturated > 0
+        headroom = await self.server_headroom(reserve) if wants_more else 0
+        limit = next_pool_limit(
+            self.limiter.limit, self.min_size, self.max_size, mean_wait,
+            self._window_saturated, self._window_peak, headroom, target_wait
+        )
+        if limit != self.limiter.limit:
+            print(f"🔧 DB pool {self.name} limit {self.limiter.limit} → {limit} "
+                  f"(mean wait {mean_wait * 1000:.1f}ms, saturated {self._window_saturated}, headroom {headroom})")
+            self.limiter.set_limit(limit)
+        self.reset_window()
+        return limit
+
+    def connection_counts(self) -> Dict[str, float]:
+        if not self.pool:
+            return {}
+        size, idle = self.pool.get_size(), self.pool.get_idle_size()
+        return {
+            'in_use': size - idle,
+            'idle': idle,
+            'limit': self.limiter.limit,
+            'waiting': len(self.limiter.waiters),
+            'max': self.max_size
+        }
+
+    def stats(self) -> Dict:
+        return {
+            'name': self.name,
+            'role': self.role,
+            'healthy': self.healthy,
+            'lag_seconds': round(self.lag_seconds, 3),
+            'outstanding': self.outstanding,
+            'saturation_events': self.saturation_events,
+            'last_error': self.last_error,
+            **self.connection_counts()
+        }
+
+
+class DBSession:
+    """A request's pinned connection and read-only REPEATABLE READ transaction"""
+
+    def __init__(self, pool: 'DatabasePool'):
+        self.pool = pool
+        self.backend: Optional[Backend] = None
+        self.conn: Optional[asyncpg.Connection] = None
+        self.transaction = None
+        self.lock = asyncio.Lock()  # one statement at a time on the connection
+        self.queries = 0
+        self.restarts = 0
+        self.closed = False
+
+    def serves(self, fresh: bool) -> bool:
+        """Whether the pinned backend (if any) is fresh enough for this query"""
+        if not fresh or self.backend is None or self.backend.role == 'primary':
+            return True
+        return self.backend.lag_seconds <= self.pool.fresh_max_lag
+
+    async def _begin(self):
+        self.transaction = self.conn.transaction(isolation='repeatable_read', readonly=True)
+        await self.transaction.start()
+
+    async def _pin(self, fresh: bool):
+        self.backend, self.conn = await self.pool._checkout(fresh)
+        try:
+            await self._begin()
+        except BaseException:
+            await self._unpin()
+            raise
+
+    async def _unpin(self):
+        """Return the connection (a read-only transaction has nothing to commit)"""
+        backend, conn, transaction = self.backend, self.conn, self.transaction
+        self.backend = self.conn = self.transaction = None
+        if conn is None:
+            return
+        try:
+            if transaction is not None and not conn.is_closed():
+                await transaction.rollback()
+        except Exception:
+            pass  # release() resets or discards the connection
+        finally:
+            await backend.checkin(conn)
+
+    async def _restart(self):
+        """A failed statement aborts the transaction: start a new one (new snapshot)"""
+        self.restarts += 1
+        try:
+            await self.transaction.rollback()
+            await self._begin()
+        except Exception:
+            await self._unpin()
+
+    @asynccontextmanager
+    async def connection(self, fresh: bool = False):
+        """Yield (backend, connection), pinning on first use"""
+        async with self.lock:
+            if self.conn is None:
+                await self._pin(fresh)
+            self.queries += 1
+            try:
+                yield self.backend, self.conn
+            except Exception:
+                if self.conn is not None:
+                    await self._restart()
+                raise
+            except BaseException:
+                await self._unpin()  # cancelled mid-statement: don't reuse the connection
+                raise
+            if self.conn.is_closed():
+                await self._unpin()  # connection lost: the next query pins afresh
+
+    async def close(self):
+        """Release the pinned connection (waits for a statement still in flight)"""
+        async with self.lock:
+            self.closed = True
+            if self.queries:
+                db_session_queries.observe(self.queries)
+            await self._unpin()
+
+
+_session: ContextVar[Optional[DBSession]] = ContextVar('db_session', default=None)
+
+
+class DatabasePool:
+    """Async connection pool manager for Supabase/Postgres (primary + optional replicas)"""
+
+    def __init__(self):
+        self.db_url = os.getenv('SUPABASE_DB_URL')
+        if not self.db_url:
+            raise ValueError("SUPABASE_DB_URL environment variable not set")
+        replica_urls = [url.strip() for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url.strip()]
+
+        self.min_size = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+        self.max_size = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+        self.max_lag = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', '30'))
+        self.fresh_max_lag = float(os.getenv('DB_FRESH_MAX_LAG_SECONDS', '5'))
+
+        self.primary = Backend('primary', self.db_url, 'primary', self.min_size, self.max_size)
+        self.replicas = [
+            Backend(f'replica{i + 1}', url, 'replica', self.min_size, self.max_size)
+            for i, url in enumerate(replica_urls)
+        ]
+        self.backends: List[Backend] = [self.primary] + self.replicas
+        self._adapt_task: Optional[asyncio.Task] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def pool(self) -> Optional[asyncpg.Pool]:
+        """The primary's asyncpg pool (None until initialized)"""
+        return self.primary.pool
+
+    async def initialize(self, min_size: Optional[int] = None, max_size: Optional[int] = None):
+        """Initialize the pools (sizes default to DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE)"""
+        if self.primary.pool is not None:
+            return
+        self.min_size = min_size or self.min_size
+        self.max_size = max(max_size or self.max_size, self.min_size)
+        for backend in self.backends:
+            backend.min_size, backend.max_size = self.min_size, self.max_size
+            if self._adapt_task is None:
+                backend.limiter.set_limit(self.max_size)
+
+        await self.primary.connect()
+        for replica in self.replicas:
+            # An unreachable replica is not fatal: health checks bring it back
+            try:
+                await replica.connect()
+                await replica.check_health()
+            except Exception as e:
+                replica.mark_down(e)
+
+    async def close(self):
+        """Close all pools"""
+        await self.stop_adaptive()
+        await self.stop_health_checks()
+        for backend in self.backends:
+            await backend.close()
+
+    def candidates(self, fresh: bool = False) -> List[Backend]:
+        """
+        Backends to try, best first
+
+        Healthy backends within the lag bound, least loaded first (replicas win
+        ties so the primary keeps headroom); the primary is always included as
+        the last resort.
+        """
+        max_lag = self.fresh_max_lag if fresh else self.max_lag
+        usable = [
+            backend for backend in self.backends
+            if backend.healthy and (backend.role == 'primary' or backend.lag_seconds <= max_lag)
+        ]
+        usable.sort(key=lambda backend: (backend.load(), backend.role == 'primary'))
+        if self.primary not in usable:
+            usable.append(self.primary)
+        return usable
+
+    async def _checkout(self, fresh: bool = False) -> Tuple[Backend, asyncpg.Connection]:
+        """Take a connection from the best backend, failing over past unreachable ones"""
+        if self.primary.pool is None:
+            await self.initialize()
+
+        last_error: Optional[Exception] = None
+        for backend in self.candidates(fresh):
+            try:
+                return backend, await backend.checkout()
+            except CONNECTION_ERRORS as e:
+                backend.mark_down(e)
+                last_error = e
+        raise ConnectionError(f"No database backend available: {last_error}")
+
+    @asynccontextmanager
+    async def _acquire_backend(self, fresh: bool = False):
+        """Yield (backend, connection): the request's pinned one inside a session"""
+        session = _session.get()
+        if session is not None and not session.closed and session.serves(fresh):
+            async with session.connection(fresh) as pinned:
+                yield pinned
+            return
+
+        backend, conn = await self._checkout(fresh)
+        try:
+            yield backend, conn
+        finally:
+            await backend.checkin(conn)
+
+    def current_session(self) -> Optional[DBSession]:
+        """The request's open session, if any (queries in it share one snapshot)"""
+        session = _session.get()
+        return session if session is not None and not session.closed else None
+
+    @asynccontextmanager
+    async def session(self, enabled: bool = True):
+        """
+        Pin one connection and snapshot for every query in the block
+
+        Nested sessions reuse the outer one. Disable for requests that may
+        park for a long time (HITL review) rather than hold a connection idle.
+
+        Usage:
+            async with db_pool.session():
+                await graph.ainvoke(state)
+        """
+        if not enabled or _session.get() is not None:
+            yield _session.get()
+            return
+        session = DBSession(self)
+        token = _session.set(session)
+        try:
+            yield session
+        finally:
+            _session.reset(token)
+            await session.close()
+
+    @asynccontextmanager
+    async def acquire(self, fresh: bool = False):
+        """
+        Hold a pooled connection (load-balanced, instrumented, respects the limit)
+
+        Args:
+            fresh: Only use replicas within DB_FRESH_MAX_LAG_SECONDS of the primary
+
+        Usage:
+            async with db_pool.acquire() as conn:
+                rows = await conn.fetch(...)
+        """
+        async with self._acquire_backend(fresh) as (_, conn):
+            yield conn
+
+    @asynccontextmanager
+    async def snapshot(self, fresh: bool = False):
+        """
+        Hold one connection inside a read-only REPEATABLE READ transaction
+
+        For long reads outside a request session, e.g. exports paging through
+        server-side cursors (which only live inside a transaction).
+
+        Usage:
+            async with db_pool.snapshot() as conn:
+                async for record in db_pool.cursor(conn, sql, params):
+                    ...
+        """
+        async with self._acquire_backend(fresh) as (_, conn):
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                yield conn
+
+    async def describe(self, conn: asyncpg.Connection, sql: str, params: dict = None, timeout: float = 5.0):
+        """Output columns (asyncpg Attributes: name, type) of a :named query, without running it"""
+        positional_sql, _ = self._convert_params(sql, params or {})
+        statement = await conn.prepare(positional_sql, timeout=timeout)
+        return statement.get_attributes()
+
+    def cursor(self, conn: asyncpg.Connection, sql: str, params: dict = None, prefetch: int = 50,
+               timeout: float = 5.0):
+        """Server-side cursor over a :named query on a held connection (inside snapshot())"""
+        positional_sql, positional_params = self._convert_params(sql, params or {})
+        return conn.cursor(positional_sql, *positional_params, prefetch=prefetch, timeout=timeout)
+
+    async def _run(self, method: str, sql: str, params: dict, timeout: float, fresh: bool):
+        """Run conn.<method>, retrying once elsewhere if the backend drops (safe: read-only)"""
+        # Convert named params to positional
+        positional_sql, positional_params = self._convert_params(sql, params or {})
+
+        for attempt in (1, 2):
+            async with self._acquire_backend(fresh) as (backend, conn):
+                started = time.perf_counter()
+                try:
+                    return await getattr(conn, method)(positional_sql, *positional_params, timeout=timeout)
+                except (asyncpg.exceptions.QueryCanceledError, asyncio.TimeoutError):
+                    raise TimeoutError(f"Query exceeded {timeout}s timeout")
+                except BACKEND_LOST_ERRORS as e:
+                    backend.mark_down(e)
+                    if attempt == 2:
+                        raise RuntimeError(f"Query execution failed: {str(e)}")
+                except Exception as e:
+                    raise RuntimeError(f"Query execution failed: {str(e)}")
+                finally:
+                    db_query_latency.observe(time.perf_counter() - started, backend=backend.name)
+
+    async def execute_query(self, sql: str, params: dict = None, timeout: float = 5.0, fresh: bool = False):
         """
         Execute a SELECT query and return results
-        
+
         Args:
             sql: SQL query string with :param placeholders
             params: Dictionary of parameter values
             timeout: Query timeout in seconds
-            
+            fresh: Freshness-sensitive: avoid lagging replicas
+
         Returns:
             List of Record objects
         """
-        if not self.pool:
-            await self.initialize()
-        
-        # Convert named params to positional
-        positional_sql, positional_params = self._convert_params(sql, params or {})
-        
-        async with self.pool.acquire() as conn:
-            try:
-                records = await conn.fetch(positional_sql, *positional_params, timeout=timeout)
-                return records
-            except asyncpg.exceptions.QueryCanceledError:
-                raise TimeoutError(f"Query exceeded {timeout}s timeout")
-            except Exception as e:
-                raise RuntimeError(f"Query execution failed: {str(e)}")
-    
-    async def execute_one(self, sql: str, params: dict = None, timeout: float = 5.0):
+        return await self._run('fetch', sql, params, timeout, fresh)
+
+    async def execute_one(self, sql: str, params: dict = None, timeout: float = 5.0, fresh: bool = False):
         """Execute a query and return a single row"""
-        if not self.pool:
-            await self.initialize()
-        
-        positional_sql, positional_params = self._convert_params(sql, params or {})
-        
-        async with self.pool.acquire() as conn:
+        return await self._run('fetchrow', sql, params, timeout, fresh)
+
+    async def check_health(self):
+        """Check every backend once"""
+        await asyncio.gather(*(backend.check_health() for backend in self.backends))
+
+    def start_health_checks(self, interval: float = 5.0):
+        """Track backend health and replica lag in the background"""
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop(interval))
+
+    async def stop_health_checks(self):
+        """Stop the background health checks"""
+        if self._health_task:
+            self._health_task.cancel()
             try:
-                record = await conn.fetchrow(positional_sql, *positional_params, timeout=timeout)
-                return record
-            except asyncpg.exceptions.QueryCanceledError:
-                raise TimeoutError(f"Query exceeded {timeout}s timeout")
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    async def _health_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check_health()
+
+    async def adapt(self, target_wait: float, reserve: int):
+        """Resize every reachable backend's limit from its last window"""
+        for backend in self.backends:
+            if backend.healthy and backend.pool is not None:
+                await backend.adapt(target_wait, reserve)
+
+    def start_adaptive(self, interval: float = 10.0):
+        """Resize the pool limits in the background, starting from DB_POOL_MIN_SIZE"""
+        if self._adapt_task is None:
+            for backend in self.backends:
+                backend.limiter.set_limit(self.min_size)
+            self._adapt_task = asyncio.create_task(self._adapt_loop(interval))
+
+    async def stop_adaptive(self):
+        """Stop the background sizing task"""
+        if self._adapt_task:
+            self._adapt_task.cancel()
+            try:
+                await self._adapt_task
+            except asyncio.CancelledError:
+                pass
+            self._adapt_task = None
+
+    async def _adapt_loop(self, interval: float):
+        target_wait = float(os.getenv('DB_POOL_TARGET_WAIT_MS', '20')) / 1000
+        reserve = int(os.getenv('DB_POOL_SERVER_RESERVE', '10'))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.adapt(target_wait, reserve)
             except Exception as e:
-                raise RuntimeError(f"Query execution failed: {str(e)}")
-    
+                print(f"Warning: DB pool sizing failed: {e}")
+
+    def connection_counts(self) -> Dict[Tuple, float]:
+        """Connections by (backend, state) for the pool gauge"""
+        return {
+            (backend.name, state): count
+            for backend in self.backends
+            for state, count in backend.connection_counts().items()
+        }
+
+    def stats(self) -> Dict:
+        """Pool state for /health"""
+        return {
+            'initialized': self.primary.pool is not None,
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'adaptive': self._adapt_task is not None,
+            'backends': [backend.stats() for backend in self.backends]
+        }
+
     def _convert_params(self, sql: str, params: dict):
-        """Convert :named params to $1, $2, etc."""
-        positional_sql = sql
+        """Convert :named params to $1, $2, etc. (whole names only: :fy never matches inside :fy_from)"""
+        positions = {}
         positional_params = []
-        param_index = 1
-        
-        for key, value in params.items():
-            placeholder = f":{key}"
-            if placeholder in positional_sql:
-                positional_sql = positional_sql.replace(placeholder, f"${param_index}")
-                positional_params.append(value)
-                param_index += 1
-        
+
+        def replace(match):
+            key = match.group(1)
+            if key not in params:
+                return match.group(0)
+            if key not in positions:
+                positional_params.append(params[key])
+                positions[key] = len(positional_params)
+            return f"${positions[key]}"
+
+        positional_sql = NAMED_PARAM_PATTERN.sub(replace, sql)
         return positional_sql, positional_params
 
 
 # Global pool instance
 db_pool = DatabasePool()
+pool_connections.set_function(db_pool.connection_counts)
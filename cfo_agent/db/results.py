@@ -0,0 +1,127 @@
+"""
+Compact columnar query results
+
+A ResultSet holds column names plus one array per column instead of a dict
+per row: float columns become float64 arrays (NaN for NULL), non-null
+integer columns int64 arrays, everything else a tuple. Columns convert to
+NumPy and pandas without copying; iterating or indexing still yields row
+dicts (NULL as None) for code that expects the old list-of-dicts shape.
+"""
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import pandas as pd
+
+
+def _pack_column(values: List) -> Union[np.ndarray, Tuple]:
+    """Typed array for all-float / non-null integer columns, tuple otherwise"""
+    present = [v for v in values if v is not None]
+    if present and all(type(v) is float for v in present):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if present and len(present) == len(values) and all(type(v) is int for v in present):
+        return np.array(values, dtype=np.int64)
+    return tuple(values)
+
+
+def _unpack_value(value):
+    """Array element back to the driver's Python value (NaN -> None)"""
+    if isinstance(value, np.floating):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+class ResultSet(Sequence):
+    """Query result as column names plus typed column arrays"""
+
+    __slots__ = ('columns', 'data', 'row_count')
+
+    def __init__(self, columns: Sequence[str], data: Dict[str, Union[np.ndarray, Tuple]], row_count: int):
+        self.columns = tuple(columns)
+        self.data = data
+        self.row_count = row_count
+
+    @classmethod
+    def from_records(cls, records: List) -> 'ResultSet':
+        """Build from asyncpg Records (one pass per column, no per-row dicts)"""
+        if not records:
+            return cls((), {}, 0)
+        columns = tuple(records[0].keys())
+        data = {name: _pack_column([record[i] for record in records]) for i, name in enumerate(columns)}
+        return cls(columns, data, len(records))
+
+    @classmethod
+    def from_dicts(cls, rows: List[Dict]) -> 'ResultSet':
+        """Build from row dicts (columns in first-seen order)"""
+        columns: Dict[str, None] = {}
+        for row in rows:
+            columns.update(dict.fromkeys(row))
+        data = {name: _pack_column([row.get(name) for row in rows]) for name in columns}
+        return cls(tuple(columns), data, len(rows))
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            data = {name: values[index] for name, values in self.data.items()}
+            return ResultSet(self.columns, data, len(range(*index.indices(self.row_count))))
+        if index < 0:
+            index += self.row_count
+        if not 0 <= index < self.row_count:
+            raise IndexError("ResultSet index out of range")
+        return {name: _unpack_value(self.data[name][index]) for name in self.columns}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(self.row_count):
+            yield {name: _unpack_value(self.data[name][index]) for name in self.columns}
+
+    def __repr__(self) -> str:
+        return f"ResultSet(columns={list(self.columns)}, rows={self.row_count})"
+
+    def column(self, name: str, dtype: Optional[type] = None) -> np.ndarray:
+        """One column as a NumPy array (the stored array itself when it is already typed)"""
+        values = self.data[name]
+        if isinstance(values, np.ndarray) and (dtype is None or values.dtype == dtype):
+            return values
+        if dtype is np.float64:
+            return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+        return np.asarray(values, dtype=dtype if dtype is not None else object)
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        DataFrame view: typed columns are passed through without copying
+
+        Float columns containing NULL stay object columns of None, so callers
+        testing `value is not None` behave as with driver rows.
+        """
+        frame = {}
+        for name in self.columns:
+            values = self.data[name]
+            if isinstance(values, np.ndarray) and values.dtype == np.float64 and np.isnan(values).any():
+                values = np.array([_unpack_value(v) for v in values], dtype=object)
+            elif not isinstance(values, np.ndarray):
+                values = np.array(values, dtype=object)
+            frame[name] = values
+        return pd.DataFrame(frame, columns=list(self.columns), copy=False)
+
+    def take(self, indexes: Sequence[int], columns: Optional[Sequence[str]] = None) -> 'ResultSet':
+        """Rows at indexes, in that order (columns default to all)"""
+        columns = self.columns if columns is None else tuple(columns)
+        data = {}
+        for name in columns:
+            values = self.data[name]
+            data[name] = values[np.asarray(indexes, dtype=np.int64)] if isinstance(values, np.ndarray) else tuple(values[i] for i in indexes)
+        return ResultSet(columns, data, len(indexes))
+
+    def split(self, name: str) -> Dict[object, 'ResultSet']:
+        """Partition rows by one column's values (that column dropped, row order kept)"""
+        columns = [column for column in self.columns if column != name]
+        indexes: Dict[object, List[int]] = {}
+        for i, value in enumerate(self.data[name] if self.row_count else ()):
+            indexes.setdefault(_unpack_value(value), []).append(i)
+        return {value: self.take(rows, columns) for value, rows in indexes.items()}
+
+    def to_dicts(self) -> List[Dict]:
+        """Row dicts (the pre-columnar shape)"""
+        return list(self)
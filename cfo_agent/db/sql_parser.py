@@ -0,0 +1,263 @@
+"""
+Single-pass SQL tokenizer and lightweight SELECT parser for validation
+
+tokenize() splits a statement into tokens in one scan: string literals,
+quoted identifiers and comments are consumed whole, so a keyword or ';'
+inside a string can't trip a check. parse_sql() walks the tokens once and
+extracts what validate_sql needs: statement type, surfaces with their
+aliases, column references (qualified and unqualified), output aliases,
+bind parameters, the top-level LIMIT and structural problems (SELECT *,
+extra statements, forbidden keywords/functions, cross joins). It is not a
+full SQL grammar: anything it can't place is left unchecked rather than
+rejected, except where a check errs on the side of safety.
+"""
+import re
+from typing import Dict, List, Tuple
+
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>[EeBbXx]?'(?:[^']|'')*')
+  | (?P<dollar>\$(?P<tag>[A-Za-z_]*)\$.*?\$(?P=tag)\$)
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<cast>::)
+  | (?P<param>:[A-Za-z_]\w*)
+  | (?P<positional>\$\d+)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op><>|<=|>=|!=|\|\||[-+*/%<>=~!@#^&|`?])
+  | (?P<punct>[(),;.\[\]])
+""", re.VERBOSE | re.DOTALL)
+
+# Keywords and type names: never column references
+KEYWORDS = frozenset("""
+    SELECT FROM WHERE AND OR NOT IS NULL TRUE FALSE AS ON USING JOIN LEFT RIGHT INNER OUTER FULL CROSS NATURAL
+    LATERAL GROUP BY ORDER HAVING LIMIT OFFSET FETCH NEXT ONLY ASC DESC NULLS FIRST LAST DISTINCT ALL ANY SOME
+    CASE WHEN THEN ELSE END IN BETWEEN LIKE ILIKE SIMILAR ESCAPE EXISTS UNION INTERSECT EXCEPT WITH RECURSIVE
+    OVER PARTITION WINDOW ROWS RANGE GROUPS PRECEDING FOLLOWING UNBOUNDED CURRENT ROW FILTER WITHIN INTERVAL
+    CAST COALESCE NULLIF GREATEST LEAST EXTRACT CURRENT_DATE CURRENT_TIME CURRENT_TIMESTAMP LOCALTIME
+    LOCALTIMESTAMP AT ZONE TIME TIMESTAMP DATE INTEGER INT INT2 INT4 INT8 SMALLINT BIGINT NUMERIC DECIMAL REAL
+    FLOAT FLOAT4 FLOAT8 DOUBLE PRECISION TEXT VARCHAR CHAR CHARACTER VARYING BOOLEAN BOOL JSON JSONB ARRAY
+    YEAR QUARTER MONTH WEEK DAY HOUR MINUTE SECOND EPOCH DOW DOY ORDINALITY VALUES
+""".split())
+
+# Statements (or clauses, like FOR UPDATE) that write, lock or run other code
+FORBIDDEN_KEYWORDS = ('INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER', 'TRUNCATE', 'GRANT', 'REVOKE',
+                      'COPY', 'CALL', 'EXECUTE', 'MERGE', 'LOCK', 'VACUUM', 'REFRESH')
+
+# Server functions that sleep, read files or reach other servers/sessions
+FORBIDDEN_FUNCTIONS = frozenset({
+    'pg_sleep', 'pg_sleep_for', 'pg_sleep_until', 'pg_read_file', 'pg_read_binary_file', 'pg_ls_dir', 'pg_stat_file',
+    'lo_import', 'lo_export', 'dblink', 'dblink_exec', 'pg_terminate_backend', 'pg_cancel_backend', 'set_config',
+    'query_to_xml', 'pg_reload_conf', 'current_setting', 'lo_get'
+})
+
+# Row-locking clauses (FOR UPDATE / FOR NO KEY UPDATE / FOR SHARE / FOR KEY SHARE)
+LOCKING_WORDS = frozenset({'UPDATE', 'SHARE', 'NO', 'KEY'})
+
+# Keywords that take a parenthesised argument list like a function
+FUNCTION_KEYWORDS = frozenset({'CAST', 'COALESCE', 'NULLIF', 'GREATEST', 'LEAST', 'EXTRACT', 'ANY', 'SOME', 'ALL',
+                               'ARRAY', 'FILTER', 'OVER', 'NUMERIC', 'DECIMAL', 'VARCHAR', 'CHAR', 'TIMESTAMP'})
+
+CLAUSES = frozenset({'SELECT', 'FROM', 'WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'ON', 'USING',
+                     'JOIN', 'WINDOW', 'UNION', 'INTERSECT', 'EXCEPT'})
+
+VALUE_END = ('word', 'quoted', 'number', 'string', 'dollar', 'param', 'positional')
+
+
+def tokenize(sql: str) -> List[Tuple[str, str]]:
+    """
+    Split SQL into (kind, text) tokens (whitespace and comments dropped)
+
+    Raises:
+        ValueError: Unterminated string/comment or a character SQL doesn't use
+    """
+    tokens = []
+    position = 0
+    while position < len(sql):
+        match = TOKEN_PATTERN.match(sql, position)
+        if match is None:
+            raise ValueError(f"Unexpected character {sql[position]!r} at position {position}")
+        kind = match.lastgroup if match.lastgroup != 'tag' else 'dollar'
+        if kind not in ('space', 'comment'):
+            tokens.append((kind, match.group(0)))
+        position = match.end()
+    return tokens
+
+
+def _identifier(token: Tuple[str, str]) -> str:
+    kind, text = token
+    return text[1:-1].replace('""', '"') if kind == 'quoted' else text.lower()
+
+
+def parse_sql(sql: str) -> Dict:
+    """
+    Extract what validation needs from one statement in a single pass
+
+    Returns:
+        {
+            'statement': first keyword ('SELECT', 'WITH', ...),
+            'surfaces': {alias or name: surface},
+            'derived': aliases of subqueries in FROM,
+            'columns': [(qualifier or None, column)],
+            'aliases': output/column aliases defined with or without AS,
+            'params': bind parameter names,
+            'limit': ('number', n) | ('param', name) | ('other', text) | None (top level),
+            'errors': structural problems, in order found
+        }
+    """
+    result = {'statement': '', 'surfaces': {}, 'derived': set(), 'columns': [], 'aliases': set(),
+              'params': [], 'limit': None, 'errors': []}
+    errors = result['errors']
+    try:
+        tokens = tokenize(sql)
+    except ValueError as e:
+        errors.append(str(e))
+        return result
+    if not tokens:
+        errors.append("Empty statement")
+        return result
+
+    result['statement'] = tokens[0][1].upper() if tokens[0][0] == 'word' else tokens[0][1]
+
+    # One frame per parenthesis level: kind ('top'|'call'|'group'|'subquery'|'using'|'derived') and clause
+    frames = [{'kind': 'top', 'clause': None}]
+    expect_table = False   # next word names a FROM/JOIN item
+    expect_alias = None    # surface/subquery just named: an alias may follow
+    count = len(tokens)
+
+    for i, (kind, text) in enumerate(tokens):
+        upper = text.upper()
+        frame = frames[-1]
+        previous = tokens[i - 1] if i else (None, '')
+        following = tokens[i + 1] if i + 1 < count else (None, '')
+
+        if kind == 'punct' and text == ';':
+            if any(token != ('punct', ';') for token in tokens[i + 1:]):
+                errors.append("Multiple statements not allowed")
+            break
+
+        if kind == 'param':
+            result['params'].append(text[1:])
+        elif kind == 'positional':
+            errors.append("Positional parameters are not allowed; use :name")
+
+        # Alias right after a FROM/JOIN item ("fact_financials f", "mv x AS y", "(SELECT ...) AS sub")
+        if expect_alias is not None:
+            target, is_derived = expect_alias
+            if kind == 'word' and upper == 'AS':
+                continue
+            expect_alias = None
+            if kind in ('word', 'quoted') and (kind == 'quoted' or upper not in KEYWORDS):
+                alias = _identifier((kind, text))
+                if is_derived:
+                    result['derived'].add(alias)
+                else:
+                    result['surfaces'][alias] = target
+                continue
+
+        if kind == 'punct' and text == '(':
+            starts_select = following[0] == 'word' and following[1].upper() == 'SELECT'
+            if expect_table:
+                paren = 'derived'
+            elif starts_select:
+                paren = 'subquery'
+            elif previous[0] == 'word' and previous[1].upper() == 'USING':
+                paren = 'using'
+            elif previous[0] == 'quoted' or previous[0] == 'word' and (previous[1].upper() not in KEYWORDS
+                                                                      or previous[1].upper() in FUNCTION_KEYWORDS):
+                paren = 'call'
+            else:
+                paren = 'group'
+            expect_table = False
+            frames.append({'kind': paren, 'clause': None})
+            continue
+
+        if kind == 'punct' and text == ')':
+            closed = frames.pop() if len(frames) > 1 else frame
+            if closed['kind'] == 'derived':
+                expect_alias = (None, True)
+            continue
+
+        if kind == 'punct' and text == ',':
+            if frame['clause'] == 'FROM' and frame['kind'] != 'call':
+                errors.append("Implicit cross join detected; use explicit JOINs with ON clauses")
+                expect_table = True
+            continue
+
+        if kind in ('word', 'quoted') and following == ('punct', '('):
+            function = _identifier((kind, text)).lower()
+            if function in FORBIDDEN_FUNCTIONS:
+                errors.append(f"Forbidden function: {function}")
+
+        if kind == 'word':
+            if upper == 'FOR' and following[0] == 'word' and following[1].upper() in LOCKING_WORDS:
+                errors.append(f"Locking clause not allowed: FOR {following[1].upper()}")
+            if upper in FORBIDDEN_KEYWORDS:
+                errors.append(f"Forbidden keyword: {upper}")
+
+            if upper in CLAUSES and frame['kind'] != 'call' and not (upper == 'FROM' and previous[0] == 'word'
+                                                                     and previous[1].upper() == 'DISTINCT'):
+                if upper == 'JOIN' and previous[0] == 'word' and previous[1].upper() == 'CROSS':
+                    errors.append("CROSS JOIN is not allowed")
+                frame['clause'] = 'FROM' if upper == 'JOIN' else upper
+                if upper in ('FROM', 'JOIN'):
+                    expect_table = True
+                if upper == 'LIMIT' and len(frames) == 1:
+                    value = following
+                    if value[0] == 'number':
+                        result['limit'] = ('number', int(float(value[1])))
+                    elif value[0] == 'param':
+                        result['limit'] = ('param', value[1][1:])
+                    else:
+                        result['limit'] = ('other', value[1])
+                continue
+
+        if expect_table and kind in ('word', 'quoted'):
+            if kind == 'word' and upper in ('LATERAL', 'ONLY'):
+                continue
+            expect_table = False
+            name = _identifier((kind, text))
+            j = i
+            while j + 2 < count and tokens[j + 1] == ('punct', '.') and tokens[j + 2][0] in ('word', 'quoted'):
+                name += '.' + _identifier(tokens[j + 2])
+                j += 2
+            result['surfaces'][name] = name  # a set-returning function has to be allowlisted too
+            if not (j + 1 < count and tokens[j + 1] == ('punct', '(')):
+                expect_alias = (name, False)
+            continue
+
+        if kind in ('word', 'quoted'):
+            if kind == 'word' and upper in KEYWORDS:
+                continue
+            name = _identifier((kind, text))
+            if previous == ('punct', '.'):
+                continue  # second part of a qualified name (handled with its qualifier)
+            if following == ('punct', '.') and i + 2 < count and tokens[i + 2][0] in ('word', 'quoted', 'op'):
+                part = tokens[i + 2]
+                if part == ('op', '*'):
+                    if frame['clause'] == 'SELECT':
+                        errors.append("SELECT * is not allowed; specify columns explicitly")
+                else:
+                    result['columns'].append((name, _identifier(part)))
+                continue
+            if following == ('punct', '('):
+                continue  # function call
+            if previous[0] == 'cast':
+                continue  # type name after ::
+            if previous[0] == 'word' and previous[1].upper() == 'AS':
+                result['aliases'].add(name)
+                continue
+            if previous[0] in VALUE_END and not (previous[0] == 'word' and previous[1].upper() in KEYWORDS) \
+                    or previous == ('punct', ')') and frame['clause'] == 'SELECT':
+                result['aliases'].add(name)  # bare alias: "revenue / 1e9 revenue_b"
+                continue
+            result['columns'].append((None, name))
+            continue
+
+        if kind == 'op' and text == '*' and frame['clause'] == 'SELECT' and frame['kind'] != 'call':
+            if previous[0] == 'word' and previous[1].upper() in ('SELECT', 'DISTINCT') or previous == ('punct', ','):
+                errors.append("SELECT * is not allowed; specify columns explicitly")
+
+    return result
@@ -1,9 +1,17 @@
 """
 SQL validation and whitelist enforcement
+
+Queries are checked with the single-pass tokenizer/parser in
+db/sql_parser.py rather than regexes over the raw text. Everything that
+depends only on the statement (shape, surfaces, columns, bind names, a
+literal LIMIT) is memoized per SQL text and schema version, so a template
+that has been validated once costs a dict lookup; only the parameter
+checks run on every call.
 """
-import re
-from typing import List, Tuple, Dict
+from functools import lru_cache
+from typing import List, Tuple, Dict, Set
 from .pool import db_pool
+from .sql_parser import parse_sql
 
 
 # Allowlist of surfaces the agent can query
@@ -46,15 +54,19 @@ ALLOWED_SURFACES = {
 }
 
 # Allowed parameter names
-ALLOWED_PARAMS = {'ticker', 'fy', 'fq', 'limit', 't1', 't2', 'latest'}
+ALLOWED_PARAMS = {'ticker', 'fy', 'fq', 'fy_from', 'fy_to', 'fq_from', 'fq_to', 'limit', 't1', 't2', 'latest',
+                  'after_company_id', 'after_fiscal_year', 'after_fiscal_quarter'}  # export keyset position
+
+# Schema cache (will be loaded from database): surface -> column names
+_schema_cache: Dict[str, Set[str]] = {}
 
-# Schema cache (will be loaded from database)
-_schema_cache: Dict[str, List[str]] = {}
+# Bumped on every schema load so memoized verdicts see new columns
+_schema_version = 0
 
 
 async def load_schema_cache():
     """Load schema cache from database"""
-    global _schema_cache
+    global _schema_version
     
     sql = """
     SELECT surface_name, column_name
@@ -70,11 +82,8 @@ async def load_schema_cache():
         )
         
         for record in records:
-            surface = record['surface_name']
-            column = record['column_name']
-            if surface not in _schema_cache:
-                _schema_cache[surface] = []
-            _schema_cache[surface].append(column)
+            _schema_cache.setdefault(record['surface_name'], set()).add(record['column_name'])
+        _schema_version += 1
     except Exception as e:
         print(f"Warning: Could not load schema cache: {e}")
         # Continue without schema cache (will skip column validation)
@@ -89,105 +98,89 @@ def validate_sql(sql: str, params: dict = None) -> Tuple[bool, str]:
     """
     params = params or {}
     
-    # 1. Check for SELECT-only
-    sql_upper = sql.strip().upper()
-    if not sql_upper.startswith('SELECT'):
-        return False, "Only SELECT queries are allowed"
+    error, limit_param = _validate_statement(sql, _schema_version)
+    if error:
+        return False, error
+    
+    for param_name in params.keys():
+        if param_name not in ALLOWED_PARAMS:
+            return False, f"Parameter '{param_name}' is not allowed"
     
-    # 2. Check for single statement (no semicolons except at end)
-    semicolon_count = sql.count(';')
-    if semicolon_count > 1 or (semicolon_count == 1 and not sql.strip().endswith(';')):
-        return False, "Multiple statements not allowed"
+    if limit_param is not None:
+        value = params.get(limit_param, 0)
+        if isinstance(value, (int, float)) and value > 200:
+            return False, "LIMIT parameter must be ≤ 200"
     
-    # 3. Check for DDL/DML keywords
-    forbidden_keywords = ['INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER', 'TRUNCATE', 'GRANT', 'REVOKE']
-    for keyword in forbidden_keywords:
-        if re.search(rf'\b{keyword}\b', sql_upper):
-            return False, f"Forbidden keyword: {keyword}"
+    return True, ""
+
+
+@lru_cache(maxsize=2048)
+def _validate_statement(sql: str, schema_version: int) -> Tuple[str, str]:
+    """
+    Parameter-independent checks for one statement (memoized)
     
-    # 4. Check for SELECT *
-    if re.search(r'SELECT\s+\*', sql_upper):
-        return False, "SELECT * is not allowed; specify columns explicitly"
+    Returns:
+        (error_message or "", name of the LIMIT bind parameter or None)
+    """
+    parsed = parse_sql(sql)
     
-    # 5. Extract surfaces from FROM/JOIN clauses
-    surfaces_in_query = extract_surfaces(sql)
+    if parsed['statement'] != 'SELECT':
+        return "Only SELECT queries are allowed", None
+    if parsed['errors']:
+        return parsed['errors'][0], None
     
-    # 6. Check surfaces against allowlist
-    for surface in surfaces_in_query:
+    for surface in sorted(set(parsed['surfaces'].values())):
         if surface not in ALLOWED_SURFACES:
-            return False, f"Surface '{surface}' is not in the allowlist"
-    
-    # 7. Check for LIMIT clause
-    if 'LIMIT' not in sql_upper:
-        return False, "LIMIT clause is required"
-    
-    # 8. Extract and validate LIMIT value
-    limit_match = re.search(r'LIMIT\s+(:limit|\d+)', sql, re.IGNORECASE)
-    if limit_match:
-        limit_val = limit_match.group(1)
-        if limit_val.isdigit() and int(limit_val) > 200:
-            return False, "LIMIT must be ≤ 200"
-        elif limit_val == ':limit' and params.get('limit', 0) > 200:
-            return False, "LIMIT parameter must be ≤ 200"
-    
-    # 9. Validate parameters
-    for param_name in params.keys():
-        if param_name not in ALLOWED_PARAMS:
-            return False, f"Parameter '{param_name}' is not allowed"
+            return f"Surface '{surface}' is not in the allowlist", None
     
-    # 10. Check for cross joins without ON
-    if re.search(r'CROSS\s+JOIN', sql_upper):
-        return False, "CROSS JOIN is not allowed"
+    for name in parsed['params']:
+        if name not in ALLOWED_PARAMS:
+            return f"Parameter '{name}' is not allowed", None
     
-    # Check for implicit cross joins (comma-separated tables without WHERE/USING/ON)
-    if ',' in sql and 'WHERE' not in sql_upper and 'USING' not in sql_upper and 'ON' not in sql_upper:
-        # This is a heuristic; may need refinement
-        return False, "Implicit cross join detected; use explicit JOINs with ON clauses"
+    limit = parsed['limit']
+    if limit is None:
+        return "LIMIT clause is required", None
+    if limit[0] == 'number' and limit[1] > 200:
+        return "LIMIT must be ≤ 200", None
+    if limit[0] == 'other':
+        return "LIMIT must be a number or a bind parameter", None
     
-    # 11. Validate columns against schema cache (if loaded)
-    # Disabled for now - too strict for JOIN queries
-    # if _schema_cache:
-    #     column_validation = validate_columns(sql, surfaces_in_query)
-    #     if not column_validation[0]:
-    #         return column_validation
+    if _schema_cache:
+        ok, error = validate_columns(parsed)
+        if not ok:
+            return error, None
     
-    return True, ""
+    return "", limit[1] if limit[0] == 'param' else None
 
 
 def extract_surfaces(sql: str) -> List[str]:
     """Extract table/view names from FROM and JOIN clauses"""
-    surfaces = []
-    
-    # Pattern to match FROM/JOIN table_name [AS alias]
-    pattern = r'(?:FROM|JOIN)\s+([a-z_][a-z0-9_]*)'
-    matches = re.findall(pattern, sql, re.IGNORECASE)
-    
-    for match in matches:
-        surface = match.lower()
-        if surface not in ['as', 'on', 'using', 'where', 'group', 'order', 'limit']:
-            surfaces.append(surface)
-    
-    return list(set(surfaces))
+    return sorted(set(parse_sql(sql)['surfaces'].values()))
 
 
-def validate_columns(sql: str, surfaces: List[str]) -> Tuple[bool, str]:
+def validate_columns(parsed: Dict) -> Tuple[bool, str]:
     """
-    Validate that all selected columns exist in the schema cache
+    Validate a parsed query's column references against the schema cache
     
-    This is a simplified validation; a full parser would be more robust
+    Qualified references (f.revenue) are checked against their alias's
+    surface; unqualified ones must exist on at least one surface of the
+    query. Surfaces without a cached schema, subquery aliases and output
+    aliases (ORDER BY revenue_b) are not checked.
     """
-    # Extract column references (simplified)
-    # Look for patterns like: SELECT a.col1, b.col2, col3
-    
-    # For now, we'll do a basic check:
-    # If a surface is used, ensure it's in the schema cache
-    for surface in surfaces:
-        if surface not in _schema_cache:
-            return False, f"Surface '{surface}' not found in schema cache"
-    
-    # TODO: Implement full column validation
-    # This would require parsing the SELECT clause and checking each column
-    # against the schema cache for the corresponding surface
+    surfaces = parsed['surfaces']
+    unqualified_known = all(surface in _schema_cache for surface in surfaces.values()) and not parsed['derived']
+    all_columns = set().union(*(_schema_cache.get(surface, set()) for surface in surfaces.values()))
+    
+    for qualifier, column in parsed['columns']:
+        if qualifier is None:
+            if unqualified_known and column not in all_columns and column not in parsed['aliases']:
+                return False, f"Unknown column '{column}'"
+        elif qualifier in surfaces:
+            known = _schema_cache.get(surfaces[qualifier])
+            if known is not None and column not in known:
+                return False, f"Unknown column '{qualifier}.{column}' on {surfaces[qualifier]}"
+        elif qualifier not in parsed['derived']:
+            return False, f"Unknown table alias '{qualifier}'"
     
     return True, ""
 
@@ -199,4 +192,4 @@ def get_allowed_surfaces() -> List[str]:
 
 def get_schema_for_surface(surface: str) -> List[str]:
     """Get column list for a surface"""
-    return _schema_cache.get(surface, [])
+    return sorted(_schema_cache.get(surface, ()))
@@ -1,16 +1,105 @@
 """
 Query decomposer: split multi-part questions into ordered tasks
 """
+import asyncio
 import json
 import os
-from typing import Dict, List
+import re
+import time
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
+from metrics import observe_llm
 
 # Load environment variables
 load_dotenv()
 
+# Growth metric keywords -> analytics.growth.GROWTH_METRICS keys (most specific first)
+GROWTH_METRIC_KEYWORDS = [
+    ('EARNINGS PER SHARE', 'eps'), ('EPS', 'eps'),
+    ('NET INCOME', 'net_income'), ('OPERATING INCOME', 'operating_income'), ('GROSS PROFIT', 'gross_profit'),
+    ('R&D', 'r_and_d_expenses'), ('RESEARCH', 'r_and_d_expenses'), ('SG&A', 'sg_and_a_expenses'),
+    ('COGS', 'cogs'), ('COST OF', 'cogs'), ('OPERATING CASH FLOW', 'operating_cash_flow'),
+    ('CASH FLOW', 'operating_cash_flow'), ('CAPEX', 'capex'), ('CAPITAL EXPENDITURE', 'capex'),
+    ('DIVIDEND', 'dividends'), ('BUYBACK', 'buybacks'), ('TOTAL ASSETS', 'total_assets'),
+    ('LIABILITIES', 'total_liabilities'), ('EQUITY', 'equity'), ('ASSETS', 'total_assets'),
+    ('REVENUE', 'revenue'), ('SALES', 'revenue'), ('EARNINGS', 'net_income'), ('PROFIT', 'net_income')
+]
+
+GROWTH_KEYWORDS = ['GROWTH', 'GROW', 'YOY', 'QOQ', 'CAGR', 'YEAR OVER YEAR', 'QUARTER OVER QUARTER', 'COMPOUND']
+PEER_KEYWORDS = ['ALL PEERS', 'ALL COMPANIES', 'EVERY COMPANY', 'PEERS', 'ACROSS COMPANIES', 'WHOLE UNIVERSE']
+# Screen metric phrases -> analytics.screener.SCREEN_METRICS keys (most specific first)
+SCREEN_METRIC_KEYWORDS = [
+    ('REVENUE GROWTH', 'revenue_growth'), ('SALES GROWTH', 'revenue_growth'),
+    ('NET INCOME GROWTH', 'net_income_growth'), ('EARNINGS GROWTH', 'net_income_growth'),
+    ('GROSS MARGIN', 'gross_margin'), ('OPERATING MARGIN', 'operating_margin'),
+    ('NET MARGIN', 'net_margin'), ('PROFIT MARGIN', 'net_margin'),
+    ('RETURN ON EQUITY', 'roe'), ('ROE', 'roe'), ('RETURN ON ASSETS', 'roa'), ('ROA', 'roa'),
+    ('DEBT TO EQUITY', 'debt_to_equity'), ('DEBT-TO-EQUITY', 'debt_to_equity'),
+    ('DEBT TO ASSETS', 'debt_to_assets'), ('DEBT-TO-ASSETS', 'debt_to_assets'),
+    ('R&D INTENSITY', 'rnd_to_revenue'), ('R&D TO REVENUE', 'rnd_to_revenue'),
+    ('EPS', 'eps'), ('NET INCOME', 'net_income'), ('OPERATING INCOME', 'operating_income'),
+    ('GROSS PROFIT', 'gross_profit'), ('REVENUE', 'revenue'), ('SALES', 'revenue')
+]
+SCREEN_OPERATORS = {
+    '>=': '>=', '<=': '<=', '>': '>', '<': '<', 'AT LEAST': '>=', 'AT MOST': '<=',
+    'ABOVE': '>', 'OVER': '>', 'GREATER THAN': '>', 'MORE THAN': '>', 'EXCEEDING': '>',
+    'BELOW': '<', 'UNDER': '<', 'LESS THAN': '<'
+}
+SCREEN_KEYWORDS = ['SCREEN', 'COMPANIES WITH', 'COMPANIES WHERE', 'WHICH COMPANIES', 'FIND COMPANIES',
+                   'LIST COMPANIES', 'SHOW COMPANIES', 'STOCKS WITH', 'FIRMS WITH']
+
+RANKING_KEYWORDS = ['WHICH COMPANY', 'WHICH COMPANIES', 'HIGHEST', 'LOWEST', 'FASTEST', 'SLOWEST', 'RANK', 'TOP ']
+
+# Period ranges: "Q3 2022 to Q2 2024", "from 2019 to 2024", "2019-2024", "since 2020", "last 8 quarters"
+NUMBER_WORDS = {'TWO': 2, 'THREE': 3, 'FOUR': 4, 'FIVE': 5, 'SIX': 6, 'SEVEN': 7, 'EIGHT': 8,
+                'NINE': 9, 'TEN': 10, 'ELEVEN': 11, 'TWELVE': 12}
+RANGE_SEPARATOR = r'\s*(?:TO|THROUGH|THRU|UNTIL|-|–)\s*'
+QUARTER_RANGE_PATTERN = re.compile(
+    r'\bQ([1-4])\s*(?:FY\s*)?((?:19|20)\d{2})' + RANGE_SEPARATOR + r'Q([1-4])\s*(?:FY\s*)?((?:19|20)\d{2})\b')
+YEAR_RANGE_PATTERN = re.compile(
+    r'\b(?:FY\s*)?((?:19|20)\d{2})' + RANGE_SEPARATOR + r'(?:FY\s*)?((?:19|20)\d{2})\b'
+    r'|\bBETWEEN\s+(?:FY\s*)?((?:19|20)\d{2})\s+AND\s+(?:FY\s*)?((?:19|20)\d{2})\b')
+# Open-ended: "since 2021", "from 2021 onward" - a bare "from 2023" is a single year
+SINCE_PATTERN = re.compile(
+    r'\bSINCE\s+(?:FY\s*)?((?:19|20)\d{2})\b'
+    r'|\bFROM\s+(?:FY\s*)?((?:19|20)\d{2})\s+(?:ONWARDS?|FORWARD|(?:TO|THROUGH|UNTIL)\s+(?:DATE|NOW|TODAY|(?:THE\s+)?PRESENT))\b')
+LAST_N_PATTERN = re.compile(
+    r'\b(?:LAST|PAST|PREVIOUS|TRAILING)\s+(\d{1,2}|' + '|'.join(NUMBER_WORDS) + r')\s+(?:FISCAL\s+)?(QUARTERS|YEARS)\b')
+
+
+def extract_period_range(question_upper: str) -> Optional[Dict]:
+    """
+    Period range named in a question
+    
+    Returns:
+        {'fy': None, 'fq': None, 'fy_from', 'fy_to', 'fq_from', 'fq_to', 'last_n'}
+        plus 'unit' ('quarter'/'year', for last N), or None for a single period
+    """
+    period = {'fy': None, 'fq': None, 'fy_from': None, 'fy_to': None, 'fq_from': None, 'fq_to': None, 'last_n': None}
+    
+    quarters = QUARTER_RANGE_PATTERN.search(question_upper)
+    years = YEAR_RANGE_PATTERN.search(question_upper)
+    since = SINCE_PATTERN.search(question_upper)
+    last = LAST_N_PATTERN.search(question_upper)
+    if quarters:
+        start = (int(quarters.group(2)), int(quarters.group(1)))
+        end = (int(quarters.group(4)), int(quarters.group(3)))
+        (period['fy_from'], period['fq_from']), (period['fy_to'], period['fq_to']) = sorted([start, end])
+    elif years:
+        bounds = [int(year) for year in years.groups() if year]
+        period['fy_from'], period['fy_to'] = min(bounds), max(bounds)
+    elif since:
+        period['fy_from'] = int(since.group(1) or since.group(2))
+    elif last:
+        count = last.group(1)
+        period['last_n'] = int(count) if count.isdigit() else NUMBER_WORDS[count]
+        period['unit'] = 'quarter' if last.group(2) == 'QUARTERS' else 'year'
+    else:
+        return None
+    return period
+
 
 class QueryDecomposer:
     """Decomposes natural language queries into structured tasks"""
@@ -26,12 +115,14 @@ class QueryDecomposer:
         with open('catalog/routing_examples.json', 'r') as f:
             self.examples = json.load(f)['examples']
     
-    async def decompose(self, question: str) -> Dict:
+    async def decompose(self, question: str, timeout: Optional[float] = None) -> Dict:
         """
         Decompose a natural language question into structured tasks
         
         Args:
             question: User's natural language question
+            timeout: Seconds allowed for the LLM call (0 = skip it); on overrun the
+                keyword/regex intent is used instead
             
         Returns:
             Dict with 'greeting', 'tasks', and 'checks'
@@ -112,14 +203,20 @@ class QueryDecomposer:
         elif 'FOURTH QUARTER' in question_upper or 'FOURTH-QUARTER' in question_upper:
             period["fq"] = 4
         
+        # A period range ("2019 to 2024", "last 8 quarters") is one task over the range
+        period_range = extract_period_range(question_upper)
+        range_unit = period_range.get('unit') if period_range else None
+        if period_range:
+            period = period_range
+        
         # Detect intent from keywords
         # Default: if year but no quarter specified → annual_metrics
         # If quarter specified or "latest quarter" → quarter_snapshot
         intent = "quarter_snapshot"  # default
         
         # Check if this is a year-only query (no quarter specified)
-        has_year = period.get("fy") is not None
-        has_quarter = period.get("fq") is not None
+        has_year = period.get("fy") is not None or bool(period_range and (period_range['fy_from'] or range_unit == 'year'))
+        has_quarter = period.get("fq") is not None or bool(period_range and (period_range['fq_from'] or range_unit == 'quarter'))
         
         # Combined/Complete queries (CHECK FIRST - comprehensive views)
         # Keywords: complete, everything, full picture, comprehensive, all metrics, full analysis
@@ -283,7 +380,7 @@ class QueryDecomposer:
             intent = "quarter_snapshot"
         # Growth queries
         elif not is_multi_company and any(word in question_upper for word in ['GROWTH', 'YOY', 'QOQ', 'CAGR']):
-            if 'CAGR' in question_upper or '3-YEAR' in question_upper or '5-YEAR' in question_upper:
+            if 'CAGR' in question_upper or re.search(r'\b\d+[-\s]?YEAR', question_upper):
                 intent = "growth_annual_cagr"
             else:
                 intent = "growth_qoq_yoy"
@@ -296,9 +393,18 @@ class QueryDecomposer:
             HumanMessage(content=f"Question: {question}\n\nOutput (JSON only):")
         ]
         
-        response = await self.llm.ainvoke(messages)
-        
         try:
+            if timeout is not None and timeout <= 0:
+                raise TimeoutError("no time budget left for LLM decomposition")
+            llm_started = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(self.llm.ainvoke(messages), timeout=timeout)
+            except Exception as llm_error:
+                timed_out = isinstance(llm_error, (TimeoutError, asyncio.TimeoutError))
+                observe_llm('decompose', time.perf_counter() - llm_started, outcome='timeout' if timed_out else 'error')
+                raise
+            observe_llm('decompose', time.perf_counter() - llm_started, response)
+            
             # Parse JSON response
             result = json.loads(response.content)
             
@@ -310,6 +416,10 @@ class QueryDecomposer:
             if 'checks' not in result:
                 result['checks'] = ["use_whitelist", "bind_params", "limit_results"]
             
+            # Per-year tasks for a range collapse into one task carrying the range
+            if period_range and result['tasks']:
+                result['tasks'] = self._collapse_range_tasks(result['tasks'], period_range)
+            
             # If entities are empty but we found tickers, add them
             if result['tasks'] and not result['tasks'][0].get('entities'):
                 result['tasks'][0]['entities'] = tickers
@@ -348,24 +458,196 @@ class QueryDecomposer:
                             # Default to quarterly for multi-company
                             result['tasks'][0]['intent'] = 'multi_company_quarter'
             
+            # Multi-predicate screens replace the LLM tasks with a single screen task
+            screen = self._extract_screen_spec(question_upper, has_quarter)
+            if screen:
+                result['tasks'] = [{
+                    'intent': 'screen',
+                    'entities': [],
+                    'period': period,
+                    'measures': [],
+                    'screen': screen
+                }]
+                return result
+            
+            # Growth questions beyond the fixed template windows go to the growth engine
+            growth = self._extract_growth_spec(question_upper, tickers, has_year, has_quarter)
+            if growth and result['tasks']:
+                task = result['tasks'][0]
+                task['intent'] = 'growth_annual_cagr' if growth['frequency'] == 'annual' else 'growth_qoq_yoy'
+                task['growth'] = growth
+                if growth['scope'] == 'tickers' and not task.get('entities'):
+                    task['entities'] = tickers
+            
             return result
         except Exception as e:
             # Fallback: create a single task with detected intent and extracted tickers
             # Make sure intent is using the same logic
             fallback_intent = intent  # Already computed above with year/quarter logic
+            fallback_task = {
+                "intent": fallback_intent,
+                "entities": tickers,
+                "period": period,
+                "measures": []
+            }
+            
+            screen = self._extract_screen_spec(question_upper, has_quarter)
+            growth = self._extract_growth_spec(question_upper, tickers, has_year, has_quarter)
+            if screen:
+                fallback_task.update({'intent': 'screen', 'entities': [], 'screen': screen})
+            elif growth:
+                fallback_task['intent'] = 'growth_annual_cagr' if growth['frequency'] == 'annual' else 'growth_qoq_yoy'
+                fallback_task['growth'] = growth
             
             return {
                 "greeting": "",
-                "tasks": [{
-                    "intent": fallback_intent,
-                    "entities": tickers,
-                    "period": period,
-                    "measures": []
-                }],
+                "tasks": [fallback_task],
                 "checks": ["use_whitelist", "bind_params", "limit_results"],
-                "error": f"Exception in decompose: {str(e)}"
+                "error": f"Exception in decompose: {str(e)}",
+                "timed_out": isinstance(e, (TimeoutError, asyncio.TimeoutError))
             }
     
+    def _collapse_range_tasks(self, tasks: List[Dict], period_range: Dict) -> List[Dict]:
+        """
+        Merge tasks that differ only in period into one task over the range
+        
+        Args:
+            tasks: LLM tasks, possibly one per year/quarter of the range
+            period_range: Range from extract_period_range
+            
+        Returns:
+            One task per (intent, entities), each with the range as its period
+            and the measures/metrics of every task it replaces
+        """
+        collapsed = {}
+        for task in tasks:
+            key = (task.get('intent'), tuple(task.get('entities') or []))
+            kept = collapsed.get(key)
+            if kept is None:
+                collapsed[key] = {**task, 'period': dict(period_range)}
+                continue
+            for field in ('measures', 'metrics'):
+                extra = [item for item in task.get(field) or [] if item not in (kept.get(field) or [])]
+                if extra:
+                    kept[field] = list(kept.get(field) or []) + extra
+        return list(collapsed.values())
+    
+    def _extract_screen_spec(self, question_upper: str, has_quarter: bool):
+        """
+        Extract a screen (predicate tree, sort, order, limit) from the question
+        
+        "companies with net margin > 20% and revenue growth > 10% in FY2024" →
+        {'where': {'and': [net_margin > 0.2, revenue_growth > 0.1]}, ...}.
+        AND binds tighter than OR. Percentages become fractions and amounts
+        are read in $B. Returns None unless the question is a screen.
+        """
+        if not any(word in question_upper for word in SCREEN_KEYWORDS):
+            return None
+        
+        metrics = '|'.join(re.escape(word) for word, _ in SCREEN_METRIC_KEYWORDS)
+        operators = '|'.join(re.escape(op) for op in sorted(SCREEN_OPERATORS, key=len, reverse=True))
+        pattern = re.compile(
+            rf'(?P<metric>{metrics})\s*(?:OF|IS|WAS)?\s*(?P<op>{operators})\s*\$?'
+            rf'(?P<num>-?\d+(?:\.\d+)?)\s*(?P<unit>%|BILLION|BN|B|MILLION|M)?(?![A-Z0-9])'
+        )
+        metric_names = dict(SCREEN_METRIC_KEYWORDS)
+        
+        leaves, connectors, previous_end = [], [], None
+        for match in pattern.finditer(question_upper):
+            metric = metric_names[match.group('metric')]
+            value = float(match.group('num'))
+            unit = match.group('unit')
+            if metric in ('revenue', 'net_income', 'operating_income', 'gross_profit'):
+                value = value / 1000 if unit in ('MILLION', 'M') else value
+            elif metric not in ('eps', 'debt_to_equity') or unit == '%':
+                value = value / 100
+            
+            if previous_end is not None:
+                connectors.append('or' if re.search(r'\bOR\b', question_upper[previous_end:match.start()]) else 'and')
+            previous_end = match.end()
+            leaves.append({'metric': metric, 'op': SCREEN_OPERATORS[match.group('op')], 'value': value})
+        
+        if not leaves:
+            return None
+        
+        # AND runs grouped under OR
+        groups, current = [], [leaves[0]]
+        for connector, leaf in zip(connectors, leaves[1:]):
+            if connector == 'or':
+                groups.append(current)
+                current = [leaf]
+            else:
+                current.append(leaf)
+        groups.append(current)
+        terms = [group[0] if len(group) == 1 else {'and': group} for group in groups]
+        where = terms[0] if len(terms) == 1 else {'or': terms}
+        
+        sort_match = re.search(rf'(?:SORT(?:ED)?|RANK(?:ED)?|ORDER(?:ED)?)\s+BY\s+(?P<metric>{metrics})', question_upper)
+        top_match = re.search(r'\b(?:TOP|FIRST)\s+(\d{1,3})\b', question_upper)
+        
+        return {
+            'where': where,
+            'sort': metric_names[sort_match.group('metric')] if sort_match else None,
+            'order': 'asc' if any(word in question_upper for word in ['ASCENDING', 'LOWEST', 'SMALLEST']) else 'desc',
+            'limit': min(int(top_match.group(1)), 200) if top_match else 25,
+            'frequency': 'quarter' if has_quarter else 'annual'
+        }
+    
+    def _extract_growth_spec(self, question_upper: str, tickers: List[str], has_year: bool, has_quarter: bool):
+        """
+        Extract a growth spec (metric, kind, window, frequency, scope) for the growth engine
+        
+        Returns None when the question is not about growth or when the
+        growth_qoq_yoy / growth_annual_cagr templates already answer it
+        (revenue / net income, 1-quarter or 1-year windows, 3/5-year revenue
+        CAGR, single company).
+        """
+        if not any(word in question_upper for word in GROWTH_KEYWORDS):
+            return None
+        
+        metric = next((m for word, m in GROWTH_METRIC_KEYWORDS if word in question_upper), 'revenue')
+        years = re.search(r'\b(\d{1,2})[-\s]?(YEAR|YR)S?\b', question_upper)
+        quarters = re.search(r'\b(\d{1,2})[-\s]?QUARTERS?\b', question_upper)
+        
+        if 'CAGR' in question_upper or 'COMPOUND' in question_upper:
+            kind, window = 'cagr', int(years.group(1)) if years else 3
+        elif 'TTM' in question_upper or 'TRAILING' in question_upper:
+            kind, window = 'ttm', int(quarters.group(1)) if quarters else 4
+        elif any(word in question_upper for word in ['QOQ', 'QUARTER OVER QUARTER', 'SEQUENTIAL']) or quarters:
+            kind, window = 'qoq', int(quarters.group(1)) if quarters else 1
+        elif years and int(years.group(1)) > 1:
+            kind, window = 'cagr', int(years.group(1))
+        else:
+            kind, window = 'yoy', 1
+        
+        is_annual = kind == 'cagr' or (kind == 'yoy' and (
+            (has_year and not has_quarter) or any(word in question_upper for word in ['ANNUAL', 'FISCAL YEAR', 'FULL YEAR'])
+        ))
+        if any(word in question_upper for word in PEER_KEYWORDS):
+            scope = 'peers'
+        elif tickers:
+            scope = 'tickers'
+        elif any(word in question_upper for word in RANKING_KEYWORDS):
+            scope = 'peers'
+        else:
+            return None  # e.g. GDP growth - not a company question
+        
+        # Leave what the growth templates already cover on the template path
+        template_covered = scope == 'tickers' and len(tickers) == 1 and metric in ('revenue', 'net_income') and (
+            (kind in ('qoq', 'yoy') and window == 1)
+            or (kind == 'cagr' and metric == 'revenue' and window in (3, 5))
+        )
+        if template_covered or window < 1:
+            return None
+        
+        return {
+            'metric': metric,
+            'kind': kind,
+            'window': window,
+            'frequency': 'annual' if is_annual else 'quarter',
+            'scope': scope
+        }
+    
     def _build_few_shot_examples(self) -> str:
         """Build few-shot examples from catalog"""
         examples_text = "\n\n## Examples:\n\n"
@@ -0,0 +1,310 @@
+"""
+Streaming export of whitelisted surfaces beyond the LIMIT 200 cap
+
+/ask answers stay capped at 200 rows; /export streams a whole surface
+(optionally one ticker and a fiscal year range) as CSV, NDJSON or Arrow IPC
+for downstream models. The export is read in keyset pages: every page is an
+ordinary SELECT ... ORDER BY <key> LIMIT :limit that continues after the key
+of the previous page's last row, so validate_sql checks each page exactly as
+it checks template SQL. Pages run on one connection inside one read-only
+snapshot and are read through a server-side cursor, each chunk encoded and
+sent before the next is fetched: memory stays at one chunk whatever the
+export size.
+
+The key columns lead every row and the key of the last row is the resume
+token (values joined by '.', e.g. "3.2023.4"): a read that breaks off, or
+stops at max_rows, continues with after=<token>. NDJSON ends with a
+{"next": token} line; CSV and Arrow readers take the token from the last row.
+"""
+import csv
+import io
+import json
+import os
+import re
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from db.whitelist import get_schema_for_surface, validate_sql
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow IPC export is optional
+    pa = None
+
+
+# Exportable surfaces and their keyset (unique, non-null, in page order)
+EXPORT_SURFACES = {
+    'fact_financials': ('company_id', 'fiscal_year', 'fiscal_quarter'),
+    'vw_ratios_quarter': ('company_id', 'fiscal_year', 'fiscal_quarter'),
+    'vw_growth_quarter': ('company_id', 'fiscal_year', 'fiscal_quarter'),
+    'vw_stock_prices_quarter': ('company_id', 'fiscal_year', 'fiscal_quarter'),
+    'vw_company_complete_quarter': ('company_id', 'fiscal_year', 'fiscal_quarter'),
+    'vw_company_macro_context_quarter': ('company_id', 'fiscal_year', 'fiscal_quarter'),
+    'vw_company_full_quarter': ('company_id', 'fiscal_year', 'fiscal_quarter'),
+    'mv_financials_annual': ('company_id', 'fiscal_year'),
+    'mv_ratios_annual': ('company_id', 'fiscal_year'),
+    'vw_growth_annual': ('company_id', 'fiscal_year'),
+    'mv_stock_prices_annual': ('company_id', 'fiscal_year'),
+    'mv_company_complete_annual': ('company_id', 'fiscal_year'),
+    'mv_company_macro_context_annual': ('company_id', 'fiscal_year'),
+    'mv_company_full_annual': ('company_id', 'fiscal_year'),
+    'vw_macro_quarter': ('fiscal_year', 'fiscal_quarter'),
+    'mv_macro_annual': ('fiscal_year',)
+}
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows')
+}
+
+# Rows per keyset page (validate_sql caps LIMIT at 200)
+EXPORT_PAGE_SIZE = max(1, min(int(os.getenv('EXPORT_PAGE_SIZE', '200')), 200))
+
+# Rows per cursor fetch, i.e. per encoded chunk
+EXPORT_PREFETCH = max(1, int(os.getenv('EXPORT_PREFETCH', '100')))
+
+EXPORT_PAGE_TIMEOUT = float(os.getenv('EXPORT_PAGE_TIMEOUT_SECONDS', '30'))
+
+COLUMN_PATTERN = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+
+def plan_export(surface: str, columns: Optional[List[str]] = None, ticker: Optional[str] = None,
+                fy_from: Optional[int] = None, fy_to: Optional[int] = None) -> Dict:
+    """
+    Check an export request and fix its column list
+
+    Args:
+        surface: One of EXPORT_SURFACES
+        columns: Columns to export (default: every column in the schema cache)
+        ticker: Only this company
+        fy_from, fy_to: Inclusive fiscal year bounds
+
+    Returns:
+        Export spec for page_query/stream_export
+
+    Raises:
+        ValueError: Unknown surface/column, or no column list available
+    """
+    if surface not in EXPORT_SURFACES:
+        raise ValueError(f"Surface '{surface}' cannot be exported (choose from {', '.join(sorted(EXPORT_SURFACES))})")
+    key = EXPORT_SURFACES[surface]
+    known = get_schema_for_surface(surface)
+
+    requested = [column.lower() for column in (columns or known)]
+    if not requested:
+        raise ValueError(f"Schema for '{surface}' is not loaded: list the columns to export")
+    for column in requested:
+        if not COLUMN_PATTERN.match(column) or (known and column not in known):
+            raise ValueError(f"Unknown column '{column}' on {surface}")
+    if ticker and 'company_id' not in key:
+        raise ValueError(f"{surface} has no company dimension to filter by ticker")
+
+    return {
+        'surface': surface,
+        'key': key,
+        'columns': list(dict.fromkeys([*key, *requested])),  # key columns lead every row
+        'filters': {'ticker': ticker.upper() if ticker else None, 'fy_from': fy_from, 'fy_to': fy_to}
+    }
+
+
+def encode_token(key_values) -> str:
+    """Resume token for the row with these key values"""
+    return '.'.join(str(int(value)) for value in key_values)
+
+
+def decode_token(token: str, spec: Dict) -> Tuple[int, ...]:
+    """Key values of a resume token (ValueError if it doesn't fit the surface's key)"""
+    try:
+        values = tuple(int(part) for part in token.split('.'))
+    except ValueError:
+        values = ()
+    if len(values) != len(spec['key']):
+        raise ValueError(f"Invalid resume token '{token}' for {spec['surface']}")
+    return values
+
+
+def page_query(spec: Dict, after: Optional[Tuple[int, ...]] = None, limit: int = EXPORT_PAGE_SIZE) -> Tuple[str, Dict]:
+    """
+    SQL and params for the page after a key (None = first page)
+
+    Raises:
+        ValueError: The page fails validate_sql
+    """
+    key, filters = spec['key'], spec['filters']
+    conditions = [f"{column} IS NOT NULL" for column in key]
+    params = {'limit': limit}
+    if filters.get('ticker'):
+        conditions.append("company_id = (SELECT company_id FROM dim_company WHERE ticker = :ticker)")
+        params['ticker'] = filters['ticker']
+    if filters.get('fy_from') is not None:
+        conditions.append("fiscal_year >= :fy_from")
+        params['fy_from'] = filters['fy_from']
+    if filters.get('fy_to') is not None:
+        conditions.append("fiscal_year <= :fy_to")
+        params['fy_to'] = filters['fy_to']
+    if after is not None:
+        conditions.append(f"({', '.join(key)}) > ({', '.join(':after_' + column for column in key)})")
+        params.update({f"after_{column}": value for column, value in zip(key, after)})
+
+    sql = (
+        f"SELECT {', '.join(spec['columns'])} FROM {spec['surface']} "
+        f"WHERE {' AND '.join(conditions)} "
+        f"ORDER BY {', '.join(key)} LIMIT :limit"
+    )
+    is_valid, error_msg = validate_sql(sql, params)
+    if not is_valid:
+        raise ValueError(f"Export page failed validation: {error_msg}")
+    return sql, params
+
+
+class CSVEncoder:
+    """Header line, then one line per row (NULL as empty)"""
+
+    def start(self, attributes) -> bytes:
+        return self._lines([[attribute.name for attribute in attributes]])
+
+    def rows(self, records: List) -> bytes:
+        return self._lines([['' if value is None else value for value in record] for record in records])
+
+    def finish(self, next_token: Optional[str], error: Optional[str] = None) -> bytes:
+        if error:
+            raise RuntimeError(error)  # no trailer in CSV: cut the stream short
+        return b''
+
+    def _lines(self, rows: List[List]) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+
+class NDJSONEncoder:
+    """One JSON object per row, then {"next": token, "rows": n}"""
+
+    def __init__(self):
+        self.sent = 0
+
+    def start(self, attributes) -> bytes:
+        return b''
+
+    def rows(self, records: List) -> bytes:
+        self.sent += len(records)
+        return ''.join(json.dumps(dict(record), default=str) + "\n" for record in records).encode()
+
+    def finish(self, next_token: Optional[str], error: Optional[str] = None) -> bytes:
+        trailer = {'next': next_token, 'rows': self.sent}
+        if error:
+            trailer['error'] = error
+        return (json.dumps(trailer) + "\n").encode()
+
+
+def _arrow_type(type_name: str):
+    """Arrow type for a Postgres column type (anything unlisted exports as text)"""
+    if type_name in ('int2', 'int4', 'int8'):
+        return pa.int64()
+    if type_name in ('float4', 'float8', 'numeric'):
+        return pa.float64()
+    if type_name == 'bool':
+        return pa.bool_()
+    if type_name == 'date':
+        return pa.date32()
+    if type_name == 'timestamp':
+        return pa.timestamp('us')
+    if type_name == 'timestamptz':
+        return pa.timestamp('us', tz='UTC')
+    return pa.string()
+
+
+class ArrowEncoder:
+    """Arrow IPC stream: the schema, then one record batch per chunk"""
+
+    def __init__(self):
+        if pa is None:
+            raise ValueError("Arrow export needs pyarrow installed")
+        self.sink = io.BytesIO()
+        self.writer = None
+
+    def start(self, attributes) -> bytes:
+        self.schema = pa.schema([(attribute.name, _arrow_type(attribute.type.name)) for attribute in attributes])
+        self.writer = pa.ipc.new_stream(self.sink, self.schema)
+        return self._drain()
+
+    def rows(self, records: List) -> bytes:
+        arrays = []
+        for i, field in enumerate(self.schema):
+            values = [record[i] for record in records]
+            if pa.types.is_floating(field.type):
+                values = [None if value is None else float(value) for value in values]  # Decimal numeric
+            elif pa.types.is_string(field.type):
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        return self._drain()
+
+    def finish(self, next_token: Optional[str], error: Optional[str] = None) -> bytes:
+        if error:
+            raise RuntimeError(error)  # a truncated IPC stream fails loudly on read
+        self.writer.close()
+        return self._drain()
+
+    def _drain(self) -> bytes:
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+
+ENCODERS = {'csv': CSVEncoder, 'ndjson': NDJSONEncoder, 'arrow': ArrowEncoder}
+
+
+def make_encoder(fmt: str):
+    """Encoder for an export format (ValueError for unknown formats or missing pyarrow)"""
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown export format '{fmt}' (choose from {', '.join(ENCODERS)})")
+    return ENCODERS[fmt]()
+
+
+async def stream_export(pool, spec: Dict, encoder, after: Optional[Tuple[int, ...]] = None,
+                        max_rows: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Stream an export page by page
+
+    Args:
+        pool: DatabasePool (one connection and snapshot for the whole export)
+        spec: From plan_export
+        encoder: From make_encoder
+        after: Resume after this key (decode_token)
+        max_rows: Stop after this many rows (the trailer/last row gives the token to go on)
+
+    Yields:
+        Encoded chunks
+    """
+    sent = 0
+    position = after
+    exhausted = False
+    async with pool.snapshot() as conn:
+        try:
+            sql, params = page_query(spec, position, EXPORT_PAGE_SIZE)
+            yield encoder.start(await pool.describe(conn, sql, params, timeout=EXPORT_PAGE_TIMEOUT))
+            while max_rows is None or sent < max_rows:
+                limit = EXPORT_PAGE_SIZE if max_rows is None else min(EXPORT_PAGE_SIZE, max_rows - sent)
+                sql, params = page_query(spec, position, limit)
+                page_rows = 0
+                chunk = []
+                async for record in pool.cursor(conn, sql, params, EXPORT_PREFETCH, EXPORT_PAGE_TIMEOUT):
+                    chunk.append(record)
+                    if len(chunk) == EXPORT_PREFETCH:
+                        yield encoder.rows(chunk)
+                        page_rows += len(chunk)
+                        position = tuple(chunk[-1][column] for column in spec['key'])
+                        chunk = []
+                if chunk:
+                    yield encoder.rows(chunk)
+                    page_rows += len(chunk)
+                    position = tuple(chunk[-1][column] for column in spec['key'])
+                sent += page_rows
+                if page_rows < limit:
+                    exhausted = True
+                    break
+        except Exception as e:
+            yield encoder.finish(encode_token(position) if position else None, error=str(e))
+            return
+    yield encoder.finish(None if exhausted or position is None else encode_token(position))
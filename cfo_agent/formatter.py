@@ -6,6 +6,9 @@ import pandas as pd
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
+from analytics.screener import describe_screen, AMOUNT_METRICS, PLAIN_METRICS
+from db.results import ResultSet
+from projection import extract_requested_metrics
 
 # Load environment variables
 load_dotenv()
@@ -22,7 +25,7 @@ class ResponseFormatter:
         Format results into simple factual response
         
         Args:
-            results: Query results as list of dicts
+            results: Query results (ResultSet or list of dicts)
             context: Execution context with intent, params, etc.
             citations: Citation information
             
@@ -32,14 +35,14 @@ class ResponseFormatter:
         if not results:
             return "No data found for the specified query."
         
-        # Convert to DataFrame for analysis
-        df = pd.DataFrame(results)
+        # Convert to DataFrame for analysis (typed ResultSet columns are not copied)
+        df = results.to_frame() if isinstance(results, ResultSet) else pd.DataFrame(results)
         
         # Generate simple factual summary
         summary = self._generate_simple_summary(df, context)
         
-        # Format table if multiple results
-        if len(results) > 1:
+        # Format table if multiple results (screens list every match in the summary)
+        if len(results) > 1 and context.get('intent') != 'screen':
             table = self._format_table(df)
             response = f"{summary}\n\n{table}"
         else:
@@ -66,217 +69,22 @@ class ResponseFormatter:
                 df[col] = df[col].round(2)
         
         # Convert to string table
-        table_str = df.to_string(index=False, max_rows=50)
+        table_str = df.to_string(index=False, max_rows=50, float_format='{:.2f}'.format)
         
         return f"```\n{table_str}\n```"
     
     def _extract_requested_metrics(self, question: str) -> set:
         """Extract which metrics were specifically requested in the question"""
-        question_upper = question.upper()
-        requested = set()
-        
-        # Revenue keywords (but NOT if asking for intensity ratios like "R&D to revenue")
-        if any(word in question_upper for word in ['REVENUE', 'SALES', 'TOP LINE', 'TOPLINE']):
-            # Don't add revenue if asking for intensity ratios
-            if not any(pattern in question_upper for pattern in ['TO REVENUE', 'TO SALES', 'INTENSITY']):
-                requested.add('revenue')
-        
-        # Operating income (check first to avoid conflict with generic "income")
-        if any(word in question_upper for word in ['OPERATING INCOME', 'OPERATING_INCOME', 'EBIT', 'OPERATING PROFIT']):
-            requested.add('operating_income')
-        
-        # Gross profit (check early too)
-        if any(word in question_upper for word in ['GROSS PROFIT', 'GROSS_PROFIT', 'GROSS INCOME']):
-            requested.add('gross_profit')
-        
-        # Net income keywords (be specific to avoid conflicts)
-        if any(word in question_upper for word in ['NET INCOME', 'NET_INCOME', 'NET PROFIT', 'EARNINGS', 'BOTTOM LINE', 'BOTTOMLINE']):
-            requested.add('net_income')
-        # Catch generic "income" only if not "operating income" or "gross income"
-        elif 'INCOME' in question_upper and 'OPERATING' not in question_upper and 'GROSS' not in question_upper:
-            requested.add('net_income')
-        # Catch generic "profit" only if not "gross profit" or "operating profit"
-        elif 'PROFIT' in question_upper and 'GROSS' not in question_upper and 'OPERATING' not in question_upper:
-            requested.add('net_income')
-        
-        # Expense keywords (but NOT if asking for intensity ratios)
-        if any(word in question_upper for word in ['R&D', 'R AND D', 'R_AND_D', 'RESEARCH', 'DEVELOPMENT', 'R & D']):
-            # Don't add 'rd' if asking for intensity/ratio
-            if not any(pattern in question_upper for pattern in ['TO REVENUE', 'TO SALES', 'INTENSITY']):
-                requested.add('rd')
-        
-        if any(word in question_upper for word in ['SG&A', 'SGA', 'SG_AND_A', 'SELLING', 'ADMINISTRATIVE', 'S&GA', 'SGNA', 'SG & A']):
-            # Don't add 'sga' if asking for intensity/ratio
-            if not any(pattern in question_upper for pattern in ['TO REVENUE', 'TO SALES', 'INTENSITY']):
-                requested.add('sga')
-        
-        if any(word in question_upper for word in ['COGS', 'COST OF GOODS', 'COST OF REVENUE', 'COST OF SALES']):
-            requested.add('cogs')
-        
-        # Intensity keywords
-        if 'R&D INTENSITY' in question_upper:
-            requested.add('rnd_to_revenue')
-        
-        if 'SG&A INTENSITY' in question_upper or 'SGNA INTENSITY' in question_upper or 'SGA INTENSITY' in question_upper:
-            requested.add('sgna_to_revenue')
-        
-        # Detect ratio patterns like "R&D to revenue ratio"
-        if 'R&D TO REVENUE' in question_upper or 'R AND D TO REVENUE' in question_upper:
-            requested.add('rnd_to_revenue')
-        
-        if 'SG&A TO REVENUE' in question_upper or 'SGA TO REVENUE' in question_upper or 'SGNA TO REVENUE' in question_upper:
-            requested.add('sgna_to_revenue')
-        
-        # Generic "intensity" for when both might be shown
-        if 'INTENSITY' in question_upper and 'R&D' not in question_upper and 'SG&A' not in question_upper and 'SGA' not in question_upper:
-            requested.add('intensity')
-        
-        # Margin keywords
-        if any(word in question_upper for word in ['GROSS MARGIN', 'GROSS PROFIT MARGIN']):
-            requested.add('gross_margin')
-        
-        if any(word in question_upper for word in ['OPERATING MARGIN', 'EBIT MARGIN']):
-            requested.add('operating_margin')
-        
-        if any(word in question_upper for word in ['NET MARGIN', 'PROFIT MARGIN', 'NET PROFIT MARGIN']):
-            requested.add('net_margin')
-        
-        # Balance sheet items (but NOT if asking for ratios)
-        # Only add 'assets' if NOT asking for debt-to-assets ratio
-        if any(word in question_upper for word in ['TOTAL ASSETS', 'TOTAL_ASSETS']) and 'DEBT TO ASSETS' not in question_upper and 'DEBT-TO-ASSETS' not in question_upper:
-            requested.add('assets')
-        elif 'ASSETS' in question_upper and 'DEBT' not in question_upper:
-            requested.add('assets')
-        
-        if any(word in question_upper for word in ['TOTAL LIABILITIES', 'TOTAL_LIABILITIES', 'LIABILITIES']):
-            requested.add('liabilities')
-        
-        # Only add 'equity' if NOT asking for debt-to-equity ratio
-        if 'EQUITY' in question_upper and 'DEBT TO EQUITY' not in question_upper and 'DEBT-TO-EQUITY' not in question_upper:
-            requested.add('equity')
-        
-        if any(word in question_upper for word in ['DEBT', 'TOTAL DEBT']) and 'DEBT TO' not in question_upper and 'DEBT-TO-' not in question_upper:
-            requested.add('debt')
-        
-        # Cash flow items (check these before generic keywords)
-        if any(word in question_upper for word in ['OPERATING CASH FLOW', 'OCF', 'CASH FROM OPERATIONS', 'CASH FLOW OPS', 'CASH_FLOW_OPS', 'CASH FLOW FROM OPERATIONS']):
-            requested.add('operating_cash_flow')
-        
-        if any(word in question_upper for word in ['INVESTING CASH FLOW', 'CASH FLOW INVESTING', 'CASH_FLOW_INVESTING', 'CASH FROM INVESTING', 'CASH FLOW FROM INVESTING']):
-            requested.add('investing_cash_flow')
-        
-        if any(word in question_upper for word in ['FINANCING CASH FLOW', 'CASH FLOW FINANCING', 'CASH_FLOW_FINANCING', 'CASH FROM FINANCING', 'CASH FLOW FROM FINANCING']):
-            requested.add('financing_cash_flow')
-        
-        if any(word in question_upper for word in ['FREE CASH FLOW', 'FCF']):
-            requested.add('fcf')
-        
-        if any(word in question_upper for word in ['CAPEX', 'CAPITAL EXPENDITURE', 'CAPITAL SPENDING']):
-            requested.add('capex')
-        
-        # Shareholder actions
-        if any(word in question_upper for word in ['DIVIDEND', 'DIVIDENDS', 'DIVIDEND PAYMENT']):
-            requested.add('dividends')
-        
-        if any(word in question_upper for word in ['BUYBACK', 'BUYBACKS', 'SHARE REPURCHASE', 'STOCK REPURCHASE']):
-            requested.add('buybacks')
-        
-        # Ratios
-        if any(word in question_upper for word in ['ROE', 'RETURN ON EQUITY']):
-            requested.add('roe')
-        
-        if any(word in question_upper for word in ['ROA', 'RETURN ON ASSETS']):
-            requested.add('roa')
-        
-        if any(word in question_upper for word in ['DEBT TO EQUITY', 'DEBT-TO-EQUITY', 'D/E RATIO']):
-            requested.add('debt_to_equity')
-        
-        if any(word in question_upper for word in ['DEBT TO ASSETS', 'DEBT-TO-ASSETS']):
-            requested.add('debt_to_assets')
-        
-        if any(word in question_upper for word in ['CURRENT RATIO']):
-            requested.add('current_ratio')
-        
-        if any(word in question_upper for word in ['QUICK RATIO', 'ACID TEST']):
-            requested.add('quick_ratio')
-        
-        # Growth metrics
-        if any(word in question_upper for word in ['YOY', 'YEAR OVER YEAR', 'YEAR-OVER-YEAR', 'Y-O-Y']):
-            requested.add('yoy')
-        
-        if any(word in question_upper for word in ['QOQ', 'QUARTER OVER QUARTER', 'QUARTER-OVER-QUARTER', 'Q-O-Q']):
-            requested.add('qoq')
-        
-        if any(word in question_upper for word in ['CAGR', 'COMPOUND ANNUAL GROWTH']):
-            requested.add('cagr')
-        
-        # Market metrics
-        if any(word in question_upper for word in ['EPS', 'EARNINGS PER SHARE']):
-            requested.add('eps')
-        
-        if any(word in question_upper for word in ['P/E', 'PE RATIO', 'PRICE TO EARNINGS', 'PRICE-TO-EARNINGS']):
-            requested.add('pe_ratio')
-        
-        if any(word in question_upper for word in ['MARKET CAP', 'MARKET CAPITALIZATION']):
-            requested.add('market_cap')
-        
-        # Stock price - check for specific types first
-        # Check for opening price (both phrase and standalone word)
-        if any(word in question_upper for word in ['OPENING PRICE', 'OPEN PRICE', 'OPENING STOCK', 'OPEN STOCK']) or \
-           ('OPENING' in question_upper and 'PRICE' in question_upper):
-            requested.add('opening_price')
-        
-        # Check for closing price (both phrase and standalone word)
-        if any(word in question_upper for word in ['CLOSING PRICE', 'CLOSE PRICE', 'CLOSING STOCK', 'CLOSE STOCK', 'EOD PRICE', 'END OF DAY PRICE']) or \
-           (('CLOSING' in question_upper or 'CLOSE' in question_upper) and 'PRICE' in question_upper):
-            requested.add('closing_price')
-        
-        # Check for high price (both phrase and standalone word)
-        if any(word in question_upper for word in ['HIGH PRICE', 'HIGHEST PRICE', 'YEAR HIGH', 'PEAK PRICE']) or \
-           ('HIGH' in question_upper and 'PRICE' in question_upper):
-            requested.add('high_price')
-        
-        # Check for low price (both phrase and standalone word)
-        if any(word in question_upper for word in ['LOW PRICE', 'LOWEST PRICE', 'YEAR LOW', 'BOTTOM PRICE']) or \
-           ('LOW' in question_upper and 'PRICE' in question_upper):
-            requested.add('low_price')
-        
-        # Check for average price
-        if any(word in question_upper for word in ['AVERAGE PRICE', 'AVG PRICE', 'MEAN PRICE']) or \
-           (('AVERAGE' in question_upper or 'AVG' in question_upper) and 'PRICE' in question_upper):
-            requested.add('average_price')
-        
-        # Generic price - only if no specific price type was mentioned
-        if 'price' not in requested and 'opening_price' not in requested and 'closing_price' not in requested and 'high_price' not in requested and 'low_price' not in requested and 'average_price' not in requested:
-            if any(word in question_upper for word in ['SHARE PRICE', 'STOCK PRICE', 'STOCK', 'PRICE', 'TRADING PRICE']):
-                requested.add('price')
-        
-        if any(word in question_upper for word in ['RETURN', 'STOCK RETURN', 'PRICE RETURN']):
-            requested.add('return')
-        
-        if any(word in question_upper for word in ['VOLATILITY', 'VOL', 'PRICE VOLATILITY']):
-            requested.add('volatility')
-        
-        if any(word in question_upper for word in ['DIVIDEND', 'DIVIDEND YIELD', 'DIV YIELD']):
-            requested.add('dividend')
-        
-        # If no specific metrics found, check if it's a generic query
-        if not requested:
-            # Generic queries should show all available data
-            generic_keywords = ['METRICS', 'DATA', 'INFORMATION', 'DETAILS', 'FINANCIAL', 'PERFORMANCE', 'NUMBERS', 'STATS', 'STATISTICS']
-            if any(word in question_upper for word in generic_keywords):
-                requested.add('all')
-            # If just asking to "show" a company with a year/quarter, show relevant metrics
-            elif 'SHOW' in question_upper and not any(word in question_upper for word in ['GROWTH', 'COMPARE', 'VS', 'VERSUS']):
-                requested.add('all')
-        
-        return requested
+        return extract_requested_metrics(question)
     
     def _generate_simple_summary(self, df: pd.DataFrame, context: Dict) -> str:
         """Generate simple factual summary from results"""
         if len(df) == 0:
             return "No data found."
         
+        if context.get('intent') == 'screen':
+            return self._generate_screen_summary(df, context)
+        
         # Check if this is a multi-company query (multiple distinct tickers)
         if 'ticker' in df.columns and len(df['ticker'].unique()) > 1:
             return self._generate_multi_company_summary(df, context)
@@ -695,6 +503,10 @@ class ResponseFormatter:
             if 'revenue_cagr_5y' in row and row['revenue_cagr_5y'] is not None:
                 parts.append(f"5-year revenue CAGR of {row['revenue_cagr_5y']*100:.1f}%")
         
+        # Growth engine rows carry a generic growth measure and its label
+        if 'growth_label' in row and pd.notna(row.get('growth')):
+            parts.append(f"{row['growth_label']} of {row['growth']*100:.1f}%")
+        
         # Build final response
         print(f"[DEBUG FORMATTER] Final parts list: {parts}")
         print(f"[DEBUG FORMATTER] Parts count: {len(parts)}")
@@ -712,6 +524,35 @@ class ResponseFormatter:
             print(f"[DEBUG FORMATTER] WARNING: Empty parts list! Returning generic message.")
             return f"Data found for {name} ({ticker}) in {period_str}."
     
+    def _generate_screen_summary(self, df: pd.DataFrame, context: Dict) -> str:
+        """List the companies matching a screen with the screened metrics"""
+        screen = context.get('screen') or {}
+        first_row = df.iloc[0]
+        quarter = first_row.get('fiscal_quarter')
+        period_str = f"Q{int(quarter)} FY{first_row['fiscal_year']}" if pd.notna(quarter) else f"FY{first_row['fiscal_year']}"
+        
+        criteria = describe_screen(screen['where']) if screen.get('where') else "the screen"
+        noun = "company matches" if len(df) == 1 else "companies match"
+        lines = [f"{len(df)} {noun} {criteria} in {period_str}:"]
+        
+        metric_columns = [c for c in df.columns if c not in ('ticker', 'name', 'fiscal_year', 'fiscal_quarter')]
+        for _, row in df.iterrows():
+            parts = []
+            for metric in metric_columns:
+                value = row[metric]
+                if pd.isna(value):
+                    continue
+                label = metric.replace('_', ' ').replace('rnd', 'R&D').replace('sgna', 'SG&A')
+                if metric in AMOUNT_METRICS:
+                    parts.append(f"{label} ${value:.2f}B")
+                elif metric in PLAIN_METRICS:
+                    parts.append(f"{label} {value:.2f}")
+                else:
+                    parts.append(f"{label} {value*100:.1f}%")
+            lines.append(f"- **{row['name']}** ({row['ticker']}): {', '.join(parts)}")
+        
+        return "\n".join(lines)
+    
     def _generate_multi_company_summary(self, df: pd.DataFrame, context: Dict) -> str:
         """Generate direct summary for multi-company queries"""
         # Get the question to understand what was requested
@@ -762,7 +603,9 @@ class ResponseFormatter:
             metric_names.append("average price")
         
         # Create intro
-        if len(metric_names) > 0:
+        if 'growth_label' in df.columns:
+            intro = f"Here is the {first_row['growth_label']} by company:"
+        elif len(metric_names) > 0:
             metrics_phrase = ", ".join(metric_names) if len(metric_names) <= 2 else f"{', '.join(metric_names[:-1])}, and {metric_names[-1]}"
             intro = f"Here is the {metrics_phrase} for {period_str}:"
         else:
@@ -842,6 +685,11 @@ class ResponseFormatter:
                 if 'avg_price_annual' in row and row['avg_price_annual'] is not None:
                     parts.append(f"${float(row['avg_price_annual']):.2f} average price")
             
+            # Growth engine rows (any metric/window), with the period each value is for
+            if 'growth_label' in row and pd.notna(row.get('growth')):
+                period = f"Q{int(row['fiscal_quarter'])} {row['fiscal_year']}" if pd.notna(row.get('fiscal_quarter')) else f"{row['fiscal_year']}"
+                parts.append(f"{row['growth']*100:.1f}% ({period})")
+            
             # Format the line
             if len(parts) > 0:
                 metrics_str = ", ".join(parts)
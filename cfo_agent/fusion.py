@@ -0,0 +1,130 @@
+"""
+Query fusion for tasks that run the same template
+
+A decomposed question often runs one template several times with different
+parameters: revenue for FY2022 and FY2023, the same snapshot for two
+tickers. fuse_queries compiles such a group into one statement. The
+parameters that differ become parallel arrays unnested WITH ORDINALITY, and
+the template runs once per array position through a LATERAL join, so each
+task keeps its own filters, ORDER BY and LIMIT. Rows come back tagged with
+their task's position and split_fused hands each task its own rows.
+Identical tasks share one position.
+"""
+from typing import Dict, List, Optional, Tuple
+import os
+from bundle import PARAM_PATTERN
+from db.results import ResultSet
+
+
+QUERY_FUSION = os.getenv('SQL_FUSION', 'true').lower() == 'true'
+
+FUSION_COLUMN = 'fusion_task'
+
+# LIMIT/OFFSET can't refer to LATERAL columns: tasks only fuse when these match
+FIXED_PARAMS = ('limit', 'offset')
+
+
+def _array_type(values: List) -> Optional[str]:
+    """Postgres array type for a differing parameter (None = can't fuse)"""
+    present = [v for v in values if v is not None]
+    if present and all(type(v) is int for v in present):
+        return 'INTEGER[]'
+    if present and all(type(v) is str for v in present):
+        return 'TEXT[]'
+    return None
+
+
+def _used_params(sql: str, params: Dict) -> List[str]:
+    return [key for key in dict.fromkeys(PARAM_PATTERN.findall(sql)) if key in params]
+
+
+def _varying_params(queries: List[Tuple[str, Dict]]) -> List[str]:
+    sql, first = queries[0]
+    return [key for key in _used_params(sql, first) if any(params.get(key) != first.get(key) for _, params in queries)]
+
+
+def _fusion_key(sql: str, params: Dict) -> Tuple:
+    used = _used_params(sql, params)
+    return sql, tuple(used), tuple((key, params[key]) for key in FIXED_PARAMS if key in used)
+
+
+def fusion_groups(queries: Dict[int, Tuple[str, Dict]]) -> List[List[int]]:
+    """
+    Find tasks that can run as one statement
+
+    Args:
+        queries: {task index: (sql, params)}
+
+    Returns:
+        Groups of two or more task indexes, each in task order
+    """
+    groups: Dict[Tuple, List[int]] = {}
+    for index, (sql, params) in queries.items():
+        try:
+            groups.setdefault(_fusion_key(sql, params), []).append(index)
+        except TypeError:
+            continue  # unhashable LIMIT value: leave the task alone
+
+    fusable = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        group = [queries[index] for index in members]
+        if all(_array_type([params.get(key) for _, params in group]) for key in _varying_params(group)):
+            fusable.append(members)
+    return fusable
+
+
+def fuse_queries(queries: List[Tuple[str, Dict]]) -> Tuple[str, Dict, List[int]]:
+    """
+    Compile tasks sharing one template into one statement
+
+    Args:
+        queries: [(sql, params)] of one fusion group (same SQL, same LIMIT)
+
+    Returns:
+        (sql, params, positions) - task i's rows carry FUSION_COLUMN = positions[i]
+
+    Raises:
+        ValueError: A differing parameter has no array type
+    """
+    sql, first = queries[0]
+    body = sql.strip().rstrip(';')
+    varying = _varying_params(queries)
+
+    distinct: Dict[Tuple, int] = {}
+    positions = []
+    for _, params in queries:
+        values = tuple(params.get(key) for key in varying)
+        positions.append(distinct.setdefault(values, len(distinct) + 1))
+
+    if not varying:
+        fused = f"SELECT 1 AS {FUSION_COLUMN}, fused.*\nFROM (\n{body}\n) AS fused"
+        return fused, dict(first), positions
+
+    fused_params = {key: value for key, value in first.items() if key not in varying}
+    arrays = []
+    for number, key in enumerate(varying):
+        column = [values[number] for values in distinct]
+        array_type = _array_type(column)
+        if array_type is None:
+            raise ValueError(f"Cannot fuse tasks on parameter '{key}'")
+        fused_params[f"fuse_{key}"] = column
+        arrays.append(f"CAST(:fuse_{key} AS {array_type})")
+
+    body = PARAM_PATTERN.sub(
+        lambda match: f"fusion_keys.{match.group(1)}" if match.group(1) in varying else match.group(0), body
+    )
+    fused = (
+        f"SELECT fusion_keys.task AS {FUSION_COLUMN}, fused.*\n"
+        f"FROM unnest({', '.join(arrays)}) WITH ORDINALITY AS fusion_keys({', '.join(varying)}, task)\n"
+        f"CROSS JOIN LATERAL (\n{body}\n) AS fused"
+    )
+    return fused, fused_params, positions
+
+
+def split_fused(result: ResultSet, positions: List[int]) -> List[ResultSet]:
+    """Per-task rows of a fused statement's result (in task order)"""
+    parts = result.split(FUSION_COLUMN) if FUSION_COLUMN in result.columns else {}
+    empty = result.take([], [column for column in result.columns if column != FUSION_COLUMN])
+    return [parts.get(position, empty) for position in positions]
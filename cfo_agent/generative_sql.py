@@ -1,11 +1,13 @@
 """
 Generative SQL builder with validation and dry-run
 """
+import time
 from typing import List, Tuple, Dict
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
 from db.whitelist import get_allowed_surfaces, get_schema_for_surface
+from metrics import observe_llm
 
 # Load environment variables
 load_dotenv()
@@ -39,7 +41,13 @@ class GenerativeSQLBuilder:
             HumanMessage(content=f"Generate SQL for intent: {context.get('intent', 'unknown')}")
         ]
         
-        response = await self.llm.ainvoke(messages)
+        llm_started = time.perf_counter()
+        try:
+            response = await self.llm.ainvoke(messages)
+        except Exception:
+            observe_llm('generative_sql', time.perf_counter() - llm_started, outcome='error')
+            raise
+        observe_llm('generative_sql', time.perf_counter() - llm_started, response)
         
         # Parse response (may contain 1 or 2 candidates separated by ----)
         sql_candidates = self._parse_candidates(response.content)
@@ -1,9 +1,11 @@
 """
 LangGraph state machine for CFO Agent
 """
-from typing import TypedDict, List, Dict, Annotated
+from typing import TypedDict, List, Dict, Annotated, Optional, Tuple
 import operator
+import asyncio
 import copy
+import time
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import BaseMessage
 
@@ -16,6 +18,34 @@ from citations import CitationFetcher
 from formatter import ResponseFormatter
 from memory import session_memory
 from hitl import hitl_gate
+from analytics.fact_store import fact_store
+from analytics.growth import growth_service
+from analytics.screener import screening_service, describe_screen
+from db.pool import db_pool
+from db.results import ResultSet
+from fusion import QUERY_FUSION, fusion_groups, fuse_queries, split_fused
+from learned_templates import learned_templates
+from metrics import node_latency, task_latency, rows_returned, cache_requests
+from options import (
+    ExecutionOptions, make_options, time_remaining, stage_timeout,
+    LLM_TIMEOUT_SECONDS, DECOMPOSE_BUDGET_SHARE, MIN_DECOMPOSE_SECONDS,
+    CITATION_TIMEOUT_SECONDS, MIN_CITATION_SECONDS
+)
+
+
+# Intents whose answers must not come from a lagging read replica
+FRESHNESS_SENSITIVE_INTENTS = ('stock_price_annual', 'stock_price_quarterly')
+
+
+def task_source(sql: str) -> str:
+    """Where a task's rows came from, from its sql_executed entry"""
+    if sql.startswith('-- fact_store'):
+        return 'fact_store'
+    if sql.startswith('-- growth_engine'):
+        return 'growth_engine'
+    if sql.startswith('-- screen'):
+        return 'screen'
+    return 'sql' if sql else 'none'
 
 
 class AgentState(TypedDict):
@@ -23,6 +53,7 @@ class AgentState(TypedDict):
     # Input
     question: str
     session_id: str
+    options: ExecutionOptions
     
     # Decomposition
     decomposed: Dict
@@ -40,6 +71,7 @@ class AgentState(TypedDict):
     
     # Citations & Formatting
     citations: List[Dict]
+    prefetched_citations: Dict[Tuple, Dict]  # (ticker, fy, fq) -> citations, from a bundled run
     formatted_responses: List[str]
     
     # Final output
@@ -48,6 +80,8 @@ class AgentState(TypedDict):
     # Metadata
     errors: Annotated[List[str], operator.add]
     is_generative: bool
+    trace: List[Dict]
+    degraded: List[str]         # shortcuts taken to stay within the deadline
 
 
 class CFOAgentGraph:
@@ -69,13 +103,13 @@ class CFOAgentGraph:
         """Build the LangGraph workflow"""
         workflow = StateGraph(AgentState)
         
-        # Add nodes
-        workflow.add_node("decompose", self.decompose_node)
-        workflow.add_node("resolve_entities", self.resolve_entities_node)
-        workflow.add_node("run_tasks", self.run_tasks_node)
-        workflow.add_node("fetch_citations", self.fetch_citations_node)
-        workflow.add_node("format_response", self.format_response_node)
-        workflow.add_node("update_memory", self.update_memory_node)
+        # Add nodes (each timed into cfo_node_seconds)
+        workflow.add_node("decompose", self._timed("decompose", self.decompose_node))
+        workflow.add_node("resolve_entities", self._timed("resolve_entities", self.resolve_entities_node))
+        workflow.add_node("run_tasks", self._timed("run_tasks", self.run_tasks_node))
+        workflow.add_node("fetch_citations", self._timed("fetch_citations", self.fetch_citations_node))
+        workflow.add_node("format_response", self._timed("format_response", self.format_response_node))
+        workflow.add_node("update_memory", self._timed("update_memory", self.update_memory_node))
         
         # Define edges
         workflow.set_entry_point("decompose")
@@ -88,11 +122,23 @@ class CFOAgentGraph:
         
         return workflow.compile()
     
+    def _timed(self, name: str, node):
+        """Wrap a node so its duration lands in the node latency histogram"""
+        async def timed_node(state: AgentState) -> AgentState:
+            with node_latency.time(node=name):
+                return await node(state)
+        return timed_node
+    
     async def decompose_node(self, state: AgentState) -> AgentState:
         """Node 1: Decompose question into tasks"""
         question = state['question']
+        options = state.get('options') or make_options()
         
-        decomposed = await self.decomposer.decompose(question)
+        # LLM gets a share of the remaining budget; past it the regex intent is used
+        timeout = stage_timeout(options, LLM_TIMEOUT_SECONDS, DECOMPOSE_BUDGET_SHARE, MIN_DECOMPOSE_SECONDS)
+        decomposed = await self.decomposer.decompose(question, timeout=timeout)
+        if decomposed.get('timed_out'):
+            state['degraded'] = state.get('degraded', []) + ["question understood by keyword matching (time budget)"]
         
         state['decomposed'] = decomposed
         state['tasks'] = decomposed.get('tasks', [])
@@ -108,23 +154,229 @@ class CFOAgentGraph:
         routed_tasks = self.router.route_all_tasks(tasks)
         
         # Plan tasks (includes entity resolution)
-        plans = await self.planner.plan_all_tasks(routed_tasks)
+        plans = await self.planner.plan_all_tasks(routed_tasks, state['question'])
         
         state['routed_tasks'] = routed_tasks
         state['plans'] = plans
         
         return state
     
+    async def _prepare_sql_plan(self, plan: Dict, options: ExecutionOptions) -> Tuple[str, Dict]:
+        """
+        Build (template-first) and approve one plan's SQL
+        
+        Returns:
+            (sql, params)
+        
+        Raises:
+            PermissionError: HITL rejected or timed out
+        """
+        try:
+            sql, params, is_generative = await self.sql_builder.build_sql(plan, use_generative=False)
+        except (ValueError, KeyError):
+            # No template SQL, or it failed validation
+            if not options['allow_generative']:
+                raise
+            sql, params, is_generative = await self.sql_builder.build_sql(
+                plan, use_generative=True, timeout=time_remaining(options)
+            )
+        
+        # HITL approval (parks this request only; bounded by the request deadline)
+        remaining = time_remaining(options)
+        approved, reason = await hitl_gate.approve_sql(
+            sql, params, is_generative,
+            enabled=options['hitl'],
+            timeout=min(hitl_gate.timeout, remaining) if remaining is not None else None
+        )
+        if not approved:
+            raise PermissionError(f"HITL rejected: {reason}")
+        if is_generative and options['hitl'] and plan.get('learned'):
+            plan['learned'] = plan['learned'][:2] + (True,)  # a reviewer saw this SQL
+        return sql, params
+    
+    async def _execute_sql_plan(self, plan: Dict, options: ExecutionOptions) -> Tuple[List[Dict], str, Dict]:
+        """
+        Build, approve and execute one plan's SQL
+        
+        Returns:
+            (rows, sql, params)
+        """
+        sql, params = await self._prepare_sql_plan(plan, options)
+        fresh = plan.get('intent') in FRESHNESS_SENSITIVE_INTENTS
+        rows = await self.sql_executor.execute(sql, params, timeout=time_remaining(options), fresh=fresh)
+        return rows, sql, params
+    
+    def _learn(self, plan: Dict, ok: bool):
+        """Report a generated query's outcome to the learned template store"""
+        learned = plan.pop('learned', None)
+        if learned is None:
+            return
+        key, sql, reviewed = learned
+        if ok:
+            learned_templates.record_success(key, sql, reviewed)
+        else:
+            learned_templates.invalidate(key, sql)
+    
+    async def _prepare_sql_plans(self, plans: List[Dict], options: ExecutionOptions) -> Dict[int, object]:
+        """
+        Build and approve the SQL of every task that runs a plain query
+        
+        Tasks served by the fact store or an engine, and multi-company stock
+        queries, are left to run_tasks_node.
+        
+        Returns:
+            {plan index: (None, sql, params) or the build/approval error}
+        """
+        prepared: Dict[int, object] = {}
+        for index, plan in enumerate(plans):
+            multi_stock = plan.get('intent') in FRESHNESS_SENSITIVE_INTENTS and len(plan.get('entities_resolved', {})) > 1
+            if plan.get('engine') or multi_stock or fact_store.can_answer(plan):
+                continue
+            try:
+                sql, params = await self._prepare_sql_plan(plan, options)
+            except Exception as e:
+                prepared[index] = e
+                continue
+            prepared[index] = (None, sql, params)
+        return prepared
+    
+    def _fusion_groups(self, prepared: Dict[int, object]) -> List[List[int]]:
+        """Prepared tasks that share a template and can run as one statement"""
+        if not QUERY_FUSION:
+            return []
+        return fusion_groups({
+            index: (entry[1], entry[2]) for index, entry in prepared.items() if isinstance(entry, tuple)
+        })
+    
+    async def _run_fused(self, plans: List[Dict], options: ExecutionOptions) -> Dict[int, object]:
+        """
+        Run tasks that share a template as one statement per template
+        
+        Tasks that don't fuse, and groups whose fused statement fails, are
+        run one query at a time by run_tasks_node.
+        
+        Returns:
+            {plan index: (rows or None, sql, params) or the build/approval error}
+        """
+        prepared = await self._prepare_sql_plans(plans, options)
+        for group in self._fusion_groups(prepared):
+            fresh = any(plans[index].get('intent') in FRESHNESS_SENSITIVE_INTENTS for index in group)
+            try:
+                group_rows = await self.sql_executor.execute_fused(
+                    [(prepared[index][1], prepared[index][2]) for index in group],
+                    timeout=time_remaining(options), fresh=fresh
+                )
+            except Exception as e:
+                print(f"Warning: fused execution failed, running tasks individually: {e}")
+                continue
+            for index, rows in zip(group, group_rows):
+                prepared[index] = (rows, prepared[index][1], prepared[index][2])
+        return prepared
+    
+    async def _run_bundle(self, plans: List[Dict], options: ExecutionOptions) -> Tuple[Dict[int, object], Dict[Tuple, Dict]]:
+        """
+        Run every SQL-bound task and citation lookup of a request as one statement
+        
+        Tasks sharing a template are fused into one query of the bundle.
+        If the bundle fails, prepared tasks run one query at a time and
+        citations are fetched as usual.
+        
+        Returns:
+            ({plan index: (rows or None, sql, params) or the build/approval error},
+             {(ticker, fy, fq): citations})
+        """
+        prepared = await self._prepare_sql_plans(plans, options)
+        queries: Dict[str, Tuple[str, Dict]] = {}
+        fused: Dict[str, Tuple[List[int], List[int]]] = {}
+        fresh = any(plans[index].get('intent') in FRESHNESS_SENSITIVE_INTENTS
+                    for index, entry in prepared.items() if isinstance(entry, tuple))
+        
+        grouped = set()
+        for group in self._fusion_groups(prepared):
+            sql, params, positions = fuse_queries([(prepared[index][1], prepared[index][2]) for index in group])
+            queries[f"fused_{group[0]}"] = (sql, params)
+            fused[f"fused_{group[0]}"] = (group, positions)
+            grouped.update(group)
+        for index, entry in prepared.items():
+            if isinstance(entry, tuple) and index not in grouped:
+                queries[f"task_{index}"] = (entry[1], entry[2])
+        
+        periods = []
+        for plan in plans:
+            params = plan.get('params') or {}
+            period = (params.get('ticker'), params.get('fy'), params.get('fq'))
+            if period[0] and period[1] and period not in periods:
+                periods.append(period)
+        for number, (ticker, fy, fq) in enumerate(periods):
+            for kind, query in self.citation_fetcher.citation_queries(ticker, fy, fq).items():
+                if kind == 'macro':
+                    queries['cite_macro'] = query  # same for every period
+                else:
+                    queries[f"cite_{number}_{kind}"] = query
+        
+        remaining = time_remaining(options)
+        if len(queries) < 2 or (remaining is not None and remaining <= 0):
+            return prepared, {}
+        
+        try:
+            rows = await self.sql_executor.execute_bundle(queries, timeout=remaining, fresh=fresh)
+        except Exception as e:
+            print(f"Warning: bundled execution failed, running queries individually: {e}")
+            return prepared, {}
+        
+        for index, entry in prepared.items():
+            if isinstance(entry, tuple) and index not in grouped:
+                prepared[index] = (rows.get(f"task_{index}", []), entry[1], entry[2])
+        for name, (group, positions) in fused.items():
+            group_rows = split_fused(rows.get(name) or ResultSet((), {}, 0), positions)
+            for index, task_rows in zip(group, group_rows):
+                prepared[index] = (task_rows, prepared[index][1], prepared[index][2])
+        
+        def first(name: str) -> Optional[Dict]:
+            found = rows.get(name)
+            return found[0] if found else None
+        
+        citations = {
+            period: {
+                'financial': first(f"cite_{number}_financial"),
+                'stock': first(f"cite_{number}_stock"),
+                'macro': first('cite_macro')
+            }
+            for number, period in enumerate(periods)
+        }
+        return prepared, citations
+    
     async def run_tasks_node(self, state: AgentState) -> AgentState:
         """Node 3: Execute SQL for each task"""
         plans = state['plans']
+        options = state.get('options') or make_options()
+        trace = state.get('trace') or []
         
         results = []
         sql_executed = []
         params_used = []
         errors = []
-        
-        for plan in plans:
+        out_of_time = 0
+        
+        # Bundled mode: one round trip for every SQL task and citation lookup;
+        # otherwise tasks sharing a template run as one fused query
+        prepared, prefetched_citations = {}, {}
+        if options.get('bundle') and not options['hitl']:
+            prepared, prefetched_citations = await self._run_bundle(plans, options)
+        elif QUERY_FUSION and len(plans) > 1 and not options['hitl']:
+            prepared = await self._run_fused(plans, options)
+        
+        for index, plan in enumerate(plans):
+            started = time.perf_counter()
+            remaining = time_remaining(options)
+            if remaining is not None and remaining <= 0:
+                errors.append(f"Deadline exceeded before task {plan.get('intent')}")
+                out_of_time += 1
+                results.append([])
+                sql_executed.append("")
+                params_used.append({})
+                continue
+            
             try:
                 # Check if this is a stock price query with multiple entities
                 intent = plan.get('intent', '')
@@ -159,17 +411,17 @@ class CFOAgentGraph:
                             print(f"[DEBUG GRAPH] Single plan entities: {single_plan['entities_resolved']}")
                             print(f"[DEBUG GRAPH] Single plan params: {single_plan.get('params', {})}")
                             
-                            # Build SQL for this entity
-                            sql, params, is_generative = await self.sql_builder.build_sql(single_plan, use_generative=False)
-                            
-                            # HITL approval
-                            approved, reason = await hitl_gate.approve_sql(sql, params, is_generative)
-                            if not approved:
-                                errors.append(f"HITL rejected for {ticker}: {reason}")
-                                continue
-                            
-                            # Execute
-                            entity_results = await self.sql_executor.execute(sql, params)
+                            # Serve from the in-process fact store when loaded
+                            entity_results = fact_store.answer(single_plan)
+                            cache_requests.inc(cache='fact_store', result='miss' if entity_results is None else 'hit')
+                            if entity_results is not None:
+                                sql, params = f"-- fact_store: {single_plan.get('template_name')}", single_plan['params']
+                            else:
+                                try:
+                                    entity_results, sql, params = await self._execute_sql_plan(single_plan, options)
+                                except PermissionError as e:
+                                    errors.append(f"{e} ({ticker})")
+                                    continue
                             print(f"[DEBUG GRAPH] Got {len(entity_results)} results for {ticker}")
                             combined_results.extend(entity_results)
                             all_sqls.append(sql)
@@ -181,35 +433,85 @@ class CFOAgentGraph:
                     results.append(combined_results)
                     sql_executed.append(" | ".join(all_sqls))
                     params_used.append(all_params[0] if all_params else {})
+                elif plan.get('engine') == 'growth':
+                    # Arbitrary-window growth/CAGR computed over the whole panel
+                    growth = plan['growth']
+                    task_results = await growth_service.answer(plan, db_pool)
+                    results.append(task_results)
+                    sql_executed.append(
+                        f"-- growth_engine: {growth['metric']} {growth['kind']} window={growth['window']} ({growth['frequency']})"
+                    )
+                    params_used.append(plan.get('params', {}))
+                elif plan.get('engine') == 'screen':
+                    # Multi-predicate screen over the per-period metric indexes
+                    task_results = await screening_service.answer(plan, db_pool)
+                    results.append(task_results)
+                    sql_executed.append(f"-- screen: {describe_screen(plan['screen']['where'])}")
+                    params_used.append(plan.get('params', {}))
+                elif index in prepared:
+                    # Built (and run, if bundled or fused) by _run_bundle / _run_fused
+                    if isinstance(prepared[index], Exception):
+                        raise prepared[index]
+                    task_results, sql, params = prepared[index]
+                    if task_results is None:
+                        fresh = intent in FRESHNESS_SENSITIVE_INTENTS
+                        task_results = await self.sql_executor.execute(
+                            sql, params, timeout=time_remaining(options), fresh=fresh
+                        )
+                    results.append(task_results)
+                    sql_executed.append(sql)
+                    params_used.append(params)
                 else:
-                    # Single entity or non-stock query - execute normally
-                    # Build SQL (template-first)
-                    sql, params, is_generative = await self.sql_builder.build_sql(plan, use_generative=False)
-                    
-                    # HITL approval
-                    approved, reason = await hitl_gate.approve_sql(sql, params, is_generative)
-                    if not approved:
-                        errors.append(f"HITL rejected: {reason}")
-                        continue
-                    
-                    # Execute
-                    task_results = await self.sql_executor.execute(sql, params)
+                    # Serve from the in-process fact store when loaded
+                    task_results = fact_store.answer(plan)
+                    cache_requests.inc(cache='fact_store', result='miss' if task_results is None else 'hit')
+                    if task_results is not None:
+                        sql, params = f"-- fact_store: {plan.get('template_name')}", plan.get('params', {})
+                    else:
+                        # Single entity or non-stock query - template-first SQL
+                        task_results, sql, params = await self._execute_sql_plan(plan, options)
                     
                     results.append(task_results)
                     sql_executed.append(sql)
                     params_used.append(params)
+                self._learn(plan, ok=True)
                 
             except Exception as e:
+                self._learn(plan, ok=False)
+                if isinstance(e, (TimeoutError, asyncio.TimeoutError)):
+                    out_of_time += 1
                 errors.append(f"Task execution failed: {str(e)}")
                 results.append([])
                 sql_executed.append("")
                 params_used.append({})
+            
+            elapsed = time.perf_counter() - started
+            template = plan.get('template_name') or plan.get('engine') or plan.get('intent') or 'unknown'
+            task_latency.observe(elapsed, template=template, source=task_source(sql_executed[-1]))
+            rows_returned.observe(len(results[-1]), template=template)
+            
+            if options['debug']:
+                trace.append({
+                    'intent': plan.get('intent'),
+                    'template': plan.get('template_name'),
+                    'engine': plan.get('engine', 'sql'),
+                    'sql': sql_executed[-1],
+                    'params': params_used[-1],
+                    'rows': len(results[-1]),
+                    'ms': round(elapsed * 1000, 2)
+                })
         
         state['results'] = results
         state['sql_executed'] = sql_executed
         state['params_used'] = params_used
+        state['trace'] = trace
+        state['prefetched_citations'] = prefetched_citations
         if errors:
             state['errors'] = errors
+        if out_of_time:
+            state['degraded'] = state.get('degraded', []) + [
+                f"partial answer: {out_of_time} of {len(plans)} tasks did not finish within the time budget"
+            ]
         
         return state
     
@@ -217,8 +519,11 @@ class CFOAgentGraph:
         """Node 4: Fetch citations for results"""
         results = state['results']
         params_used = state['params_used']
+        options = state.get('options') or make_options()
         
+        prefetched = state.get('prefetched_citations') or {}
         citations_list = []
+        skipped = False
         
         for result_set, params in zip(results, params_used):
             if result_set and params.get('ticker'):
@@ -226,15 +531,27 @@ class CFOAgentGraph:
                 fy = params.get('fy')
                 fq = params.get('fq')
                 
-                if fy:
-                    citations = await self.citation_fetcher.fetch_citations(ticker, fy, fq)
+                # Citations are nice-to-have: skip them rather than overrun the deadline
+                timeout = stage_timeout(options, CITATION_TIMEOUT_SECONDS, floor=MIN_CITATION_SECONDS)
+                if (ticker, fy, fq) in prefetched:
+                    citations_list.append(prefetched[(ticker, fy, fq)])
+                elif fy and timeout > 0:
+                    try:
+                        citations = await asyncio.wait_for(
+                            self.citation_fetcher.fetch_citations(ticker, fy, fq), timeout=timeout
+                        )
+                    except asyncio.TimeoutError:
+                        citations, skipped = {}, True
                     citations_list.append(citations)
                 else:
+                    skipped = skipped or bool(fy)
                     citations_list.append({})
             else:
                 citations_list.append({})
         
         state['citations'] = citations_list
+        if skipped:
+            state['degraded'] = state.get('degraded', []) + ["sources omitted (time budget)"]
         
         return state
     
@@ -255,6 +572,7 @@ class CFOAgentGraph:
                     'intent': plan.get('intent'),
                     'params': plan.get('params', {}),
                     'question': question,  # Pass original question for selective display
+                    'screen': plan.get('screen'),
                     'citation_line': self.citation_fetcher.format_citation_line(citations)
                 }
                 
@@ -270,6 +588,10 @@ class CFOAgentGraph:
         
         final_parts.extend(formatted_responses)
         
+        # Say so when shortcuts were taken to answer within the deadline
+        if state.get('degraded'):
+            final_parts.append("⏱️ Note: " + "; ".join(state['degraded']) + ".")
+        
         state['formatted_responses'] = formatted_responses
         state['final_response'] = "\n\n---\n\n".join(final_parts)
         
@@ -303,25 +625,25 @@ class CFOAgentGraph:
             
             surfaces.extend(plan.get('surfaces', []))
         
-        # Update memory
-        if tickers:
-            session_memory.update_tickers(session_id, tickers)
-        if periods:
-            session_memory.update_period(session_id, periods[-1])  # Last period
-        if surfaces:
-            session_memory.update_surfaces(session_id, list(set(surfaces)))
-        
-        session_memory.increment_query_count(session_id)
+        # Update memory in one backend write per request
+        await session_memory.offload(
+            session_memory.record_request,
+            session_id,
+            tickers=tickers,
+            period=periods[-1] if periods else None,  # Last period
+            surfaces=list(set(surfaces))
+        )
         
         return state
     
-    async def run(self, question: str, session_id: str = "default") -> str:
+    async def run(self, question: str, session_id: str = "default", options: Optional[ExecutionOptions] = None) -> str:
         """
         Run the agent on a question
         
         Args:
             question: Natural language question
             session_id: Session identifier for memory
+            options: Request execution options (see make_options)
             
         Returns:
             Formatted response string
@@ -329,12 +651,23 @@ class CFOAgentGraph:
         initial_state = {
             'question': question,
             'session_id': session_id,
+            'options': options or make_options(),
             'errors': []
         }
         
-        final_state = await self.graph.ainvoke(initial_state)
+        final_state = await self.invoke(initial_state)
         
         return final_state.get('final_response', 'Error: No response generated')
+    
+    async def invoke(self, state: AgentState) -> AgentState:
+        """
+        Run the graph with all of the request's reads on one pinned connection
+        
+        HITL requests can park for minutes awaiting review, so they don't pin.
+        """
+        options = state.get('options') or make_options()
+        async with db_pool.session(enabled=not options['hitl']):
+            return await self.graph.ainvoke(state)
 
 
 # Global graph instance
@@ -1,96 +1,160 @@
 """
 Human-in-the-loop gate for query approval
+
+Approval is request-scoped: callers pass whether HITL applies to their
+request instead of toggling the shared gate. Pending approvals are parked as
+futures that the approve endpoint resolves, so a waiting request only
+suspends its own coroutine and gives up after a timeout.
+
+Pending approvals live in the process that parked them, so HITL needs a
+single API worker: with API_WORKERS > 1 a decision could reach a worker
+that never saw the approval.
 """
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import json
+import os
+import time
+import uuid
+
+from admission import paused
+
+
+class PendingApproval:
+    """An approval request waiting for a human decision"""
+
+    def __init__(self, context: Dict, message: str):
+        self.approval_id = uuid.uuid4().hex[:12]
+        self.context = context
+        self.message = message
+        self.created_at = time.time()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def to_dict(self) -> Dict:
+        return {
+            'approval_id': self.approval_id,
+            'message': self.message,
+            'context': json.loads(json.dumps(self.context, default=str)),
+            'created_at': self.created_at
+        }
 
 
 class HITLGate:
     """Human-in-the-loop approval gate"""
-    
-    def __init__(self, enabled: bool = False, always_approve_templates: bool = True):
+
+    def __init__(self, enabled: bool = False, always_approve_templates: bool = True, timeout: Optional[float] = None):
         self.enabled = enabled
         self.always_approve_templates = always_approve_templates
-    
-    async def approve_plan(self, plan: Dict, is_generative: bool = False) -> Tuple[bool, str]:
+        self.timeout = timeout if timeout is not None else float(os.getenv('HITL_APPROVAL_TIMEOUT_SECONDS', '120'))
+        self.pending: Dict[str, PendingApproval] = {}
+
+    async def approve_plan(self, plan: Dict, is_generative: bool = False, enabled: Optional[bool] = None,
+                           timeout: Optional[float] = None) -> Tuple[bool, str]:
         """
         Request approval for execution plan
-        
+
         Args:
             plan: Execution plan with SQL and params
             is_generative: Whether this is generative SQL
-            
+            enabled: Whether HITL applies to this request (None = gate default)
+            timeout: Seconds to wait for a decision (None = gate default)
+
         Returns:
             (approved, reason)
         """
         # If HITL is disabled, auto-approve
-        if not self.enabled:
+        if not (self.enabled if enabled is None else enabled):
             return True, "HITL disabled"
-        
+
         # If template-based and auto-approve is on, approve
         if not is_generative and self.always_approve_templates:
             return True, "Template auto-approved"
-        
+
         # For generative SQL, always require approval when HITL is enabled
         if is_generative:
-            return await self._request_approval(plan, "Generative SQL requires approval")
-        
+            return await self._request_approval(plan, "Generative SQL requires approval", timeout)
+
         # Default: approve
         return True, "Approved"
-    
-    async def approve_sql(self, sql: str, params: Dict, is_generative: bool = False) -> Tuple[bool, str]:
+
+    async def approve_sql(self, sql: str, params: Dict, is_generative: bool = False, enabled: Optional[bool] = None,
+                          timeout: Optional[float] = None) -> Tuple[bool, str]:
         """
         Request approval for SQL execution
-        
+
         Args:
             sql: SQL query
             params: Query parameters
             is_generative: Whether this is generative SQL
-            
+            enabled: Whether HITL applies to this request (None = gate default)
+            timeout: Seconds to wait for a decision (None = gate default)
+
         Returns:
             (approved, reason)
         """
         # If HITL is disabled, auto-approve
-        if not self.enabled:
+        if not (self.enabled if enabled is None else enabled):
             return True, "HITL disabled"
-        
+
         # For generative SQL, require approval
         if is_generative:
             return await self._request_approval(
                 {'sql': sql, 'params': params},
-                "Generative SQL execution requires approval"
+                "Generative SQL execution requires approval",
+                timeout
             )
-        
+
         # Default: approve
         return True, "Approved"
-    
-    async def _request_approval(self, context: Dict, message: str) -> Tuple[bool, str]:
+
+    async def _request_approval(self, context: Dict, message: str, timeout: Optional[float] = None) -> Tuple[bool, str]:
+        """
+        Park the request until resolve() is called or the timeout expires
+
+        Returns:
+            (approved, reason) - (False, "...timed out...") if nobody decided in time
+        """
+        pending = PendingApproval(context, message)
+        self.pending[pending.approval_id] = pending
+        wait = self.timeout if timeout is None else max(timeout, 0.0)
+
+        print(f"\n⚠️ HITL APPROVAL REQUIRED [{pending.approval_id}]: {message}")
+
+        try:
+            # Parked time isn't service time for admission control
+            with paused():
+                return await asyncio.wait_for(pending.future, timeout=wait)
+        except asyncio.TimeoutError:
+            return False, f"Approval {pending.approval_id} timed out after {wait:.0f}s"
+        finally:
+            self.pending.pop(pending.approval_id, None)
+
+    def resolve(self, approval_id: str, approved: bool, reason: str = "") -> bool:
         """
-        Request human approval (stub for UI integration)
-        
-        In production, this would:
-        1. Send approval request to UI
-        2. Wait for human response
-        3. Return approval status
-        
-        For now, this is a stub that auto-approves with a warning
+        Resolve a pending approval
+
+        Returns:
+            False if the approval is unknown or already decided/expired
         """
-        print(f"\n⚠️ HITL APPROVAL REQUIRED: {message}")
-        print(f"Context: {json.dumps(context, indent=2, default=str)}")
-        print("Note: Auto-approving for development (integrate with UI for production)\n")
-        
-        # In production, replace this with actual approval mechanism
-        # For now, auto-approve
-        return True, "Auto-approved (development mode)"
-    
+        pending = self.pending.get(approval_id)
+        if pending is None or pending.future.done():
+            return False
+        default_reason = "Approved by reviewer" if approved else "Rejected by reviewer"
+        pending.future.set_result((approved, reason or default_reason))
+        return True
+
+    def list_pending(self) -> List[Dict]:
+        """Pending approvals, oldest first"""
+        return [p.to_dict() for p in sorted(self.pending.values(), key=lambda p: p.created_at)]
+
     def enable(self):
-        """Enable HITL"""
+        """Enable HITL by default (requests can still override)"""
         self.enabled = True
-    
+
     def disable(self):
-        """Disable HITL"""
+        """Disable HITL by default (requests can still override)"""
         self.enabled = False
 
 
 # Global HITL gate instance
-hitl_gate = HITLGate(enabled=False)  # Disabled by default
+hitl_gate = HITLGate(enabled=os.getenv('HITL_ENABLED', 'false').lower() == 'true')  # Disabled by default
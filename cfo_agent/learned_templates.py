@@ -0,0 +1,163 @@
+"""
+Learned templates: generated SQL reused for structurally identical requests
+
+The generative path pays a full LLM call per task. Its SQL only depends on
+the request's shape - intent, surfaces, parameter names and requested
+metrics - not on the parameter values, so once a generated query has
+validated and executed successfully it is stored under that shape and
+served to the next matching task without calling the LLM. That only holds
+when the SQL binds every parameter: a query that inlines 'AAPL' or 2024 as a
+literal is stored under a key that also carries the resolved entity and
+parameter values, so it is only replayed for the same request. Entries count
+hits and successes; after LEARNED_PROMOTE_AFTER successful runs an entry is
+promoted and runs as a template - without HITL review only if one of its runs
+was approved through HITL. A failed execution drops the entry, and the least
+recently used entries are evicted beyond LEARNED_TEMPLATES_MAX (unpromoted
+ones first).
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from db.sql_parser import tokenize
+
+
+LEARNED_TEMPLATES = os.getenv('LEARNED_TEMPLATES', 'true').lower() == 'true'
+
+LEARNED_TEMPLATES_MAX = int(os.getenv('LEARNED_TEMPLATES_MAX', '256'))
+
+LEARNED_PROMOTE_AFTER = int(os.getenv('LEARNED_PROMOTE_AFTER', '3'))
+
+
+def learned_key(plan: Dict) -> Tuple:
+    """Shape of a task: (intent, surfaces, parameter names, requested metrics)"""
+    return (
+        plan.get('intent'),
+        tuple(sorted(plan.get('surfaces') or [])),
+        tuple(sorted(plan.get('params') or {})),
+        tuple(sorted(plan.get('metrics') or []))
+    )
+
+
+def _hashable(value):
+    return tuple(value) if isinstance(value, (list, tuple, set)) else value
+
+
+def value_key(plan: Dict) -> Tuple:
+    """Shape of a task plus its resolved entities and parameter values"""
+    params = plan.get('params') or {}
+    entities = plan.get('entities_resolved') or {}
+    return learned_key(plan) + (
+        tuple(sorted((name, _hashable(value)) for name, value in params.items())),
+        tuple(sorted(str(ticker) for ticker in entities.values() if ticker))
+    )
+
+
+def _plan_values(plan: Dict):
+    for value in list((plan.get('params') or {}).values()) + list((plan.get('entities_resolved') or {}).values()):
+        yield from value if isinstance(value, (list, tuple, set)) else [value]
+
+
+def is_parameterized(sql: str, plan: Dict) -> bool:
+    """
+    True when the SQL can be replayed for other values of the same shape
+
+    Every parameter with a value must be bound (:name) and no string or
+    number literal may equal one of the plan's parameter or entity values.
+    """
+    try:
+        tokens = tokenize(sql)
+    except ValueError:
+        return False
+    bound = {text[1:] for kind, text in tokens if kind == 'param'}
+    if any(value is not None and name not in bound for name, value in (plan.get('params') or {}).items()):
+        return False
+    strings = {str(value).lower() for value in _plan_values(plan) if isinstance(value, str)}
+    numbers = {value for value in _plan_values(plan) if isinstance(value, (int, float)) and not isinstance(value, bool)}
+    for kind, text in tokens:
+        if kind == 'string' and text[text.index("'") + 1:-1].replace("''", "'").lower() in strings:
+            return False
+        if kind == 'number' and float(text) in numbers:
+            return False
+    return True
+
+
+def learning_key(sql: str, plan: Dict) -> Tuple:
+    """Key to store generated SQL under: its shape, or shape + values when it inlines them"""
+    return learned_key(plan) if is_parameterized(sql, plan) else value_key(plan)
+
+
+class LearnedTemplateStore:
+    """Successful generated SQL by task shape, with hit counts, promotion and LRU eviction"""
+
+    def __init__(self, max_entries: int = LEARNED_TEMPLATES_MAX, promote_after: int = LEARNED_PROMOTE_AFTER):
+        self.max_entries = max_entries
+        self.promote_after = promote_after
+        self.entries: 'OrderedDict[Tuple, Dict]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.invalidated = 0
+
+    def lookup(self, *keys: Tuple) -> Optional[Tuple[Tuple, Dict]]:
+        """(key, entry) for the first stored key (counts one hit), or None"""
+        key = next((key for key in keys if key in self.entries), None)
+        if key is None:
+            self.misses += 1
+            return None
+        entry = self.entries[key]
+        self.hits += 1
+        entry['hits'] += 1
+        entry['last_used'] = time.time()
+        self.entries.move_to_end(key)
+        return key, entry
+
+    def record_success(self, key: Tuple, sql: str, reviewed: bool = False):
+        """
+        A query for this key executed successfully: store it, or count towards promotion
+
+        Args:
+            reviewed: The run was approved through HITL
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry['sql'] != sql:
+            entry = {'sql': sql, 'hits': 0, 'successes': 0, 'promoted': False, 'reviewed': False,
+                     'created': time.time()}
+            self.entries[key] = entry
+        entry['successes'] += 1
+        entry['reviewed'] = entry['reviewed'] or reviewed
+        entry['last_used'] = time.time()
+        if entry['successes'] >= self.promote_after:
+            entry['promoted'] = True
+        self.entries.move_to_end(key)
+        self._evict()
+
+    def invalidate(self, key: Tuple, sql: Optional[str] = None):
+        """A query for this shape failed: forget it (only if it is the stored SQL, when given)"""
+        entry = self.entries.get(key)
+        if entry is not None and (sql is None or entry['sql'] == sql):
+            del self.entries[key]
+            self.invalidated += 1
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            victim = next((key for key, entry in self.entries.items() if not entry['promoted']), None)
+            if victim is None:
+                victim = next(iter(self.entries))
+            del self.entries[victim]
+            self.evicted += 1
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': LEARNED_TEMPLATES,
+            'entries': len(self.entries),
+            'promoted': sum(1 for entry in self.entries.values() if entry['promoted']),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evicted': self.evicted,
+            'invalidated': self.invalidated
+        }
+
+
+# Global store instance
+learned_templates = LearnedTemplateStore()
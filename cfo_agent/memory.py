@@ -1,74 +1,396 @@
 """
 Short-term session memory for context retention
+
+Sessions live in a pluggable backend so the API can run several worker
+processes: the in-process backend is an LRU of compact records, the SQLite
+backend is a WAL-mode file shared by every worker on the host. Select with
+SESSION_BACKEND=memory|sqlite (SESSION_DB_PATH for the SQLite file).
+
+Both backends are bounded: at most SESSION_MAX_COUNT sessions (least
+recently used evicted first) and sessions idle for SESSION_IDLE_TTL_SECONDS
+are dropped by a background sweeper.
+
+SQLite calls can wait up to 5s on another worker's write lock, so async
+callers go through SessionMemory.offload(), which runs them in a thread
+when the backend blocks.
 """
-from typing import Dict, List, Optional
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+def new_session() -> Dict:
+    """Empty session record"""
+    return {
+        'last_tickers': [],
+        'last_period': None,
+        'last_surfaces': [],
+        'alias_resolutions': {},
+        'query_count': 0
+    }
+
+
+class SessionRecord:
+    """Fixed-slot session representation for the in-process backend"""
+
+    __slots__ = ('tickers', 'period', 'surfaces', 'aliases', 'query_count', 'last_seen')
+
+    def __init__(self):
+        self.tickers = ()
+        self.period = None
+        self.surfaces = ()
+        self.aliases = None
+        self.query_count = 0
+        self.last_seen = time.time()
+
+    @classmethod
+    def from_dict(cls, session: Dict) -> 'SessionRecord':
+        record = cls()
+        record.tickers = tuple(session['last_tickers'])
+        record.period = tuple(session['last_period'].items()) if session['last_period'] else None
+        record.surfaces = tuple(sys.intern(s) for s in session['last_surfaces'])
+        record.aliases = tuple(session['alias_resolutions'].items()) or None
+        record.query_count = session['query_count']
+        return record
+
+    def to_dict(self) -> Dict:
+        return {
+            'last_tickers': list(self.tickers),
+            'last_period': dict(self.period) if self.period else None,
+            'last_surfaces': list(self.surfaces),
+            'alias_resolutions': dict(self.aliases or ()),
+            'query_count': self.query_count
+        }
+
+    def approx_bytes(self) -> int:
+        """Record plus its containers and strings (shared strings counted per record)"""
+        size = sys.getsizeof(self)
+        for value in (self.tickers, self.period, self.surfaces, self.aliases):
+            if value:
+                size += sys.getsizeof(value)
+                for item in value:
+                    size += sum(sys.getsizeof(v) for v in item) if isinstance(item, tuple) else sys.getsizeof(item)
+        return size
+
+
+class SessionBackend(ABC):
+    """Storage interface for session records"""
+
+    # Calls may block on I/O or locks (run them off the event loop)
+    blocking = False
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Dict]:
+        """Return the stored session or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, session_id: str, mutate: Callable[[Dict], None]) -> Dict:
+        """Atomically load (or create), mutate and store a session; returns it"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """Remove a session"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Drop idle sessions; returns how many were removed"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        """Live session count and approximate footprint"""
+        raise NotImplementedError
+
+
+class InProcessBackend(SessionBackend):
+    """Process-local LRU of SessionRecords (single worker)"""
+
+    def __init__(self, max_sessions: int = 10000, idle_ttl: float = 86400.0):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.sessions: 'OrderedDict[str, SessionRecord]' = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+
+    def _get(self, session_id: str) -> Optional[SessionRecord]:
+        record = self.sessions.get(session_id)
+        if record is None:
+            return None
+        now = time.time()
+        if now - record.last_seen > self.idle_ttl:
+            del self.sessions[session_id]
+            self.expired += 1
+            return None
+        record.last_seen = now
+        self.sessions.move_to_end(session_id)
+        return record
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        record = self._get(session_id)
+        return record.to_dict() if record else None
+
+    def update(self, session_id: str, mutate: Callable[[Dict], None]) -> Dict:
+        record = self._get(session_id)
+        session = record.to_dict() if record else new_session()
+        mutate(session)
+        self.sessions[session_id] = SessionRecord.from_dict(session)
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+            self.evicted += 1
+        return session
+
+    def delete(self, session_id: str):
+        self.sessions.pop(session_id, None)
+
+    def sweep(self) -> int:
+        # Least recently used first, so stop at the first live session
+        cutoff = time.time() - self.idle_ttl
+        removed = 0
+        while self.sessions:
+            session_id, record = next(iter(self.sessions.items()))
+            if record.last_seen > cutoff:
+                break
+            del self.sessions[session_id]
+            removed += 1
+        self.expired += removed
+        return removed
+
+    def stats(self) -> Dict:
+        keys = sum(sys.getsizeof(k) for k in self.sessions)
+        records = sum(r.approx_bytes() for r in self.sessions.values())
+        return {
+            'backend': 'memory',
+            'live_sessions': len(self.sessions),
+            'approx_bytes': sys.getsizeof(self.sessions) + keys + records,
+            'evicted_lru': self.evicted,
+            'expired_idle': self.expired
+        }
+
+
+class SQLiteBackend(SessionBackend):
+    """SQLite file in WAL mode, shared by all worker processes on a host"""
+
+    blocking = True
+
+    def __init__(self, path: str = 'sessions.db', max_sessions: int = 10000, idle_ttl: float = 86400.0):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.evicted = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_updated_at ON sessions (updated_at)")
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ? AND updated_at > ?",
+                (session_id, time.time() - self.idle_ttl)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, session_id: str, mutate: Callable[[Dict], None]) -> Dict:
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front so concurrent
+            # workers serialize their read-modify-write cycles
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT data FROM sessions WHERE session_id = ? AND updated_at > ?",
+                    (session_id, time.time() - self.idle_ttl)
+                ).fetchone()
+                session = json.loads(row[0]) if row else new_session()
+                mutate(session)
+                self._conn.execute(
+                    "INSERT INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    (session_id, json.dumps(session), time.time())
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return session
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def sweep(self) -> int:
+        # Idle sessions first, then the least recently used beyond the cap
+        with self._lock:
+            expired = self._conn.execute(
+                "DELETE FROM sessions WHERE updated_at <= ?", (time.time() - self.idle_ttl,)
+            ).rowcount
+            evicted = self._conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            ).rowcount
+        self.expired += expired
+        self.evicted += evicted
+        return expired + evicted
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, data_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(session_id) + LENGTH(data)), 0) FROM sessions"
+            ).fetchone()
+        return {
+            'backend': 'sqlite',
+            'live_sessions': count,
+            'approx_bytes': data_bytes,
+            'evicted_lru': self.evicted,
+            'expired_idle': self.expired
+        }
+
+
+def create_backend() -> SessionBackend:
+    """Backend selected by SESSION_BACKEND (memory or sqlite)"""
+    kind = os.getenv('SESSION_BACKEND', 'memory').lower()
+    max_sessions = int(os.getenv('SESSION_MAX_COUNT', '10000'))
+    idle_ttl = float(os.getenv('SESSION_IDLE_TTL_SECONDS', '86400'))
+    if kind == 'sqlite':
+        return SQLiteBackend(os.getenv('SESSION_DB_PATH', 'sessions.db'), max_sessions, idle_ttl)
+    if kind != 'memory':
+        raise ValueError(f"Unknown SESSION_BACKEND: {kind}")
+    return InProcessBackend(max_sessions, idle_ttl)
 
 
 class SessionMemory:
     """Manages short-term session memory for the agent"""
-    
-    def __init__(self, max_tickers: int = 3):
+
+    def __init__(self, max_tickers: int = 3, backend: Optional[SessionBackend] = None):
         self.max_tickers = max_tickers
-        self.sessions: Dict[str, Dict] = {}
-    
+        self.backend = backend or InProcessBackend()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.offload(self.backend.sweep)
+            except Exception as e:
+                print(f"Warning: Session sweep failed: {e}")
+
+    def start_sweeper(self, interval: float = 60.0):
+        """Expire idle sessions in the background"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop(interval))
+
+    async def stop_sweeper(self):
+        """Stop the background sweeper"""
+        if self._sweeper:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def offload(self, call: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a memory or backend call from async code
+
+        Blocking backends run in a worker thread so a busy SQLite lock
+        doesn't stall the event loop; the in-process backend runs inline.
+        """
+        if self.backend.blocking:
+            return await asyncio.to_thread(call, *args, **kwargs)
+        return call(*args, **kwargs)
+
+    def stats(self) -> Dict:
+        """Live sessions, approximate bytes and eviction counters"""
+        return self.backend.stats()
+
     def get_or_create_session(self, session_id: str) -> Dict:
         """Get or create a session"""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                'last_tickers': [],
-                'last_period': None,
-                'last_surfaces': [],
-                'alias_resolutions': {},
-                'query_count': 0
-            }
-        return self.sessions[session_id]
-    
-    def update_tickers(self, session_id: str, tickers: List[str]):
-        """Update last used tickers"""
-        session = self.get_or_create_session(session_id)
-        
+        session = self.backend.load(session_id)
+        if session is None:
+            session = self.backend.update(session_id, lambda s: None)
+        return session
+
+    def _add_tickers(self, session: Dict, tickers: List[str]):
         # Add new tickers, keep only last N
         for ticker in tickers:
             if ticker and ticker not in session['last_tickers']:
                 session['last_tickers'].append(ticker)
-        
-        # Keep only last max_tickers
         session['last_tickers'] = session['last_tickers'][-self.max_tickers:]
-    
+
+    def record_request(self, session_id: str, tickers: Optional[List[str]] = None, period: Optional[Dict] = None,
+                       surfaces: Optional[List[str]] = None):
+        """
+        Apply all of a request's memory updates in one backend write
+
+        Args:
+            session_id: Session identifier
+            tickers: Tickers used by the request (appended, last N kept)
+            period: Last period used
+            surfaces: Surfaces queried
+        """
+        def mutate(session: Dict):
+            if tickers:
+                self._add_tickers(session, tickers)
+            if period:
+                session['last_period'] = period
+            if surfaces:
+                session['last_surfaces'] = surfaces
+            session['query_count'] += 1
+
+        self.backend.update(session_id, mutate)
+
+    def update_tickers(self, session_id: str, tickers: List[str]):
+        """Update last used tickers"""
+        self.backend.update(session_id, lambda s: self._add_tickers(s, tickers))
+
     def update_period(self, session_id: str, period: Dict):
         """Update last used period"""
-        session = self.get_or_create_session(session_id)
-        session['last_period'] = period
-    
+        self.backend.update(session_id, lambda s: s.update(last_period=period))
+
     def update_surfaces(self, session_id: str, surfaces: List[str]):
         """Update last used surfaces"""
-        session = self.get_or_create_session(session_id)
-        session['last_surfaces'] = surfaces
-    
+        self.backend.update(session_id, lambda s: s.update(last_surfaces=surfaces))
+
     def add_alias_resolution(self, session_id: str, alias: str, ticker: str):
         """Remember an alias resolution"""
-        session = self.get_or_create_session(session_id)
-        session['alias_resolutions'][alias] = ticker
-    
+        self.backend.update(session_id, lambda s: s['alias_resolutions'].update({alias: ticker}))
+
     def increment_query_count(self, session_id: str):
         """Increment query count"""
-        session = self.get_or_create_session(session_id)
-        session['query_count'] += 1
-    
+        self.backend.update(session_id, lambda s: s.update(query_count=s['query_count'] + 1))
+
     def get_last_tickers(self, session_id: str) -> List[str]:
         """Get last used tickers"""
         session = self.get_or_create_session(session_id)
         return session['last_tickers']
-    
+
     def get_last_period(self, session_id: str) -> Optional[Dict]:
         """Get last used period"""
         session = self.get_or_create_session(session_id)
         return session['last_period']
-    
+
     def get_context_summary(self, session_id: str) -> str:
         """Get a summary of session context"""
         session = self.get_or_create_session(session_id)
-        
+
         parts = []
         if session['last_tickers']:
             parts.append(f"Recent tickers: {', '.join(session['last_tickers'])}")
@@ -76,14 +398,16 @@ class SessionMemory:
             parts.append(f"Last period: {session['last_period']}")
         if session['query_count'] > 0:
             parts.append(f"Queries in session: {session['query_count']}")
-        
+
         return " | ".join(parts) if parts else "New session"
-    
+
     def clear_session(self, session_id: str):
         """Clear a session"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        self.backend.delete(session_id)
 
 
-# Global memory instance
-session_memory = SessionMemory()
+# Global memory instance (backend from SESSION_BACKEND)
+session_memory = SessionMemory(
+    max_tickers=int(os.getenv('SESSION_MAX_TICKERS', '3')),
+    backend=create_backend()
+)
@@ -0,0 +1,222 @@
+"""
+In-process Prometheus-style metrics
+
+Counters, gauges and histograms are plain Python objects updated inline on
+the request path (a dict lookup and a bisect per observation) and rendered
+in the Prometheus text exposition format by GET /metrics. Each worker
+process exposes its own series; scrape every worker or run one per host.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import time
+
+
+# Seconds: 5ms .. 30s covers SQL, LLM and end-to-end latency
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 1000, 5000)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Base class: a named family of label-keyed series"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """Point-in-time value, set inline or read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple, float] = {}
+        self.function: Optional[Callable[[], Dict[Tuple, float]]] = None
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], Dict[Tuple, float]]):
+        """function() -> {label values tuple: value}, evaluated on every scrape"""
+        self.function = function
+
+    def samples(self) -> Iterator[str]:
+        values = dict(self.values)
+        if self.function is not None:
+            values.update(self.function())
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram with sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple, List] = {}  # key -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self.series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self) -> Iterator[str]:
+        for key, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    """Holds metric families and renders them for scraping"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric '{metric.name}' already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+# Global registry and the agent's metric families
+registry = Registry()
+
+request_latency = registry.histogram(
+    "cfo_request_seconds", "End-to-end /ask latency", ("intent", "template"))
+requests_total = registry.counter(
+    "cfo_requests_total", "Answered /ask requests", ("intent", "status"))
+node_latency = registry.histogram(
+    "cfo_node_seconds", "Agent graph node duration", ("node",))
+task_latency = registry.histogram(
+    "cfo_task_seconds", "Per-task execution time (SQL or engine)", ("template", "source"))
+rows_returned = registry.histogram(
+    "cfo_rows_returned", "Rows returned per task", ("template",), buckets=ROW_BUCKETS)
+llm_latency = registry.histogram(
+    "cfo_llm_seconds", "LLM call latency", ("stage", "outcome"))
+llm_tokens = registry.histogram(
+    "cfo_llm_tokens", "Tokens per LLM call", ("stage", "kind"), buckets=TOKEN_BUCKETS)
+pool_acquire_wait = registry.histogram(
+    "cfo_db_pool_acquire_seconds", "Time waiting for a pooled connection", ("backend",))
+db_query_latency = registry.histogram(
+    "cfo_db_query_seconds", "Database round-trip time (connection held)", ("backend",))
+pool_saturation = registry.counter(
+    "cfo_db_pool_saturated_total", "Acquires that found every allowed connection busy", ("backend",))
+pool_connections = registry.gauge(
+    "cfo_db_pool_connections", "Pooled connections by backend and state", ("backend", "state"))
+db_session_queries = registry.histogram(
+    "cfo_db_session_queries", "Queries served per request-pinned connection", buckets=(1, 2, 3, 5, 10, 20, 50))
+backend_failovers = registry.counter(
+    "cfo_db_backend_down_total", "Times a database backend was marked unhealthy", ("backend",))
+cache_requests = registry.counter(
+    "cfo_cache_requests_total", "Cache lookups by result", ("cache", "result"))
+cost_gate_verdicts = registry.counter(
+    "cfo_sql_cost_gate_total", "Generative SQL candidates by EXPLAIN verdict", ("verdict",))
+
+
+def observe_llm(stage: str, seconds: float, response=None, outcome: str = 'ok'):
+    """Record one LLM call: latency, and token usage when the response reports it"""
+    llm_latency.observe(seconds, stage=stage, outcome=outcome)
+    usage = getattr(response, 'usage_metadata', None) or {}
+    if not usage:
+        token_usage = (getattr(response, 'response_metadata', None) or {}).get('token_usage') or {}
+        usage = {'input_tokens': token_usage.get('prompt_tokens'), 'output_tokens': token_usage.get('completion_tokens')}
+    for kind, key in (('prompt', 'input_tokens'), ('completion', 'output_tokens')):
+        if usage.get(key) is not None:
+            llm_tokens.observe(usage[key], stage=stage, kind=kind)
@@ -0,0 +1,75 @@
+"""
+Per-request execution options
+
+Options travel with each request's state instead of living on shared
+singletons, so concurrent requests can't change each other's behaviour.
+Every stage derives its timeout from the time left before the request
+deadline (stage_timeout) and degrades instead of overrunning it.
+"""
+from typing import TypedDict, Optional
+import os
+import time
+
+
+# Default request deadline when the caller gives none (under Streamlit's 30s timeout)
+REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', '25'))
+
+# LLM decomposition: at most LLM_TIMEOUT_SECONDS and half the remaining budget;
+# below MIN_DECOMPOSE_SECONDS the keyword/regex intent is used directly
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '12'))
+DECOMPOSE_BUDGET_SHARE = 0.5
+MIN_DECOMPOSE_SECONDS = 1.0
+
+# Citations are skipped when less than this is left
+CITATION_TIMEOUT_SECONDS = 2.0
+MIN_CITATION_SECONDS = 1.0
+
+
+class ExecutionOptions(TypedDict):
+    """Per-request execution options (never stored on shared singletons)"""
+    hitl: bool                  # require human approval for generative SQL
+    allow_generative: bool      # fall back to generative SQL when a template fails
+    deadline: Optional[float]   # time.monotonic() by which the request must finish
+    debug: bool                 # collect a per-task execution trace
+    bundle: bool                # run all task SQL and citations in one round trip
+
+
+def make_options(hitl: bool = False, allow_generative: bool = False, timeout_seconds: Optional[float] = None,
+                 debug: bool = False, bundle: Optional[bool] = None) -> ExecutionOptions:
+    """Build request options; timeout_seconds becomes an absolute deadline (bundle defaults to SQL_BUNDLE)"""
+    if bundle is None:
+        bundle = os.getenv('SQL_BUNDLE', 'false').lower() == 'true'
+    return {
+        'hitl': bool(hitl),
+        'allow_generative': bool(allow_generative),
+        'deadline': time.monotonic() + timeout_seconds if timeout_seconds else None,
+        'debug': bool(debug),
+        'bundle': bool(bundle)
+    }
+
+
+def time_remaining(options: ExecutionOptions) -> Optional[float]:
+    """Seconds left before the request deadline (None = no deadline)"""
+    if options.get('deadline') is None:
+        return None
+    return options['deadline'] - time.monotonic()
+
+
+def stage_timeout(options: ExecutionOptions, cap: float, share: float = 1.0, floor: float = 0.0) -> float:
+    """
+    Timeout for one stage of the request
+    
+    Args:
+        options: Request options (deadline)
+        cap: Stage's own maximum
+        share: Fraction of the remaining budget the stage may use
+        floor: Below this the stage should be skipped
+    
+    Returns:
+        Seconds (0.0 = skip the stage)
+    """
+    remaining = time_remaining(options)
+    if remaining is None:
+        return cap
+    timeout = min(cap, remaining * share)
+    return timeout if timeout >= floor and remaining > 0 else 0.0
@@ -1,23 +1,32 @@
 """
 Task planner: create structured execution plan with parameters
 """
-from typing import Dict, List
+from typing import Dict, List, Optional
 from db.resolve import resolve_entities, resolve_ticker, get_latest_period
+from projection import extract_requested_metrics, projected_template_sql
+from analytics.growth import growth_frequency
 
 
 class TaskPlanner:
     """Creates structured execution plans for routed tasks"""
     
-    async def plan_task(self, routed_task: Dict) -> Dict:
+    async def plan_task(self, routed_task: Dict, question: Optional[str] = None) -> Dict:
         """
         Create execution plan for a routed task
         
         Args:
             routed_task: Output from router with template and entities
+            question: Original question; wide templates select only the
+                columns of the metrics it asks for
             
         Returns:
             Dict with 'sql', 'params', 'surfaces', 'entities_resolved'
+            (plus 'engine' and 'growth' for tasks routed to the growth engine,
+            'pruned' when the SQL was projected to the requested metrics)
         """
+        if routed_task['intent'] == 'screen':
+            return self._plan_screen(routed_task)
+        
         template = routed_task['template']
         entities = routed_task['entities']
         period = routed_task['period']
@@ -44,10 +53,11 @@ class TaskPlanner:
             routed_task.get('measures', [])
         )
         
-        # Get SQL from template
+        # Get SQL from template, pruned to the requested metrics' columns
         sql = template['sql']
+        projected = projected_template_sql(routed_task['template_name'], sql, question)
         
-        return {
+        plan = {
             'sql': sql,
             'params': params,
             'surfaces': routed_task['surfaces'],
@@ -55,6 +65,45 @@ class TaskPlanner:
             'template_name': routed_task['template_name'],
             'intent': routed_task['intent']
         }
+        if projected:
+            plan['sql'] = projected
+            plan['pruned'] = True
+        if question:
+            plan['metrics'] = sorted(extract_requested_metrics(question))
+        
+        # Growth windows/metrics/peer sets the templates cannot serve go to the growth engine
+        growth = routed_task.get('growth')
+        if growth:
+            plan['engine'] = 'growth'
+            plan['growth'] = growth
+            self._bind_growth_range(params, period, growth)
+            if growth.get('scope') == 'peers':
+                params['tickers'] = []
+                params['limit'] = 50
+            else:
+                params['tickers'] = [t for t in entities_resolved.values() if t]
+        
+        return plan
+    
+    def _plan_screen(self, routed_task: Dict) -> Dict:
+        """Plan a screen: no SQL, just the period and top-K for the screening engine"""
+        screen = routed_task['screen']
+        period = routed_task['period']
+        
+        return {
+            'sql': None,
+            'params': {
+                'fy': period.get('fy'),
+                'fq': period.get('fq'),
+                'limit': min(int(screen.get('limit', 25)), 200)
+            },
+            'surfaces': routed_task['surfaces'],
+            'entities_resolved': {},
+            'template_name': 'screen',
+            'intent': 'screen',
+            'engine': 'screen',
+            'screen': screen
+        }
     
     async def _build_params(self, template: Dict, entities_resolved: Dict, period: Dict, measures: List) -> Dict:
         """Build parameter dict for SQL execution"""
@@ -94,6 +143,10 @@ class TaskPlanner:
         else:
             params['fq'] = None
         
+        # Period ranges: one query for a whole trend instead of one task per year
+        if 'fy_from' in template_params:
+            await self._bind_period_range(params, period, template_params)
+        
         # Ensure limit is set
         if 'limit' not in params:
             params['limit'] = 10
@@ -104,10 +157,85 @@ class TaskPlanner:
         
         return params
     
-    async def plan_all_tasks(self, routed_tasks: List[Dict]) -> List[Dict]:
+    async def _bind_period_range(self, params: Dict, period: Dict, template_params: List):
+        """
+        Bind fy_from/fy_to (fq_from/fq_to) or the last N periods, and size LIMIT to the range
+        
+        The last N periods of one company (or of a macro series) are simply its
+        N latest rows; for two-company templates they become a range ending at
+        the first company's latest reported period. N is converted to the
+        template's granularity first ("last 3 years" = 12 quarterly rows).
+        """
+        quarterly = 'fq_from' in template_params
+        pair = 't1' in template_params
+        entities = 2 if pair else 1 if 'ticker' in template_params else None
+        fy_from, fy_to = period.get('fy_from'), period.get('fy_to')
+        fq_from, fq_to = (period.get('fq_from'), period.get('fq_to')) if quarterly else (None, None)
+        last_n = self._last_n_periods(period, quarterly)
+        
+        if last_n and not pair:
+            params.update(fy=None, fq=None, limit=last_n)
+            return
+        if last_n:
+            latest = await get_latest_period(params['t1']) if params.get('t1') else None
+            if not latest:
+                params.update(fy=None, fq=None, limit=last_n * 2)
+                return
+            year, quarter = latest['fiscal_year'], latest['fiscal_quarter']
+            if quarterly:
+                fy_from, fq_from = divmod(year * 4 + quarter - last_n, 4)
+                fq_from += 1
+                fy_to, fq_to = year, quarter
+            else:
+                # A fiscal year counts once its Q4 is reported
+                fy_to = year if quarter == 4 else year - 1
+                fy_from = fy_to - last_n + 1
+        if not fy_from and not fy_to:
+            return
+        
+        params.update(fy=None, fq=None, fy_from=fy_from, fy_to=fy_to)
+        if quarterly:
+            params.update(fq_from=fq_from, fq_to=fq_to)
+        if fy_from and fy_to and entities:
+            if quarterly:
+                periods = (fy_to * 4 + (fq_to or 4)) - (fy_from * 4 + (fq_from or 1)) + 1
+            else:
+                periods = fy_to - fy_from + 1
+            params['limit'] = max(periods, 1) * entities
+        else:
+            params['limit'] = 200  # open-ended or company-wide: the range bounds the rows
+    
+    @staticmethod
+    def _last_n_periods(period: Dict, quarterly: bool) -> Optional[int]:
+        """Last N converted to the target granularity ("last 3 years" = 12 quarters)"""
+        last_n = int(period['last_n']) if period.get('last_n') else None
+        if last_n and quarterly and period.get('unit') == 'year':
+            last_n *= 4
+        elif last_n and not quarterly and period.get('unit') == 'quarter':
+            last_n = -(-last_n // 4)  # whole fiscal years covering the quarters
+        return last_n
+    
+    def _bind_growth_range(self, params: Dict, period: Dict, growth: Dict):
+        """
+        Bind a period range or last N in the growth engine's own granularity
+        
+        The template's binding counts periods at the template's granularity
+        (and is skipped for templates without range params), so growth tasks
+        are re-bound against the frequency of the growth result.
+        """
+        quarterly = growth_frequency(growth.get('kind', 'yoy'), growth.get('frequency', 'quarter')) == 'quarter'
+        if period.get('fy_from') or period.get('fy_to'):
+            params.update(fy=None, fq=None, fy_from=period.get('fy_from'), fy_to=period.get('fy_to'),
+                          fq_from=period.get('fq_from') if quarterly else None,
+                          fq_to=period.get('fq_to') if quarterly else None,
+                          limit=200)  # the range bounds the rows
+        elif period.get('last_n'):
+            params.update(fy=None, fq=None, limit=min(self._last_n_periods(period, quarterly), 200))
+    
+    async def plan_all_tasks(self, routed_tasks: List[Dict], question: Optional[str] = None) -> List[Dict]:
         """Plan multiple tasks"""
         plans = []
         for task in routed_tasks:
-            plan = await self.plan_task(task)
+            plan = await self.plan_task(task, question)
             plans.append(plan)
         return plans
@@ -0,0 +1,425 @@
+"""
+Column pruning for wide templates
+
+The planner works out which metrics a question asks for (the same keyword
+rules the formatter uses for selective display) and rewrites the template's
+top-level SELECT list to the columns those metrics are read from, plus the
+key columns. Wide views such as mv_company_full_annual then scan, ship and
+decode a handful of columns instead of 30. Projected SQL is cached per
+(template SQL, column set).
+
+Anything the rules can't map (generic questions, unknown metrics, macro
+questions without a specific indicator) runs the full template.
+"""
+from functools import lru_cache
+from typing import FrozenSet, List, Optional
+import os
+import re
+
+
+COLUMN_PRUNING = os.getenv('SQL_COLUMN_PRUNING', 'true').lower() == 'true'
+
+# Wide templates whose metric columns are independent of each other
+PRUNABLE_TEMPLATES = {
+    'quarter_snapshot', 'annual_metrics',
+    'complete_quarterly', 'complete_annual',
+    'complete_macro_context_quarterly', 'complete_macro_context_annual',
+    'complete_full_quarterly', 'complete_full_annual',
+    'multi_company_quarter', 'multi_company_annual',
+    'multi_company_macro_quarter', 'multi_company_macro_annual'
+}
+
+# Always selected: identify the company and period of each row
+KEY_COLUMNS = frozenset({'ticker', 'name', 'fiscal_year', 'fiscal_quarter'})
+
+# Requested metric -> output columns the formatter reads it from
+METRIC_COLUMNS = {
+    'revenue': {'revenue_b', 'revenue_yoy', 'revenue_qoq'},
+    'net_income': {'net_income_b'},
+    'operating_income': {'op_income_b'},
+    'gross_profit': {'gross_profit_b', 'gross_profit_annual_b', 'gross_profit_annual'},
+    'rd': {'rd_b', 'rd_annual_b'},
+    'sga': {'sga_b', 'sga_annual_b'},
+    'cogs': {'cogs_b', 'cogs_annual_b'},
+    'rnd_to_revenue': {'rnd_to_revenue', 'rnd_to_revenue_annual', 'rd_intensity', 'rd_intensity_annual'},
+    'sgna_to_revenue': {'sgna_to_revenue', 'sgna_to_revenue_annual', 'sga_intensity', 'sga_intensity_annual'},
+    'intensity': {'rnd_to_revenue', 'rnd_to_revenue_annual', 'rd_intensity', 'rd_intensity_annual',
+                  'sgna_to_revenue', 'sgna_to_revenue_annual', 'sga_intensity', 'sga_intensity_annual'},
+    'gross_margin': {'gross_margin', 'gross_margin_annual', 'gross_margin_ttm'},
+    'operating_margin': {'operating_margin', 'operating_margin_annual', 'operating_margin_ttm'},
+    'net_margin': {'net_margin', 'net_margin_annual', 'net_margin_ttm'},
+    'roe': {'roe', 'roe_annual', 'roe_annual_avg_equity', 'roe_ttm'},
+    'roa': {'roa', 'roa_annual', 'roa_ttm'},
+    'debt_to_equity': {'debt_to_equity', 'debt_to_equity_annual'},
+    'debt_to_assets': {'debt_to_assets', 'debt_to_assets_annual'},
+    'assets': {'total_assets', 'total_assets_eoy'},
+    'liabilities': {'total_liabilities', 'total_liabilities_eoy'},
+    'equity': {'equity', 'equity_eoy'},
+    'operating_cash_flow': {'operating_cash_flow', 'cash_from_operations', 'ocf'},
+    'investing_cash_flow': {'investing_cash_flow', 'cash_from_investing'},
+    'financing_cash_flow': {'financing_cash_flow', 'cash_from_financing'},
+    'fcf': {'free_cash_flow', 'fcf'},
+    'capex': {'capex', 'capex_annual_b'},
+    'dividends': {'dividends', 'dividend_payments'},
+    'buybacks': {'buybacks', 'share_repurchases'},
+    'yoy': {'revenue_yoy', 'return_yoy'},
+    'qoq': {'revenue_qoq', 'return_qoq'},
+    'cagr': {'revenue_cagr_3y', 'revenue_cagr_5y'},
+    'eps': {'eps', 'earnings_per_share'},
+    'opening_price': {'open_price', 'avg_open_price', 'avg_open_price_annual'},
+    'closing_price': {'close_price', 'close_price_eoy', 'avg_close_price', 'avg_close_price_annual'},
+    'high_price': {'high_price', 'high_price_annual'},
+    'low_price': {'low_price', 'low_price_annual'},
+    'average_price': {'avg_price', 'avg_price_annual'},
+    'price': {'avg_price', 'avg_price_annual', 'close_price', 'close_price_eoy',
+              'high_price', 'low_price', 'high_price_annual', 'low_price_annual'},
+    'return': {'return_qoq', 'return_yoy', 'return_annual'},
+    'volatility': {'volatility_pct', 'volatility_pct_annual'},
+    'dividend': {'dividend_yield', 'dividend_yield_annual'}
+}
+
+# Macro indicators named in the question -> their columns (and the betas on them)
+MACRO_COLUMNS = (
+    (('GDP',), {'gdp', 'gdp_t', 'gdp_annual'}),
+    (('CPI', 'INFLATION'), {'cpi', 'cpi_annual', 'core_cpi', 'core_cpi_annual',
+                            'beta_nm_cpi_12q', 'beta_nm_cpi_annual', 'beta_gm_cpi_12q', 'beta_gm_cpi_annual'}),
+    (('UNEMPLOYMENT', 'JOBLESS'), {'unemployment_rate', 'unemployment_rate_annual'}),
+    (('FED FUNDS', 'FEDERAL FUNDS', 'FFR', 'INTEREST RATE'), {'fed_funds_rate', 'fed_funds_rate_annual',
+                                                             'beta_nm_ffr_12q', 'beta_nm_ffr_annual'}),
+    (('S&P', 'SP500', 'SPX'), {'sp500_index', 'sp500_index_annual', 'beta_nm_spx_12q', 'beta_nm_spx_annual'})
+)
+
+# Questions about the macro picture as a whole keep every column
+GENERIC_MACRO_KEYWORDS = ('MACRO', 'ECONOM', 'BETA', 'SENSITIV')
+
+
+def extract_requested_metrics(question: str) -> set:
+    """Extract which metrics were specifically requested in the question"""
+    question_upper = question.upper()
+    requested = set()
+
+    # Revenue keywords (but NOT if asking for intensity ratios like "R&D to revenue")
+    if any(word in question_upper for word in ['REVENUE', 'SALES', 'TOP LINE', 'TOPLINE']):
+        # Don't add revenue if asking for intensity ratios
+        if not any(pattern in question_upper for pattern in ['TO REVENUE', 'TO SALES', 'INTENSITY']):
+            requested.add('revenue')
+
+    # Operating income (check first to avoid conflict with generic "income")
+    if any(word in question_upper for word in ['OPERATING INCOME', 'OPERATING_INCOME', 'EBIT', 'OPERATING PROFIT']):
+        requested.add('operating_income')
+
+    # Gross profit (check early too)
+    if any(word in question_upper for word in ['GROSS PROFIT', 'GROSS_PROFIT', 'GROSS INCOME']):
+        requested.add('gross_profit')
+
+    # Net income keywords (be specific to avoid conflicts)
+    if any(word in question_upper for word in ['NET INCOME', 'NET_INCOME', 'NET PROFIT', 'EARNINGS', 'BOTTOM LINE', 'BOTTOMLINE']):
+        requested.add('net_income')
+    # Catch generic "income" only if not "operating income" or "gross income"
+    elif 'INCOME' in question_upper and 'OPERATING' not in question_upper and 'GROSS' not in question_upper:
+        requested.add('net_income')
+    # Catch generic "profit" only if not "gross profit" or "operating profit"
+    elif 'PROFIT' in question_upper and 'GROSS' not in question_upper and 'OPERATING' not in question_upper:
+        requested.add('net_income')
+
+    # Expense keywords (but NOT if asking for intensity ratios)
+    if any(word in question_upper for word in ['R&D', 'R AND D', 'R_AND_D', 'RESEARCH', 'DEVELOPMENT', 'R & D']):
+        # Don't add 'rd' if asking for intensity/ratio
+        if not any(pattern in question_upper for pattern in ['TO REVENUE', 'TO SALES', 'INTENSITY']):
+            requested.add('rd')
+
+    if any(word in question_upper for word in ['SG&A', 'SGA', 'SG_AND_A', 'SELLING', 'ADMINISTRATIVE', 'S&GA', 'SGNA', 'SG & A']):
+        # Don't add 'sga' if asking for intensity/ratio
+        if not any(pattern in question_upper for pattern in ['TO REVENUE', 'TO SALES', 'INTENSITY']):
+            requested.add('sga')
+
+    if any(word in question_upper for word in ['COGS', 'COST OF GOODS', 'COST OF REVENUE', 'COST OF SALES']):
+        requested.add('cogs')
+
+    # Intensity keywords
+    if 'R&D INTENSITY' in question_upper:
+        requested.add('rnd_to_revenue')
+
+    if 'SG&A INTENSITY' in question_upper or 'SGNA INTENSITY' in question_upper or 'SGA INTENSITY' in question_upper:
+        requested.add('sgna_to_revenue')
+
+    # Detect ratio patterns like "R&D to revenue ratio"
+    if 'R&D TO REVENUE' in question_upper or 'R AND D TO REVENUE' in question_upper:
+        requested.add('rnd_to_revenue')
+
+    if 'SG&A TO REVENUE' in question_upper or 'SGA TO REVENUE' in question_upper or 'SGNA TO REVENUE' in question_upper:
+        requested.add('sgna_to_revenue')
+
+    # Generic "intensity" for when both might be shown
+    if 'INTENSITY' in question_upper and 'R&D' not in question_upper and 'SG&A' not in question_upper and 'SGA' not in question_upper:
+        requested.add('intensity')
+
+    # Margin keywords
+    if any(word in question_upper for word in ['GROSS MARGIN', 'GROSS PROFIT MARGIN']):
+        requested.add('gross_margin')
+
+    if any(word in question_upper for word in ['OPERATING MARGIN', 'EBIT MARGIN']):
+        requested.add('operating_margin')
+
+    if any(word in question_upper for word in ['NET MARGIN', 'PROFIT MARGIN', 'NET PROFIT MARGIN']):
+        requested.add('net_margin')
+
+    # Balance sheet items (but NOT if asking for ratios)
+    # Only add 'assets' if NOT asking for debt-to-assets ratio
+    if any(word in question_upper for word in ['TOTAL ASSETS', 'TOTAL_ASSETS']) and 'DEBT TO ASSETS' not in question_upper and 'DEBT-TO-ASSETS' not in question_upper:
+        requested.add('assets')
+    elif 'ASSETS' in question_upper and 'DEBT' not in question_upper:
+        requested.add('assets')
+
+    if any(word in question_upper for word in ['TOTAL LIABILITIES', 'TOTAL_LIABILITIES', 'LIABILITIES']):
+        requested.add('liabilities')
+
+    # Only add 'equity' if NOT asking for debt-to-equity ratio
+    if 'EQUITY' in question_upper and 'DEBT TO EQUITY' not in question_upper and 'DEBT-TO-EQUITY' not in question_upper:
+        requested.add('equity')
+
+    if any(word in question_upper for word in ['DEBT', 'TOTAL DEBT']) and 'DEBT TO' not in question_upper and 'DEBT-TO-' not in question_upper:
+        requested.add('debt')
+
+    # Cash flow items (check these before generic keywords)
+    if any(word in question_upper for word in ['OPERATING CASH FLOW', 'OCF', 'CASH FROM OPERATIONS', 'CASH FLOW OPS', 'CASH_FLOW_OPS', 'CASH FLOW FROM OPERATIONS']):
+        requested.add('operating_cash_flow')
+
+    if any(word in question_upper for word in ['INVESTING CASH FLOW', 'CASH FLOW INVESTING', 'CASH_FLOW_INVESTING', 'CASH FROM INVESTING', 'CASH FLOW FROM INVESTING']):
+        requested.add('investing_cash_flow')
+
+    if any(word in question_upper for word in ['FINANCING CASH FLOW', 'CASH FLOW FINANCING', 'CASH_FLOW_FINANCING', 'CASH FROM FINANCING', 'CASH FLOW FROM FINANCING']):
+        requested.add('financing_cash_flow')
+
+    if any(word in question_upper for word in ['FREE CASH FLOW', 'FCF']):
+        requested.add('fcf')
+
+    if any(word in question_upper for word in ['CAPEX', 'CAPITAL EXPENDITURE', 'CAPITAL SPENDING']):
+        requested.add('capex')
+
+    # Shareholder actions
+    if any(word in question_upper for word in ['DIVIDEND', 'DIVIDENDS', 'DIVIDEND PAYMENT']):
+        requested.add('dividends')
+
+    if any(word in question_upper for word in ['BUYBACK', 'BUYBACKS', 'SHARE REPURCHASE', 'STOCK REPURCHASE']):
+        requested.add('buybacks')
+
+    # Ratios
+    if any(word in question_upper for word in ['ROE', 'RETURN ON EQUITY']):
+        requested.add('roe')
+
+    if any(word in question_upper for word in ['ROA', 'RETURN ON ASSETS']):
+        requested.add('roa')
+
+    if any(word in question_upper for word in ['DEBT TO EQUITY', 'DEBT-TO-EQUITY', 'D/E RATIO']):
+        requested.add('debt_to_equity')
+
+    if any(word in question_upper for word in ['DEBT TO ASSETS', 'DEBT-TO-ASSETS']):
+        requested.add('debt_to_assets')
+
+    if any(word in question_upper for word in ['CURRENT RATIO']):
+        requested.add('current_ratio')
+
+    if any(word in question_upper for word in ['QUICK RATIO', 'ACID TEST']):
+        requested.add('quick_ratio')
+
+    # Growth metrics
+    if any(word in question_upper for word in ['YOY', 'YEAR OVER YEAR', 'YEAR-OVER-YEAR', 'Y-O-Y']):
+        requested.add('yoy')
+
+    if any(word in question_upper for word in ['QOQ', 'QUARTER OVER QUARTER', 'QUARTER-OVER-QUARTER', 'Q-O-Q']):
+        requested.add('qoq')
+
+    if any(word in question_upper for word in ['CAGR', 'COMPOUND ANNUAL GROWTH']):
+        requested.add('cagr')
+
+    # Market metrics
+    if any(word in question_upper for word in ['EPS', 'EARNINGS PER SHARE']):
+        requested.add('eps')
+
+    if any(word in question_upper for word in ['P/E', 'PE RATIO', 'PRICE TO EARNINGS', 'PRICE-TO-EARNINGS']):
+        requested.add('pe_ratio')
+
+    if any(word in question_upper for word in ['MARKET CAP', 'MARKET CAPITALIZATION']):
+        requested.add('market_cap')
+
+    # Stock price - check for specific types first
+    # Check for opening price (both phrase and standalone word)
+    if any(word in question_upper for word in ['OPENING PRICE', 'OPEN PRICE', 'OPENING STOCK', 'OPEN STOCK']) or \
+       ('OPENING' in question_upper and 'PRICE' in question_upper):
+        requested.add('opening_price')
+
+    # Check for closing price (both phrase and standalone word)
+    if any(word in question_upper for word in ['CLOSING PRICE', 'CLOSE PRICE', 'CLOSING STOCK', 'CLOSE STOCK', 'EOD PRICE', 'END OF DAY PRICE']) or \
+       (('CLOSING' in question_upper or 'CLOSE' in question_upper) and 'PRICE' in question_upper):
+        requested.add('closing_price')
+
+    # Check for high price (both phrase and standalone word)
+    if any(word in question_upper for word in ['HIGH PRICE', 'HIGHEST PRICE', 'YEAR HIGH', 'PEAK PRICE']) or \
+       ('HIGH' in question_upper and 'PRICE' in question_upper):
+        requested.add('high_price')
+
+    # Check for low price (both phrase and standalone word)
+    if any(word in question_upper for word in ['LOW PRICE', 'LOWEST PRICE', 'YEAR LOW', 'BOTTOM PRICE']) or \
+       ('LOW' in question_upper and 'PRICE' in question_upper):
+        requested.add('low_price')
+
+    # Check for average price
+    if any(word in question_upper for word in ['AVERAGE PRICE', 'AVG PRICE', 'MEAN PRICE']) or \
+       (('AVERAGE' in question_upper or 'AVG' in question_upper) and 'PRICE' in question_upper):
+        requested.add('average_price')
+
+    # Generic price - only if no specific price type was mentioned
+    if 'price' not in requested and 'opening_price' not in requested and 'closing_price' not in requested and 'high_price' not in requested and 'low_price' not in requested and 'average_price' not in requested:
+        if any(word in question_upper for word in ['SHARE PRICE', 'STOCK PRICE', 'STOCK', 'PRICE', 'TRADING PRICE']):
+            requested.add('price')
+
+    if any(word in question_upper for word in ['RETURN', 'STOCK RETURN', 'PRICE RETURN']):
+        requested.add('return')
+
+    if any(word in question_upper for word in ['VOLATILITY', 'VOL', 'PRICE VOLATILITY']):
+        requested.add('volatility')
+
+    if any(word in question_upper for word in ['DIVIDEND', 'DIVIDEND YIELD', 'DIV YIELD']):
+        requested.add('dividend')
+
+    # If no specific metrics found, check if it's a generic query
+    if not requested:
+        # Generic queries should show all available data
+        generic_keywords = ['METRICS', 'DATA', 'INFORMATION', 'DETAILS', 'FINANCIAL', 'PERFORMANCE', 'NUMBERS', 'STATS', 'STATISTICS']
+        if any(word in question_upper for word in generic_keywords):
+            requested.add('all')
+        # If just asking to "show" a company with a year/quarter, show relevant metrics
+        elif 'SHOW' in question_upper and not any(word in question_upper for word in ['GROWTH', 'COMPARE', 'VS', 'VERSUS']):
+            requested.add('all')
+
+    return requested
+
+
+def required_columns(question: str) -> Optional[FrozenSet[str]]:
+    """
+    Metric columns a question needs (keys not included)
+
+    Returns:
+        Column names, or None when the full column list must be kept
+    """
+    if not question:
+        return None
+    question_upper = question.upper()
+    if any(word in question_upper for word in GENERIC_MACRO_KEYWORDS):
+        return None
+
+    requested = extract_requested_metrics(question)
+    if not requested or not requested <= METRIC_COLUMNS.keys():
+        return None  # 'all', or a metric no column list is known for
+
+    columns = set()
+    for metric in requested:
+        columns |= METRIC_COLUMNS[metric]
+    for keywords, macro_columns in MACRO_COLUMNS:
+        if any(word in question_upper for word in keywords):
+            columns |= macro_columns
+    return frozenset(columns)
+
+
+def _split_top_level(text: str) -> List[str]:
+    """Split on commas outside parentheses and string literals"""
+    items, depth, start, quoted = [], 0, 0, False
+    for i, char in enumerate(text):
+        if char == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            items.append(text[start:i])
+            start = i + 1
+    items.append(text[start:])
+    return items
+
+
+def _find_top_level(sql: str, keyword: str, start: int = 0) -> int:
+    """Index of the first keyword outside parentheses and string literals (-1 if none)"""
+    pattern = re.compile(rf'\b{keyword}\b', re.IGNORECASE)
+    depth, quoted = 0, False
+    for i in range(start, len(sql)):
+        char = sql[i]
+        if char == "'":
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0 and pattern.match(sql, i) and (i == 0 or not (sql[i - 1].isalnum() or sql[i - 1] == '_')):
+            return i
+    return -1
+
+
+def _output_name(item: str) -> Optional[str]:
+    """Output column name of a select item (None for unnamed expressions)"""
+    match = re.search(r'\bas\s+"?(\w+)"?\s*$', item, re.IGNORECASE)
+    if match:
+        return match.group(1)
+    match = re.fullmatch(r'\s*(?:\w+\.)?(\w+)\s*', item)
+    return match.group(1) if match else None
+
+
+@lru_cache(maxsize=512)
+def project_sql(sql: str, columns: FrozenSet[str]) -> Optional[str]:
+    """
+    Rewrite a query's top-level SELECT list to the key columns plus columns
+
+    Unnamed expressions and aliases the ORDER BY refers to are always kept.
+
+    Args:
+        sql: Template SQL (a single SELECT)
+        columns: Metric output columns to keep
+
+    Returns:
+        Projected SQL, or None when nothing can be pruned or none of columns
+        is selected (the template can't narrow the answer, keep it whole)
+    """
+    match = re.match(r'\s*SELECT\s+', sql, re.IGNORECASE)
+    if not match or re.match(r'DISTINCT\b', sql[match.end():], re.IGNORECASE):
+        return None
+    from_index = _find_top_level(sql, 'FROM', match.end())
+    if from_index < 0:
+        return None
+
+    tail = sql[from_index:]
+    order_index = _find_top_level(tail, r'ORDER\s+BY')
+    ordered = set(re.findall(r'(?<![\w.])(\w+)', tail[order_index:])) if order_index >= 0 else set()
+
+    items = _split_top_level(sql[match.end():from_index])
+    kept, matched = [], False
+    for item in items:
+        name = _output_name(item)
+        if name is None or name in KEY_COLUMNS or name in ordered:
+            kept.append(item)
+        elif name in columns:
+            kept.append(item)
+            matched = True
+
+    if not matched or len(kept) == len(items):
+        return None
+    return sql[:match.end()] + ", ".join(item.strip() for item in kept) + " " + tail
+
+
+def projected_template_sql(template_name: str, sql: str, question: str) -> Optional[str]:
+    """
+    Pruned variant of a template's SQL for a question
+
+    Returns:
+        Projected SQL, or None to run the template as is
+    """
+    if not COLUMN_PRUNING or template_name not in PRUNABLE_TEMPLATES:
+        return None
+    columns = required_columns(question)
+    if columns is None:
+        return None
+    return project_sql(sql, columns)
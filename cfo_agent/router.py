@@ -5,6 +5,12 @@ import json
 from typing import Dict, List
 
 
+# Surfaces behind the screening engine's annual / quarterly indexes
+SCREEN_SURFACES = {
+    'annual': ['mv_financials_annual', 'mv_ratios_annual', 'vw_growth_annual'],
+    'quarter': ['fact_financials', 'vw_ratios_quarter', 'vw_growth_quarter']
+}
+
 class IntentRouter:
     """Routes tasks to appropriate database surfaces based on intent"""
     
@@ -27,10 +33,25 @@ class IntentRouter:
             task: Task dict with 'intent', 'entities', 'period', 'measures'
             
         Returns:
-            Dict with 'intent', 'template_name', 'surfaces', 'entities', 'period', 'measures'
+            Dict with 'intent', 'template_name', 'surfaces', 'entities', 'period', 'measures',
+            'growth' (growth engine spec) or 'screen' (screen spec)
         """
         intent = task.get('intent', 'quarter_snapshot')
         
+        # Screens run on the in-process screening engine, not a SQL template
+        if intent == 'screen':
+            frequency = (task.get('screen') or {}).get('frequency', 'annual')
+            return {
+                'intent': intent,
+                'template_name': 'screen',
+                'template': None,
+                'surfaces': SCREEN_SURFACES[frequency],
+                'entities': [],
+                'period': task.get('period', {'latest': True, 'fy': None, 'fq': None}),
+                'measures': task.get('measures', []),
+                'screen': task.get('screen')
+            }
+        
         # Find matching template
         template_name = None
         template = None
@@ -56,7 +77,8 @@ class IntentRouter:
             'surfaces': surfaces,
             'entities': task.get('entities', []),
             'period': task.get('period', {'latest': True, 'fy': None, 'fq': None}),
-            'measures': task.get('measures', [])
+            'measures': task.get('measures', []),
+            'growth': task.get('growth')
         }
     
     def route_all_tasks(self, tasks: List[Dict]) -> List[Dict]:
@@ -0,0 +1,57 @@
+"""
+Run the batch data-quality stage after a data load
+
+Recomputes outlier z-scores and balance-sheet health flags into
+dq_quarter_flags (see sql/create_data_quality_flags.sql).
+
+Usage:
+    python run_data_quality.py                      # full universe
+    python run_data_quality.py --company-id 1 3     # only companies touched by the load
+    python run_data_quality.py --sigma 2.5 --balance-tol-pct 0.01
+"""
+import argparse
+import asyncio
+import os
+import time
+from db.pool import db_pool
+from analytics.data_quality import DataQualityStage
+
+
+async def run_data_quality(args):
+    """Execute the data-quality stage"""
+    await db_pool.initialize()
+
+    print("\n" + "="*100)
+    print("DATA-QUALITY STAGE: outliers + financial health")
+    print("="*100)
+    print(f"  Sigma threshold:          {args.sigma}")
+    print(f"  Balance tolerance (pct):  {args.balance_tol_pct}")
+    print(f"  Balance tolerance (abs):  {args.balance_tol_abs:,.0f}")
+    print(f"  Companies:                {args.company_id or 'ALL'}")
+
+    stage = DataQualityStage(
+        sigma_threshold=args.sigma,
+        balance_tolerance_pct=args.balance_tol_pct,
+        balance_tolerance_abs=args.balance_tol_abs
+    )
+
+    start = time.perf_counter()
+    try:
+        written = await stage.run(db_pool.pool, company_ids=args.company_id)
+        elapsed = time.perf_counter() - start
+        print(f"\n✅ Wrote {written} flag rows in {elapsed:.2f}s")
+    except Exception as e:
+        print(f"\n❌ Data-quality stage failed: {str(e)}")
+        raise
+    finally:
+        await db_pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute data-quality flags after a load")
+    parser.add_argument('--sigma', type=float, default=float(os.getenv('DQ_SIGMA_THRESHOLD', '3.0')))
+    parser.add_argument('--balance-tol-pct', type=float, default=float(os.getenv('DQ_BALANCE_TOLERANCE_PCT', '0.005')))
+    parser.add_argument('--balance-tol-abs', type=float, default=float(os.getenv('DQ_BALANCE_TOLERANCE_ABS', '1000000')))
+    parser.add_argument('--company-id', type=int, nargs='*', default=None)
+
+    asyncio.run(run_data_quality(parser.parse_args()))
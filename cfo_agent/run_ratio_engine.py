@@ -0,0 +1,117 @@
+"""
+Run the vectorized ratio engine over the full universe
+
+Modes:
+    python run_ratio_engine.py --verify   # compare engine output with the SQL ratio views
+    python run_ratio_engine.py --write    # refresh calc_ratios_quarter / calc_ratios_annual
+
+See sql/create_calc_ratio_tables.sql for the target tables.
+"""
+import argparse
+import asyncio
+import time
+import numpy as np
+from db.pool import db_pool
+from analytics.panel import records_to_columns, to_python
+from analytics.ratios import RatioEngine, QUARTER_RATIOS, TTM_RATIOS, ANNUAL_RATIOS, compare
+
+
+# SQL surfaces the engine is verified against
+VERIFY_SOURCES = [
+    ('vw_ratios_canonical', ['company_id', 'fiscal_year', 'fiscal_quarter'], list(QUARTER_RATIOS), 'quarter'),
+    ('mv_ratios_ttm', ['company_id', 'fiscal_year', 'fiscal_quarter'], list(TTM_RATIOS), 'ttm'),
+    ('mv_ratios_annual', ['company_id', 'fiscal_year'], list(ANNUAL_RATIOS), 'annual')
+]
+
+
+async def verify(engine: RatioEngine):
+    """Compare engine output with the SQL views, column by column"""
+    outputs = {
+        'quarter': engine.quarterly_ratios(),
+        'ttm': engine.ttm(),
+        'annual': engine.annual()
+    }
+
+    all_ok = True
+    for surface, keys, columns, output in VERIFY_SOURCES:
+        print(f"\n[VERIFY] {surface}")
+        print("-"*100)
+
+        async with db_pool.pool.acquire() as conn:
+            available = {r['column_name'] for r in await conn.fetch(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = $1", surface
+            )}
+            present = [c for c in columns if c in available]
+            records = await conn.fetch(f"SELECT {', '.join(keys + present)} FROM {surface}")
+
+        report = compare(outputs[output], records_to_columns(records), keys, present)
+        for column, stats in report.items():
+            ok = stats['mismatches'] == 0 and stats['null_mismatches'] == 0
+            all_ok = all_ok and ok
+            print(f"  {'✅' if ok else '❌'} {column:<28} rows={stats['rows']:<6} "
+                  f"mismatches={stats['mismatches']:<4} null_mismatches={stats['null_mismatches']:<4} "
+                  f"max_abs_diff={stats['max_abs_diff']:.3e}")
+        for column in sorted(set(columns) - set(present)):
+            print(f"  ⏸️  {column:<28} not exposed by {surface}")
+
+    return all_ok
+
+
+async def write_tables(engine: RatioEngine):
+    """Replace calc_ratios_quarter and calc_ratios_annual in one write transaction"""
+    quarter = {**engine.quarterly_ratios(), **engine.ttm()}
+    annual = engine.annual()
+
+    async with db_pool.pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("SET TRANSACTION READ WRITE")
+            for table, data in (('calc_ratios_quarter', quarter), ('calc_ratios_annual', annual)):
+                columns = list(data.keys())
+                rows = [
+                    tuple(to_python(data[c][i]) for c in columns)
+                    for i in range(len(data[columns[0]]))
+                ]
+                await conn.execute(f"DELETE FROM {table}")
+                await conn.copy_records_to_table(table, records=rows, columns=columns)
+                print(f"  ✅ {table}: {len(rows)} rows")
+
+
+async def main(args):
+    await db_pool.initialize()
+
+    print("\n" + "="*100)
+    print("VECTORIZED RATIO ENGINE")
+    print("="*100)
+
+    try:
+        start = time.perf_counter()
+        engine = await RatioEngine.from_pool(db_pool.pool)
+        loaded = time.perf_counter()
+
+        engine.quarterly_ratios()
+        engine.ttm()
+        engine.annual()
+        computed = time.perf_counter()
+
+        n_rows = len(engine.keys['company_id'])
+        n_companies = len(np.unique(engine.keys['company_id']))
+        print(f"Panel: {n_rows} company-quarters across {n_companies} companies")
+        print(f"Load: {loaded - start:.2f}s | Compute (quarter + TTM + annual): {(computed - loaded) * 1000:.1f}ms")
+
+        if args.verify:
+            ok = await verify(engine)
+            print("\n" + ("✅ Engine matches SQL views" if ok else "❌ Differences found (see above)"))
+
+        if args.write:
+            print("\n[WRITE] Refreshing precomputed ratio tables")
+            await write_tables(engine)
+    finally:
+        await db_pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch ratio/TTM computation")
+    parser.add_argument('--verify', action='store_true', help="Compare with vw_ratios_canonical, mv_ratios_ttm, mv_ratios_annual")
+    parser.add_argument('--write', action='store_true', help="Refresh calc_ratios_quarter / calc_ratios_annual")
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,77 @@
+"""
+Single-flight coalescing of identical concurrent work
+
+The first caller for a key starts the computation as a task; callers that
+arrive while it is running await the same task and share its result (or
+exception). The key is released when the task finishes, so results are never
+cached beyond the in-flight window.
+"""
+import asyncio
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from metrics import cache_requests
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key"""
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self.inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]],
+                 timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Run fn() once per key across concurrent callers
+
+        Args:
+            key: Hashable identity of the work
+            fn: Zero-argument coroutine factory, only called by the leader
+            timeout: How long this caller waits (the shared task keeps running)
+
+        Returns:
+            (result, shared) - shared is True when another caller did the work
+        """
+        task = self.inflight.get(key)
+        shared = task is not None
+        cache_requests.inc(cache=f"{self.name}_coalesce", result='hit' if shared else 'miss')
+        if shared:
+            self.followers += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self.inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._release(k, t))
+
+        # shield: a caller giving up (timeout/disconnect) must not cancel the others' work
+        result = await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        return result, shared
+
+    def _release(self, key: Hashable, task: asyncio.Task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller gave up
+
+    def stats(self) -> Dict:
+        """Leader/follower counts and current in-flight keys"""
+        total = self.leaders + self.followers
+        return {
+            'inflight': len(self.inflight),
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'coalesced_ratio': round(self.followers / total, 4) if total else 0.0
+        }
+
+
+def normalize_question(question: str) -> str:
+    """Case, whitespace and trailing punctuation don't change the answer"""
+    return re.sub(r'\s+', ' ', question).strip().rstrip('?.! ').lower()
+
+
+def params_key(sql: str, params: Dict) -> Tuple[str, str]:
+    """Stable key for an (sql, params) pair"""
+    return sql, json.dumps(params, sort_keys=True, default=str)
@@ -0,0 +1,100 @@
+-- ============================================================================
+-- PRECOMPUTED RATIO TABLES - WRITTEN BY THE VECTORIZED RATIO ENGINE
+-- ============================================================================
+-- Purpose: Hold the output of analytics/ratios.py (run_ratio_engine.py --write)
+--          so ratio lookups and verification do not re-run the ratio views.
+--
+-- Pattern:
+--   - calc_ratios_quarter: vw_ratios_canonical + mv_financials_ttm / mv_ratios_ttm
+--   - calc_ratios_annual:  mv_financials_annual + mv_ratios_annual
+-- ============================================================================
+
+-- ----------------------------------------------------------------------------
+-- 1. QUARTERLY + TTM RATIOS
+-- ----------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS calc_ratios_quarter (
+    company_id              int NOT NULL REFERENCES dim_company(company_id) ON DELETE CASCADE,
+    fiscal_year             int NOT NULL,
+    fiscal_quarter          int NOT NULL,
+
+    -- Quarterly ratios
+    roe                     double precision,
+    roa                     double precision,
+    gross_margin            double precision,
+    operating_margin        double precision,
+    net_margin              double precision,
+    debt_to_equity          double precision,
+    debt_to_assets          double precision,
+    rnd_to_revenue          double precision,
+    sgna_to_revenue         double precision,
+
+    -- Trailing twelve months
+    revenue_ttm             double precision,
+    gross_profit_ttm        double precision,
+    cogs_ttm                double precision,
+    operating_income_ttm    double precision,
+    net_income_ttm          double precision,
+    r_and_d_expenses_ttm    double precision,
+    sgna_ttm                double precision,
+    capex_ttm               double precision,
+    total_assets_avg_ttm    double precision,
+    equity_avg_ttm          double precision,
+    gross_margin_ttm        double precision,
+    operating_margin_ttm    double precision,
+    net_margin_ttm          double precision,
+    roe_ttm                 double precision,
+    roa_ttm                 double precision,
+
+    computed_at             timestamptz NOT NULL DEFAULT now(),
+
+    PRIMARY KEY (company_id, fiscal_year, fiscal_quarter)
+);
+
+
+-- ----------------------------------------------------------------------------
+-- 2. ANNUAL AGGREGATES + RATIOS
+-- ----------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS calc_ratios_annual (
+    company_id                  int NOT NULL REFERENCES dim_company(company_id) ON DELETE CASCADE,
+    fiscal_year                 int NOT NULL,
+    quarter_count               int NOT NULL,
+
+    -- Aggregates
+    revenue_annual              double precision,
+    gross_profit_annual         double precision,
+    cogs_annual                 double precision,
+    operating_income_annual     double precision,
+    net_income_annual           double precision,
+    r_and_d_expenses_annual     double precision,
+    sg_and_a_expenses_annual    double precision,
+    capex_annual                double precision,
+    total_assets_eoy            double precision,
+    total_liabilities_eoy       double precision,
+    equity_eoy                  double precision,
+    total_assets_avg_fy         double precision,
+    equity_avg_fy               double precision,
+
+    -- Ratios
+    gross_margin_annual         double precision,
+    operating_margin_annual     double precision,
+    net_margin_annual           double precision,
+    roe_annual_avg_equity       double precision,
+    roe_annual_end_equity       double precision,
+    roa_annual                  double precision,
+    debt_to_equity_annual       double precision,
+    debt_to_assets_annual       double precision,
+    rnd_to_revenue_annual       double precision,
+    sgna_to_revenue_annual      double precision,
+
+    computed_at                 timestamptz NOT NULL DEFAULT now(),
+
+    PRIMARY KEY (company_id, fiscal_year)
+);
+
+COMMENT ON TABLE calc_ratios_quarter IS 'Quarterly and TTM ratios computed in batch by analytics/ratios.py';
+COMMENT ON TABLE calc_ratios_annual IS 'Annual aggregates and ratios computed in batch by analytics/ratios.py';
+
+GRANT SELECT ON calc_ratios_quarter TO authenticated, anon;
+GRANT SELECT ON calc_ratios_annual TO authenticated, anon;
@@ -0,0 +1,110 @@
+-- ============================================================================
+-- DATA-QUALITY FLAGS - PRECOMPUTED AT INGEST TIME
+-- ============================================================================
+-- Purpose: Store outlier z-scores and balance-sheet health flags computed by
+--          the batch data-quality stage (run_data_quality.py) after each load.
+--
+-- Pattern:
+--   - Table: dq_quarter_flags (written by analytics/data_quality.py)
+--   - Views: vw_financial_health_quarter, vw_outliers_quarter become thin
+--            selects over the table, so health_flags/outliers queries cost
+--            O(rows returned) instead of a window scan over vw_company_quarter
+-- ============================================================================
+
+-- ----------------------------------------------------------------------------
+-- 1. FLAGS TABLE
+-- ----------------------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS dq_quarter_flags (
+    company_id                  int NOT NULL REFERENCES dim_company(company_id) ON DELETE CASCADE,
+    fiscal_year                 int NOT NULL,
+    fiscal_quarter              int NOT NULL,
+
+    -- Outliers (per-company population z-scores)
+    revenue                     double precision,
+    net_margin                  double precision,
+    z_revenue                   double precision,
+    z_net_margin                double precision,
+    outlier_revenue_3sigma      smallint NOT NULL DEFAULT 0,
+    outlier_net_margin_3sigma   smallint NOT NULL DEFAULT 0,
+
+    -- Balance-sheet health
+    total_assets                double precision,
+    total_liabilities           double precision,
+    equity                      double precision,
+    liabilities_plus_equity     double precision,
+    balance_gap                 double precision,
+    balance_gap_pct             double precision,
+    balance_status              text NOT NULL,
+    flag_negative_equity        smallint NOT NULL DEFAULT 0,
+    flag_net_loss               smallint NOT NULL DEFAULT 0,
+
+    -- Metadata
+    sigma_threshold             double precision NOT NULL,   -- Threshold used for the outlier flags
+    computed_at                 timestamptz NOT NULL DEFAULT now(),
+
+    PRIMARY KEY (company_id, fiscal_year, fiscal_quarter)
+);
+
+-- Latest-first lookups per company (health_flags template)
+CREATE INDEX IF NOT EXISTS ix_dq_flags_company_period
+    ON dq_quarter_flags (company_id, fiscal_year DESC, fiscal_quarter DESC);
+
+-- Outlier rows only (outliers template filters on the flags)
+CREATE INDEX IF NOT EXISTS ix_dq_flags_outliers
+    ON dq_quarter_flags (company_id, fiscal_year DESC, fiscal_quarter DESC)
+    WHERE outlier_revenue_3sigma = 1 OR outlier_net_margin_3sigma = 1;
+
+COMMENT ON TABLE dq_quarter_flags IS 'Per-company per-quarter outlier and balance-sheet flags written by the batch data-quality stage after each load';
+
+
+-- ----------------------------------------------------------------------------
+-- 2. FINANCIAL HEALTH VIEW (thin select)
+-- ----------------------------------------------------------------------------
+
+DROP VIEW IF EXISTS vw_financial_health_quarter;
+
+CREATE VIEW vw_financial_health_quarter AS
+SELECT
+    company_id, fiscal_year, fiscal_quarter,
+    total_assets, total_liabilities, equity,
+    liabilities_plus_equity,
+    balance_gap,
+    balance_gap_pct,
+    balance_status,
+    flag_negative_equity,
+    flag_net_loss,
+    computed_at
+FROM dq_quarter_flags;
+
+COMMENT ON VIEW vw_financial_health_quarter IS 'Balance-sheet health flags - thin select over dq_quarter_flags';
+
+
+-- ----------------------------------------------------------------------------
+-- 3. OUTLIERS VIEW (thin select)
+-- ----------------------------------------------------------------------------
+
+DROP VIEW IF EXISTS vw_outliers_quarter;
+
+CREATE VIEW vw_outliers_quarter AS
+SELECT
+    company_id, fiscal_year, fiscal_quarter,
+    revenue, net_margin,
+    z_revenue,
+    z_net_margin,
+    outlier_revenue_3sigma,
+    outlier_net_margin_3sigma,
+    sigma_threshold,
+    computed_at
+FROM dq_quarter_flags;
+
+COMMENT ON VIEW vw_outliers_quarter IS 'Revenue and net-margin outliers - thin select over dq_quarter_flags';
+
+
+-- ----------------------------------------------------------------------------
+-- 4. PERMISSIONS
+-- ----------------------------------------------------------------------------
+
+GRANT SELECT ON dq_quarter_flags TO authenticated, anon;
+GRANT SELECT ON vw_financial_health_quarter TO authenticated, anon;
+GRANT SELECT ON vw_outliers_quarter TO authenticated, anon;
@@ -4,6 +4,9 @@ SQL builder: template-first with guarded generative fallback
 from typing import Dict, Tuple, Optional
 from db.whitelist import validate_sql
 from generative_sql import GenerativeSQLBuilder
+from cost_gate import COST_GATE, cost_gate
+from learned_templates import LEARNED_TEMPLATES, learned_key, learning_key, learned_templates, value_key
+from metrics import cache_requests
 
 
 class SQLBuilder:
@@ -12,20 +15,22 @@ class SQLBuilder:
     def __init__(self):
         self.generative_builder = GenerativeSQLBuilder()
     
-    async def build_sql(self, plan: Dict, use_generative: bool = False) -> Tuple[str, Dict, bool]:
+    async def build_sql(self, plan: Dict, use_generative: bool = False,
+                        timeout: Optional[float] = None) -> Tuple[str, Dict, bool]:
         """
         Build SQL query from plan
         
         Args:
             plan: Execution plan with 'sql', 'params', 'surfaces'
             use_generative: Force generative SQL path
+            timeout: Remaining request budget (bounds the cost gate's EXPLAINs)
             
         Returns:
             (sql, params, is_generative)
         """
         if use_generative:
             # Generative path
-            return await self._build_generative(plan)
+            return await self._build_generative(plan, timeout)
         else:
             # Template path (default)
             return await self._build_from_template(plan)
@@ -43,8 +48,28 @@ class SQLBuilder:
         
         return sql, params, False
     
-    async def _build_generative(self, plan: Dict) -> Tuple[str, Dict, bool]:
-        """Build SQL using generative approach"""
+    async def _build_generative(self, plan: Dict, timeout: Optional[float] = None) -> Tuple[str, Dict, bool]:
+        """
+        Build SQL using generative approach (valid candidates must pass the EXPLAIN cost gate)
+        
+        SQL that already ran for a task of the same shape (or, if it inlined
+        values, for the same values) is reused without an LLM call.
+        plan['learned'] = (key, sql, reviewed) asks the caller to report the
+        outcome to the learned template store.
+        """
+        if LEARNED_TEMPLATES:
+            found = learned_templates.lookup(learned_key(plan), value_key(plan))
+            cache_requests.inc(cache='learned_templates', result='hit' if found else 'miss')
+            if found:
+                key, entry = found
+                params = dict(plan.get('params', {}))
+                is_valid, _ = validate_sql(entry['sql'], params)
+                if is_valid:
+                    plan['learned'] = (key, entry['sql'], False)
+                    # Promoted entries that were approved through HITL run as templates
+                    return entry['sql'], params, not (entry['promoted'] and entry['reviewed'])
+                learned_templates.invalidate(key, entry['sql'])
+        
         # Extract context from plan
         context = {
             'intent': plan.get('intent'),
@@ -56,20 +81,32 @@ class SQLBuilder:
         # Generate SQL candidates
         candidates = await self.generative_builder.generate_sql(context)
         
-        # Validate and select best candidate
+        # Validate candidates
+        valid = []
+        reasons = []
         for sql, params in candidates:
             is_valid, error_msg = validate_sql(sql, params)
             if is_valid:
-                # Try dry-run
-                try:
-                    # This would be implemented in sql_exec.py
-                    # For now, just return the first valid candidate
-                    return sql, params, True
-                except Exception as e:
-                    continue
-        
-        # All candidates failed
-        raise ValueError("All generated SQL candidates failed validation")
+                valid.append((sql, params))
+            else:
+                reasons.append(error_msg)
+        
+        if not valid:
+            raise ValueError(f"All generated SQL candidates failed validation: {'; '.join(reasons)}")
+        if not COST_GATE:
+            sql, params = valid[0]
+            if LEARNED_TEMPLATES:
+                plan['learned'] = (learning_key(sql, plan), sql, False)
+            return sql, params, True
+        
+        # EXPLAIN every valid candidate concurrently; run the cheapest that fits the ceilings
+        passing, rejected = await cost_gate.rank(valid, timeout)
+        if not passing:
+            raise ValueError(f"All generated SQL candidates failed the cost gate: {'; '.join(rejected)}")
+        sql, params = passing[0]
+        if LEARNED_TEMPLATES:
+            plan['learned'] = (learning_key(sql, plan), sql, False)
+        return sql, params, True
     
     def validate_and_fix(self, sql: str, params: Dict) -> Tuple[str, Dict, bool]:
         """
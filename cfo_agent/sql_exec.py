@@ -1,43 +1,108 @@
 """
 SQL execution with read-only access and timeout
+
+Identical concurrent (sql, params) pairs are coalesced into one database
+round trip (SQL_COALESCE=false to disable). execute_bundle runs several
+queries as one statement (see bundle.py); execute_fused runs tasks sharing a
+template as one statement (see fusion.py).
 """
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
+import asyncio
+import os
 from db.pool import db_pool
+from singleflight import SingleFlight, params_key
+from bundle import bundle_queries, decode_bundle
+from fusion import fuse_queries, split_fused
+from db.results import ResultSet
 
 
 class SQLExecutor:
     """Executes validated SQL queries against the database"""
     
-    def __init__(self, timeout: float = 5.0):
+    def __init__(self, timeout: float = 5.0, coalesce: Optional[bool] = None):
         self.timeout = timeout
+        if coalesce is None:
+            coalesce = os.getenv('SQL_COALESCE', 'true').lower() == 'true'
+        self.flight = SingleFlight("sql") if coalesce else None
     
-    async def execute(self, sql: str, params: Dict) -> List[Dict]:
+    async def execute(self, sql: str, params: Dict, timeout: Optional[float] = None,
+                      fresh: bool = False) -> ResultSet:
         """
-        Execute SQL query and return results as list of dicts
+        Execute SQL query and return results as a columnar ResultSet
         
         Args:
             sql: Validated SQL query
             params: Query parameters
+            timeout: Remaining request budget; the query gets min(timeout, self.timeout)
+            fresh: Freshness-sensitive: skip replicas lagging beyond DB_FRESH_MAX_LAG_SECONDS
             
         Returns:
-            List of result rows as dicts
+            ResultSet (iterates as row dicts)
         """
+        effective_timeout = self.timeout if timeout is None else max(min(timeout, self.timeout), 0.001)
+        async def fetch() -> ResultSet:
+            records = await db_pool.execute_query(sql, params, timeout=effective_timeout, fresh=fresh)
+            return ResultSet.from_records(records)
+        
         try:
-            records = await db_pool.execute_query(sql, params, timeout=self.timeout)
-            
-            # Convert asyncpg Records to dicts
-            results = [dict(record) for record in records]
-            
-            return results
-        except TimeoutError as e:
-            raise TimeoutError(f"Query exceeded {self.timeout}s timeout")
+            if self.flight is None:
+                return await fetch()
+            # Columnar and immutable: built once and shared by coalesced callers. Inside a
+            # session the leader reads its own snapshot, so only coalesce within that session
+            key = (params_key(sql, params), fresh, db_pool.current_session())
+            result, _ = await self.flight.do(key, fetch, timeout=effective_timeout)
+            return result
+        except (TimeoutError, asyncio.TimeoutError) as e:
+            raise TimeoutError(f"Query exceeded {effective_timeout:.2f}s timeout")
         except Exception as e:
             raise RuntimeError(f"Query execution failed: {str(e)}")
     
-    async def dry_run(self, sql: str, params: Dict) -> bool:
+    async def execute_bundle(self, queries: Dict[str, Tuple[str, Dict]], timeout: Optional[float] = None,
+                             fresh: bool = False) -> Dict[str, ResultSet]:
+        """
+        Execute several read queries in one round trip
+        
+        Args:
+            queries: {name: (sql, params)}
+            timeout: Remaining request budget; the statement gets min(timeout, self.timeout)
+            fresh: Freshness-sensitive: skip lagging replicas
+            
+        Returns:
+            {name: ResultSet}
+        """
+        sql, params = bundle_queries(queries)
+        effective_timeout = self.timeout if timeout is None else max(min(timeout, self.timeout), 0.001)
+        try:
+            record = await db_pool.execute_one(sql, params, timeout=effective_timeout, fresh=fresh)
+        except (TimeoutError, asyncio.TimeoutError):
+            raise TimeoutError(f"Bundled query exceeded {effective_timeout:.2f}s timeout")
+        decoded = decode_bundle(record['bundle'] if record else None)
+        return {name: ResultSet.from_dicts(rows) for name, rows in decoded.items()}
+    
+    async def execute_fused(self, queries: List[Tuple[str, Dict]], timeout: Optional[float] = None,
+                            fresh: bool = False) -> List[ResultSet]:
+        """
+        Execute tasks of one fusion group as one statement
+        
+        Args:
+            queries: [(sql, params)] sharing one template (see fusion.fusion_groups)
+            timeout: Remaining request budget
+            fresh: Freshness-sensitive: skip lagging replicas
+            
+        Returns:
+            One ResultSet per query, in order
+        """
+        sql, params, positions = fuse_queries(queries)
+        result = await self.execute(sql, params, timeout=timeout, fresh=fresh)
+        return split_fused(result, positions)
+    
+    async def dry_run(self, sql: str, params: Dict, timeout: Optional[float] = None) -> bool:
         """
         Dry-run query with LIMIT 1 to test validity
         
+        Args:
+            timeout: Remaining request budget (capped at 2s)
+        
         Returns:
             True if query executes successfully
         """
@@ -51,7 +116,7 @@ class SQLExecutor:
             dry_run_sql = re.sub(r'LIMIT\s+\d+', 'LIMIT 1', sql, flags=re.IGNORECASE)
         
         try:
-            await db_pool.execute_query(dry_run_sql, params, timeout=2.0)
+            await db_pool.execute_query(dry_run_sql, params, timeout=2.0 if timeout is None else max(min(timeout, 2.0), 0.001))
             return True
         except Exception:
             return False
@@ -745,6 +745,13 @@ if prompt := st.chat_input("Ask a financial question..."):
                     "content": answer,
                     "viz_metadata": viz_metadata  # Store viz_metadata for chart display
                 })
+            elif response.status_code == 429:
+                progress_container.empty()
+                status_container.empty()
+                retry_after = response.headers.get("Retry-After", "a few")
+                error_msg = f"🚦 The agent is busy right now. Please try again in {retry_after} seconds."
+                st.warning(error_msg)
+                st.session_state.messages.append({"role": "assistant", "content": error_msg})
             else:
                 progress_container.empty()
                 status_container.empty()
@@ -0,0 +1,140 @@
+"""Test admission control: bounded in-flight work, early 429s, priority"""
+import asyncio
+from admission import AdmissionController, AdmittedStreamingResponse, Overloaded, paused, retry_after_header
+
+
+async def hold(controller, seconds, deadline=10.0):
+    async with controller.admit(deadline):
+        await asyncio.sleep(seconds)
+
+
+def test_inflight_limit_and_queue_order():
+    async def run():
+        controller = AdmissionController("ask", max_inflight=2, max_queue=4, initial_service_time=0.02)
+        started = []
+
+        async def request(i):
+            async with controller.admit(10.0):
+                started.append(i)
+                assert controller.inflight <= 2
+                await asyncio.sleep(0.02)
+
+        await asyncio.gather(*[request(i) for i in range(6)])
+        assert started == list(range(6))  # FIFO
+        assert controller.inflight == 0 and controller.stats()['admitted'] == 6
+    asyncio.run(run())
+
+
+def test_reject_early_when_queue_full_or_wait_exceeds_deadline():
+    async def run():
+        controller = AdmissionController("ask", max_inflight=1, max_queue=1, initial_service_time=1.0)
+        busy = asyncio.ensure_future(hold(controller, 0.05))
+        await asyncio.sleep(0)
+
+        # Projected wait (1 x 1.0s) + service (1.0s) > 0.5s deadline: rejected without queueing
+        try:
+            await controller.acquire(deadline=0.5)
+            raise AssertionError("expected Overloaded")
+        except Overloaded as e:
+            assert retry_after_header(e) == {'Retry-After': '1'}
+
+        queued = asyncio.ensure_future(hold(controller, 0.0))
+        await asyncio.sleep(0)
+        try:
+            await controller.acquire(deadline=10.0)  # queue (size 1) is full
+            raise AssertionError("expected Overloaded")
+        except Overloaded:
+            pass
+
+        await asyncio.gather(busy, queued)
+        assert controller.stats()['rejected'] == 2 and controller.inflight == 0
+    asyncio.run(run())
+
+
+def test_lower_priority_yields_to_queued_high_priority():
+    async def run():
+        ask = AdmissionController("ask", max_inflight=1, max_queue=4, initial_service_time=0.01)
+        viz = AdmissionController("visualize", max_inflight=2, max_queue=4, yield_to=ask, initial_service_time=0.01)
+        order = []
+
+        async def request(controller, label, seconds=0.02):
+            async with controller.admit(10.0):
+                order.append(label)
+                await asyncio.sleep(seconds)
+
+        first = asyncio.ensure_future(request(ask, 'ask1'))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(request(ask, 'ask2'))  # queued behind ask1
+        await asyncio.sleep(0)
+        chart = asyncio.ensure_future(request(viz, 'viz'))  # viz has free slots but must wait
+        await asyncio.sleep(0.005)
+        assert order == ['ask1'] and viz.inflight == 0
+
+        await first
+        await asyncio.sleep(0.005)
+        assert order == ['ask1', 'ask2', 'viz'] and not second.done()  # starts once the ask queue drains
+
+        await asyncio.gather(second, chart)
+        assert viz.inflight == 0 and ask.inflight == 0
+    asyncio.run(run())
+
+
+def test_paused_time_left_out_of_service_time():
+    async def run():
+        ask = AdmissionController("ask", max_inflight=2, max_queue=2, initial_service_time=0.05)
+
+        async def review():
+            with paused():
+                await asyncio.sleep(0.2)
+
+        async with ask.admit(deadline=5.0):
+            await asyncio.sleep(0.02)
+            await asyncio.gather(review(), review())  # parallel tasks parked at once count once
+        assert ask.service_time < 0.06  # only the 20ms of work went into the average
+
+        with paused():  # outside an admitted request: no-op
+            pass
+    asyncio.run(run())
+
+
+def test_streaming_response_releases_slot_however_it_ends():
+    async def run():
+        controller = AdmissionController("export", max_inflight=1, max_queue=1, initial_service_time=0.05)
+        started = []
+
+        async def body():
+            started.append(True)
+            yield b"row\n"
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def gone(message):
+            raise OSError("client went away")
+
+        async def ok(message):
+            pass
+
+        scope = {'type': 'http', 'asgi': {'spec_version': '2.4'}}
+        # Client gone before the body is ever iterated
+        await controller.acquire(deadline=1.0)
+        try:
+            await AdmittedStreamingResponse(body(), controller)(scope, receive, gone)
+        except Exception:
+            pass
+        assert not started and controller.inflight == 0
+
+        # Normal completion
+        await controller.acquire(deadline=1.0)
+        await AdmittedStreamingResponse(body(), controller)(scope, receive, ok)
+        assert started and controller.inflight == 0
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_inflight_limit_and_queue_order()
+    test_reject_early_when_queue_full_or_wait_exceeds_deadline()
+    test_lower_priority_yields_to_queued_high_priority()
+    test_paused_time_left_out_of_service_time()
+    test_streaming_response_releases_slot_however_it_ends()
+    print("✅ Admission control tests passed")
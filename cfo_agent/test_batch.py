@@ -0,0 +1,80 @@
+"""Test batch answering: duplicate questions and shared plans run once"""
+import asyncio
+import json
+from batch import BatchRunner, plan_key
+
+
+class RecordingGraph:
+    """Stands in for CFOAgentGraph's nodes and counts the work done"""
+
+    def __init__(self):
+        self.decomposed = []
+        self.executed = []
+
+    async def decompose_node(self, state):
+        self.decomposed.append(state['question'])
+        await asyncio.sleep(0.01)
+        # "A and B revenue 2023" -> one task per company
+        companies = state['question'].split(' revenue ')[0].split(' and ')
+        state['tasks'] = [{'ticker': c, 'fy': 2023} for c in companies]
+        state['greeting'] = ''
+        return state
+
+    async def resolve_entities_node(self, state):
+        state['plans'] = [{'intent': 'annual_metric', 'template_name': 'annual_metric',
+                           'sql': 'SELECT ...', 'params': task} for task in state['tasks']]
+        return state
+
+    async def run_tasks_node(self, state):
+        plan = state['plans'][0]
+        self.executed.append(plan['params']['ticker'])
+        await asyncio.sleep(0.01)
+        state.update(results=[[{'ticker': plan['params']['ticker']}]], sql_executed=['SELECT ...'],
+                     params_used=[plan['params']])
+        return state
+
+    async def fetch_citations_node(self, state):
+        state['citations'] = [{} for _ in state['results']]
+        return state
+
+    async def format_response_node(self, state):
+        state['final_response'] = ", ".join(rows[0]['ticker'] for rows in state['results'])
+        return state
+
+    async def update_memory_node(self, state):
+        return state
+
+
+async def collect(runner, questions):
+    return [line async for line in runner.stream(questions)]
+
+
+def test_batch_dedupes_questions_and_plans():
+    graph = RecordingGraph()
+    questions = ["AAPL revenue 2023", "AAPL and MSFT revenue 2023", "aapl revenue 2023?", "MSFT and GOOG revenue 2023"]
+    lines = asyncio.run(collect(BatchRunner(graph, concurrency=2, sql_concurrency=2), questions))
+
+    answers = {line['index']: line for line in lines[:-1]}
+    assert sorted(answers) == [0, 1, 2, 3]
+    assert answers[1]['response'] == "AAPL, MSFT"
+    assert answers[2]['question'] == "aapl revenue 2023?" and answers[2]['response'] == "AAPL"
+    assert all(line['errors'] == [] for line in answers.values())
+
+    # 4 questions -> 3 decompositions; 6 plans -> 3 distinct executions
+    assert len(graph.decomposed) == 3
+    assert sorted(graph.executed) == ['AAPL', 'GOOG', 'MSFT']
+    assert lines[-1]['summary']['plans'] == 6 and lines[-1]['summary']['distinct_plans'] == 3
+    json.dumps(lines)  # NDJSON-serializable
+
+
+def test_plan_key_ignores_unrelated_fields():
+    a = {'template_name': 't', 'params': {'ticker': 'AAPL', 'fy': 2023}, 'surfaces': ['x']}
+    b = {'params': {'fy': 2023, 'ticker': 'AAPL'}, 'template_name': 't', 'surfaces': ['y']}
+    assert plan_key(a) == plan_key(b)
+    assert plan_key(a) != plan_key({**a, 'params': {'ticker': 'MSFT', 'fy': 2023}})
+
+
+if __name__ == "__main__":
+    test_batch_dedupes_questions_and_plans()
+    test_plan_key_ignores_unrelated_fields()
+    print("✅ Batch tests passed")
@@ -0,0 +1,50 @@
+"""Test single round-trip bundling of a request's queries"""
+import json
+from bundle import bundle_queries, decode_bundle
+
+
+def test_bundle_renames_params_per_query():
+    sql, params = bundle_queries({
+        'task_0': ("SELECT revenue::numeric FROM mv_q WHERE ticker = :ticker AND (:fy IS NULL OR fiscal_year = :fy);",
+                   {'ticker': 'AAPL', 'fy': 2024, 'limit': 10}),
+        'task_1': ("SELECT * FROM mv_q WHERE ticker = :ticker LIMIT :limit", {'ticker': 'MSFT', 'limit': 5}),
+        'cite_macro': ("SELECT source_code FROM vw_macro_citations WHERE indicator_code = 'CPIAUCSL' LIMIT 1", {})
+    })
+    assert params == {'b0000': 'AAPL', 'b0001': 2024, 'b0002': 'MSFT', 'b0003': 5}  # unused :limit not bound
+    assert "ticker = :b0000 AND (:b0001 IS NULL OR fiscal_year = :b0001)" in sql  # repeated param shares a name
+    assert "revenue::numeric" in sql  # casts untouched
+    assert "task_0 AS (" in sql and "task_1 AS (" in sql and "cite_macro AS (" in sql
+    assert ";" not in sql
+    assert sql.count("json_agg(") == 3 and "json_object_agg(name, rows) AS bundle" in sql
+    # Rows are numbered in the query's own order and aggregated in it
+    assert sql.count("row_number() OVER () AS rn") == 3
+    assert "(SELECT json_agg(row_json ORDER BY rn) FROM task_1)" in sql
+
+
+def test_bundle_rejects_unsafe_names():
+    try:
+        bundle_queries({'task 0; drop': ("SELECT 1", {})})
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+
+def test_decode_bundle_splits_result_sets():
+    document = json.dumps({
+        'task_0': [{'ticker': 'AAPL', 'revenue': 391035000000.0, 'period_end': '2024-09-28'}],
+        'task_1': None,  # json_agg over no rows is NULL
+        'cite_0_financial': [{'source_code': 'ALPHAVANTAGE_FIN'}]
+    })
+    decoded = decode_bundle(document)
+    assert decoded['task_0'][0]['revenue'] == 391035000000.0
+    assert decoded['task_1'] == []
+    assert decoded['cite_0_financial'][0]['source_code'] == 'ALPHAVANTAGE_FIN'
+    assert decode_bundle(None) == {}
+    assert decode_bundle({'task_0': []}) == {'task_0': []}
+
+
+if __name__ == "__main__":
+    test_bundle_renames_params_per_query()
+    test_bundle_rejects_unsafe_names()
+    test_decode_bundle_splits_result_sets()
+    print("✅ Bundle tests passed")
@@ -0,0 +1,76 @@
+"""Test the EXPLAIN cost gate for generative SQL"""
+import asyncio
+import json
+import os
+
+os.environ.setdefault('SUPABASE_DB_URL', 'postgresql://localhost/unused')  # global pool is created on import, never connected
+from cost_gate import CostGate, plan_estimate, sql_hash
+
+EXPLAIN_OUTPUT = json.dumps([{"Plan": {
+    "Node Type": "Limit", "Total Cost": 1234.5, "Plan Rows": 10,
+    "Plans": [{"Node Type": "Hash Join", "Total Cost": 1200.0, "Plan Rows": 250000,
+               "Plans": [{"Node Type": "Seq Scan", "Plan Rows": 5000}, {"Node Type": "Hash", "Plan Rows": 50}]}]
+}}])
+
+
+class FakeExplain:
+    """Returns canned (cost, rows) per SQL and counts EXPLAIN round trips"""
+
+    def __init__(self, estimates, delay=0.05):
+        self.estimates = estimates
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def __call__(self, sql, params, timeout):
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            estimate = self.estimates[sql]
+            if isinstance(estimate, Exception):
+                raise estimate
+            return estimate
+        finally:
+            self.active -= 1
+
+
+def test_plan_estimate_walks_every_node():
+    assert plan_estimate(EXPLAIN_OUTPUT) == (1234.5, 250000.0)
+    assert sql_hash("SELECT 1\n  LIMIT 1") == sql_hash("SELECT 1 LIMIT 1")
+
+
+def test_rank_rejects_and_orders_by_cost():
+    explain = FakeExplain({
+        'cheap': (120.0, 40), 'cheaper': (80.0, 10), 'join': (900000.0, 10), 'wide': (300.0, 5000000),
+        'broken': RuntimeError('column "x" does not exist')
+    })
+    gate = CostGate(explain, max_cost=50000, max_rows=1000000)
+    candidates = [(name, {}) for name in ('cheap', 'join', 'cheaper', 'wide', 'broken')]
+    passing, reasons = asyncio.run(gate.rank(candidates))
+    assert [sql for sql, _ in passing] == ['cheaper', 'cheap']
+    assert len(reasons) == 3 and any('cost' in r for r in reasons) and any('rows' in r for r in reasons)
+    assert explain.peak == 5  # all candidates explained at once
+
+
+def test_verdicts_cached_per_sql():
+    explain = FakeExplain({'q': (10.0, 1), 'slow': asyncio.TimeoutError(), 'flaky': ConnectionResetError('reset')}, delay=0)
+    gate = CostGate(explain, cache_size=1)
+    asyncio.run(gate.judge('q', {}))
+    assert asyncio.run(gate.judge('q', {'ticker': 'MSFT'}))['ok'] and explain.calls == 1
+    assert not asyncio.run(gate.judge('slow', {}))['ok']
+    asyncio.run(gate.judge('slow', {}))
+    assert explain.calls == 3  # timeouts are not cached
+    assert asyncio.run(gate.judge('flaky', {}))['reason'] == "EXPLAIN failed: reset"
+    explain.estimates['flaky'] = (20.0, 1)  # the database recovered
+    assert asyncio.run(gate.judge('flaky', {}))['ok'] and explain.calls == 5  # errors are not cached
+    assert gate.stats()['cached_verdicts'] == 1
+
+
+if __name__ == "__main__":
+    test_plan_estimate_walks_every_node()
+    test_rank_rejects_and_orders_by_cost()
+    test_verdicts_cached_per_sql()
+    print("✅ Cost gate tests passed")
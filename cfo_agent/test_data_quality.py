@@ -0,0 +1,70 @@
+"""Test the vectorized data-quality flags against a row-by-row reference"""
+import math
+import numpy as np
+from analytics.data_quality import DataQualityStage, group_zscores, compute_health_flags
+
+
+def reference_zscores(groups, values):
+    """Row-by-row AVG/STDDEV_POP per group (mirrors the old SQL window)"""
+    out = []
+    for g, v in zip(groups, values):
+        peers = [x for gg, x in zip(groups, values) if gg == g and not math.isnan(x)]
+        mu = sum(peers) / len(peers)
+        sd = math.sqrt(sum((x - mu) ** 2 for x in peers) / len(peers))
+        out.append(float('nan') if sd == 0 or math.isnan(v) else (v - mu) / sd)
+    return out
+
+
+def test_group_zscores_match_reference():
+    groups = np.array([1, 1, 1, 1, 2, 2, 2, 3])
+    values = np.array([10.0, 12.0, 11.0, 40.0, 5.0, np.nan, 7.0, 3.0])
+
+    z = group_zscores(groups, values)
+    expected = reference_zscores(list(groups), list(values))
+
+    for actual, exp in zip(z, expected):
+        if math.isnan(exp):
+            assert math.isnan(actual)
+        else:
+            assert abs(actual - exp) < 1e-12
+
+
+def test_outlier_threshold_is_configurable():
+    records = []
+    for q in range(12):
+        revenue = 100.0 if q != 11 else 1000.0
+        records.append({
+            'company_id': 1, 'fiscal_year': 2020 + q // 4, 'fiscal_quarter': q % 4 + 1,
+            'revenue': revenue, 'net_margin': 0.2, 'net_income': 20.0,
+            'total_assets': 500.0, 'total_liabilities': 300.0, 'equity': 200.0
+        })
+
+    strict = DataQualityStage(sigma_threshold=3.0).compute(records)
+    loose = DataQualityStage(sigma_threshold=10.0).compute(records)
+
+    # outlier_revenue_3sigma is column index 7
+    assert strict[-1][7] == 1
+    assert loose[-1][7] == 0
+    # Constant net margin has no spread -> no z-score, no flag
+    assert strict[-1][6] is None and strict[-1][8] == 0
+
+
+def test_health_flags_tolerance():
+    assets = np.array([1e9, 1e9, np.nan])
+    liabilities = np.array([6e8, 6e8, 1.0])
+    equity = np.array([4e8 + 4e6, 3e8, -1.0])
+    net_income = np.array([1.0, -1.0, np.nan])
+
+    flags = compute_health_flags(assets, liabilities, equity, net_income, tolerance_pct=0.005)
+
+    assert list(flags['balance_status']) == ['within_tolerance', 'out_of_balance', 'within_tolerance']
+    assert list(flags['flag_negative_equity']) == [0, 0, 1]
+    assert list(flags['flag_net_loss']) == [0, 1, 0]
+    assert math.isnan(flags['balance_gap_pct'][2])
+
+
+if __name__ == "__main__":
+    test_group_zscores_match_reference()
+    test_outlier_threshold_is_configurable()
+    test_health_flags_tolerance()
+    print("✅ Data-quality flag tests passed")
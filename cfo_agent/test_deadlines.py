@@ -0,0 +1,45 @@
+"""Test deadline budgets and degradation"""
+import asyncio
+import time
+from options import make_options, stage_timeout, time_remaining
+from decomposer import QueryDecomposer
+
+
+class SlowLLM:
+    async def ainvoke(self, messages):
+        await asyncio.sleep(5)
+
+
+def test_stage_timeout_follows_remaining_budget():
+    assert stage_timeout(make_options(), cap=12.0) == 12.0  # no deadline: stage cap
+    options = make_options(timeout_seconds=4.0)
+    assert 1.9 < stage_timeout(options, cap=12.0, share=0.5) <= 2.0
+    assert stage_timeout(options, cap=1.0) == 1.0
+    options['deadline'] = time.monotonic() + 0.5
+    assert stage_timeout(options, cap=2.0, floor=1.0) == 0.0  # skip the stage
+    options['deadline'] = time.monotonic() - 1
+    assert stage_timeout(options, cap=2.0) == 0.0 and time_remaining(options) < 0
+
+
+def test_decompose_falls_back_to_regex_intent():
+    decomposer = object.__new__(QueryDecomposer)
+    decomposer.llm = SlowLLM()
+    decomposer.router_prompt = ""
+    decomposer.examples = []
+
+    started = time.perf_counter()
+    result = asyncio.run(decomposer.decompose("What was Apple's revenue in Q2 2024?", timeout=0.05))
+    assert time.perf_counter() - started < 1
+    assert result['timed_out']
+    task = result['tasks'][0]
+    assert task['entities'] == ['AAPL'] and task['period'] == {'fy': 2024, 'fq': 2}
+
+    # No budget at all: the LLM isn't called
+    result = asyncio.run(decomposer.decompose("Microsoft net margin 2023", timeout=0))
+    assert result['timed_out'] and result['tasks'][0]['entities'] == ['MSFT']
+
+
+if __name__ == "__main__":
+    test_stage_timeout_follows_remaining_budget()
+    test_decompose_falls_back_to_regex_intent()
+    print("✅ Deadline tests passed")
@@ -0,0 +1,143 @@
+"""Test streaming export in keyset pages"""
+import asyncio
+import io
+import json
+import os
+from contextlib import asynccontextmanager, contextmanager
+
+os.environ.setdefault('SUPABASE_DB_URL', 'postgresql://localhost/unused')  # global pool is created on import, never connected
+import export
+from export import decode_token, encode_token, make_encoder, page_query, plan_export, stream_export
+
+COLUMNS = ('company_id', 'fiscal_year', 'revenue')
+
+
+class FakeRecord(tuple):
+    """Stands in for asyncpg.Record: indexable by position or name"""
+
+    def __getitem__(self, key):
+        return super().__getitem__(COLUMNS.index(key) if isinstance(key, str) else key)
+
+    def keys(self):
+        return COLUMNS
+
+
+class FakeAttribute:
+    def __init__(self, name, type_name):
+        self.name = name
+        self.type = type('Type', (), {'name': type_name})
+
+
+class FakePool:
+    """Serves keyset pages of a small table and records every page's params"""
+
+    def __init__(self, rows, fail_after=None):
+        self.rows = [FakeRecord(row) for row in rows]
+        self.pages = []
+        self.fail_after = fail_after
+
+    @asynccontextmanager
+    async def snapshot(self):
+        yield 'conn'
+
+    async def describe(self, conn, sql, params, timeout):
+        return [FakeAttribute('company_id', 'int4'), FakeAttribute('fiscal_year', 'int4'),
+                FakeAttribute('revenue', 'numeric')]
+
+    async def cursor(self, conn, sql, params, prefetch, timeout):
+        self.pages.append(params)
+        if self.fail_after is not None and len(self.pages) > self.fail_after:
+            raise RuntimeError("connection lost")
+        after = (params['after_company_id'], params['after_fiscal_year']) if 'after_company_id' in params else None
+        for row in [row for row in self.rows if after is None or row[:2] > after][:params['limit']]:
+            yield row
+
+
+ROWS = [(1, 2022, 10.5), (1, 2023, 11.0), (2, 2022, None), (2, 2023, 7.25), (3, 2023, 1.0)]
+
+
+@contextmanager
+def small_pages(page_size=2, prefetch=1):
+    saved = export.EXPORT_PAGE_SIZE, export.EXPORT_PREFETCH
+    export.EXPORT_PAGE_SIZE, export.EXPORT_PREFETCH = page_size, prefetch
+    try:
+        yield
+    finally:
+        export.EXPORT_PAGE_SIZE, export.EXPORT_PREFETCH = saved
+
+
+async def collect(pool, fmt, **options):
+    spec = plan_export('mv_financials_annual', ['revenue'])
+    return b''.join([chunk async for chunk in stream_export(pool, spec, make_encoder(fmt), **options)])
+
+
+def test_plan_export_leads_with_key_columns():
+    spec = plan_export('mv_financials_annual', ['Revenue', 'fiscal_year'], ticker='aapl')
+    assert spec['columns'] == ['company_id', 'fiscal_year', 'revenue']
+    assert spec['filters']['ticker'] == 'AAPL'
+    for bad in [dict(surface='fact_stock_prices', columns=['close']),
+                dict(surface='mv_financials_annual', columns=['revenue; drop table x']),
+                dict(surface='mv_macro_annual', columns=['gdp_annual'], ticker='AAPL'),
+                dict(surface='mv_financials_annual')]:  # schema cache not loaded
+        try:
+            plan_export(**bad)
+            assert False, f"expected ValueError for {bad}"
+        except ValueError:
+            pass
+
+
+def test_pages_are_validated_keyset_queries():
+    spec = plan_export('vw_company_complete_quarter', ['revenue'], ticker='AAPL', fy_from=2020)
+    sql, params = page_query(spec)
+    assert "ORDER BY company_id, fiscal_year, fiscal_quarter LIMIT :limit" in sql and params['limit'] <= 200
+    sql, params = page_query(spec, decode_token('3.2023.4', spec))
+    assert "(company_id, fiscal_year, fiscal_quarter) > (:after_company_id, :after_fiscal_year, :after_fiscal_quarter)" in sql
+    assert (params['after_company_id'], params['after_fiscal_quarter'], params['fy_from']) == (3, 4, 2020)
+    assert encode_token((3, 2023, 4)) == '3.2023.4'
+    try:
+        decode_token('3.2023', spec)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+
+def test_ndjson_streams_every_page():
+    pool = FakePool(ROWS)
+    with small_pages():
+        lines = [json.loads(line) for line in asyncio.run(collect(pool, 'ndjson')).decode().splitlines()]
+    assert [line.get('fiscal_year') for line in lines[:-1]] == [2022, 2023, 2022, 2023, 2023]
+    assert lines[-1] == {'next': None, 'rows': 5}
+    assert [page.get('after_company_id') for page in pool.pages] == [None, 1, 2]
+    assert all(page['limit'] == 2 for page in pool.pages)
+
+
+def test_max_rows_and_resume():
+    with small_pages():
+        first = asyncio.run(collect(FakePool(ROWS), 'ndjson', max_rows=3)).decode().splitlines()
+        rest = asyncio.run(collect(FakePool(ROWS), 'csv', after=(2, 2022))).decode().splitlines()
+    assert len(first) == 4 and json.loads(first[-1])['next'] == '2.2022'
+    assert rest == ['company_id,fiscal_year,revenue', '2,2023,7.25', '3,2023,1.0']
+
+
+def test_broken_stream_reports_resume_point():
+    with small_pages():
+        lines = asyncio.run(collect(FakePool(ROWS, fail_after=1), 'ndjson')).decode().splitlines()
+    assert json.loads(lines[-1]) == {'next': '1.2023', 'rows': 2, 'error': 'connection lost'}
+
+
+def test_arrow_stream_has_typed_batches():
+    import pyarrow as pa
+    with small_pages():
+        table = pa.ipc.open_stream(io.BytesIO(asyncio.run(collect(FakePool(ROWS), 'arrow')))).read_all()
+    assert table.num_rows == 5 and table.schema.field('revenue').type == pa.float64()
+    assert table.column('revenue').to_pylist()[2] is None
+
+
+if __name__ == "__main__":
+    test_plan_export_leads_with_key_columns()
+    test_pages_are_validated_keyset_queries()
+    test_ndjson_streams_every_page()
+    test_max_rows_and_resume()
+    test_broken_stream_reports_resume_point()
+    test_arrow_stream_has_typed_batches()
+    print("✅ Export tests passed")
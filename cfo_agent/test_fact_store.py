@@ -0,0 +1,126 @@
+"""Test the in-process fact store against template semantics (no database needed)"""
+import json
+import time
+from analytics.fact_store import (
+    FactStore, ColumnarTable, TABLE_SOURCES, INTENT_TABLES, REQUIRED_MATCH, template_output_columns
+)
+from analytics.panel import records_to_columns
+
+
+def load_templates():
+    with open('catalog/templates.json', 'r') as f:
+        return json.load(f)['templates']
+
+
+def build_store():
+    """Small synthetic quarter table: two companies x 8 quarters"""
+    quarter_cols = template_output_columns(TABLE_SOURCES['quarter'])
+    records = []
+    for ticker, name in [('AAPL', 'Apple Inc.'), ('MSFT', 'Microsoft Corp.')]:
+        for fy in (2023, 2024):
+            for fq in (1, 2, 3, 4):
+                row = {c: float(fy * 10 + fq) for c in quarter_cols}
+                row.update({'ticker': ticker, 'name': name, 'fiscal_year': fy, 'fiscal_quarter': fq})
+                row['roe'] = None
+                records.append(row)
+
+    store = FactStore()
+    store.load_tables({'quarter': ColumnarTable('quarter', records_to_columns(records))}, version='test')
+    return store
+
+
+def test_load_sql_covers_template_columns():
+    templates = load_templates()
+    for template in templates.values():
+        if template['intent'] not in INTENT_TABLES:
+            continue
+        table_name, _ = INTENT_TABLES[template['intent']]
+        stored = set(template_output_columns(TABLE_SOURCES[table_name]))
+        missing = set(template_output_columns(template['sql'])) - stored
+        assert not missing, f"{template['intent']} missing {missing}"
+
+
+def test_snapshot_latest_and_exact_period():
+    store = build_store()
+    columns = template_output_columns(load_templates()['quarter_snapshot']['sql'])
+
+    latest = store.answer({'intent': 'quarter_snapshot', 'params': {'ticker': 'AAPL', 'fy': None, 'fq': None, 'limit': 1}})
+    assert list(latest[0].keys()) == columns
+    assert (latest[0]['fiscal_year'], latest[0]['fiscal_quarter']) == (2024, 4)
+    assert latest[0]['roe'] is None
+
+    exact = store.answer({'intent': 'quarter_snapshot', 'params': {'ticker': 'AAPL', 'fy': 2023, 'fq': 2, 'limit': 1}})
+    assert (exact[0]['fiscal_year'], exact[0]['fiscal_quarter']) == (2023, 2)
+
+    year = store.answer({'intent': 'quarter_snapshot', 'params': {'ticker': 'MSFT', 'fy': 2023, 'fq': None, 'limit': 10}})
+    assert [r['fiscal_quarter'] for r in year] == [4, 3, 2, 1]
+
+
+def test_multi_company_ordering():
+    store = build_store()
+    rows = store.answer({'intent': 'multi_company_quarter', 'params': {'t1': 'MSFT', 't2': 'AAPL', 'fy': 2024, 'fq': None, 'limit': 10}})
+    assert [r['ticker'] for r in rows] == ['AAPL'] * 4 + ['MSFT'] * 4
+
+
+def test_period_range():
+    store = build_store()
+    rows = store.answer({'intent': 'multi_company_quarter', 'params': {
+        't1': 'AAPL', 't2': 'MSFT', 'fy': None, 'fq': None,
+        'fy_from': 2023, 'fq_from': 3, 'fy_to': 2024, 'fq_to': 2, 'limit': 8}})
+    assert [(r['ticker'], r['fiscal_year'], r['fiscal_quarter']) for r in rows[:4]] == [
+        ('AAPL', 2024, 2), ('AAPL', 2024, 1), ('AAPL', 2023, 4), ('AAPL', 2023, 3)]
+    assert len(rows) == 8
+    since = store.answer({'intent': 'quarter_snapshot', 'params': {'ticker': 'AAPL', 'fy_from': 2024, 'limit': 200}})
+    assert [r['fiscal_quarter'] for r in since] == [4, 3, 2, 1]
+
+
+def test_falls_back_when_not_servable():
+    store = build_store()
+    # annual table not loaded -> Postgres fallback
+    assert store.answer({'intent': 'annual_metrics', 'params': {'ticker': 'AAPL', 'limit': 1}}) is None
+    assert store.answer({'intent': 'health_flags', 'params': {'ticker': 'AAPL', 'limit': 1}}) is None
+    assert store.answer({'intent': 'quarter_snapshot', 'params': {'ticker': 'ZZZZ', 'limit': 1}}) == []
+
+
+def test_missing_ratio_row_follows_template_join():
+    annual_cols = template_output_columns(TABLE_SOURCES['annual'])
+    assert 'has_ratios' in annual_cols and REQUIRED_MATCH == {'annual_metrics': 'has_ratios'}
+    records = []
+    for fy in (2023, 2024):
+        row = {c: float(fy) for c in annual_cols}
+        row.update({'ticker': 'AAPL', 'name': 'Apple Inc.', 'fiscal_year': fy, 'has_ratios': True})
+        records.append(row)
+    # FY2024 has financials but no mv_ratios_annual row (LEFT JOIN -> NULL ratios)
+    for c in annual_cols:
+        if c.endswith('_annual') or c in ('roe_annual_avg_equity', 'roe_annual'):
+            records[1][c] = None
+    records[1]['has_ratios'] = False
+
+    store = FactStore()
+    store.load_tables({'annual': ColumnarTable('annual', records_to_columns(records))}, version='test')
+
+    # annual_metrics inner-joins the ratios: FY2024 is absent, as in Postgres
+    rows = store.answer({'intent': 'annual_metrics', 'params': {'ticker': 'AAPL', 'limit': 10}})
+    assert [r['fiscal_year'] for r in rows] == [2023]
+    # multi_company_annual left-joins them: FY2024 comes back with NULL ratios
+    rows = store.answer({'intent': 'multi_company_annual', 'params': {'t1': 'AAPL', 't2': None, 'limit': 10}})
+    assert [r['fiscal_year'] for r in rows] == [2024, 2023]
+    assert rows[0]['revenue_b'] == 2024.0 and rows[0]['net_margin_annual'] is None
+
+
+if __name__ == "__main__":
+    test_load_sql_covers_template_columns()
+    test_snapshot_latest_and_exact_period()
+    test_multi_company_ordering()
+    test_period_range()
+    test_falls_back_when_not_servable()
+    test_missing_ratio_row_follows_template_join()
+
+    store = build_store()
+    plan = {'intent': 'quarter_snapshot', 'params': {'ticker': 'AAPL', 'fy': 2023, 'fq': 2, 'limit': 1}}
+    n = 10000
+    start = time.perf_counter()
+    for _ in range(n):
+        store.answer(plan)
+    print(f"Single-fact answer: {(time.perf_counter() - start) / n * 1e6:.1f} µs")
+    print("✅ Fact store tests passed")
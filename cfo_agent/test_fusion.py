@@ -0,0 +1,62 @@
+"""Test fusing tasks that share a template into one query"""
+from db.results import ResultSet
+from fusion import FUSION_COLUMN, fuse_queries, fusion_groups, split_fused
+
+SNAPSHOT = ("SELECT c.ticker, f.fiscal_year, f.revenue/1e9 as revenue_b FROM fact_financials f JOIN dim_company c USING (company_id) "
+            "WHERE c.ticker = :ticker AND (CAST(:fy AS INTEGER) IS NULL OR f.fiscal_year = :fy) "
+            "ORDER BY f.fiscal_year DESC LIMIT :limit")
+
+
+def test_groups_need_same_sql_and_limit():
+    groups = fusion_groups({
+        0: (SNAPSHOT, {'ticker': 'AAPL', 'fy': 2022, 'limit': 10}),
+        1: ("SELECT 1", {}),
+        2: (SNAPSHOT, {'ticker': 'AAPL', 'fy': 2023, 'limit': 10}),
+        3: (SNAPSHOT, {'ticker': 'AAPL', 'fy': 2023, 'limit': 1}),  # LIMIT can't vary per task
+        4: (SNAPSHOT, {'ticker': 'MSFT', 'fy': 2023, 'limit': 10, 'unused': [1]})
+    })
+    assert groups == [[0, 2, 4]]
+    assert fusion_groups({0: (SNAPSHOT, {'ticker': 'AAPL', 'fy': 2023, 'limit': 10}),
+                          1: (SNAPSHOT, {'ticker': 'AAPL', 'fy': 2.5, 'limit': 10})}) == []
+
+
+def test_fuse_queries_unnests_differing_params():
+    sql, params, positions = fuse_queries([
+        (SNAPSHOT, {'ticker': 'AAPL', 'fy': 2022, 'limit': 10}),
+        (SNAPSHOT, {'ticker': 'AAPL', 'fy': None, 'limit': 10}),
+        (SNAPSHOT, {'ticker': 'AAPL', 'fy': 2022, 'limit': 10})  # duplicate shares a position
+    ])
+    assert params == {'ticker': 'AAPL', 'limit': 10, 'fuse_fy': [2022, None]}
+    assert positions == [1, 2, 1]
+    assert "unnest(CAST(:fuse_fy AS INTEGER[])) WITH ORDINALITY AS fusion_keys(fy, task)" in sql
+    assert "CAST(fusion_keys.fy AS INTEGER) IS NULL OR f.fiscal_year = fusion_keys.fy" in sql
+    assert "c.ticker = :ticker" in sql and "LIMIT :limit" in sql
+    assert sql.startswith(f"SELECT fusion_keys.task AS {FUSION_COLUMN}, fused.*")
+
+
+def test_identical_tasks_run_once():
+    sql, params, positions = fuse_queries([(SNAPSHOT, {'ticker': 'AAPL', 'fy': 2023, 'limit': 10})] * 2)
+    assert positions == [1, 1] and params['fy'] == 2023 and "unnest" not in sql
+
+
+def test_split_fused_returns_rows_per_task():
+    result = ResultSet.from_dicts([
+        {FUSION_COLUMN: 1, 'ticker': 'AAPL', 'fiscal_year': 2023, 'revenue_b': 383.3},
+        {FUSION_COLUMN: 1, 'ticker': 'AAPL', 'fiscal_year': 2022, 'revenue_b': 394.3},
+        {FUSION_COLUMN: 3, 'ticker': 'MSFT', 'fiscal_year': 2023, 'revenue_b': 211.9}
+    ])
+    first, second, third, again = split_fused(result, [1, 2, 3, 1])
+    assert first.columns == ('ticker', 'fiscal_year', 'revenue_b')
+    assert [row['fiscal_year'] for row in first] == [2023, 2022]  # order kept
+    assert len(second) == 0 and second.columns == first.columns
+    assert third[0] == {'ticker': 'MSFT', 'fiscal_year': 2023, 'revenue_b': 211.9}
+    assert again.to_dicts() == first.to_dicts()
+    assert [len(part) for part in split_fused(ResultSet.from_records([]), [1, 2])] == [0, 0]
+
+
+if __name__ == "__main__":
+    test_groups_need_same_sql_and_limit()
+    test_fuse_queries_unnests_differing_params()
+    test_identical_tasks_run_once()
+    test_split_fused_returns_rows_per_task()
+    print("✅ Fusion tests passed")
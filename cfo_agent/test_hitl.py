@@ -0,0 +1,60 @@
+"""Test request-scoped HITL approvals"""
+import asyncio
+from hitl import HITLGate
+
+
+SQL = "SELECT ticker FROM fact_financials WHERE fiscal_year = :fy"
+
+
+async def _approve_when_pending(gate: HITLGate, approved: bool):
+    while not gate.pending:
+        await asyncio.sleep(0.001)
+    approval_id = gate.list_pending()[0]['approval_id']
+    assert gate.resolve(approval_id, approved)
+    assert not gate.resolve(approval_id, approved)  # already decided
+
+
+def test_resolve_approves_and_rejects():
+    async def run():
+        gate = HITLGate(timeout=5)
+        for decision in (True, False):
+            result, _ = await asyncio.gather(
+                gate.approve_sql(SQL, {'fy': 2024}, is_generative=True, enabled=True),
+                _approve_when_pending(gate, decision)
+            )
+            assert result[0] is decision
+        assert gate.pending == {}
+    asyncio.run(run())
+
+
+def test_timeout_rejects():
+    async def run():
+        gate = HITLGate(timeout=5)
+        approved, reason = await gate.approve_sql(SQL, {}, is_generative=True, enabled=True, timeout=0.01)
+        assert not approved and "timed out" in reason
+        assert gate.pending == {}
+        assert not gate.resolve("unknown", True)
+    asyncio.run(run())
+
+
+def test_requests_do_not_share_settings():
+    async def run():
+        gate = HITLGate(enabled=False, timeout=5)
+        waiting = asyncio.ensure_future(gate.approve_sql(SQL, {}, is_generative=True, enabled=True))
+        await asyncio.sleep(0.01)
+
+        # Another request without HITL runs straight through while the first is parked
+        assert await gate.approve_sql(SQL, {}, is_generative=True, enabled=False) == (True, "HITL disabled")
+        assert await gate.approve_sql(SQL, {}, is_generative=False, enabled=True) == (True, "Approved")
+        assert not waiting.done() and len(gate.pending) == 1
+
+        gate.resolve(gate.list_pending()[0]['approval_id'], True)
+        assert (await waiting)[0] is True
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_resolve_approves_and_rejects()
+    test_timeout_rejects()
+    test_requests_do_not_share_settings()
+    print("✅ HITL tests passed")
@@ -0,0 +1,122 @@
+"""Test reuse of successful generated SQL by task shape"""
+import asyncio
+import os
+
+os.environ.setdefault('SUPABASE_DB_URL', 'postgresql://localhost/unused')  # global pool is created on import, never connected
+os.environ.setdefault('OPENAI_API_KEY', 'unused')  # LLM client is created, never called
+import sql_builder
+from cost_gate import CostGate
+from learned_templates import LearnedTemplateStore, is_parameterized, learned_key, learning_key, value_key
+
+SQL = "SELECT c.ticker, f.revenue FROM fact_financials f JOIN dim_company c ON c.company_id = f.company_id WHERE c.ticker = :ticker LIMIT :limit"
+
+INLINED = "SELECT c.ticker, f.revenue FROM fact_financials f JOIN dim_company c ON c.company_id = f.company_id WHERE c.ticker = 'AAPL' LIMIT :limit"
+
+
+def plan_for(ticker):
+    return {'intent': 'custom', 'surfaces': ['fact_financials', 'dim_company'], 'metrics': ['revenue'],
+            'params': {'ticker': ticker, 'limit': 10}}
+
+
+class FakeGenerator:
+    """Stands in for GenerativeSQLBuilder and counts LLM calls"""
+
+    def __init__(self, sql=SQL):
+        self.sql = sql
+        self.calls = 0
+
+    async def generate_sql(self, context):
+        self.calls += 1
+        return [(self.sql, dict(context['params']))]
+
+
+async def cheap(sql, params, timeout):
+    return 10.0, 1.0
+
+
+def test_key_ignores_param_values():
+    assert learned_key(plan_for('AAPL')) == learned_key(plan_for('MSFT'))
+    assert learned_key(plan_for('AAPL')) != learned_key({**plan_for('AAPL'), 'metrics': ['eps']})
+
+
+def test_inlined_values_key_by_value():
+    plan = plan_for('AAPL')
+    assert is_parameterized(SQL, plan) and learning_key(SQL, plan) == learned_key(plan)
+    assert not is_parameterized(INLINED, plan) and learning_key(INLINED, plan) == value_key(plan)
+    assert not is_parameterized(SQL.replace(':limit', '10'), plan)  # literal equal to a param value
+    assert not is_parameterized(SQL.replace(':ticker', "'MSFT'"), plan)  # bound param unused
+    assert value_key(plan) != value_key(plan_for('MSFT'))
+
+
+def test_promotion_invalidation_and_eviction():
+    store = LearnedTemplateStore(max_entries=2, promote_after=2)
+    store.record_success('a', 'SELECT 1')
+    key, entry = store.lookup('missing', 'a')
+    assert key == 'a' and entry['hits'] == 1 and not store.entries['a']['promoted']
+    store.record_success('a', 'SELECT 1')
+    assert store.entries['a']['promoted']
+    store.record_success('b', 'SELECT 2')
+    store.record_success('c', 'SELECT 3')  # evicts b (unpromoted), not the older promoted a
+    assert list(store.entries) == ['a', 'c'] and store.evicted == 1
+    store.invalidate('c', 'SELECT other')  # a different query failed: keep
+    store.invalidate('c', 'SELECT 3')
+    assert store.lookup('c') is None and store.stats()['invalidated'] == 1
+
+
+def test_builder_skips_llm_for_learned_shape():
+    builder = sql_builder.SQLBuilder()
+    builder.generative_builder = FakeGenerator()
+    saved = sql_builder.cost_gate, sql_builder.learned_templates
+    sql_builder.cost_gate = CostGate(cheap)
+    sql_builder.learned_templates = store = LearnedTemplateStore(promote_after=2)
+    try:
+        first = plan_for('AAPL')
+        sql, params, is_generative = asyncio.run(builder.build_sql(first, use_generative=True))
+        assert is_generative and builder.generative_builder.calls == 1
+        assert first['learned'] == (learned_key(first), SQL, False)
+        store.record_success(*first['learned'])  # graph reports the successful run
+
+        second = plan_for('MSFT')
+        sql, params, is_generative = asyncio.run(builder.build_sql(second, use_generative=True))
+        assert sql == SQL and params['ticker'] == 'MSFT' and is_generative
+        assert builder.generative_builder.calls == 1  # no LLM call
+        store.record_success(*second['learned'])
+
+        third = plan_for('GOOG')
+        _, _, is_generative = asyncio.run(builder.build_sql(third, use_generative=True))
+        assert is_generative  # promoted, but no run was reviewed: still goes through HITL
+        store.record_success(third['learned'][0], SQL, True)
+
+        _, _, is_generative = asyncio.run(builder.build_sql(plan_for('NVDA'), use_generative=True))
+        assert not is_generative  # promoted and reviewed: runs as a template
+    finally:
+        sql_builder.cost_gate, sql_builder.learned_templates = saved
+
+
+
+def test_inlined_sql_not_replayed_for_other_values():
+    builder = sql_builder.SQLBuilder()
+    builder.generative_builder = FakeGenerator(INLINED)
+    saved = sql_builder.cost_gate, sql_builder.learned_templates
+    sql_builder.cost_gate = CostGate(cheap)
+    sql_builder.learned_templates = store = LearnedTemplateStore(promote_after=2)
+    try:
+        first = plan_for('AAPL')
+        asyncio.run(builder.build_sql(first, use_generative=True))
+        store.record_success(*first['learned'])
+
+        asyncio.run(builder.build_sql(plan_for('MSFT'), use_generative=True))
+        assert builder.generative_builder.calls == 2  # other company: regenerated
+        asyncio.run(builder.build_sql(plan_for('AAPL'), use_generative=True))
+        assert builder.generative_builder.calls == 2  # same values: reused
+    finally:
+        sql_builder.cost_gate, sql_builder.learned_templates = saved
+
+
+if __name__ == "__main__":
+    test_key_ignores_param_values()
+    test_inlined_values_key_by_value()
+    test_inlined_sql_not_replayed_for_other_values()
+    test_promotion_invalidation_and_eviction()
+    test_builder_skips_llm_for_learned_shape()
+    print("✅ Learned template tests passed")
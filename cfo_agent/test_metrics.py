@@ -0,0 +1,63 @@
+"""Test in-process metrics and their Prometheus text rendering"""
+from metrics import Registry, observe_llm, llm_latency, llm_tokens
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("req_seconds", "Latency", ("intent",), buckets=(0.1, 0.5, 1.0))
+    for value in (0.05, 0.1, 0.3, 2.0):
+        latency.observe(value, intent="annual_metrics")
+
+    text = registry.render()
+    assert '# TYPE req_seconds histogram' in text
+    assert 'req_seconds_bucket{intent="annual_metrics",le="0.1"} 2' in text  # le is inclusive
+    assert 'req_seconds_bucket{intent="annual_metrics",le="0.5"} 3' in text
+    assert 'req_seconds_bucket{intent="annual_metrics",le="1"} 3' in text
+    assert 'req_seconds_bucket{intent="annual_metrics",le="+Inf"} 4' in text
+    assert 'req_seconds_count{intent="annual_metrics"} 4' in text
+    assert 'req_seconds_sum{intent="annual_metrics"} 2.45' in text
+
+
+def test_counter_gauge_and_label_escaping():
+    registry = Registry()
+    hits = registry.counter("cache_total", "Lookups", ("cache", "result"))
+    hits.inc(cache="fact_store", result="hit")
+    hits.inc(3, cache="fact_store", result="hit")
+    pool = registry.gauge("pool_connections", "Connections", ("state",))
+    pool.set_function(lambda: {('in_use',): 3, ('idle',): 7})
+    odd = registry.counter("odd_total", "Odd labels", ("template",))
+    odd.inc(template='say "hi"\n')
+
+    text = registry.render()
+    assert 'cache_total{cache="fact_store",result="hit"} 4' in text
+    assert 'pool_connections{state="in_use"} 3' in text and 'pool_connections{state="idle"} 7' in text
+    assert 'odd_total{template="say \\"hi\\"\\n"} 1' in text
+    try:
+        registry.counter("cache_total", "again")
+        raise AssertionError("expected duplicate registration error")
+    except ValueError:
+        pass
+
+
+def test_observe_llm_reads_token_usage():
+    class Response:
+        usage_metadata = {'input_tokens': 1800, 'output_tokens': 120}
+
+    class LegacyResponse:
+        usage_metadata = None
+        response_metadata = {'token_usage': {'prompt_tokens': 900, 'completion_tokens': 60}}
+
+    before = llm_tokens.count(stage="test", kind="prompt")
+    observe_llm("test", 0.8, Response())
+    observe_llm("test", 0.4, LegacyResponse())
+    observe_llm("test", 5.0, outcome="timeout")
+    assert llm_tokens.count(stage="test", kind="prompt") == before + 2
+    assert llm_latency.count(stage="test", outcome="ok") == 2
+    assert llm_latency.count(stage="test", outcome="timeout") == 1
+
+
+if __name__ == "__main__":
+    test_histogram_buckets_are_cumulative()
+    test_counter_gauge_and_label_escaping()
+    test_observe_llm_reads_token_usage()
+    print("✅ Metrics tests passed")
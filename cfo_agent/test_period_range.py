@@ -0,0 +1,84 @@
+"""Test parsing of period ranges from questions"""
+import asyncio
+import os
+
+os.environ.setdefault('SUPABASE_DB_URL', 'postgresql://localhost/unused')  # global pool is created on import, never connected
+from decomposer import QueryDecomposer, extract_period_range
+from planner import TaskPlanner
+
+QUARTERLY = ['ticker', 'fy', 'fq', 'fy_from', 'fy_to', 'fq_from', 'fq_to', 'limit']
+ANNUAL = ['ticker', 'fy', 'fy_from', 'fy_to', 'limit']
+
+
+def test_year_ranges():
+    assert extract_period_range("APPLE REVENUE FROM 2019 TO 2024")['fy_from'] == 2019
+    period = extract_period_range("REVENUE BETWEEN FY2024 AND FY2020")
+    assert (period['fy'], period['fy_from'], period['fy_to']) == (None, 2020, 2024)
+    assert extract_period_range("MSFT NET INCOME 2019-2021")['fy_to'] == 2021
+    assert extract_period_range("MSFT NET INCOME SINCE 2021")['fy_to'] is None
+    assert extract_period_range("MSFT NET INCOME FROM FY2021 ONWARD")['fy_from'] == 2021
+    assert extract_period_range("REVENUE FROM 2023") is None
+    assert extract_period_range("AAPL'S MARGIN FROM FY2023") is None
+    assert extract_period_range("APPLE REVENUE 2023") is None
+    assert extract_period_range("APPLE AND MICROSOFT REVENUE 2023 AND 2024") is None
+
+
+def test_quarter_ranges():
+    period = extract_period_range("APPLE Q3 2022 TO Q2 2024 REVENUE")
+    assert (period['fy_from'], period['fq_from'], period['fy_to'], period['fq_to']) == (2022, 3, 2024, 2)
+
+
+def test_last_n_periods():
+    period = extract_period_range("APPLE REVENUE OVER THE LAST 8 QUARTERS")
+    assert period['last_n'] == 8 and period['unit'] == 'quarter' and period['fy_from'] is None
+    assert extract_period_range("APPLE MARGINS PAST FIVE YEARS")['unit'] == 'year'
+
+
+def test_last_n_limit_follows_template_granularity():
+    def limit(period, template_params):
+        params = {'ticker': 'AAPL'}
+        asyncio.run(TaskPlanner()._bind_period_range(params, period, template_params))
+        return params['limit']
+
+    assert limit(extract_period_range("APPLE REVENUE LAST 3 YEARS"), QUARTERLY) == 12
+    assert limit(extract_period_range("APPLE REVENUE LAST 3 YEARS"), ANNUAL) == 3
+    assert limit(extract_period_range("APPLE REVENUE LAST 8 QUARTERS"), QUARTERLY) == 8
+    assert limit(extract_period_range("APPLE REVENUE LAST 6 QUARTERS"), ANNUAL) == 2
+    assert limit({'last_n': 5}, QUARTERLY) == 5  # no unit (LLM period): template granularity
+
+
+def test_growth_tasks_bind_range_at_engine_granularity():
+    def bind(question, growth):
+        params = {'ticker': 'AAPL', 'fy': None, 'fq': None, 'limit': 10}
+        TaskPlanner()._bind_growth_range(params, extract_period_range(question) or {'fy': 2023}, growth)
+        return params
+
+    params = bind("APPLE REVENUE GROWTH Q3 2022 TO Q2 2024", {'kind': 'yoy', 'frequency': 'quarter'})
+    assert (params['fy_from'], params['fq_from'], params['fy_to'], params['fq_to']) == (2022, 3, 2024, 2)
+    params = bind("APPLE REVENUE CAGR 2019 TO 2024", {'kind': 'cagr'})
+    assert (params['fy_from'], params['fy_to'], params['fq_from']) == (2019, 2024, None)
+    assert bind("APPLE EPS GROWTH LAST 2 YEARS", {'kind': 'qoq'})['limit'] == 8
+    assert bind("APPLE EPS GROWTH LAST 6 QUARTERS", {'kind': 'cagr'})['limit'] == 2
+    assert bind("APPLE EPS GROWTH IN 2023", {'kind': 'qoq'}) == {'ticker': 'AAPL', 'fy': None, 'fq': None, 'limit': 10}
+
+
+def test_collapsed_tasks_keep_every_measure():
+    decomposer = QueryDecomposer.__new__(QueryDecomposer)  # no LLM needed
+    period = extract_period_range("APPLE REVENUE AND EPS FROM 2019 TO 2024")
+    tasks = decomposer._collapse_range_tasks([
+        {'intent': 'annual_metrics', 'entities': ['AAPL'], 'period': {'fy': 2019}, 'measures': ['revenue']},
+        {'intent': 'annual_metrics', 'entities': ['AAPL'], 'period': {'fy': 2020}, 'measures': ['revenue', 'eps']},
+        {'intent': 'annual_metrics', 'entities': ['MSFT'], 'period': {'fy': 2019}, 'measures': []}
+    ], period)
+    assert len(tasks) == 2
+    assert tasks[0]['measures'] == ['revenue', 'eps'] and tasks[0]['period']['fy_from'] == 2019
+
+
+if __name__ == "__main__":
+    test_year_ranges()
+    test_quarter_ranges()
+    test_last_n_periods()
+    test_last_n_limit_follows_template_granularity()
+    test_growth_tasks_bind_range_at_engine_granularity()
+    test_collapsed_tasks_keep_every_measure()
+    print("✅ Period range tests passed")
@@ -0,0 +1,271 @@
+"""Test connection pool limiting, instrumentation, adaptive sizing, replica routing and request sessions"""
+import asyncio
+import os
+
+import asyncpg
+
+os.environ.setdefault('SUPABASE_DB_URL', 'postgresql://localhost/unused')  # global pool is created on import, never connected
+from db.pool import DatabasePool, AdjustableLimiter, next_pool_limit
+
+
+class FakeAsyncpgPool:
+    """Stands in for asyncpg.Pool: hands out connection tokens (or fails like a dead server)"""
+
+    def __init__(self, down: bool = False, lag: float = 0.0):
+        self.held = 0
+        self.down = down
+        self.lag = lag
+        self.served = 0
+
+    async def acquire(self, timeout=None):
+        if self.down:
+            raise ConnectionRefusedError("connection refused")
+        self.held += 1
+        self.served += 1
+        return FakeConnection(self)
+
+    async def release(self, conn):
+        self.held -= 1
+
+    def get_size(self):
+        return 10
+
+    def get_idle_size(self):
+        return 10 - self.held
+
+    def get_max_size(self):
+        return 10
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.transactions = []
+        self.busy = False
+
+    def transaction(self, isolation=None, readonly=False):
+        transaction = FakeTransaction(isolation, readonly)
+        self.transactions.append(transaction)
+        return transaction
+
+    def is_closed(self):
+        return False
+
+    async def fetch(self, sql, *args, timeout=None):
+        assert not self.busy, "concurrent statements on one connection"
+        self.busy = True
+        try:
+            await asyncio.sleep(0)
+            if 'missing_view' in sql:
+                raise ValueError('relation "missing_view" does not exist')
+            if 'misuse' in sql:
+                raise asyncpg.exceptions.InterfaceError('cannot call Connection.fetch(): connection has been released')
+            if 'dropped' in sql and self.pool.lag == 0.5:
+                raise asyncpg.exceptions.ConnectionDoesNotExistError('connection was closed in the middle of operation')
+            return [{'sql': sql, 'args': args, 'conn': self}]
+        finally:
+            self.busy = False
+
+    async def fetchrow(self, sql, *args, timeout=None):
+        return (await self.fetch(sql, *args, timeout=timeout))[0]
+
+    async def fetchval(self, sql, *args, timeout=None):
+        return self.pool.lag
+
+
+class FakeTransaction:
+    def __init__(self, isolation, readonly):
+        self.isolation = isolation
+        self.readonly = readonly
+        self.state = 'new'
+
+    async def start(self):
+        self.state = 'started'
+
+    async def rollback(self):
+        self.state = 'rolled_back'
+
+
+def pool_with_replicas(*replicas):
+    """DatabasePool whose primary and replicas are fake asyncpg pools"""
+    os.environ['DB_REPLICA_URLS'] = ",".join(f"postgresql://replica{i}/db" for i in range(len(replicas)))
+    try:
+        pool = DatabasePool()
+    finally:
+        del os.environ['DB_REPLICA_URLS']
+    pool.primary.pool = FakeAsyncpgPool()
+    for backend, fake in zip(pool.replicas, replicas):
+        backend.pool = fake
+    return pool
+
+
+def test_next_pool_limit():
+    grow = next_pool_limit(8, 2, 20, mean_wait=0.1, saturated=5, peak_in_use=8, headroom=50, target_wait=0.02)
+    assert grow == 10  # +25%
+    assert next_pool_limit(8, 2, 20, 0.1, 5, 8, headroom=1, target_wait=0.02) == 9  # server headroom caps growth
+    assert next_pool_limit(8, 2, 20, 0.1, 5, 8, headroom=0, target_wait=0.02) == 8  # no room: hold
+    assert next_pool_limit(19, 2, 20, 0.1, 5, 19, 50, 0.02) == 20  # configured max
+    assert next_pool_limit(8, 2, 20, 0.001, 0, 3, 50, 0.02) == 7  # mostly idle: shrink
+    assert next_pool_limit(2, 2, 20, 0.0, 0, 0, 50, 0.02) == 2  # configured min
+    assert next_pool_limit(8, 2, 20, 0.01, 0, 6, 50, 0.02) == 8  # busy but not queueing: hold
+
+
+def test_limiter_resizes_and_survives_cancellation():
+    async def run():
+        limiter = AdjustableLimiter(1)
+        await limiter.acquire()
+        waiters = [asyncio.ensure_future(limiter.acquire()) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert len(limiter.waiters) == 3
+
+        waiters[0].cancel()
+        limiter.set_limit(3)  # grow: two queued callers get in
+        await asyncio.sleep(0)
+        assert limiter.in_use == 3 and waiters[1].done() and waiters[2].done()
+
+        limiter.set_limit(1)  # shrink: holders finish, nobody new starts until below the limit
+        limiter.release()
+        limiter.release()
+        assert limiter.in_use == 1
+    asyncio.run(run())
+
+
+def test_acquire_enforces_limit_and_counts_saturation():
+    async def run():
+        pool = DatabasePool()
+        primary = pool.primary
+        primary.pool = FakeAsyncpgPool()
+        primary.limiter.set_limit(2)
+        peak = 0
+
+        async def query():
+            nonlocal peak
+            async with pool.acquire():
+                peak = max(peak, primary.pool.held)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*[query() for _ in range(6)])
+        assert peak == 2
+        assert primary.saturation_events == 4
+        assert primary.stats()['limit'] == 2 and primary.stats()['waiting'] == 0
+
+        # Saturated window with server headroom -> the limit grows
+        primary.server_headroom = lambda reserve: asyncio.sleep(0, result=5)
+        assert await primary.adapt(target_wait=0.001, reserve=0) == 3
+    asyncio.run(run())
+
+
+def test_routes_to_least_outstanding_backend():
+    async def run():
+        pool = pool_with_replicas(FakeAsyncpgPool(), FakeAsyncpgPool())
+        held = []
+        for _ in range(3):
+            cm = pool.acquire()
+            await cm.__aenter__()
+            held.append(cm)
+        # One connection per backend, replicas before the primary
+        assert [b.pool.held for b in pool.backends] == [1, 1, 1]
+        assert [b.name for b in pool.candidates()][-1] == 'primary'
+        for cm in held:
+            await cm.__aexit__(None, None, None)
+        assert all(b.outstanding == 0 for b in pool.backends)
+    asyncio.run(run())
+
+
+def test_lagging_replica_skipped_for_fresh_queries():
+    async def run():
+        pool = pool_with_replicas(FakeAsyncpgPool(lag=10.0))
+        await pool.check_health()
+        replica = pool.replicas[0]
+        assert replica.healthy and replica.lag_seconds == 10.0
+
+        assert replica in pool.candidates(fresh=False)  # within DB_REPLICA_MAX_LAG_SECONDS
+        assert pool.candidates(fresh=True) == [pool.primary]  # beyond DB_FRESH_MAX_LAG_SECONDS
+
+        served = replica.pool.served
+        await pool.execute_query("SELECT 1", fresh=True)
+        assert replica.pool.served == served
+    asyncio.run(run())
+
+
+def test_fails_over_to_primary_and_recovers():
+    async def run():
+        dead = FakeAsyncpgPool(down=True)
+        pool = pool_with_replicas(dead)
+        rows = await pool.execute_query("SELECT :x", {'x': 1})
+        assert rows[0]['sql'] == "SELECT $1" and rows[0]['args'] == (1,)
+        assert not pool.replicas[0].healthy and pool.primary.pool.served == 1
+        assert pool.candidates() == [pool.primary]
+        assert pool.replicas[0].limiter.in_use == 0  # failed checkout gave its slot back
+
+        dead.down = False
+        await pool.check_health()
+        assert pool.replicas[0].healthy and pool.candidates()[0] is pool.replicas[0]
+    asyncio.run(run())
+
+
+def test_session_pins_one_connection_and_snapshot():
+    async def run():
+        pool = pool_with_replicas()
+        async with pool.session() as session:
+            rows = await asyncio.gather(*[pool.execute_query("SELECT :n", {'n': n}) for n in range(5)])
+            row = await pool.execute_one("SELECT 1")
+            async with pool.acquire() as conn:
+                assert conn is row['conn']
+            assert pool.primary.pool.served == 1 and pool.primary.pool.held == 1
+            conn = row['conn']
+            assert all(r[0]['conn'] is conn for r in rows)  # serialized on the one connection
+            assert [(t.isolation, t.readonly) for t in conn.transactions] == [('repeatable_read', True)]
+        assert session.closed and session.queries == 7
+        assert conn.transactions[0].state == 'rolled_back' and pool.primary.pool.held == 0
+
+        await pool.execute_query("SELECT 1")  # outside a session: a fresh checkout
+        assert pool.primary.pool.served == 2 and pool.primary.pool.held == 0
+    asyncio.run(run())
+
+
+def test_session_restarts_transaction_after_failed_statement():
+    async def run():
+        pool = pool_with_replicas()
+        async with pool.session(enabled=False) as session:
+            assert session is None  # disabled (HITL): queries check out as usual
+        async with pool.session() as session:
+            row = await pool.execute_one("SELECT 1")
+            try:
+                await pool.execute_query("SELECT * FROM missing_view")
+                assert False, "expected failure"
+            except RuntimeError:
+                pass
+            after = await pool.execute_one("SELECT 2")
+            assert after['conn'] is row['conn'] and session.restarts == 1
+            assert [t.state for t in row['conn'].transactions] == ['rolled_back', 'started']
+    asyncio.run(run())
+
+
+def test_only_lost_connections_mark_backend_down():
+    async def run():
+        pool = pool_with_replicas(FakeAsyncpgPool(lag=0.5))  # lag 0.5: this replica drops 'dropped' queries
+        replica = pool.replicas[0]
+        try:
+            await pool.execute_query("SELECT 'misuse'")
+            assert False, "expected failure"
+        except RuntimeError:
+            pass
+        assert replica.healthy  # client-side misuse: backend is fine
+
+        rows = await pool.execute_query("SELECT 'dropped'")
+        assert not replica.healthy and rows[0]['conn'].pool is pool.primary.pool  # retried on the primary
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_next_pool_limit()
+    test_limiter_resizes_and_survives_cancellation()
+    test_acquire_enforces_limit_and_counts_saturation()
+    test_routes_to_least_outstanding_backend()
+    test_lagging_replica_skipped_for_fresh_queries()
+    test_fails_over_to_primary_and_recovers()
+    test_session_pins_one_connection_and_snapshot()
+    test_session_restarts_transaction_after_failed_statement()
+    test_only_lost_connections_mark_backend_down()
+    print("✅ Pool sizing, routing and session tests passed")
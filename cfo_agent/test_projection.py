@@ -0,0 +1,55 @@
+"""Test column pruning of wide templates to the requested metrics"""
+import json
+from pathlib import Path
+from projection import project_sql, projected_template_sql, required_columns
+
+TEMPLATES = json.loads((Path(__file__).parent / 'catalog' / 'templates.json').read_text())['templates']
+
+
+def test_required_columns_follow_formatter_metrics():
+    assert required_columns("What was Apple's revenue in Q2 2024?") == {'revenue_b', 'revenue_yoy', 'revenue_qoq'}
+    assert 'gross_margin_annual' in required_columns("Microsoft gross margin FY2023")
+    assert required_columns("Show Apple financial data for 2024") is None  # 'all'
+    assert required_columns("Apple current ratio 2024") is None  # no known column list
+    assert required_columns("How sensitive is Apple's net margin to macro factors?") is None
+    assert 'beta_nm_cpi_annual' in required_columns("Apple net margin and CPI in 2023")
+
+
+def test_project_keeps_keys_and_requested_columns():
+    sql = TEMPLATES['complete_full_annual']['sql']
+    projected = project_sql(sql, frozenset({'net_margin_annual'}))
+    select_list = projected[:projected.index(' FROM ')]
+    assert select_list == "SELECT ticker, name, fiscal_year, net_margin_annual"
+    assert projected.endswith(sql[sql.index(' FROM ') + 1:])
+    assert project_sql(sql, frozenset({'net_margin_annual'})) is projected  # cached per column set
+
+
+def test_project_handles_expressions_and_group_by():
+    sql = TEMPLATES['annual_metrics']['sql']
+    projected = project_sql(sql, frozenset({'eps', 'roa_annual'}))
+    assert "SUM(f.eps) as eps" in projected and "r.roa_annual" in projected
+    assert "revenue_b" not in projected[:projected.index(' FROM ')]
+    assert "GROUP BY c.ticker" in projected and projected.count(':ticker') == 1
+
+
+def test_project_returns_none_when_nothing_to_prune():
+    sql = TEMPLATES['multi_company_quarter']['sql']
+    assert project_sql(sql, frozenset({'eps'})) is None  # template has no eps column
+    assert project_sql("SELECT ticker, revenue_b FROM t ORDER BY revenue_b", frozenset({'net_income_b'})) is None
+    assert project_sql("SELECT DISTINCT ticker, eps FROM t", frozenset({'eps'})) is None
+
+
+def test_only_wide_templates_are_pruned():
+    question = "What was Apple's gross margin in 2023?"
+    assert projected_template_sql('complete_annual', TEMPLATES['complete_annual']['sql'], question)
+    assert projected_template_sql('macro_sensitivity_annual', TEMPLATES['macro_sensitivity_annual']['sql'], question) is None
+    assert projected_template_sql('complete_annual', TEMPLATES['complete_annual']['sql'], None) is None
+
+
+if __name__ == "__main__":
+    test_required_columns_follow_formatter_metrics()
+    test_project_keeps_keys_and_requested_columns()
+    test_project_handles_expressions_and_group_by()
+    test_project_returns_none_when_nothing_to_prune()
+    test_only_wide_templates_are_pruned()
+    print("✅ Projection tests passed")
@@ -0,0 +1,64 @@
+"""Test compact columnar query results"""
+import numpy as np
+from db.results import ResultSet
+
+
+class FakeRecord(tuple):
+    """Stands in for asyncpg.Record: a tuple with keys()"""
+
+    def __new__(cls, names, values):
+        record = super().__new__(cls, values)
+        record.names = names
+        return record
+
+    def keys(self):
+        return self.names
+
+
+def sample():
+    names = ('ticker', 'fiscal_year', 'revenue', 'gross_margin')
+    return ResultSet.from_records([
+        FakeRecord(names, ('AAPL', 2024, 391035000000.0, 0.462)),
+        FakeRecord(names, ('MSFT', 2024, 245122000000.0, None)),
+    ])
+
+
+def test_columns_are_typed_arrays():
+    result = sample()
+    assert len(result) == 2 and result.columns == ('ticker', 'fiscal_year', 'revenue', 'gross_margin')
+    assert result.data['revenue'].dtype == np.float64
+    assert result.data['fiscal_year'].dtype == np.int64
+    assert result.data['ticker'] == ('AAPL', 'MSFT')
+    assert np.isnan(result.data['gross_margin'][1])
+    assert result.column('revenue') is result.data['revenue']  # no copy
+
+
+def test_rows_read_like_driver_dicts():
+    result = sample()
+    assert result[1] == {'ticker': 'MSFT', 'fiscal_year': 2024, 'revenue': 245122000000.0, 'gross_margin': None}
+    assert type(result[0]['fiscal_year']) is int and type(result[0]['revenue']) is float
+    assert [row['ticker'] for row in result] == ['AAPL', 'MSFT']
+    assert result[-1]['ticker'] == 'MSFT' and len(result[:1]) == 1
+    assert not ResultSet.from_records([])
+
+
+def test_to_frame_keeps_types_and_nulls():
+    frame = sample().to_frame()
+    assert frame['revenue'].dtype == np.float64
+    assert frame['gross_margin'].iloc[1] is None  # NULL stays None, not NaN
+    assert list(frame.columns) == ['ticker', 'fiscal_year', 'revenue', 'gross_margin']
+
+
+def test_from_dicts_matches_bundle_rows():
+    result = ResultSet.from_dicts([{'ticker': 'AAPL', 'eps': 6.11}, {'ticker': 'MSFT', 'eps': 11.8, 'note': 'x'}])
+    assert result.columns == ('ticker', 'eps', 'note')
+    assert result.data['eps'].dtype == np.float64
+    assert result[0] == {'ticker': 'AAPL', 'eps': 6.11, 'note': None}
+
+
+if __name__ == "__main__":
+    test_columns_are_typed_arrays()
+    test_rows_read_like_driver_dicts()
+    test_to_frame_keeps_types_and_nulls()
+    test_from_dicts_matches_bundle_rows()
+    print("✅ Result set tests passed")
@@ -0,0 +1,144 @@
+"""Test the screening engine against brute-force evaluation"""
+import time
+import numpy as np
+from analytics.screener import ScreenIndex, describe_screen
+from decomposer import QueryDecomposer
+
+
+def synthetic_tables(n_companies=50, years=(2022, 2023, 2024), seed=3):
+    """'annual' + 'growth_annual' tables shaped like the fact store's, with NULLs"""
+    rng = np.random.default_rng(seed)
+    keys = [(f"T{c:04d}", y) for c in range(n_companies) for y in years]
+    n = len(keys)
+    annual = {
+        'ticker': np.array([k[0] for k in keys], dtype=object),
+        'name': np.array([f"Company {k[0]}" for k in keys], dtype=object),
+        'fiscal_year': np.array([k[1] for k in keys], dtype=np.int32),
+        'revenue_b': rng.uniform(1, 400, n),
+        'net_margin_annual': rng.uniform(-0.1, 0.4, n),
+        'roe_annual': rng.uniform(-0.2, 0.6, n),
+        'debt_to_equity_annual': rng.uniform(0, 4, n)
+    }
+    annual['net_margin_annual'][::7] = np.nan
+
+    # Growth rows in a different order, one company-year missing
+    growth_order = rng.permutation(n)[1:]
+    growth = {
+        'ticker': annual['ticker'][growth_order],
+        'name': annual['name'][growth_order],
+        'fiscal_year': annual['fiscal_year'][growth_order],
+        'revenue_yoy': rng.uniform(-0.3, 0.5, len(growth_order))
+    }
+    return {'annual': annual, 'growth_annual': growth}
+
+
+def brute_force(tables, year, predicate):
+    annual, growth = tables['annual'], tables['growth_annual']
+    growth_by_key = {(t, y): g for t, y, g in zip(growth['ticker'], growth['fiscal_year'], growth['revenue_yoy'])}
+    matches = set()
+    for i in range(len(annual['ticker'])):
+        if annual['fiscal_year'][i] != year:
+            continue
+        row = {
+            'net_margin': annual['net_margin_annual'][i],
+            'roe': annual['roe_annual'][i],
+            'revenue': annual['revenue_b'][i],
+            'revenue_growth': growth_by_key.get((annual['ticker'][i], year), np.nan)
+        }
+        if predicate(row):
+            matches.add(annual['ticker'][i])
+    return matches
+
+
+def test_and_or_matches_brute_force():
+    tables = synthetic_tables()
+    index = ScreenIndex('annual', tables)
+
+    where = {'or': [
+        {'and': [
+            {'metric': 'net_margin', 'op': '>', 'value': 0.2},
+            {'metric': 'revenue_growth', 'op': '>=', 'value': 0.1}
+        ]},
+        {'metric': 'roe', 'op': 'between', 'value': [0.5, 0.55]}
+    ]}
+    result = index.screen(where, fiscal_year=2023, limit=200)
+
+    # NaN comparisons are False, like NULL in SQL
+    expected = brute_force(tables, 2023, lambda r: (r['net_margin'] > 0.2 and r['revenue_growth'] >= 0.1)
+                           or 0.5 <= r['roe'] <= 0.55)
+    assert result['matched'] == len(expected)
+    assert {r['ticker'] for r in result['rows']} == expected
+    assert result['period'] == {'fiscal_year': 2023, 'fiscal_quarter': None}
+
+
+def test_top_k_ordering_and_latest_period():
+    index = ScreenIndex('annual', synthetic_tables())
+    where = {'metric': 'revenue', 'op': '>', 'value': 50}
+
+    top = index.screen(where, sort='roe', limit=5)
+    assert top['period']['fiscal_year'] == 2024
+    roes = [r['roe'] for r in top['rows']]
+    assert len(roes) == 5 and roes == sorted(roes, reverse=True)
+    assert all(r['revenue'] > 50 for r in top['rows'])
+
+    bottom = index.screen(where, sort='roe', order='asc', limit=5)
+    assert [r['roe'] for r in bottom['rows']] == sorted(r['roe'] for r in bottom['rows'])
+    assert bottom['rows'][0]['roe'] <= top['rows'][-1]['roe']
+
+
+def test_validation_errors():
+    index = ScreenIndex('annual', synthetic_tables())
+    for where in ({'metric': 'nope', 'op': '>', 'value': 1},
+                  {'metric': 'roe', 'op': '!=', 'value': 1},
+                  {'and': []},
+                  {'metric': 'roe', 'op': 'between', 'value': 1}):
+        try:
+            index.screen(where)
+        except ValueError:
+            continue
+        raise AssertionError(f"expected ValueError for {where}")
+
+
+def test_decomposer_screen_spec():
+    decomposer = object.__new__(QueryDecomposer)
+    spec = decomposer._extract_screen_spec(
+        "COMPANIES WITH NET MARGIN > 20% AND REVENUE GROWTH > 10% IN FY2024", False
+    )
+    assert spec['where'] == {'and': [
+        {'metric': 'net_margin', 'op': '>', 'value': 0.2},
+        {'metric': 'revenue_growth', 'op': '>', 'value': 0.1}
+    ]}
+    assert spec['frequency'] == 'annual'
+    assert describe_screen(spec['where']) == "net margin > 20.0% and revenue growth > 10.0%"
+
+    spec = decomposer._extract_screen_spec(
+        "WHICH COMPANIES HAD ROE ABOVE 15% OR REVENUE OVER $100B, TOP 5 SORTED BY REVENUE", False
+    )
+    assert spec['where'] == {'or': [
+        {'metric': 'roe', 'op': '>', 'value': 0.15},
+        {'metric': 'revenue', 'op': '>', 'value': 100.0}
+    ]}
+    assert spec['sort'] == 'revenue' and spec['limit'] == 5
+
+    assert decomposer._extract_screen_spec("APPLE NET MARGIN 2023", False) is None
+
+
+if __name__ == "__main__":
+    test_and_or_matches_brute_force()
+    test_top_k_ordering_and_latest_period()
+    test_validation_errors()
+    test_decomposer_screen_spec()
+
+    # Latency on a large synthetic universe
+    index = ScreenIndex('annual', synthetic_tables(n_companies=5000))
+    where = {'and': [
+        {'metric': 'net_margin', 'op': '>', 'value': 0.2},
+        {'metric': 'revenue_growth', 'op': '>', 'value': 0.1}
+    ]}
+    index.screen(where, fiscal_year=2024)
+    runs = 1000
+    start = time.perf_counter()
+    for _ in range(runs):
+        index.screen(where, fiscal_year=2024, limit=25)
+    print(f"5000-company two-predicate screen + top-25: {(time.perf_counter() - start) / runs * 1e6:.0f}µs")
+    print("✅ Screening engine tests passed")
@@ -0,0 +1,137 @@
+"""Test session memory backends (in-process and shared SQLite)"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from multiprocessing import Pool
+from memory import SessionBackend, SessionMemory, InProcessBackend, SQLiteBackend
+
+
+def exercise(memory: SessionMemory):
+    memory.record_request('s1', tickers=['AAPL', 'MSFT'], period={'fy': 2023, 'fq': None}, surfaces=['mv_financials_annual'])
+    memory.record_request('s1', tickers=['GOOG', 'META'])
+
+    session = memory.get_or_create_session('s1')
+    assert session['last_tickers'] == ['MSFT', 'GOOG', 'META']
+    assert session['last_period'] == {'fy': 2023, 'fq': None}
+    assert session['query_count'] == 2
+    assert memory.get_context_summary('s1').startswith("Recent tickers: MSFT, GOOG, META")
+
+    memory.add_alias_resolution('s1', 'apple', 'AAPL')
+    assert memory.get_or_create_session('s1')['alias_resolutions'] == {'apple': 'AAPL'}
+
+    memory.clear_session('s1')
+    assert memory.get_context_summary('s1') == "New session"
+
+
+def test_in_process_backend():
+    exercise(SessionMemory(backend=InProcessBackend()))
+
+
+def test_sqlite_backend():
+    with tempfile.TemporaryDirectory() as tmp:
+        exercise(SessionMemory(backend=SQLiteBackend(os.path.join(tmp, 'sessions.db'))))
+
+
+def _worker_requests(args):
+    path, n = args
+    memory = SessionMemory(backend=SQLiteBackend(path))
+    for _ in range(n):
+        memory.record_request('shared', tickers=['AAPL'])
+    return os.getpid()
+
+
+def test_sqlite_shared_across_processes():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sessions.db')
+        SQLiteBackend(path)  # create schema before workers start
+
+        with Pool(4) as pool:
+            pool.map(_worker_requests, [(path, 25)] * 4)
+
+        # A fresh "worker" sees every other worker's writes, none lost
+        memory = SessionMemory(backend=SQLiteBackend(path))
+        session = memory.get_or_create_session('shared')
+        assert session['query_count'] == 100
+        assert session['last_tickers'] == ['AAPL']
+
+
+def test_lru_cap_and_idle_ttl():
+    backend = InProcessBackend(max_sessions=3, idle_ttl=60.0)
+    memory = SessionMemory(backend=backend)
+    for i in range(4):
+        memory.record_request(f"s{i}", tickers=['AAPL'])
+    memory.get_or_create_session('s1')  # touch: s2 becomes least recently used
+
+    memory.record_request('s4')
+    assert list(backend.sessions) == ['s3', 's1', 's4']
+    assert backend.stats()['evicted_lru'] == 2
+
+    # Age everything but s4 past the TTL; the sweeper drops them
+    for session_id in ('s3', 's1'):
+        backend.sessions[session_id].last_seen -= 120
+    assert backend.sweep() == 2
+    assert list(backend.sessions) == ['s4']
+    assert memory.get_context_summary('s3') == "New session"
+
+
+def test_sqlite_cap_and_idle_ttl():
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(os.path.join(tmp, 'sessions.db'), max_sessions=2, idle_ttl=60.0)
+        memory = SessionMemory(backend=backend)
+        for i in range(3):
+            memory.record_request(f"s{i}")
+        backend._conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = 's0'", (time.time() - 120,))
+
+        assert memory.get_context_summary('s0') == "New session"
+        assert backend.sweep() == 1
+        assert backend.stats()['live_sessions'] == 2
+
+
+def test_footprint_stays_flat():
+    backend = InProcessBackend(max_sessions=1000, idle_ttl=3600.0)
+    memory = SessionMemory(backend=backend)
+
+    def churn(start):
+        for i in range(start, start + 5000):
+            memory.record_request(f"session_{i}", tickers=['AAPL', 'MSFT'], period={'fy': 2024, 'fq': 2, 'latest': False},
+                                  surfaces=['fact_financials'])
+
+    churn(0)
+    first = backend.stats()
+    churn(5000)
+    second = backend.stats()
+    assert first['live_sessions'] == second['live_sessions'] == 1000
+    assert abs(second['approx_bytes'] - first['approx_bytes']) < 0.05 * first['approx_bytes']
+
+
+def test_sqlite_calls_run_off_the_event_loop():
+    def thread_of(memory):
+        threads = []
+        asyncio.run(memory.offload(memory.backend.update, 's1', lambda s: threads.append(threading.get_ident())))
+        return threads[0]
+
+    assert thread_of(SessionMemory(backend=InProcessBackend())) == threading.get_ident()
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = SessionMemory(backend=SQLiteBackend(os.path.join(tmp, 'sessions.db')))
+        assert thread_of(memory) != threading.get_ident()
+        asyncio.run(memory.offload(memory.record_request, 's1', tickers=['AAPL']))
+        assert memory.get_or_create_session('s1')['last_tickers'] == ['AAPL']
+
+    try:
+        SessionBackend()
+        raise AssertionError("expected TypeError")
+    except TypeError:
+        pass
+
+
+if __name__ == "__main__":
+    test_in_process_backend()
+    test_sqlite_backend()
+    test_sqlite_shared_across_processes()
+    test_lru_cap_and_idle_ttl()
+    test_sqlite_cap_and_idle_ttl()
+    test_footprint_stays_flat()
+    test_sqlite_calls_run_off_the_event_loop()
+    print("✅ Session memory tests passed")
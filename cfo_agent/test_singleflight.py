@@ -0,0 +1,120 @@
+"""Test single-flight coalescing of concurrent identical work"""
+import asyncio
+import os
+from contextvars import ContextVar
+
+os.environ.setdefault('SUPABASE_DB_URL', 'postgresql://localhost/unused')  # global pool is created on import, never connected
+import sql_exec
+from singleflight import SingleFlight, normalize_question, params_key
+
+
+def test_concurrent_duplicates_share_one_run():
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return ['row']
+
+        results = await asyncio.gather(*[flight.do('k', work) for _ in range(20)])
+        assert len(calls) == 1
+        assert [shared for _, shared in results].count(False) == 1
+        assert all(rows == ['row'] for rows, _ in results)
+        assert flight.inflight == {}
+
+        # Finished keys are released: the next call runs again
+        await flight.do('k', work)
+        assert len(calls) == 2
+        assert flight.stats()['followers'] == 19
+    asyncio.run(run())
+
+
+def test_errors_are_shared_and_released():
+    async def run():
+        flight = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("db down")
+
+        results = await asyncio.gather(*[flight.do('k', boom) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert flight.inflight == {}
+    asyncio.run(run())
+
+
+def test_follower_timeout_does_not_cancel_leader():
+    async def run():
+        flight = SingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return 42
+
+        leader = asyncio.ensure_future(flight.do('k', slow))
+        await asyncio.sleep(0)
+        try:
+            await flight.do('k', slow, timeout=0.01)
+            raise AssertionError("expected timeout")
+        except asyncio.TimeoutError:
+            pass
+        assert await leader == (42, False)
+    asyncio.run(run())
+
+
+def test_keys():
+    assert normalize_question("  What was Apple's  revenue in 2023? ") == normalize_question("what was apple's revenue in 2023")
+    assert params_key("SELECT 1", {'a': 1, 'b': 2}) == params_key("SELECT 1", {'b': 2, 'a': 1})
+
+
+class Record(dict):
+    """asyncpg Records index by position as well as by name"""
+
+    def __getitem__(self, key):
+        return list(self.values())[key] if isinstance(key, int) else super().__getitem__(key)
+
+
+class SessionPool:
+    """Stands in for db_pool: a per-task session and a counted, slow query"""
+
+    def __init__(self):
+        self.session = ContextVar('session', default=None)
+        self.queries = []
+
+    def current_session(self):
+        return self.session.get()
+
+    async def execute_query(self, sql, params, timeout=None, fresh=False):
+        self.queries.append(self.session.get())
+        await asyncio.sleep(0.01)
+        return [Record(session=self.session.get())]
+
+
+def test_sessions_do_not_share_coalesced_reads():
+    async def request(executor, pool, name):
+        pool.session.set(name)
+        first, second = await asyncio.gather(*[executor.execute("SELECT 1", {}) for _ in range(2)])
+        return first[0]['session'], second[0]['session']
+
+    async def run():
+        executor = sql_exec.SQLExecutor(coalesce=True)
+        saved, sql_exec.db_pool = sql_exec.db_pool, SessionPool()
+        try:
+            pool = sql_exec.db_pool
+            results = await asyncio.gather(request(executor, pool, 'a'), request(executor, pool, 'b'))
+            assert results == [('a', 'a'), ('b', 'b')]  # each request reads its own snapshot
+            assert sorted(pool.queries) == ['a', 'b']  # but duplicates within a request still coalesce
+        finally:
+            sql_exec.db_pool = saved
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_concurrent_duplicates_share_one_run()
+    test_errors_are_shared_and_released()
+    test_follower_timeout_does_not_cancel_leader()
+    test_keys()
+    test_sessions_do_not_share_coalesced_reads()
+    print("✅ Single-flight tests passed")
@@ -0,0 +1,142 @@
+"""Test the tokenizer-based SQL validator"""
+import json
+import os
+from contextlib import contextmanager
+
+os.environ.setdefault('SUPABASE_DB_URL', 'postgresql://localhost/unused')
+
+from db import whitelist
+from db.sql_parser import parse_sql, tokenize
+from db.whitelist import _validate_statement, extract_surfaces, validate_sql
+
+SNAPSHOT = ("SELECT c.ticker, f.fiscal_year, f.revenue/1e9 as revenue_b FROM fact_financials f JOIN dim_company c USING (company_id) "
+            "WHERE c.ticker = :ticker AND (CAST(:fy AS INTEGER) IS NULL OR f.fiscal_year = :fy) "
+            "ORDER BY f.fiscal_year DESC, revenue_b LIMIT :limit")
+
+SCHEMA = {
+    'fact_financials': {'company_id', 'fiscal_year', 'fiscal_quarter', 'revenue'},
+    'dim_company': {'company_id', 'ticker', 'name'}
+}
+
+
+@contextmanager
+def schema(surfaces):
+    saved, version = dict(whitelist._schema_cache), whitelist._schema_version
+    whitelist._schema_cache.clear()
+    whitelist._schema_cache.update(surfaces)
+    whitelist._schema_version = version + 1
+    try:
+        yield
+    finally:
+        whitelist._schema_cache.clear()
+        whitelist._schema_cache.update(saved)
+        whitelist._schema_version = version + 2
+
+
+def test_tokenizer_keeps_strings_and_casts_whole():
+    tokens = tokenize("SELECT name::text, 'it''s; DROP' FROM dim_company -- LIMIT 1\nWHERE ticker = :ticker")
+    assert ('string', "'it''s; DROP'") in tokens
+    assert ('cast', '::') in tokens and ('param', ':ticker') in tokens
+    assert all(text != 'LIMIT' for _, text in tokens)  # comment dropped
+
+
+def test_parse_extracts_surfaces_columns_limit_and_params():
+    parsed = parse_sql(SNAPSHOT)
+    assert parsed['statement'] == 'SELECT'
+    assert parsed['surfaces'] == {'fact_financials': 'fact_financials', 'f': 'fact_financials',
+                                  'dim_company': 'dim_company', 'c': 'dim_company'}
+    assert ('c', 'ticker') in parsed['columns'] and ('f', 'revenue') in parsed['columns']
+    assert (None, 'company_id') in parsed['columns'] and 'revenue_b' in parsed['aliases']
+    assert parsed['limit'] == ('param', 'limit')
+    assert parsed['params'] == ['ticker', 'fy', 'fy', 'limit'] and not parsed['errors']
+
+
+def test_catalog_templates_validate():
+    path = os.path.join(os.path.dirname(__file__), 'catalog', 'templates.json')
+    with open(path) as f:
+        templates = json.load(f)['templates']
+    for name, template in templates.items():
+        assert validate_sql(template['sql'], {'limit': 10}) == (True, ""), name
+
+
+def test_select_lists_are_not_cross_joins():
+    assert validate_sql("SELECT ticker, name FROM dim_company LIMIT 5") == (True, "")
+    assert validate_sql("SELECT ticker FROM dim_company, fact_financials LIMIT 5")[1].startswith("Implicit cross join")
+    assert validate_sql("SELECT ticker FROM dim_company CROSS JOIN fact_financials LIMIT 5") == \
+        (False, "CROSS JOIN is not allowed")
+
+
+def test_unsafe_statements_rejected():
+    assert validate_sql("SELECT name FROM dim_company WHERE name = 'a; DROP TABLE x' LIMIT 5") == (True, "")
+    assert validate_sql("SELECT name FROM dim_company LIMIT 5; DROP TABLE dim_company") == \
+        (False, "Multiple statements not allowed")
+    assert validate_sql("SELECT name FROM dim_company LIMIT 5;") == (True, "")
+    assert validate_sql("DELETE FROM dim_company") == (False, "Only SELECT queries are allowed")
+    assert validate_sql("SELECT name FROM dim_company LIMIT 5 FOR UPDATE") == \
+        (False, "Locking clause not allowed: FOR UPDATE")
+    assert validate_sql("SELECT name FROM dim_company LIMIT 5 FOR SHARE") == \
+        (False, "Locking clause not allowed: FOR SHARE")
+    assert validate_sql("SELECT pg_sleep(10) FROM dim_company LIMIT 1") == (False, "Forbidden function: pg_sleep")
+    assert validate_sql('SELECT "pg_sleep"(5) FROM vw_cfo_answers LIMIT 1') == (False, "Forbidden function: pg_sleep")
+    assert validate_sql("SELECT current_setting('is_superuser') FROM dim_company LIMIT 1") == \
+        (False, "Forbidden function: current_setting")
+    assert validate_sql("SELECT lo_get(1) FROM dim_company LIMIT 1") == (False, "Forbidden function: lo_get")
+    assert validate_sql('SELECT ticker FROM "pg_roles" LIMIT 1') == (False, "Surface 'pg_roles' is not in the allowlist")
+    assert validate_sql('SELECT c.ticker FROM "dim_company" c LIMIT 1') == (True, "")
+    assert validate_sql("SELECT name FROM dim_company WHERE ticker = $1 LIMIT 5")[1].startswith("Positional")
+    assert validate_sql("SELECT name FROM dim_company WHERE ticker = :tick LIMIT 5") == \
+        (False, "Parameter 'tick' is not allowed")
+    assert validate_sql("SELECT name FROM public.dim_company LIMIT 5") == \
+        (False, "Surface 'public.dim_company' is not in the allowlist")
+    assert validate_sql("SELECT name FROM dim_company WHERE company_id IN (SELECT company_id FROM pg_user) LIMIT 5") == \
+        (False, "Surface 'pg_user' is not in the allowlist")
+    assert extract_surfaces(SNAPSHOT) == ['dim_company', 'fact_financials']
+
+
+def test_select_star_and_limits():
+    assert validate_sql("SELECT * FROM dim_company LIMIT 5")[1].startswith("SELECT *")
+    assert validate_sql("SELECT c.* FROM dim_company c LIMIT 5")[1].startswith("SELECT *")
+    assert validate_sql("SELECT COUNT(*) AS n, 2 * 3 AS six FROM dim_company LIMIT 5") == (True, "")
+    assert validate_sql("SELECT name FROM dim_company") == (False, "LIMIT clause is required")
+    assert validate_sql("SELECT name FROM dim_company WHERE company_id IN "
+                        "(SELECT company_id FROM dim_company LIMIT 5)") == (False, "LIMIT clause is required")
+    assert validate_sql("SELECT name FROM dim_company LIMIT 500") == (False, "LIMIT must be ≤ 200")
+    assert validate_sql("SELECT name FROM dim_company LIMIT :limit", {'limit': 500}) == \
+        (False, "LIMIT parameter must be ≤ 200")
+    assert validate_sql("SELECT name FROM dim_company LIMIT :limit", {'limit': 50}) == (True, "")
+    assert validate_sql("SELECT name FROM dim_company LIMIT 5", {'secret': 1}) == (False, "Parameter 'secret' is not allowed")
+
+
+def test_columns_checked_against_schema_cache():
+    with schema(SCHEMA):
+        assert validate_sql(SNAPSHOT, {'ticker': 'AAPL', 'fy': 2023, 'limit': 10}) == (True, "")
+        assert validate_sql("SELECT f.revenue_typo FROM fact_financials f LIMIT 5") == \
+            (False, "Unknown column 'f.revenue_typo' on fact_financials")
+        assert validate_sql("SELECT ticker, revenu FROM fact_financials JOIN dim_company USING (company_id) LIMIT 5") == \
+            (False, "Unknown column 'revenu'")
+        assert validate_sql("SELECT x.ticker FROM dim_company c LIMIT 5") == (False, "Unknown table alias 'x'")
+        assert validate_sql("SELECT ticker, EXTRACT(YEAR FROM CURRENT_DATE) yr FROM dim_company ORDER BY yr LIMIT 5") == (True, "")
+    # No schema loaded: references can't be checked
+    with schema({}):
+        assert validate_sql("SELECT f.revenue_typo FROM fact_financials f LIMIT 5") == (True, "")
+
+
+def test_verdicts_memoized_per_statement():
+    sql = "SELECT ticker FROM dim_company WHERE ticker = :ticker LIMIT :limit"
+    validate_sql(sql, {'ticker': 'AAPL', 'limit': 5})
+    hits = _validate_statement.cache_info().hits
+    assert validate_sql(sql, {'ticker': 'MSFT', 'limit': 5}) == (True, "")
+    assert validate_sql(sql, {'ticker': 'MSFT', 'limit': 201}) == (False, "LIMIT parameter must be ≤ 200")
+    assert _validate_statement.cache_info().hits == hits + 2
+
+
+if __name__ == "__main__":
+    test_tokenizer_keeps_strings_and_casts_whole()
+    test_parse_extracts_surfaces_columns_limit_and_params()
+    test_catalog_templates_validate()
+    test_select_lists_are_not_cross_joins()
+    test_unsafe_statements_rejected()
+    test_select_star_and_limits()
+    test_columns_checked_against_schema_cache()
+    test_verdicts_memoized_per_statement()
+    print("✅ SQL validator tests passed")